@@ -0,0 +1,594 @@
+"""
+Benchmark del servidor de codigo_base.py.
+
+Levanta el servidor en loopback (un proceso nuevo por escenario), le manda carga concurrente
+con conexiones persistentes y mide throughput, latencias (p50/p95/p99) y CPU/memoria del servidor.
+Los resultados se guardan en JSON para poder comparar versiones:
+
+    python3 benchmark.py --sizes 1K,1M,16M --concurrency 1,8,32 --gzip off,on --output actual.json
+    python3 benchmark.py --compare base.json actual.json
+
+Con --tls off,on cada escenario se mide también por HTTPS (con un certificado autofirmado generado con
+el comando openssl) y al final se resume cuánto cuesta TLS en req/s y CPU del servidor.
+"""
+from socket import *
+import sys
+import os
+import time
+import json
+import shutil
+import signal
+import math
+import random
+import tempfile
+import threading
+import subprocess
+import platform
+import statistics
+import ssl
+import http.client
+
+# Carga que se puede medir: página principal, descarga de un archivo y subida multipart
+CARGAS = ('index', 'download', 'upload')
+
+DIRECTORIO_REPO = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_SERVIDOR = os.path.join(DIRECTORIO_REPO, "codigo_base.py")
+
+# Palabras para generar contenido de texto (comprimible, como un log o un CSV)
+PALABRAS = (b"redes", b"paquete", b"socket", b"tcp", b"http", b"servidor", b"cliente", b"archivo",
+            b"descarga", b"subida", b"latencia", b"ventana", b"congestion", b"ack", b"syn", b"fin")
+
+
+def parsear_tamaño(texto):
+    """
+    Requiere: texto: str como '512', '64K', '1M' o '1G'
+    Devuelve: int, cantidad de bytes
+    """
+    texto = texto.strip().upper()
+    multiplicadores = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    if texto and texto[-1] in multiplicadores:
+        return int(float(texto[:-1]) * multiplicadores[texto[-1]])
+    return int(texto)
+
+
+def generar_contenido(tamaño, tipo, semilla=0):
+    """
+    Devuelve bytes de contenido reproducible: 'texto' (comprimible) o 'aleatorio' (no comprimible).
+    """
+    generador = random.Random(semilla)
+    if tipo == 'aleatorio':
+        return generador.randbytes(tamaño)
+    partes = []
+    total = 0
+    while total < tamaño:
+        linea = b" ".join(generador.choice(PALABRAS) for _ in range(12)) + b" %d\n" % generador.randrange(10 ** 6)
+        partes.append(linea)
+        total += len(linea)
+    return b"".join(partes)[:tamaño]
+
+
+def armar_multipart(nombre, datos):
+    """Devuelve (content_type, body) de un multipart/form-data con un solo archivo."""
+    boundary = "----benchmark%016x" % random.getrandbits(64)
+    body = (f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{nombre}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n").encode('utf-8')
+    body += datos + f"\r\n--{boundary}--\r\n".encode('utf-8')
+    return f"multipart/form-data; boundary={boundary}", body
+
+
+def puerto_libre():
+    s = socket(AF_INET, SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    puerto = s.getsockname()[1]
+    s.close()
+    return puerto
+
+
+def generar_certificado(directorio):
+    """
+    Genera un certificado autofirmado para 127.0.0.1 con el comando openssl.
+    Devuelve: tuple (ruta del certificado, ruta de la clave)
+    """
+    certificado = os.path.join(directorio, "cert.pem")
+    clave = os.path.join(directorio, "key.pem")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-keyout", clave, "-out", certificado, "-subj", "/CN=127.0.0.1",
+                        "-addext", "subjectAltName=IP:127.0.0.1"],
+                       check=True, capture_output=True, timeout=60)
+    except (OSError, subprocess.SubprocessError) as e:
+        raise RuntimeError(f"No se pudo generar el certificado con openssl ({e})")
+    return certificado, clave
+
+
+def medir_handshakes(puerto, contexto, cantidad=20):
+    """
+    Abre cantidad conexiones TLS nuevas y mide cuánto tarda el handshake completo (la primera de cada par)
+    y el que retoma la sesión anterior con su ticket.
+    Devuelve: dict con las medianas en ms y cuántos intentos de retomar funcionaron
+    """
+    completos = []
+    reanudados = []
+    aciertos = 0
+    for _ in range(cantidad):
+        sesion = None
+        for intento in range(2):
+            inicio = time.perf_counter()
+            conexion = contexto.wrap_socket(create_connection(("127.0.0.1", puerto), timeout=5),
+                                            server_hostname="127.0.0.1", session=sesion)
+            duracion = (time.perf_counter() - inicio) * 1000
+            # En TLS 1.3 el ticket llega después del handshake: un request lo hace leer
+            conexion.sendall(b"GET /list HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+            while conexion.recv(65536):
+                pass
+            if intento == 0:
+                completos.append(duracion)
+                sesion = conexion.session
+            else:
+                reanudados.append(duracion)
+                aciertos += conexion.session_reused
+            conexion.close()
+    return {
+        'completo_ms': round(statistics.median(completos), 3),
+        'reanudado_ms': round(statistics.median(reanudados), 3),
+        'reanudados': f"{aciertos}/{cantidad}",
+    }
+
+
+def leer_proc_proceso(pid):
+    """
+    Lee CPU y memoria de un proceso desde /proc (solo Linux).
+    Devuelve: dict con 'ppid', 'cpu' (segundos de usuario + sistema), 'rss' y 'rss_pico' (bytes), o None
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # El nombre del proceso va entre paréntesis y puede tener espacios: cortar después del último ')'
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            status = dict(linea.split(":", 1) for linea in f if ":" in linea)
+    except OSError:
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    return {
+        'ppid': int(campos[1]),
+        'cpu': (int(campos[11]) + int(campos[12])) / ticks,
+        # Los procesos zombies (y los del kernel) no tienen memoria
+        'rss': int(status.get('VmRSS', '0').split()[0]) * 1024,
+        'rss_pico': int(status.get('VmHWM', '0').split()[0]) * 1024,
+    }
+
+
+def leer_proc(pid):
+    """
+    Lee CPU y memoria del servidor sumando el proceso y sus hijos directos (los workers de --workers).
+    Devuelve: dict con 'cpu' (segundos de usuario + sistema), 'rss' y 'rss_pico' (bytes), o None
+    """
+    total = leer_proc_proceso(pid)
+    if total is None:
+        return None
+    for nombre in os.listdir("/proc"):
+        if not nombre.isdigit() or int(nombre) == pid:
+            continue
+        proceso = leer_proc_proceso(nombre)
+        if proceso is not None and proceso['ppid'] == pid:
+            for clave in ('cpu', 'rss', 'rss_pico'):
+                total[clave] += proceso[clave]
+    return total
+
+
+def percentil(ordenados, p):
+    """Percentil p (0-100) por rango más cercano de una lista ya ordenada."""
+    if not ordenados:
+        return None
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+class Servidor:
+    """
+    Proceso del servidor levantado en 127.0.0.1 con un directorio de trabajo propio.
+    - directorio: carpeta donde se crea archivos_servidor
+    - argumentos: list con el modo y las opciones de codigo_base.py (por ejemplo ['upload', '--gzip'])
+    """
+
+    def __init__(self, directorio, argumentos):
+        self.directorio = directorio
+        self.argumentos = argumentos
+        self.puerto = puerto_libre()
+        self.proceso = None
+
+    def iniciar(self, espera=10.0):
+        entorno = dict(os.environ, HOST="127.0.0.1", PUERTO=str(self.puerto))
+        self.proceso = subprocess.Popen([sys.executable, SCRIPT_SERVIDOR] + self.argumentos, cwd=self.directorio,
+                                        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        limite = time.monotonic() + espera
+        while time.monotonic() < limite:
+            if self.proceso.poll() is not None:
+                raise RuntimeError(f"El servidor terminó al iniciar (código {self.proceso.returncode})")
+            try:
+                create_connection(("127.0.0.1", self.puerto), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        self.detener()
+        raise RuntimeError("El servidor no empezó a escuchar a tiempo")
+
+    def detener(self):
+        if self.proceso is None or self.proceso.poll() is not None:
+            return
+        # Ctrl+C: el servidor cierra el socket y termina
+        self.proceso.send_signal(signal.SIGINT)
+        try:
+            self.proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proceso.kill()
+            self.proceso.wait()
+
+
+def trabajador(puerto, carga, escenario, fin_calentamiento, fin, resultados, indice):
+    """
+    Hilo que repite requests sobre una conexión persistente hasta fin.
+    Los requests que terminan antes de fin_calentamiento no se cuentan.
+    """
+    latencias = []
+    bytes_transferidos = 0
+    errores = 0
+    if escenario['tls']:
+        conexion = http.client.HTTPSConnection("127.0.0.1", puerto, timeout=30, context=escenario['contexto_tls'])
+    else:
+        conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=30)
+    headers = {}
+    if escenario['gzip']:
+        headers['Accept-Encoding'] = 'gzip'
+    buffer = bytearray(256 * 1024)
+
+    if carga == 'upload':
+        content_type, body = armar_multipart(f"bench_subida_{indice}.bin", escenario['datos'])
+        headers['Content-Type'] = content_type
+    elif carga == 'download':
+        ruta = f"/download?archivo={escenario['archivo']}"
+
+    while True:
+        inicio = time.perf_counter()
+        if inicio >= fin:
+            break
+        try:
+            if carga == 'index':
+                conexion.request("GET", "/", headers=headers)
+            elif carga == 'download':
+                conexion.request("GET", ruta, headers=headers)
+            else:
+                conexion.request("POST", "/", body=body, headers=headers)
+            respuesta = conexion.getresponse()
+            recibidos = 0
+            while True:
+                leidos = respuesta.readinto(buffer)
+                if not leidos:
+                    break
+                recibidos += leidos
+            ok = 200 <= respuesta.status < 300
+        except (OSError, http.client.HTTPException):
+            conexion.close()
+            ok = False
+            recibidos = 0
+        duracion = time.perf_counter() - inicio
+        if inicio < fin_calentamiento:
+            continue
+        if not ok:
+            errores += 1
+            continue
+        latencias.append(duracion)
+        bytes_transferidos += len(body) if carga == 'upload' else recibidos
+
+    conexion.close()
+    resultados[indice] = (latencias, bytes_transferidos, errores)
+
+
+def correr_escenario(directorio, escenario, opciones):
+    """
+    Levanta un servidor nuevo, le aplica la carga del escenario y devuelve un dict con las mediciones.
+    """
+    argumentos = ['upload', '--concurrency', escenario['modo'], '--threads', str(opciones['hilos_servidor']),
+                  '--workers', str(escenario['workers'])]
+    if escenario['gzip']:
+        argumentos.append('--gzip')
+    if escenario['tls']:
+        argumentos += ['--tls', *opciones['certificado']]
+    argumentos += opciones['argumentos_servidor']
+
+    servidor = Servidor(directorio, argumentos)
+    servidor.iniciar()
+    handshakes = None
+    try:
+        if escenario['tls']:
+            handshakes = medir_handshakes(servidor.puerto, escenario['contexto_tls'])
+        concurrencia = escenario['concurrencia']
+        resultados = [None] * concurrencia
+        ahora = time.perf_counter()
+        fin_calentamiento = ahora + opciones['calentamiento']
+        fin = fin_calentamiento + opciones['duracion']
+
+        hilos = [threading.Thread(target=trabajador,
+                                  args=(servidor.puerto, escenario['carga'], escenario, fin_calentamiento, fin,
+                                        resultados, i))
+                 for i in range(concurrencia)]
+        for hilo in hilos:
+            hilo.start()
+
+        # Medir la CPU del servidor solo durante la parte medida (sin calentamiento)
+        time.sleep(max(0.0, fin_calentamiento - time.perf_counter()))
+        antes = leer_proc(servidor.proceso.pid)
+        for hilo in hilos:
+            hilo.join()
+        despues = leer_proc(servidor.proceso.pid)
+        duracion_real = time.perf_counter() - fin_calentamiento
+    finally:
+        servidor.detener()
+
+    latencias = sorted(latencia for resultado in resultados if resultado for latencia in resultado[0])
+    total_bytes = sum(resultado[1] for resultado in resultados if resultado)
+    errores = sum(resultado[2] for resultado in resultados if resultado)
+
+    medicion = {
+        'carga': escenario['carga'],
+        'tamaño': escenario['tamaño'],
+        'concurrencia': escenario['concurrencia'],
+        'gzip': escenario['gzip'],
+        'modo': escenario['modo'],
+        'workers': escenario['workers'],
+        'tls': escenario['tls'],
+        'handshake_tls': handshakes,
+        'requests': len(latencias),
+        'errores': errores,
+        'duracion': round(duracion_real, 3),
+        'requests_por_segundo': round(len(latencias) / duracion_real, 2),
+        'mb_por_segundo': round(total_bytes / duracion_real / (1024 * 1024), 3),
+        'latencia_ms': {
+            'p50': None if not latencias else round(percentil(latencias, 50) * 1000, 3),
+            'p95': None if not latencias else round(percentil(latencias, 95) * 1000, 3),
+            'p99': None if not latencias else round(percentil(latencias, 99) * 1000, 3),
+            'max': None if not latencias else round(latencias[-1] * 1000, 3),
+        },
+        'cpu_servidor_segundos': None,
+        'cpu_servidor_porcentaje': None,
+        'rss_servidor_mb': None,
+        'rss_pico_servidor_mb': None,
+    }
+    if antes is not None and despues is not None:
+        cpu = despues['cpu'] - antes['cpu']
+        medicion['cpu_servidor_segundos'] = round(cpu, 3)
+        medicion['cpu_servidor_porcentaje'] = round(100 * cpu / duracion_real, 1)
+        medicion['rss_servidor_mb'] = round(despues['rss'] / (1024 * 1024), 2)
+        medicion['rss_pico_servidor_mb'] = round(despues['rss_pico'] / (1024 * 1024), 2)
+    return medicion
+
+
+def armar_escenarios(opciones):
+    """Devuelve la lista de escenarios: todas las combinaciones de carga, tamaño, concurrencia, gzip, modo, workers y tls."""
+    escenarios = []
+    for carga in opciones['cargas']:
+        # La página principal no depende del tamaño de archivo
+        tamaños = [None] if carga == 'index' else opciones['tamaños']
+        for tamaño in tamaños:
+            for concurrencia in opciones['concurrencias']:
+                for gzip_activo in opciones['gzip']:
+                    for modo in opciones['modos']:
+                        for workers in opciones['workers']:
+                            for tls in opciones['tls']:
+                                escenarios.append({'carga': carga, 'tamaño': tamaño, 'concurrencia': concurrencia,
+                                                   'gzip': gzip_activo, 'modo': modo, 'workers': workers,
+                                                   'tls': tls})
+    return escenarios
+
+
+def version_codigo():
+    """Devuelve el commit actual del repositorio (o None si no es un repositorio git)."""
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORIO_REPO,
+                                capture_output=True, text=True, timeout=5)
+    except OSError:
+        return None
+    return salida.stdout.strip() or None
+
+
+def correr_benchmark(opciones):
+    """
+    Prepara el directorio de trabajo con los archivos de prueba, corre todos los escenarios
+    y devuelve el dict con los resultados (el que se guarda en JSON).
+    """
+    directorio = tempfile.mkdtemp(prefix="benchmark-servidor-")
+    try:
+        archivos = os.path.join(directorio, "archivos_servidor")
+        os.makedirs(archivos)
+        # Archivos extra para que el listado de la página principal tenga un tamaño realista
+        for i in range(opciones['archivos_listado']):
+            with open(os.path.join(archivos, f"relleno_{i:05d}.txt"), 'wb') as f:
+                f.write(b"x")
+
+        datos_por_tamaño = {}
+        for tamaño in opciones['tamaños']:
+            datos = generar_contenido(tamaño, opciones['contenido'], semilla=tamaño)
+            datos_por_tamaño[tamaño] = datos
+            with open(os.path.join(archivos, f"bench_{tamaño}.txt"), 'wb') as f:
+                f.write(datos)
+
+        contexto_tls = None
+        if True in opciones['tls']:
+            opciones['certificado'] = generar_certificado(directorio)
+            contexto_tls = ssl.create_default_context(cafile=opciones['certificado'][0])
+
+        resultados = []
+        escenarios = armar_escenarios(opciones)
+        for numero, escenario in enumerate(escenarios, 1):
+            if escenario['tamaño'] is not None:
+                escenario['archivo'] = f"bench_{escenario['tamaño']}.txt"
+                escenario['datos'] = datos_por_tamaño[escenario['tamaño']]
+            escenario['contexto_tls'] = contexto_tls
+            print(f"[{numero}/{len(escenarios)}] {escenario['carga']} tamaño={escenario['tamaño']} "
+                  f"concurrencia={escenario['concurrencia']} gzip={'on' if escenario['gzip'] else 'off'} "
+                  f"modo={escenario['modo']} workers={escenario['workers']} "
+                  f"tls={'on' if escenario['tls'] else 'off'}", flush=True)
+            medicion = correr_escenario(directorio, escenario, opciones)
+            print(f"    {medicion['requests_por_segundo']} req/s, {medicion['mb_por_segundo']} MB/s, "
+                  f"p50={medicion['latencia_ms']['p50']} ms, p99={medicion['latencia_ms']['p99']} ms, "
+                  f"errores={medicion['errores']}, cpu={medicion['cpu_servidor_porcentaje']}%", flush=True)
+            if medicion['handshake_tls'] is not None:
+                print(f"    handshake completo {medicion['handshake_tls']['completo_ms']} ms, "
+                      f"retomado {medicion['handshake_tls']['reanudado_ms']} ms "
+                      f"({medicion['handshake_tls']['reanudados']} retomados)", flush=True)
+            resultados.append(medicion)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    resumir_tls(resultados)
+    parametros = {clave: valor for clave, valor in opciones.items()
+                  if clave not in ('salida', 'comparar', 'certificado')}
+    return {
+        'version': version_codigo(),
+        'fecha': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'parametros': parametros,
+        'resultados': resultados,
+    }
+
+
+def resumir_tls(resultados):
+    """Imprime, para cada escenario medido con y sin TLS, cuánto cambian req/s y la CPU del servidor por segundo."""
+    sin_tls = {}
+    for medicion in resultados:
+        if not medicion['tls']:
+            sin_tls[(medicion['carga'], medicion['tamaño'], medicion['concurrencia'], medicion['gzip'],
+                     medicion['modo'], medicion['workers'])] = medicion
+    lineas = []
+    for medicion in resultados:
+        anterior = sin_tls.get((medicion['carga'], medicion['tamaño'], medicion['concurrencia'], medicion['gzip'],
+                                medicion['modo'], medicion['workers']))
+        if not medicion['tls'] or anterior is None or not anterior['requests_por_segundo']:
+            continue
+        cambio_rps = (medicion['requests_por_segundo'] / anterior['requests_por_segundo'] - 1) * 100
+        cpu_antes, cpu_ahora = anterior['cpu_servidor_porcentaje'], medicion['cpu_servidor_porcentaje']
+        lineas.append(f"  {medicion['carga']:8} tamaño={medicion['tamaño']} c={medicion['concurrencia']} "
+                      f"gzip={'on' if medicion['gzip'] else 'off'} {medicion['modo']:10} w={medicion['workers']} "
+                      f"req/s {anterior['requests_por_segundo']} -> {medicion['requests_por_segundo']} "
+                      f"({cambio_rps:+.1f}%)  cpu {cpu_antes}% -> {cpu_ahora}%")
+    if lineas:
+        print("Costo de TLS (sin -> con):")
+        print("\n".join(lineas))
+
+
+def comparar(ruta_base, ruta_actual):
+    """Imprime, para cada escenario presente en ambos archivos, cómo cambiaron throughput y latencia."""
+    with open(ruta_base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(ruta_actual, encoding='utf-8') as f:
+        actual = json.load(f)
+
+    def clave(medicion):
+        # Los resultados de antes de --workers y --tls son todos de un solo proceso y sin cifrar
+        return (medicion['carga'], medicion['tamaño'], medicion['concurrencia'], medicion['gzip'], medicion['modo'],
+                medicion.get('workers', 1), medicion.get('tls', False))
+
+    anteriores = {clave(medicion): medicion for medicion in base['resultados']}
+    print(f"Comparando {base.get('version')} -> {actual.get('version')}")
+    for medicion in actual['resultados']:
+        anterior = anteriores.get(clave(medicion))
+        if anterior is None:
+            continue
+        cambio_rps = (medicion['requests_por_segundo'] / anterior['requests_por_segundo'] - 1) * 100 \
+            if anterior['requests_por_segundo'] else float('nan')
+        p99_antes, p99_ahora = anterior['latencia_ms']['p99'], medicion['latencia_ms']['p99']
+        cambio_p99 = (p99_ahora / p99_antes - 1) * 100 if p99_antes and p99_ahora else float('nan')
+        carga, tamaño, concurrencia, gzip_activo, modo, workers, tls = clave(medicion)
+        print(f"  {carga:8} tamaño={tamaño} c={concurrencia} gzip={'on' if gzip_activo else 'off'} {modo:10} w={workers} "
+              f"tls={'on' if tls else 'off'} "
+              f"req/s {anterior['requests_por_segundo']} -> {medicion['requests_por_segundo']} ({cambio_rps:+.1f}%)  "
+              f"p99 {p99_antes} -> {p99_ahora} ms ({cambio_p99:+.1f}%)")
+
+
+def extraer_opcion(argumentos, nombre, defecto=None):
+    """Saca '--nombre valor' de argumentos y devuelve el valor (o defecto si no está)."""
+    if nombre not in argumentos:
+        return defecto
+    indice = argumentos.index(nombre)
+    if indice + 1 >= len(argumentos):
+        print(f"Error: {nombre} requiere un valor")
+        sys.exit(1)
+    valor = argumentos[indice + 1]
+    del argumentos[indice:indice + 2]
+    return valor
+
+
+def lista(texto):
+    return [parte.strip() for parte in texto.split(',') if parte.strip()]
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    if '-h' in argumentos or '--help' in argumentos:
+        print("Uso:")
+        print("  python3 benchmark.py [opciones]")
+        print("  python3 benchmark.py --compare base.json actual.json")
+        print("Opciones:")
+        print("  --workloads index,download,upload        Cargas a medir (por defecto todas)")
+        print("  --sizes 4K,1M,16M                        Tamaños de archivo para download/upload")
+        print("  --concurrency 1,8,32                     Conexiones concurrentes del cliente")
+        print("  --gzip off,on                            Escenarios sin y con compresión")
+        print("  --modes threads,async,sequential         Modos de concurrencia del servidor (por defecto threads)")
+        print("  --duration S                             Segundos medidos por escenario (por defecto 5)")
+        print("  --warmup S                               Segundos de calentamiento sin medir (por defecto 1)")
+        print("  --server-threads N                       Hilos del pool del servidor (por defecto 16)")
+        print("  --workers 1,4                            Procesos del servidor (--workers de codigo_base.py, por defecto 1)")
+        print("  --tls off,on                             Escenarios sin y con HTTPS (por defecto off; on requiere openssl)")
+        print("  --content texto|aleatorio                Contenido de los archivos (por defecto texto)")
+        print("  --listing-files N                        Archivos extra en el listado de la página (por defecto 100)")
+        print("  --server-args \"...\"                      Opciones extra para codigo_base.py")
+        print("  --output archivo.json                    Dónde guardar los resultados (por defecto benchmark.json)")
+        sys.exit(0)
+
+    if '--compare' in argumentos:
+        indice = argumentos.index('--compare')
+        if len(argumentos) < indice + 3:
+            print("Error: --compare requiere dos archivos JSON")
+            sys.exit(1)
+        comparar(argumentos[indice + 1], argumentos[indice + 2])
+        sys.exit(0)
+
+    try:
+        opciones = {
+            'cargas': lista(extraer_opcion(argumentos, '--workloads', ','.join(CARGAS))),
+            'tamaños': [parsear_tamaño(t) for t in lista(extraer_opcion(argumentos, '--sizes', '4K,1M,16M'))],
+            'concurrencias': [int(c) for c in lista(extraer_opcion(argumentos, '--concurrency', '1,8,32'))],
+            'gzip': [g == 'on' for g in lista(extraer_opcion(argumentos, '--gzip', 'off,on'))],
+            'modos': lista(extraer_opcion(argumentos, '--modes', 'threads')),
+            'workers': [int(w) for w in lista(extraer_opcion(argumentos, '--workers', '1'))],
+            'tls': [t == 'on' for t in lista(extraer_opcion(argumentos, '--tls', 'off'))],
+            'duracion': float(extraer_opcion(argumentos, '--duration', '5')),
+            'calentamiento': float(extraer_opcion(argumentos, '--warmup', '1')),
+            'hilos_servidor': int(extraer_opcion(argumentos, '--server-threads', '16')),
+            'contenido': extraer_opcion(argumentos, '--content', 'texto'),
+            'archivos_listado': int(extraer_opcion(argumentos, '--listing-files', '100')),
+            'argumentos_servidor': extraer_opcion(argumentos, '--server-args', '').split(),
+            'salida': extraer_opcion(argumentos, '--output', 'benchmark.json'),
+        }
+    except ValueError as e:
+        print(f"Error: valor inválido ({e})")
+        sys.exit(1)
+
+    if argumentos:
+        print(f"Opciones no reconocidas: {' '.join(argumentos)}")
+        sys.exit(1)
+    for carga in opciones['cargas']:
+        if carga not in CARGAS:
+            print(f"Error: carga desconocida '{carga}' (opciones: {', '.join(CARGAS)})")
+            sys.exit(1)
+    if opciones['contenido'] not in ('texto', 'aleatorio'):
+        print("Error: --content debe ser texto o aleatorio")
+        sys.exit(1)
+
+    resultado = correr_benchmark(opciones)
+    with open(opciones['salida'], 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"Resultados guardados en {opciones['salida']}")
@@ -1,71 +1,369 @@
 from socket import *
 import sys
 import os
-from urllib.parse import parse_qs, urlparse, unquote
-import qrcode
+from urllib.parse import parse_qs, urlparse, quote
+from html import escape
+import ipaddress
+import struct
+import ssl
 import mimetypes
-import gzip
 import time
+import tempfile
+import uuid
+import email.utils
+import hashlib
+import hmac
+import mmap
+import zlib
+import zipfile
+import tarfile
+from collections import OrderedDict
+import threading
+import contextvars
+import contextlib
+import json
+import copy
+import asyncio
+import signal
+import shutil
+import errno
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Codecs opcionales: si no están instalados solo se ofrece gzip
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+# ioctl para leer las direcciones de las interfaces (solo Unix); qrcode se importa recién al dibujar un QR
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Modos de concurrencia disponibles para start_server
+MODOS_CONCURRENCIA = ('sequential', 'threads', 'async')
+
+# Tamaño de los bloques para copiar archivos cuando no se puede usar sendfile
+TAMAÑO_BLOQUE = 256 * 1024
+
+# Lectura de requests: tamaño de cada recv y límites de la cabecera
+TAMAÑO_LECTURA = 64 * 1024
+MAX_TAMAÑO_CABECERA = 64 * 1024
+MAX_CANTIDAD_HEADERS = 100
+MAX_PARAMETROS_QUERY = 100
+
+# Máximo de buffers que se pasan en un mismo sendmsg (el kernel limita el tamaño del vector)
+MAX_PARTES_SENDMSG = 64
+
+# Frases de los códigos de estado que puede responder el servidor
+MENSAJES_ESTADO = {
+    200: 'OK',
+    201: 'Created',
+    206: 'Partial Content',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    409: 'Conflict',
+    411: 'Length Required',
+    413: 'Content Too Large',
+    415: 'Unsupported Media Type',
+    416: 'Range Not Satisfiable',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+# Tipos MIME que no vale la pena comprimir porque ya vienen comprimidos
+TIPOS_YA_COMPRIMIDOS = {
+    'application/pdf', 'application/zip', 'application/gzip', 'application/x-gzip',
+    'application/x-bzip2', 'application/x-xz', 'application/x-7z-compressed',
+    'application/x-rar-compressed', 'application/vnd.rar', 'application/zstd',
+    'application/java-archive', 'application/epub+zip',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+# Excepciones a las reglas por prefijo (image/, audio/...): formatos de texto o sin comprimir
+TIPOS_COMPRIMIBLES = {'image/svg+xml', 'image/bmp', 'image/x-ms-bmp', 'audio/wav', 'audio/x-wav'}
+
+# Compresión gzip por defecto: nivel (1-9), ventana (log2, 9-15) y tamaño a partir del cual
+# un archivo se comprime mientras se envía en lugar de comprimirlo entero antes
+NIVEL_GZIP = 6
+VENTANA_GZIP = 15
+UMBRAL_STREAMING_GZIP = 1024 * 1024
+
+# Codificaciones ofrecidas, en orden de preferencia del servidor cuando el cliente no distingue (mismo q)
+PREFERENCIA_CODECS = ['zstd', 'br', 'gzip']
+NIVEL_ZSTD = 3
+NIVEL_BROTLI = 5
+
+# Máximo de rangos aceptados en un header Range (con más se responde el archivo entero)
+MAX_RANGOS = 16
+
+# Cache de archivos calientes: memoria por defecto, tamaño hasta el que un archivo se copia a memoria
+# (los más grandes se mapean con mmap), tamaño máximo de un archivo mapeado (más grandes conviene
+# mandarlos con sendfile, que no los copia) y cuántas veces se tiene que pedir un archivo para que entre.
+# Cada VENTANA_FRECUENCIAS_CACHE pedidos las frecuencias se dividen por dos: pesa más lo reciente
+CACHE_ARCHIVOS_MB = 64
+UMBRAL_ARCHIVO_EN_MEMORIA = 1024 * 1024
+MAX_ARCHIVO_MAPEADO = 4 * 1024 * 1024
+MIN_FRECUENCIA_CACHE = 2
+VENTANA_FRECUENCIAS_CACHE = 1000
+
+# Listado de archivos de la página principal: órdenes posibles y tamaño de página
+ORDENES_INDICE = ('nombre', 'tamaño', 'fecha')
+POR_PAGINA_DEFECTO = 100
+MAX_POR_PAGINA = 1000
+# Cada cuántos segundos se mira si el directorio cambió por fuera del servidor
+REFRESCO_INDICE = 1.0
+
+# Protección contra sobrecarga: plazo para que llegue la cabecera completa una vez que empezó,
+# plazo sin ningún progreso al recibir un body o enviar una respuesta, velocidad promedio mínima de un
+# body pasado ese plazo (los clientes que mandan de a un byte se cortan), requests y bytes de subidas
+# en curso como mucho y cuántos segundos se le pide esperar (Retry-After) al que recibe un 503
+PLAZO_CABECERA = 10.0
+PLAZO_INACTIVIDAD = 30.0
+TASA_MINIMA_BODY = 1024
+MAX_REQUESTS_EN_CURSO = 256
+MAX_SUBIDAS_EN_CURSO_MB = 1024
+ESPERA_REINTENTO = 1
+# Porción de archivo por cada loop.sendfile cuando se vigila el plazo de envío (modo async)
+PORCION_VIGILADA = 1024 * 1024
+
+# TLS: protocolo que se anuncia por ALPN y opción de Linux para saber si el kernel cifra lo que se
+# manda por el socket (kTLS): en ese caso los archivos pueden salir con sendfile
+PROTOCOLOS_ALPN = ['http/1.1']
+SOL_TLS = 282
+TLS_TX = 1
+
+# Límites de ancho de banda: cuánto se manda o se recibe como mucho de una vez cuando hay un límite
+# (también es la ráfaga de los token buckets) y tamaño hasta el que una transferencia es chica y no
+# espera detrás de las grandes
+PORCION_LIMITADA = 64 * 1024
+UMBRAL_TRANSFERENCIA_CHICA = 128 * 1024
+
+# Métricas: límites (en segundos) de los histogramas y rutas que se distinguen en las etiquetas
+LIMITES_HISTOGRAMA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RUTAS_METRICAS = {'/', '/blob', '/download', '/download-bundle', '/list', '/metrics', '/upload-tar', '/uploads'}
+
+# Modo multiproceso (--workers): cada cuántos segundos publica cada worker sus métricas para
+# que /metrics las junte, cuánto se espera antes de reiniciar un worker que se cae enseguida
+# y cuánto más que el keep-alive se les da a los workers para cerrar antes de matarlos
+INTERVALO_METRICAS_WORKERS = 1.0
+ESPERA_REINICIO_WORKER = 1.0
+PLAZO_CIERRE_WORKERS = 5.0
+
+# Cliente (get/put): conexiones en paralelo, tamaño de los segmentos en que se baja un archivo grande
+# y cuántos archivos (y bytes) se suben como mucho en un mismo POST
+CONEXIONES_CLIENTE = 8
+TAMAÑO_SEGMENTO_CLIENTE = 8 * 1024 * 1024
+MAX_LOTE_CLIENTE = 500
+TAMAÑO_LOTE_CLIENTE = 8 * 1024 * 1024
+# Veces que el cliente vuelve a mandar lo que falta de una subida reanudable antes de darse por vencido
+INTENTOS_CLIENTE = 5
+
+# Subidas reanudables: dónde se guardan las sesiones (dentro de archivos_servidor), cuánto tiempo
+# sin recibir nada se conserva una sesión antes de borrarla al iniciar el servidor y tamaño máximo
+# de un archivo subido así (además tiene que entrar en el espacio libre del disco)
+DIRECTORIO_SESIONES = ".sesiones"
+VIGENCIA_SESIONES = 7 * 24 * 3600
+MAX_TAMAÑO_SESION = 1024 ** 4
+
+# Política de Cache-Control por defecto: los clientes pueden guardar la respuesta pero tienen que
+# revalidarla (con If-None-Match / If-Modified-Since) antes de usarla
+CACHE_CONTROL_DEFECTO = "no-cache"
+
+# Hashes SHA-256 ya calculados para los ETag por contenido: (ruta, inodo, tamaño, mtime) -> hex
+HASHES_CONTENIDO = OrderedDict()
+LOCK_HASHES = threading.Lock()
+MAX_HASHES_CONTENIDO = 4096
+
+# Códigos QR ya dibujados, uno por URL: así reiniciar el servidor no vuelve a importar qrcode ni a armar la matriz
+DIRECTORIO_QR = os.path.join(tempfile.gettempdir(), "servidor-archivos-qr")
+
+# Direcciones especiales de --bind: todas las interfaces IPv4, o IPv6 e IPv4 en un mismo socket (dual-stack)
+DIRECCIONES_BIND = {'all': '0.0.0.0', 'dual': '::'}
+
+# Interfaces que se prefieren para mostrar la URL (Wi-Fi, después cableadas); las virtuales van al final
+PREFIJOS_INTERFAZ = (('wl',), ('en', 'eth'))
+PREFIJOS_VIRTUALES = ('docker', 'br-', 'veth', 'virbr', 'vmnet', 'vboxnet', 'tun', 'tap', 'utun')
+# ioctl de Linux que devuelve la dirección IPv4 de una interfaz
+SIOCGIFADDR = 0x8915
 
 #FUNCIONES AUXILIARES
 
-def imprimir_qr_en_terminal(url):
+def dibujar_qr(url):
     """
-    Requiere: url: str, la URL a imprimir como QR
-    Ejecuta: imprime el QR de la URL en el terminal
-    Devuelve: None
+    Requiere: url: str, la URL a codificar
+    Devuelve: str con el QR dibujado con bloques (una línea por fila), o None si qrcode no está instalado
+    El dibujo se guarda en DIRECTORIO_QR: la próxima vez que se pida la misma URL no se importa qrcode.
     """
+    ruta = os.path.join(DIRECTORIO_QR, hashlib.blake2b(url.encode('utf-8'), digest_size=16).hexdigest() + ".txt")
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            return archivo.read()
+    except OSError:
+        pass
 
+    try:
+        import qrcode
+    except ImportError:
+        return None
     qr = qrcode.QRCode(border=1)
     qr.add_data(url)
     qr.make(fit=True)
     mat = qr.get_matrix()
     black = "██"
     white = "  "
+    dibujo = "\n".join("".join(black if cell else white for cell in row) for row in mat)
+
+    try:
+        os.makedirs(DIRECTORIO_QR, exist_ok=True)
+        fd, ruta_temporal = tempfile.mkstemp(prefix=".qr-", dir=DIRECTORIO_QR)
+        with os.fdopen(fd, 'w', encoding='utf-8') as archivo:
+            archivo.write(dibujo)
+        os.replace(ruta_temporal, ruta)
+    except OSError:
+        # Sin cache se vuelve a dibujar la próxima vez
+        pass
+    return dibujo
+
+
+def imprimir_qr_en_terminal(url):
+    """
+    Requiere: url: str, la URL a imprimir como QR
+    Ejecuta: imprime el QR de la URL en el terminal (o solo la URL si qrcode no está instalado)
+    Devuelve: None
+    """
+    dibujo = dibujar_qr(url)
     print()
-    for row in mat:
-        line = "".join(black if cell else white for cell in row)
-        print(line)
+    if dibujo is None:
+        print("(instalá qrcode para ver el código QR: pip install qrcode)")
+    else:
+        print(dibujo)
     print()
     print(url)
 
 
+def interfaces_locales():
+    """
+    Lista las direcciones de las interfaces de red de la máquina sin mandar nada por la red
+    (funciona sin conexión y sin ruta por defecto).
+    En Linux lee las IPv4 con ioctl y las IPv6 de /proc/net/if_inet6; en otros sistemas usa las
+    direcciones a las que resuelve el nombre de la máquina.
+    Devuelve: list de tuple (nombre de la interfaz, ip: str), sin las IPv6 de enlace local
+    """
+    direcciones = []
+    if fcntl is not None and sys.platform.startswith('linux'):
+        s = socket(AF_INET, SOCK_DGRAM)
+        try:
+            for _, nombre in if_nameindex():
+                try:
+                    datos = fcntl.ioctl(s.fileno(), SIOCGIFADDR, struct.pack('256s', nombre[:15].encode('utf-8')))
+                except OSError:
+                    # La interfaz no tiene IPv4 (o está caída)
+                    continue
+                direcciones.append((nombre, inet_ntoa(datos[20:24])))
+        finally:
+            s.close()
+        try:
+            with open('/proc/net/if_inet6', encoding='ascii') as archivo:
+                for linea in archivo:
+                    campos = linea.split()
+                    if len(campos) < 6:
+                        continue
+                    ip = ipaddress.IPv6Address(bytes.fromhex(campos[0]))
+                    if not ip.is_link_local:
+                        direcciones.append((campos[5], str(ip)))
+        except OSError:
+            pass
+    if not direcciones:
+        try:
+            for familia, _, _, _, direccion in getaddrinfo(gethostname(), None, 0, SOCK_STREAM):
+                ip = direccion[0]
+                if familia in (AF_INET, AF_INET6) and not ipaddress.ip_address(ip.split('%')[0]).is_link_local:
+                    direcciones.append(('?', ip))
+        except OSError:
+            pass
+    return direcciones
+
+
+def prioridad_interfaz(nombre, ip):
+    """Devuelve: int, menor cuanto más conviene mostrar esa dirección (ver PREFIJOS_INTERFAZ)."""
+    if ipaddress.ip_address(ip).is_loopback:
+        return len(PREFIJOS_INTERFAZ) + 2
+    if nombre.startswith(PREFIJOS_VIRTUALES):
+        return len(PREFIJOS_INTERFAZ) + 1
+    for prioridad, prefijos in enumerate(PREFIJOS_INTERFAZ):
+        if nombre.startswith(prefijos):
+            return prioridad
+    return len(PREFIJOS_INTERFAZ)
+
+
 def get_wifi_ip():
-    """Obtiene la IP local asociada a la interfaz de red"""
-    s = socket(AF_INET, SOCK_DGRAM)
-    try:
-        s.connect(("8.8.8.8", 80))
-        ip = s.getsockname()[0]
-    finally:
-        s.close()
-    return ip #Devuelve la IP como string
+    """
+    Obtiene la IP local asociada a la interfaz de red (Wi-Fi antes que cableada, las virtuales
+    como docker0 al final) sin salir a la red; sin ninguna interfaz conectada devuelve 127.0.0.1
+    """
+    candidatas = [(prioridad_interfaz(nombre, ip), ip) for nombre, ip in interfaces_locales() if ':' not in ip]
+    if not candidatas:
+        return '127.0.0.1'
+    return min(candidatas, key=lambda candidata: candidata[0])[1] #Devuelve la IP como string
+
+
+def urls_servidor(ip_server, puerto, esquema='http'):
+    """
+    Requiere: ip_server: str, la dirección donde escucha el servidor, puerto: int, esquema: 'http' o 'https'
+    Devuelve: list de str con las URLs para entrar al servidor: si escucha en todas las interfaces
+              ('0.0.0.0' o '::') una por cada dirección de la máquina, la más conveniente primero
+    """
+    if ip_server not in DIRECCIONES_BIND.values():
+        ips = [ip_server]
+    else:
+        candidatas = [(prioridad_interfaz(nombre, ip), ip) for nombre, ip in interfaces_locales()
+                      if ip_server == '::' or ':' not in ip]
+        candidatas.sort(key=lambda candidata: candidata[0])
+        # Las de loopback solo sirven si no hay otra
+        ips = [ip for _, ip in candidatas if not ipaddress.ip_address(ip).is_loopback]
+        ips = list(dict.fromkeys(ips)) or ['127.0.0.1']
+    return [f"{esquema}://[{ip}]:{puerto}" if ':' in ip else f"{esquema}://{ip}:{puerto}" for ip in ips]
 
-def parsear_headers_y_body(data):
+def parsear_headers_y_body(data, max_headers=None):
     """
     Separa los headers del body en un request HTTP.
-    Requiere: data: bytes, los datos completos del request HTTP
+    Requiere: data: bytes, los datos del request HTTP (al menos la cabecera completa),
+              max_headers: int o None, cantidad máxima de headers aceptada
     Devuelve: tuple (headers: dict, body: bytes), diccionario de headers y body en bytes
+    Solo se decodifica la cabecera: el body puede ser binario y las posiciones se calculan en bytes.
     """
-    # Decodificar para buscar el separador de headers/body
-    request_text = data.decode("utf-8", errors="ignore")
-    
     # Buscar el separador entre headers y body (\r\n\r\n o \n\n)
-    header_end = request_text.find("\r\n\r\n")
+    header_end = buscar_fin_headers(data)
     if header_end == -1:
-        header_end = request_text.find("\n\n")
-        header_text = request_text[:header_end]
-        body = data[header_end + 2:]
-    else:
-        header_text = request_text[:header_end]
-        body = data[header_end + 4:]  # +4 para saltar \r\n\r\n
-    
+        header_end = len(data)
+    header_text = data[:header_end].decode("utf-8", errors="replace")
+    body = data[header_end:]
+
     # Parsear los headers en un diccionario
     headers = {}
-    for line in header_text.split("\r\n")[1:]:  # [1:] para saltar la request line
+    cantidad = 0
+    for line in header_text.split("\n")[1:]:  # [1:] para saltar la request line
+        line = line.rstrip("\r")
         if ":" in line:
+            cantidad += 1
+            if max_headers is not None and cantidad > max_headers:
+                raise CabeceraInvalida(431, "demasiados headers")
             key, value = line.split(":", 1)
-            headers[key.strip().lower()] = value.strip()
-    
+            key = key.strip().lower()
+            value = value.strip()
+            # Un header repetido equivale a uno solo con los valores separados por comas
+            headers[key] = f"{headers[key]}, {value}" if key in headers else value
+
     return headers, body
 
 def extraer_boundary(headers):
@@ -87,51 +385,813 @@ def extraer_boundary(headers):
     boundary = boundary.strip('"').strip()
     return boundary
 
-def parsear_multipart(body, boundary):
-    try:
-        # Se divide el cuerpo por el boundary para luego poder extraer el nombre y contenido del archivo
-        parts = body.split(f'--{boundary}'.encode())
-        for part in parts:
-            if b'filename=' in part:
-                # Se extrae el nombre del archivo
-                filename_start = part.find(b'filename="') + len(b'filename="')
-                filename_end = part.find(b'"', filename_start)
-                filename = part[filename_start:filename_end].decode()
-
-                # Se extrae el contenido del archivo que arranca después de los headers
-                header_end = part.find(b'\r\n\r\n')
-                if header_end == -1:
-                    header_end = part.find(b'\n\n')
-                    content_start = header_end + 2
+class ParserMultipart:
+    """
+    Parser incremental de multipart/form-data (máquina de estados).
+    Recibe el body en pedazos con feed() y escribe cada archivo a un temporal dentro de
+    directorio_destino a medida que llega; cuando la parte termina lo renombra a su nombre
+    final con os.replace (atómico). El boundary se encuentra aunque quede partido entre
+    dos pedazos, así que la memoria usada no depende del tamaño de la subida.
+    Se guardan todas las partes que son archivos; los campos que no son archivos se descartan.
+    Con un AlmacenContenido cada archivo se hashea mientras llega y se guarda en el almacén.
+    """
+
+    PREAMBULO = 0
+    DELIMITADOR = 1
+    HEADERS = 2
+    CONTENIDO = 3
+    FIN = 4
+    ERROR = 5
+
+    # Límite para los headers de cada parte
+    MAX_HEADERS_PARTE = 16 * 1024
+
+    def __init__(self, boundary, directorio_destino, almacen=None):
+        self.delimitador = b"--" + boundary.encode('utf-8')
+        # Dentro del contenido el delimitador siempre viene precedido por CRLF
+        self.separador = b"\r\n" + self.delimitador
+        self.directorio_destino = directorio_destino
+        self.almacen = almacen
+        self.hash = None
+        self.estado = self.PREAMBULO
+        self.buffer = bytearray()
+        # Archivos ya guardados: lista de tuplas (filename, ruta, tamaño)
+        self.archivos = []
+        # Parte actual: archivo temporal abierto (None si la parte no es un archivo)
+        self.destino = None
+        self.ruta_temporal = None
+        self.filename = None
+        self.tamaño = 0
+
+    def feed(self, chunk):
+        """
+        Requiere: chunk: bytes-like, el siguiente pedazo del body
+        Ejecuta: avanza la máquina de estados y escribe a disco el contenido de los archivos
+        """
+        if self.estado in (self.FIN, self.ERROR):
+            return
+        self.buffer += chunk
+        try:
+            while self._avanzar():
+                pass
+        except Exception as e:
+            print(f"Error al parsear multipart: {e}")
+            self.abortar()
+            self.estado = self.ERROR
+
+    def _avanzar(self):
+        """Procesa lo que haya en el buffer para el estado actual. Devuelve True si puede seguir."""
+        buffer = self.buffer
+
+        if self.estado == self.PREAMBULO:
+            indice = buffer.find(self.delimitador)
+            if indice == -1:
+                # Conservar solo lo que podría ser el comienzo del delimitador
+                del buffer[:max(0, len(buffer) - len(self.delimitador) + 1)]
+                return False
+            del buffer[:indice + len(self.delimitador)]
+            self.estado = self.DELIMITADOR
+            return True
+
+        if self.estado == self.DELIMITADOR:
+            # Después del delimitador viene '--' (fin del multipart) o el fin de línea
+            if len(buffer) < 2:
+                return False
+            if buffer[:2] == b"--":
+                buffer.clear()
+                self.estado = self.FIN
+                return False
+            fin_linea = buffer.find(b"\n")
+            if fin_linea == -1:
+                if len(buffer) > 1024:
+                    raise ValueError("línea del delimitador demasiado larga")
+                return False
+            del buffer[:fin_linea + 1]
+            self.estado = self.HEADERS
+            return True
+
+        if self.estado == self.HEADERS:
+            fin = buscar_fin_headers(buffer)
+            if fin == -1:
+                if len(buffer) > self.MAX_HEADERS_PARTE:
+                    raise ValueError("headers de la parte demasiado largos")
+                return False
+            headers_parte = bytes(buffer[:fin])
+            del buffer[:fin]
+            self._iniciar_parte(headers_parte)
+            self.estado = self.CONTENIDO
+            return True
+
+        if self.estado == self.CONTENIDO:
+            indice = buffer.find(self.separador)
+            if indice == -1:
+                # Escribir todo salvo el final, que podría ser el comienzo del separador
+                seguros = len(buffer) - len(self.separador) + 1
+                if seguros > 0:
+                    self._escribir(buffer, seguros)
+                    del buffer[:seguros]
+                return False
+            self._escribir(buffer, indice)
+            del buffer[:indice + len(self.separador)]
+            self._terminar_parte()
+            self.estado = self.DELIMITADOR
+            return True
+
+        return False
+
+    def _iniciar_parte(self, headers_parte):
+        """Lee el filename de Content-Disposition y abre el temporal si la parte es un archivo."""
+        self.filename = None
+        self.tamaño = 0
+        texto = headers_parte.decode('utf-8', errors='replace')
+        inicio = texto.find('filename="')
+        if inicio == -1:
+            return
+        inicio += len('filename="')
+        fin = texto.find('"', inicio)
+        filename = texto[inicio:fin] if fin != -1 else ""
+        # Algunos navegadores mandan la ruta completa: quedarse solo con el nombre
+        filename = os.path.basename(filename.replace('\\', '/'))
+        if not nombre_archivo_valido(filename):
+            return
+        self.filename = filename
+        fd, self.ruta_temporal = tempfile.mkstemp(prefix=".subida-", suffix=".tmp", dir=self.directorio_destino)
+        self.destino = os.fdopen(fd, 'wb')
+        self.hash = hashlib.sha256() if self.almacen is not None else None
+
+    def _escribir(self, buffer, cantidad):
+        if self.destino is None or cantidad == 0:
+            return
+        inicio = time.perf_counter()
+        with memoryview(buffer) as vista:
+            self.destino.write(vista[:cantidad])
+            if self.hash is not None:
+                self.hash.update(vista[:cantidad])
+        sumar_tiempo('disco_escritura', inicio)
+        self.tamaño += cantidad
+
+    def _terminar_parte(self):
+        """Cierra el temporal y lo mueve a su nombre definitivo."""
+        if self.destino is None:
+            return
+        self.destino.close()
+        self.destino = None
+        # Un input sin archivo elegido llega con filename="" y ya se salteó: esto es un archivo (aunque esté vacío)
+        ruta_archivo = os.path.join(self.directorio_destino, self.filename)
+        if self.almacen is not None:
+            self.almacen.guardar(self.ruta_temporal, self.filename, self.hash.hexdigest())
+        else:
+            os.replace(self.ruta_temporal, ruta_archivo)
+        self.archivos.append((self.filename, ruta_archivo, self.tamaño))
+        self.ruta_temporal = None
+
+    def abortar(self):
+        """Descarta la parte que estaba a medio escribir."""
+        if self.destino is not None:
+            self.destino.close()
+            self.destino = None
+        if self.ruta_temporal is not None:
+            try:
+                os.remove(self.ruta_temporal)
+            except OSError:
+                pass
+            self.ruta_temporal = None
+
+    def finalizar(self):
+        """
+        Termina el parseo. Si el body llegó incompleto la última parte se descarta.
+        Devuelve: list de tuplas (filename, ruta, tamaño) con los archivos guardados
+        """
+        if self.estado != self.FIN:
+            self.abortar()
+        return self.archivos
+
+
+class ParserTar:
+    """
+    Extractor incremental de un archivo tar (ustar, GNU o pax), opcionalmente comprimido con gzip
+    o zstd (se reconoce por los primeros bytes). Igual que ParserMultipart recibe el body en pedazos
+    con feed() y escribe cada archivo a un temporal dentro de directorio_destino que se renombra al
+    completarse, así que nunca tiene el tar entero en memoria.
+    Los archivos se guardan con su nombre sin los directorios (directorio_destino es plano); los
+    directorios, links y archivos ocultos se saltean. Con un AlmacenContenido, igual que en
+    ParserMultipart, cada archivo se hashea mientras llega y se guarda en el almacén.
+    """
+
+    BLOQUE = 512
+    MAGIA_GZIP = b"\x1f\x8b"
+    MAGIA_ZSTD = b"\x28\xb5\x2f\xfd"
+    # Límite para los nombres largos (GNU) y los headers pax, que se juntan en memoria
+    MAX_METADATOS = 64 * 1024
+
+    def __init__(self, directorio_destino, almacen=None):
+        self.directorio_destino = directorio_destino
+        self.almacen = almacen
+        self.hash = None
+        # Compresión del tar ('gzip', 'zstd' o None), que se sabe al ver los primeros bytes
+        self.codificacion = None
+        self.descompresor = None
+        self.comienzo = bytearray()
+        self.buffer = bytearray()
+        # Archivos ya guardados: lista de tuplas (nombre, ruta, tamaño)
+        self.archivos = []
+        # Entrada actual: bytes de contenido y de relleno que faltan, y a dónde va el contenido
+        self.restantes = 0
+        self.relleno = 0
+        self.destino = None
+        self.ruta_temporal = None
+        self.nombre = None
+        self.tamaño = 0
+        self.metadatos = None
+        self.tipo_metadatos = None
+        # Nombre largo (GNU) y atributos pax que corresponden a la próxima entrada
+        self.nombre_largo = None
+        self.pax = {}
+        self.terminado = False
+        # Si algo falla: tuple (codigo, mensaje)
+        self.error = None
+
+    def feed(self, chunk):
+        """
+        Requiere: chunk: bytes-like, el siguiente pedazo del body
+        Ejecuta: descomprime si hace falta, avanza el parseo y escribe a disco el contenido de los archivos
+        """
+        if self.error is not None or self.terminado:
+            return
+        try:
+            if self.comienzo is not None:
+                self.comienzo += chunk
+                if len(self.comienzo) < len(self.MAGIA_ZSTD):
+                    return
+                chunk = bytes(self.comienzo)
+                self.comienzo = None
+                self._elegir_descompresor(chunk)
+            if self.codificacion is None:
+                self._procesar(chunk)
+            elif self.codificacion == 'zstd':
+                self.descompresor.write(chunk)
+            else:
+                self._descomprimir_gzip(chunk)
+        except Exception as e:
+            print(f"Error al extraer el tar: {e}")
+            self.abortar()
+            if self.error is None:
+                self.error = (400, str(e))
+
+    def _elegir_descompresor(self, comienzo):
+        if comienzo.startswith(self.MAGIA_GZIP):
+            self.codificacion = 'gzip'
+            self.descompresor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif comienzo.startswith(self.MAGIA_ZSTD):
+            if zstandard is None:
+                self.error = (415, "el servidor no tiene instalado zstandard")
+                raise ValueError(self.error[1])
+            # stream_writer va llamando a write() con la salida en pedazos de TAMAÑO_BLOQUE
+            self.codificacion = 'zstd'
+            self.descompresor = zstandard.ZstdDecompressor().stream_writer(self, write_size=TAMAÑO_BLOQUE)
+
+    def _descomprimir_gzip(self, chunk):
+        datos = bytes(chunk)
+        while datos and not self.terminado:
+            # max_length acota la memoria aunque el contenido se comprima muchísimo
+            self._procesar(self.descompresor.decompress(datos, TAMAÑO_BLOQUE))
+            datos = self.descompresor.unconsumed_tail
+            if self.descompresor.eof and self.descompresor.unused_data:
+                # gzip con varios miembros concatenados
+                datos = self.descompresor.unused_data
+                self.descompresor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def write(self, datos):
+        """Recibe la salida del descompresor de zstd (interfaz de archivo de stream_writer)."""
+        if not self.terminado:
+            self._procesar(datos)
+        return len(datos)
+
+    def _procesar(self, datos):
+        self.buffer += datos
+        while self._avanzar():
+            pass
+
+    def _avanzar(self):
+        """Procesa lo que haya en el buffer. Devuelve True si puede seguir."""
+        buffer = self.buffer
+        if self.terminado:
+            # Lo que viene después del fin del tar es relleno
+            buffer.clear()
+            return False
+
+        if self.restantes:
+            cantidad = min(self.restantes, len(buffer))
+            if cantidad == 0:
+                return False
+            self._escribir(buffer, cantidad)
+            del buffer[:cantidad]
+            self.restantes -= cantidad
+            if self.restantes:
+                return False
+            self._terminar_entrada()
+            return True
+
+        if self.relleno:
+            cantidad = min(self.relleno, len(buffer))
+            del buffer[:cantidad]
+            self.relleno -= cantidad
+            return self.relleno == 0
+
+        if len(buffer) < self.BLOQUE:
+            return False
+        cabecera = bytes(buffer[:self.BLOQUE])
+        del buffer[:self.BLOQUE]
+        self._iniciar_entrada(cabecera)
+        return True
+
+    @staticmethod
+    def _numero(campo):
+        """Campo numérico de la cabecera: octal en ASCII o, si no entra, binario (base 256, extensión GNU)."""
+        if campo[0] & 0x80:
+            return int.from_bytes(bytes([campo[0] & 0x7f]) + campo[1:], 'big')
+        texto = campo.strip(b"\0 ")
+        return int(texto, 8) if texto else 0
+
+    @staticmethod
+    def _texto(campo):
+        return campo.split(b"\0", 1)[0].decode('utf-8', errors='replace')
+
+    def _iniciar_entrada(self, cabecera):
+        """Lee la cabecera de una entrada y decide a dónde va su contenido."""
+        if cabecera.count(0) == self.BLOQUE:
+            # Un bloque de ceros marca el fin del tar
+            self.terminado = True
+            return
+        suma = sum(cabecera[:148]) + 8 * ord(' ') + sum(cabecera[156:])
+        try:
+            valida = self._numero(cabecera[148:156]) == suma
+        except ValueError:
+            valida = False
+        if not valida:
+            raise ValueError("la cabecera de una entrada del tar está dañada")
+
+        tipo = cabecera[156:157]
+        tamaño = self._numero(cabecera[124:136])
+        nombre = self._texto(cabecera[:100])
+        if cabecera[257:263] == b"ustar\0" and cabecera[345] != 0:
+            nombre = self._texto(cabecera[345:500]) + "/" + nombre
+
+        self.metadatos = None
+        self.tamaño = 0
+        if tipo in (b"L", b"x"):
+            if tamaño > self.MAX_METADATOS:
+                raise ValueError("metadatos del tar demasiado largos")
+            self.metadatos = bytearray()
+            self.tipo_metadatos = tipo
+        elif tipo not in (b"g", b"K"):
+            # Los atributos juntados hasta acá son de esta entrada
+            if self.nombre_largo is not None:
+                nombre = self.nombre_largo
+            nombre = self.pax.get('path', nombre)
+            if 'size' in self.pax:
+                tamaño = int(self.pax['size'])
+            self.nombre_largo = None
+            self.pax = {}
+            if tipo in (b"0", b"\0", b"7"):
+                self._abrir_destino(nombre)
+
+        self.restantes = tamaño
+        self.relleno = -tamaño % self.BLOQUE
+        if tamaño == 0:
+            self._terminar_entrada()
+
+    def _abrir_destino(self, nombre):
+        nombre = os.path.basename(nombre.replace('\\', '/'))
+        # Los ocultos se saltean: son temporales del servidor o basura como los ._ de macOS
+        if not nombre_archivo_valido(nombre):
+            return
+        self.nombre = nombre
+        fd, self.ruta_temporal = tempfile.mkstemp(prefix=".subida-", suffix=".tmp", dir=self.directorio_destino)
+        self.destino = os.fdopen(fd, 'wb')
+        self.hash = hashlib.sha256() if self.almacen is not None else None
+
+    def _escribir(self, buffer, cantidad):
+        if self.metadatos is not None:
+            self.metadatos += buffer[:cantidad]
+            return
+        if self.destino is None:
+            return
+        inicio = time.perf_counter()
+        with memoryview(buffer) as vista:
+            self.destino.write(vista[:cantidad])
+            if self.hash is not None:
+                self.hash.update(vista[:cantidad])
+        sumar_tiempo('disco_escritura', inicio)
+        self.tamaño += cantidad
+
+    def _terminar_entrada(self):
+        """Guarda los metadatos leídos o mueve el archivo terminado a su nombre definitivo."""
+        if self.metadatos is not None:
+            if self.tipo_metadatos == b"L":
+                self.nombre_largo = self._texto(bytes(self.metadatos))
+            else:
+                self.pax.update(self._parsear_pax(bytes(self.metadatos)))
+            self.metadatos = None
+            return
+        if self.destino is None:
+            return
+        self.destino.close()
+        self.destino = None
+        ruta_archivo = os.path.join(self.directorio_destino, self.nombre)
+        if self.almacen is not None:
+            self.almacen.guardar(self.ruta_temporal, self.nombre, self.hash.hexdigest())
+        else:
+            os.replace(self.ruta_temporal, ruta_archivo)
+        self.archivos.append((self.nombre, ruta_archivo, self.tamaño))
+        self.ruta_temporal = None
+
+    @staticmethod
+    def _parsear_pax(datos):
+        """Registros pax: 'LARGO clave=valor\\n', donde LARGO cuenta el registro entero."""
+        atributos = {}
+        while datos:
+            espacio = datos.index(b" ")
+            largo = int(datos[:espacio])
+            clave, _, valor = datos[espacio + 1:largo].rstrip(b"\n").partition(b"=")
+            atributos[clave.decode('utf-8', errors='replace')] = valor.decode('utf-8', errors='replace')
+            datos = datos[largo:]
+        return atributos
+
+    def abortar(self):
+        """Descarta la entrada que estaba a medio escribir."""
+        if self.destino is not None:
+            self.destino.close()
+            self.destino = None
+        if self.ruta_temporal is not None:
+            try:
+                os.remove(self.ruta_temporal)
+            except OSError:
+                pass
+            self.ruta_temporal = None
+
+    def finalizar(self):
+        """
+        Termina la extracción. Si el tar llegó cortado la última entrada se descarta y queda anotado en error.
+        Devuelve: list de tuplas (nombre, ruta, tamaño) con los archivos guardados
+        """
+        if not self.terminado:
+            self.abortar()
+            if self.error is None:
+                self.error = (400, "el tar llegó incompleto")
+        return self.archivos
+
+
+class AlmacenContenido:
+    """
+    Almacén por contenido para las subidas (--dedup): cada contenido distinto se guarda una sola vez
+    en directorio/.blobs/<2 primeros>/<sha256> y cada nombre de directorio es un hard link a su blob.
+    El resto del servidor (listado, descargas, sendfile) sigue viendo archivos comunes, pero el mismo
+    contenido subido muchas veces ocupa lugar una sola vez.
+    El índice nombre -> hash se arma al iniciar comparando inodos y se actualiza con cada subida; como
+    se verifica contra el inodo, un archivo reemplazado a mano simplemente deja de estar en el índice.
+    Los blobs que ya no tienen ningún nombre se borran al iniciar. Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.directorio_blobs = os.path.join(directorio, ".blobs")
+        # nombre -> (sha256, inodo del archivo)
+        self.nombres = {}
+        self.lock = threading.Lock()
+        os.makedirs(self.directorio_blobs, exist_ok=True)
+        # Sin hard links no hay almacén: mejor fallar acá que en cada subida
+        fd, prueba = tempfile.mkstemp(dir=self.directorio_blobs)
+        os.close(fd)
+        try:
+            os.link(prueba, prueba + ".link")
+            os.remove(prueba + ".link")
+        finally:
+            os.remove(prueba)
+        self.cargar()
+
+    def ruta_blob(self, digest):
+        return os.path.join(self.directorio_blobs, digest[:2], digest)
+
+    def cargar(self):
+        """Recorre los blobs (borrando los huérfanos) y reconstruye el índice de nombres."""
+        blobs = {}
+        for subdirectorio in os.scandir(self.directorio_blobs):
+            if not subdirectorio.is_dir():
+                continue
+            for entrada in os.scandir(subdirectorio.path):
+                stat = entrada.stat()
+                if stat.st_nlink <= 1:
+                    # Ningún nombre apunta a este contenido: todos se reemplazaron o borraron
+                    os.remove(entrada.path)
                 else:
-                    content_start = header_end + 4
+                    blobs[(stat.st_dev, stat.st_ino)] = entrada.name
+        nombres = {}
+        with os.scandir(self.directorio) as entradas:
+            for entrada in entradas:
+                if entrada.name.startswith('.') or not entrada.is_file():
+                    continue
+                stat = entrada.stat()
+                digest = blobs.get((stat.st_dev, stat.st_ino))
+                if digest is not None:
+                    nombres[entrada.name] = (digest, stat.st_ino)
+        with self.lock:
+            self.nombres = nombres
+
+    def tamaño(self, digest):
+        """Devuelve el tamaño del contenido con ese SHA-256, o None si no está en el almacén."""
+        try:
+            return os.stat(self.ruta_blob(digest)).st_size
+        except OSError:
+            return None
 
-                # El contenido va hasta el último CRLF antes del boundary
-                content_end = part.rfind(b'\r\n')
-                if content_end <= content_start:
-                    content_end = part.rfind(b'\n')
+    def hash_de(self, nombre, stat):
+        """
+        Requiere: nombre: str, stat: os.stat_result actual del archivo
+        Devuelve: str, el SHA-256 del archivo si es un nombre del almacén (sin leerlo), o None
+        """
+        with self.lock:
+            entrada = self.nombres.get(nombre)
+        if entrada is None or entrada[1] != stat.st_ino:
+            return None
+        return entrada[0]
 
-                file_content = part[content_start:content_end]
-                if filename and file_content:
-                    return filename, file_content
-        return None, None
-    except Exception as e:
-        print(f"Error al parsear multipart: {e}")
-        return None, None
+    def guardar(self, ruta_temporal, nombre, digest):
+        """
+        Termina una subida: su contenido pasa al almacén (si no estaba ya) y nombre queda apuntando a él.
+        Requiere: ruta_temporal: str, la subida completa; digest: str, su SHA-256 calculado mientras llegaba
+        """
+        ruta_blob = self.ruta_blob(digest)
+        os.makedirs(os.path.dirname(ruta_blob), exist_ok=True)
+        try:
+            os.link(ruta_temporal, ruta_blob)
+        except FileExistsError:
+            # El contenido ya estaba: la copia recién escrita sobra
+            pass
+        self.enlazar(digest, nombre)
+        os.remove(ruta_temporal)
+
+    def enlazar(self, digest, nombre):
+        """
+        Hace que nombre apunte al contenido digest (reemplazando lo que hubiera con ese nombre).
+        Devuelve: int, el tamaño del contenido, o None si el almacén no lo tiene
+        """
+        ruta_blob = self.ruta_blob(digest)
+        # Se crea el link con un nombre oculto y se renombra: el reemplazo es atómico
+        ruta_enlace = os.path.join(self.directorio, f".enlace-{uuid.uuid4().hex}")
+        try:
+            os.link(ruta_blob, ruta_enlace)
+        except FileNotFoundError:
+            return None
+        stat = os.stat(ruta_enlace)
+        os.replace(ruta_enlace, os.path.join(self.directorio, nombre))
+        with self.lock:
+            self.nombres[nombre] = (digest, stat.st_ino)
+        return stat.st_size
+
+
+def escribir_en(fd, datos, posicion):
+    """Escribe datos en el descriptor fd a partir de posicion (sin mover un puntero compartido)."""
+    vista = memoryview(datos)
+    while vista:
+        escritos = os.pwrite(fd, vista, posicion)
+        vista = vista[escritos:]
+        posicion += escritos
+
+
+def hash_archivo(ruta):
+    """Devuelve el SHA-256 (hex) del contenido de un archivo."""
+    h = hashlib.sha256()
+    buffer = bytearray(TAMAÑO_BLOQUE)
+    vista = memoryview(buffer)
+    with open(ruta, 'rb') as archivo:
+        while leidos := archivo.readinto(buffer):
+            h.update(vista[:leidos])
+    return h.hexdigest()
+
+
+def rangos_faltantes(rangos, tamaño):
+    """
+    Requiere: rangos: list de [inicio, fin) ordenados, tamaño: int
+    Devuelve: list de [inicio, fin) entre 0 y tamaño que no están en rangos
+    """
+    faltan = []
+    posicion = 0
+    for inicio, fin in rangos:
+        if inicio > posicion:
+            faltan.append([posicion, inicio])
+        posicion = max(posicion, fin)
+    if posicion < tamaño:
+        faltan.append([posicion, tamaño])
+    return faltan
+
+
+def es_id_sesion(valor):
+    """Devuelve True si valor tiene la forma de un id de sesión de subida (32 dígitos hexadecimales)."""
+    return len(valor) == 32 and all(c in '0123456789abcdef' for c in valor)
+
+
+class SesionSubida:
+    """
+    Subida reanudable: el contenido llega en fragmentos (PUT con offset, en cualquier orden y en
+    paralelo) a un archivo del tamaño final dentro de directorio/.sesiones/<id>/, y cada rango
+    recibido se anota en un log. Todo queda en disco, así que una subida cortada (o un reinicio del
+    servidor) se retoma mandando solo lo que falta.
+    - datos: el archivo que se va llenando
+    - estado.json: nombre, tamaño y SHA-256 esperado (no cambia)
+    - rangos.log: una línea 'inicio fin' por fragmento escrito; se agrega con O_APPEND, así que varios
+      hilos o workers pueden anotar a la vez sin pisarse
+    """
+
+    def __init__(self, directorio, id_sesion):
+        self.id = id_sesion
+        self.directorio_destino = directorio
+        self.directorio = os.path.join(directorio, DIRECTORIO_SESIONES, id_sesion)
+        with open(os.path.join(self.directorio, "estado.json"), encoding='utf-8') as archivo:
+            estado = json.load(archivo)
+        self.nombre = estado['nombre']
+        self.tamaño = estado['tamaño']
+        self.sha256 = estado.get('sha256')
+        self.ruta_datos = os.path.join(self.directorio, "datos")
+        self.ruta_rangos = os.path.join(self.directorio, "rangos.log")
+
+    @classmethod
+    def abrir(cls, directorio, id_sesion):
+        """Devuelve la sesión, o None si no existe (o id_sesion no es un id válido)."""
+        if not es_id_sesion(id_sesion):
+            return None
+        try:
+            return cls(directorio, id_sesion)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def crear(cls, directorio, nombre, tamaño, sha256=None):
+        """
+        Crea una sesión, o devuelve la que ya existe para el mismo archivo: con sha256 el id sale de
+        nombre, tamaño y hash, así un cliente que se reinició retoma su subida sin guardar nada.
+        Devuelve: tuple (SesionSubida, creada: bool)
+        """
+        if sha256:
+            id_sesion = hashlib.sha256(f"{nombre}\0{tamaño}\0{sha256}".encode('utf-8')).hexdigest()[:32]
+            existente = cls.abrir(directorio, id_sesion)
+            if existente is not None:
+                return existente, False
+        else:
+            id_sesion = uuid.uuid4().hex
+        base = os.path.join(directorio, DIRECTORIO_SESIONES)
+        os.makedirs(base, exist_ok=True)
+        # Se arma en un directorio temporal y se renombra: nunca se ve una sesión a medio crear
+        temporal = tempfile.mkdtemp(prefix=".nueva-", dir=base)
+        try:
+            with open(os.path.join(temporal, "estado.json"), 'w', encoding='utf-8') as archivo:
+                json.dump({'nombre': nombre, 'tamaño': tamaño, 'sha256': sha256, 'creada': time.time()}, archivo)
+            with open(os.path.join(temporal, "datos"), 'wb') as archivo:
+                # Archivo disperso del tamaño final: cada fragmento se escribe directo en su lugar
+                archivo.truncate(tamaño)
+            open(os.path.join(temporal, "rangos.log"), 'wb').close()
+        except BaseException:
+            # Por ejemplo EFBIG si el sistema de archivos no admite ese tamaño: no dejar el temporal
+            shutil.rmtree(temporal, ignore_errors=True)
+            raise
+        try:
+            os.rename(temporal, os.path.join(base, id_sesion))
+            creada = True
+        except OSError:
+            # Otro request creó la misma sesión al mismo tiempo
+            shutil.rmtree(temporal, ignore_errors=True)
+            creada = False
+        return cls(directorio, id_sesion), creada
+
+    def registrar(self, inicio, fin):
+        """
+        Anota que los bytes [inicio, fin) ya están escritos en datos.
+        Devuelve: bool, False si la sesión ya no existe (se borró o se completó mientras llegaban)
+        """
+        if fin <= inicio:
+            return True
+        try:
+            fd = os.open(self.ruta_rangos, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            return False
+        try:
+            os.write(fd, f"{inicio} {fin}\n".encode('ascii'))
+        finally:
+            os.close(fd)
+        return True
+
+    def rangos(self):
+        """Devuelve: list de [inicio, fin) recibidos, ordenados y sin solaparse."""
+        with open(self.ruta_rangos, 'rb') as archivo:
+            lineas = archivo.read().split(b"\n")
+        intervalos = []
+        for linea in lineas:
+            try:
+                inicio, fin = map(int, linea.split())
+            except ValueError:
+                continue
+            intervalos.append((inicio, fin))
+        intervalos.sort()
+        unidos = []
+        for inicio, fin in intervalos:
+            if unidos and inicio <= unidos[-1][1]:
+                unidos[-1][1] = max(unidos[-1][1], fin)
+            else:
+                unidos.append([inicio, fin])
+        return unidos
+
+    def faltantes(self, rangos=None):
+        """Devuelve: list de [inicio, fin) que todavía no llegaron."""
+        return rangos_faltantes(self.rangos() if rangos is None else rangos, self.tamaño)
+
+    def describir(self):
+        """Devuelve: dict con el estado de la sesión, para responder en JSON."""
+        rangos = self.rangos()
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'tamaño': self.tamaño,
+            'sha256': self.sha256,
+            'recibidos': rangos,
+            'faltan': sum(fin - inicio for inicio, fin in self.faltantes(rangos)),
+        }
+
+
+def limpiar_sesiones(directorio, vigencia=VIGENCIA_SESIONES):
+    """
+    Al iniciar el servidor: borra las sesiones de subida sin actividad hace más de vigencia segundos
+    y devuelve a su lugar las que quedaron a medio completar si el servidor se cortó.
+    """
+    base = os.path.join(directorio, DIRECTORIO_SESIONES)
+    if not os.path.isdir(base):
+        return
+    limite = time.time() - vigencia
+    for entrada in os.scandir(base):
+        if entrada.name.startswith(".completando-"):
+            id_sesion = entrada.name[len(".completando-"):]
+            if not os.path.exists(os.path.join(base, id_sesion)):
+                os.rename(entrada.path, os.path.join(base, id_sesion))
+                continue
+        try:
+            actividad = os.stat(os.path.join(entrada.path, "rangos.log")).st_mtime
+        except OSError:
+            actividad = entrada.stat().st_mtime
+        if actividad < limite:
+            shutil.rmtree(entrada.path, ignore_errors=True)
+
+
+class ReceptorFragmento:
+    """
+    Recibe el body de un PUT /uploads/<id>?offset=N y lo escribe en su lugar del archivo de la sesión.
+    Al terminar anota el rango escrito, aunque el body haya llegado cortado: lo recibido no se pierde.
+    """
 
-def generar_html_interfaz(modo, directorio_archivos="archivos_servidor"):
+    def __init__(self, sesion, offset):
+        self.sesion = sesion
+        self.offset = offset
+        self.escritos = 0
+        self.fd = os.open(sesion.ruta_datos, os.O_WRONLY)
+
+    def feed(self, chunk):
+        inicio = time.perf_counter()
+        escribir_en(self.fd, chunk, self.offset + self.escritos)
+        sumar_tiempo('disco_escritura', inicio)
+        self.escritos += len(chunk)
+
+    def finalizar(self):
+        """
+        Cierra el archivo y anota el rango escrito.
+        Devuelve: bool, False si la sesión desapareció mientras llegaba el fragmento (ver SesionSubida.registrar)
+        """
+        if self.fd is None:
+            return True
+        os.close(self.fd)
+        self.fd = None
+        return self.sesion.registrar(self.offset, self.offset + self.escritos)
+
+    def abortar(self):
+        self.finalizar()
+
+
+def generar_html_interfaz(modo, directorio_archivos="archivos_servidor", archivos=None, navegacion=""):
     """
     Genera el HTML de la interfaz principal:
     - Si modo == 'download': incluye un enlace o botón para descargar el archivo.
     - Si modo == 'upload': incluye un formulario para subir un archivo.
     - Si modo == 'both': incluye ambas funcionalidades.
+    archivos es la lista de tuplas (nombre, tamaño) a mostrar (si es None se lista directorio_archivos)
+    y navegacion es HTML extra que va después de la lista (paginado y orden).
     """
     # Obtener lista de archivos disponibles si el directorio existe
     archivos_disponibles = []
-    if os.path.exists(directorio_archivos):
+    if archivos is not None:
+        archivos_disponibles = archivos
+    elif os.path.exists(directorio_archivos):
         try:
-            archivos_disponibles = [f for f in os.listdir(directorio_archivos) 
-                                   if os.path.isfile(os.path.join(directorio_archivos, f))]
+            # Los archivos ocultos (por ejemplo subidas en curso) no se listan
+            archivos_disponibles = [(f, os.path.getsize(os.path.join(directorio_archivos, f)))
+                                    for f in os.listdir(directorio_archivos)
+                                    if not f.startswith('.') and os.path.isfile(os.path.join(directorio_archivos, f))]
         except:
             archivos_disponibles = []
     
@@ -169,7 +1229,7 @@ def generar_html_interfaz(modo, directorio_archivos="archivos_servidor"):
   <body>
     <h1>Subir archivo</h1>
     <form method="POST" enctype="multipart/form-data">
-      <input type="file" name="file" required>
+      <input type="file" name="file" multiple required>
       <input type="submit" value="Subir">
     </form>
   </body>
@@ -179,12 +1239,13 @@ def generar_html_interfaz(modo, directorio_archivos="archivos_servidor"):
     else:  # modo == 'both' o cualquier otro
         lista_archivos_html = ""
         if archivos_disponibles:
-            lista_archivos_html = "<h2>Archivos disponibles para descargar:</h2><ul>"
-            for archivo in archivos_disponibles:
-                lista_archivos_html += f'<li><a href="/download?archivo={archivo}">{archivo}</a></li>'
-            lista_archivos_html += "</ul>"
+            # Armar la lista con join (con miles de archivos los += repetidos se vuelven cuadráticos)
+            items = [f'<li><a href="/download?archivo={quote(nombre)}">{escape(nombre)}</a> '
+                     f'<span>{tamaño} bytes</span></li>' for nombre, tamaño in archivos_disponibles]
+            lista_archivos_html = "<h2>Archivos disponibles para descargar:</h2><ul>" + "".join(items) + "</ul>"
         else:
             lista_archivos_html = "<p>No hay archivos disponibles para descargar.</p>"
+        lista_archivos_html += navegacion
         
         return f"""
 <html>
@@ -209,7 +1270,7 @@ def generar_html_interfaz(modo, directorio_archivos="archivos_servidor"):
     
     <h2>Subir archivo</h2>
     <form method="POST" enctype="multipart/form-data">
-      <input type="file" name="file" required>
+      <input type="file" name="file" multiple required>
       <br>
       <input type="submit" value="Subir archivo">
     </form>
@@ -220,110 +1281,1454 @@ def generar_html_interfaz(modo, directorio_archivos="archivos_servidor"):
 """
 
 
-#CODIGO A COMPLETAR
-
-def manejar_descarga(archivo, request_line, headers=None, comprimir_gzip=False):
+class IndiceDirectorio:
     """
-    Genera una respuesta HTTP con el archivo solicitado. 
-    Si el archivo no existe debe devolver un error.
-    Debe incluir los headers: Content-Type, Content-Length y Content-Disposition.
-    Si comprimir_gzip=True y el cliente acepta gzip, comprime el contenido.
+    Índice en memoria de los archivos de un directorio, para no recorrerlo en cada GET /.
+    Guarda nombre -> (tamaño, mtime) y se mantiene al día con registrar() cuando se sube un archivo.
+    Si intervalo_revalidacion no es None, además se mira el mtime del directorio (a lo sumo una vez
+    cada intervalo_revalidacion segundos) y si cambió se vuelve a escanear: así también aparecen
+    los archivos copiados o borrados a mano.
+    Las listas ordenadas y las páginas ya renderizadas (con sus variantes comprimidas) se guardan
+    y se descartan con cada cambio. Es seguro usarlo desde varios hilos.
     """
-    # Verificar si el archivo existe
-    if archivo is None or not os.path.exists(archivo):
-        # Archivo no encontrado - devolver 404
-        response = b"HTTP/1.1 404 Not Found\r\n"
-        response += b"Content-Type: text/html\r\n"
-        response += b"Content-Length: 0\r\n"
-        response += b"\r\n"
-        return response
-    
-    try:
-        # Leer el archivo en modo binario
-        with open(archivo, 'rb') as f:
-            file_content = f.read()
-        
-        # Obtener el nombre del archivo para Content-Disposition
-        filename = os.path.basename(archivo)
-        
-        # Determinar el Content-Type usando mimetypes
-        content_type, _ = mimetypes.guess_type(archivo)
-        if content_type is None:
-            content_type = 'application/octet-stream'  # Tipo por defecto para archivos desconocidos
-        
-        # Verificar si el cliente acepta compresión gzip
-        acepta_gzip = False
-        if comprimir_gzip and headers:
-            accept_encoding = headers.get('accept-encoding', '')
-            if 'gzip' in accept_encoding.lower():
-                acepta_gzip = True
-        
-        # Comprimir el contenido si está habilitado y el cliente lo acepta
-        usar_gzip = comprimir_gzip and acepta_gzip
-        if usar_gzip:
-            file_content = gzip.compress(file_content)
-        
-        # Obtener el tamaño del archivo (Content-Length) después de comprimir
-        content_length = len(file_content)
-        
-        # Construir la respuesta HTTP
-        response = b"HTTP/1.1 200 OK\r\n"
-        response += f"Content-Type: {content_type}\r\n".encode('utf-8')
-        if usar_gzip:
-            response += b"Content-Encoding: gzip\r\n"
-        response += f"Content-Length: {content_length}\r\n".encode('utf-8')
-        response += f'Content-Disposition: attachment; filename="{filename}"\r\n'.encode('utf-8')
-        response += b"\r\n"  # Línea vacía que separa headers del body
-        response += file_content  # Contenido del archivo (comprimido o no)
-        
-        return response
-    
-    except Exception as e:
-        # Error al leer el archivo -> devolver 500
-        print(f"Error al leer el archivo: {e}")
-        response = b"HTTP/1.1 500 Internal Server Error\r\n"
-        response += b"Content-Type: text/html\r\n"
-        response += b"Content-Length: 0\r\n"
-        response += b"\r\n"
-        return response
+
+    def __init__(self, directorio, intervalo_revalidacion=REFRESCO_INDICE, max_paginas=256):
+        self.directorio = directorio
+        self.intervalo_revalidacion = intervalo_revalidacion
+        self.max_paginas = max_paginas
+        self.archivos = {}
+        # version aumenta con cada cambio; modificado es la fecha del último cambio (para Last-Modified)
+        self.version = 0
+        self.modificado = None
+        self.mtime_directorio = None
+        self.ultima_revision = time.monotonic()
+        self.ordenados = {}
+        self.paginas = OrderedDict()
+        self.lock = threading.Lock()
+        self.escanear()
+
+    def escanear(self):
+        """Recorre el directorio completo (os.scandir) y reemplaza el índice."""
+        archivos = {}
+        try:
+            # El mtime se toma antes de recorrer: si algo cambia durante el recorrido, la próxima revisión lo ve
+            mtime_directorio = os.stat(self.directorio).st_mtime_ns
+            with os.scandir(self.directorio) as entradas:
+                for entrada in entradas:
+                    # Los archivos ocultos (por ejemplo subidas en curso) no se listan
+                    if entrada.name.startswith('.'):
+                        continue
+                    try:
+                        if entrada.is_file():
+                            stat = entrada.stat()
+                            archivos[entrada.name] = (stat.st_size, stat.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            mtime_directorio = None
+        with self.lock:
+            self.archivos = archivos
+            self.mtime_directorio = mtime_directorio
+            self._cambio(mtime_directorio / 1e9 if mtime_directorio is not None else None)
+
+    def revisar(self):
+        """Vuelve a escanear si el mtime del directorio cambió (como mucho una vez por intervalo)."""
+        if self.intervalo_revalidacion is None:
+            return
+        ahora = time.monotonic()
+        if ahora - self.ultima_revision < self.intervalo_revalidacion:
+            return
+        self.ultima_revision = ahora
+        try:
+            mtime_directorio = os.stat(self.directorio).st_mtime_ns
+        except OSError:
+            mtime_directorio = None
+        if mtime_directorio != self.mtime_directorio:
+            self.escanear()
+
+    def registrar(self, nombre):
+        """Agrega (o actualiza) un archivo recién guardado sin volver a recorrer el directorio."""
+        try:
+            stat = os.stat(os.path.join(self.directorio, nombre))
+            mtime_directorio = os.stat(self.directorio).st_mtime_ns
+        except OSError:
+            return
+        with self.lock:
+            self.archivos[nombre] = (stat.st_size, stat.st_mtime)
+            # El cambio de mtime del directorio ya está reflejado: que revisar() no vuelva a escanear
+            self.mtime_directorio = mtime_directorio
+            self._cambio(time.time())
+
+    def _cambio(self, modificado):
+        # Se llama con el lock tomado
+        self.version += 1
+        self.modificado = modificado
+        self.ordenados.clear()
+        self.paginas.clear()
+
+    def listar(self, orden='nombre', descendente=False):
+        """
+        Requiere: orden: uno de ORDENES_INDICE, descendente: bool
+        Devuelve: list de tuplas (nombre, tamaño) ordenada; se ordena una sola vez por versión
+        """
+        with self.lock:
+            clave = (orden, descendente)
+            lista = self.ordenados.get(clave)
+            if lista is None:
+                archivos = self.archivos
+                if orden == 'tamaño':
+                    nombres = sorted(archivos, key=lambda nombre: (archivos[nombre][0], nombre), reverse=descendente)
+                elif orden == 'fecha':
+                    nombres = sorted(archivos, key=lambda nombre: (archivos[nombre][1], nombre), reverse=descendente)
+                else:
+                    nombres = sorted(archivos, key=str.lower, reverse=descendente)
+                lista = [(nombre, archivos[nombre][0]) for nombre in nombres]
+                self.ordenados[clave] = lista
+            return lista
+
+    def obtener_pagina(self, clave):
+        """Devuelve lo guardado con guardar_pagina para clave en la versión actual, o None."""
+        with self.lock:
+            pagina = self.paginas.get(clave)
+            if pagina is not None:
+                self.paginas.move_to_end(clave)
+            return pagina
+
+    def guardar_pagina(self, clave, version, pagina):
+        """Guarda una página renderizada, salvo que el índice haya cambiado mientras se generaba."""
+        with self.lock:
+            if version != self.version:
+                return
+            self.paginas[clave] = pagina
+            while len(self.paginas) > self.max_paginas:
+                self.paginas.popitem(last=False)
 
 
-def manejar_carga(body, boundary, directorio_destino="."):
+def parametros_indice(query_params, por_pagina_defecto=POR_PAGINA_DEFECTO):
     """
-    Procesa un POST con multipart/form-data, guarda el archivo y devuelve una página de confirmación.
+    Requiere: query_params: dict con los parámetros de la URL (pagina, por_pagina, orden, dir)
+    Devuelve: tuple (pagina, por_pagina, orden, descendente) con valores válidos
     """
-    try:
-        # Parsear el multipart para extraer el nombre del archivo y su contenido
-        filename, file_content = parsear_multipart(body, boundary)
-        
-        # Verificar que se pudo extraer el archivo correctamente
-        if filename is None or file_content is None:
-            # No se pudo parsear el archivo -> devolver 400 Bad Request
-            error_html = """
-            <html>
+    def entero(nombre, defecto):
+        try:
+            return int(query_params.get(nombre, defecto))
+        except ValueError:
+            return defecto
+
+    pagina = max(1, entero('pagina', 1))
+    por_pagina = min(max(1, entero('por_pagina', por_pagina_defecto)), MAX_POR_PAGINA)
+    orden = query_params.get('orden', 'nombre')
+    if orden == 'tamano':
+        orden = 'tamaño'
+    if orden not in ORDENES_INDICE:
+        orden = 'nombre'
+    descendente = query_params.get('dir', 'asc') == 'desc'
+    return pagina, por_pagina, orden, descendente
+
+
+def generar_navegacion_indice(pagina, total_paginas, por_pagina, orden, descendente):
+    """Devuelve el HTML con los enlaces para cambiar de página y de orden del listado."""
+    def enlace(texto, pagina_destino, orden_destino, descendente_destino):
+        href = (f"/?pagina={pagina_destino}&amp;por_pagina={por_pagina}"
+                f"&amp;orden={quote(orden_destino)}&amp;dir={'desc' if descendente_destino else 'asc'}")
+        return f'<a href="{href}">{texto}</a>'
+
+    partes = ['<p class="navegacion">Ordenar por: ']
+    for orden_destino in ORDENES_INDICE:
+        # Volver a elegir el orden actual lo invierte
+        invertir = orden_destino == orden and not descendente
+        partes.append(enlace(orden_destino, 1, orden_destino, invertir) + " ")
+    partes.append("</p>")
+    if total_paginas > 1:
+        partes.append(f'<p class="navegacion">Página {pagina} de {total_paginas} ')
+        if pagina > 1:
+            partes.append(enlace("« Anterior", pagina - 1, orden, descendente) + " ")
+        if pagina < total_paginas:
+            partes.append(enlace("Siguiente »", pagina + 1, orden, descendente))
+        partes.append("</p>")
+    return "".join(partes)
+
+
+#CODIGO A COMPLETAR
+
+def es_comprimible(content_type):
+    """
+    Requiere: content_type: str, el tipo MIME del contenido
+    Devuelve: bool, False para formatos que ya vienen comprimidos (comprimirlos gasta CPU sin achicarlos)
+    """
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type in TIPOS_COMPRIMIBLES:
+        return True
+    if content_type.startswith(('image/', 'video/', 'audio/', 'font/woff')):
+        return False
+    return content_type not in TIPOS_YA_COMPRIMIDOS
+
+
+class CacheComprimidos:
+    """
+    Cache LRU de variantes comprimidas con un presupuesto máximo de bytes.
+    Las claves de los archivos incluyen ruta, mtime y tamaño, así que si el archivo
+    cambia la variante vieja nunca se vuelve a usar (y termina saliendo por LRU).
+    Si usar_sidecar=True, las variantes de archivos también se guardan en disco en
+    <directorio>/.comprimidos/<nombre>.gz y sobreviven a un reinicio del servidor.
+    Cada variante la comprime un solo request a la vez (ver reservar).
+    Es seguro usarla desde varios hilos.
+    """
+
+    def __init__(self, max_bytes, usar_sidecar=False):
+        self.max_bytes = max_bytes
+        self.usar_sidecar = usar_sidecar
+        self.entradas = OrderedDict()
+        self.bytes_usados = 0
+        self.en_curso = set()
+        self.lock = threading.Lock()
+
+    def reservar(self, clave):
+        """
+        Marca que un request empieza a comprimir la variante clave.
+        Devuelve: False si otro ya la está comprimiendo (conviene no repetir el trabajo)
+        """
+        with self.lock:
+            if clave in self.en_curso:
+                return False
+            self.en_curso.add(clave)
+            return True
+
+    def liberar(self, clave):
+        """Termina la reserva de reservar (haya terminado bien o no la compresión)."""
+        with self.lock:
+            self.en_curso.discard(clave)
+
+    def obtener(self, clave):
+        """Devuelve la variante guardada para clave (y la marca como recién usada), o None."""
+        with self.lock:
+            datos = self.entradas.get(clave)
+            if datos is not None:
+                self.entradas.move_to_end(clave)
+            return datos
+
+    def guardar(self, clave, datos):
+        """Guarda la variante, desalojando las menos usadas hasta que entre en el presupuesto."""
+        if len(datos) > self.max_bytes:
+            return
+        with self.lock:
+            anterior = self.entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes_usados -= len(anterior)
+            while self.entradas and self.bytes_usados + len(datos) > self.max_bytes:
+                _, desalojado = self.entradas.popitem(last=False)
+                self.bytes_usados -= len(desalojado)
+            self.entradas[clave] = datos
+            self.bytes_usados += len(datos)
+
+
+def ruta_sidecar(ruta, extension):
+    """Devuelve la ruta del archivo comprimido guardado en disco para ruta (en un directorio oculto)."""
+    directorio, nombre = os.path.split(ruta)
+    return os.path.join(directorio, ".comprimidos", nombre + extension)
+
+
+def leer_sidecar(ruta, stat, extension):
+    """
+    Devuelve el contenido del sidecar si corresponde a esta versión del archivo, o None.
+    El sidecar se escribe con el mismo mtime que el original, así que si no coincide está desactualizado.
+    """
+    ruta_comprimida = ruta_sidecar(ruta, extension)
+    inicio = time.perf_counter()
+    try:
+        with open(ruta_comprimida, 'rb') as f:
+            if os.fstat(f.fileno()).st_mtime_ns != stat.st_mtime_ns:
+                return None
+            return f.read()
+    except OSError:
+        return None
+    finally:
+        sumar_tiempo('disco_lectura', inicio)
+
+
+def escribir_sidecar(ruta, stat, extension, datos):
+    """Guarda la variante comprimida en disco (temporal + os.replace, así nunca queda uno a medias)."""
+    ruta_comprimida = ruta_sidecar(ruta, extension)
+    inicio = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(ruta_comprimida), exist_ok=True)
+        fd, ruta_temporal = tempfile.mkstemp(prefix=".sidecar-", dir=os.path.dirname(ruta_comprimida))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(datos)
+        os.utime(ruta_temporal, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(ruta_temporal, ruta_comprimida)
+    except OSError as e:
+        print(f"No se pudo guardar el sidecar comprimido de {ruta}: {e}")
+    finally:
+        sumar_tiempo('disco_escritura', inicio)
+
+
+class CompresorBrotli:
+    """Adapta brotli.Compressor a la interfaz compress()/flush() de zlib."""
+
+    def __init__(self, nivel):
+        self.compresor = brotli.Compressor(quality=nivel)
+
+    def compress(self, datos):
+        return self.compresor.process(bytes(datos))
+
+    def flush(self):
+        return self.compresor.finish()
+
+
+def crear_compresor_gzip(nivel, compresion):
+    # wbits = 16 + ventana le indica a zlib que escriba header y trailer gzip
+    return zlib.compressobj(nivel, zlib.DEFLATED, 16 + compresion.get('ventana', VENTANA_GZIP))
+
+
+def crear_compresor_zstd(nivel, compresion):
+    return zstandard.ZstdCompressor(level=nivel).compressobj()
+
+
+def crear_compresor_brotli(nivel, compresion):
+    return CompresorBrotli(nivel)
+
+
+# Registro de codificaciones de contenido (Content-Encoding). Cada codec tiene la extensión
+# de su sidecar, el nivel por defecto y una función (nivel, compresion) -> objeto con
+# compress()/flush(). zstd y brotli solo se registran si sus módulos están instalados.
+CODECS = {}
+
+
+def registrar_codec(nombre, extension, nivel_defecto, crear_compresor):
+    """Agrega una codificación al registro de codecs disponibles."""
+    CODECS[nombre] = {
+        'extension': extension,
+        'nivel': nivel_defecto,
+        'crear_compresor': crear_compresor,
+    }
+
+
+registrar_codec('gzip', '.gz', NIVEL_GZIP, crear_compresor_gzip)
+if zstandard is not None:
+    registrar_codec('zstd', '.zst', NIVEL_ZSTD, crear_compresor_zstd)
+if brotli is not None:
+    registrar_codec('br', '.br', NIVEL_BROTLI, crear_compresor_brotli)
+
+
+def codecs_disponibles(pedidos=None):
+    """
+    Requiere: pedidos: list de nombres de codecs en orden de preferencia, o None para todos
+    Devuelve: list con los codecs pedidos que están registrados, en orden de preferencia del servidor
+    """
+    if pedidos is None:
+        pedidos = PREFERENCIA_CODECS
+    return [nombre for nombre in pedidos if nombre in CODECS]
+
+
+def parsear_accept_encoding(valor):
+    """
+    Requiere: valor: str, el header Accept-Encoding
+    Devuelve: dict codificación -> q (entre 0 y 1), con los nombres en minúsculas
+    """
+    preferencias = {}
+    for item in valor.split(','):
+        nombre, _, parametros = item.partition(';')
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        if nombre == 'x-gzip':
+            nombre = 'gzip'
+        q = 1.0
+        for parametro in parametros.split(';'):
+            clave, _, valor_q = parametro.partition('=')
+            if clave.strip().lower() == 'q':
+                try:
+                    q = min(max(float(valor_q), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0
+        preferencias[nombre] = q
+    return preferencias
+
+
+def negociar_codificacion(headers, compresion):
+    """
+    Elige la codificación de la respuesta según el Accept-Encoding del cliente.
+    Gana el codec con mayor q; si empatan, el primero en el orden de preferencia del servidor.
+    Requiere: headers: dict con claves en minúsculas, compresion: dict con la lista 'codecs' habilitados
+    Devuelve: str, el nombre del codec, o None si hay que mandar el contenido sin comprimir (identity)
+    """
+    if 'accept-encoding' not in headers:
+        return None
+    preferencias = parsear_accept_encoding(headers['accept-encoding'])
+    comodin = preferencias.get('*', 0.0)
+    elegido = None
+    mejor_q = 0.0
+    for nombre in compresion.get('codecs', ['gzip']):
+        q = preferencias.get(nombre, comodin)
+        if q > mejor_q:
+            elegido, mejor_q = nombre, q
+    return elegido
+
+
+def crear_compresor(codec, compresion):
+    """
+    Requiere: codec: str, nombre registrado en CODECS, compresion: dict con los niveles por codec o None
+    Devuelve: un objeto con compress(datos) y flush()
+    """
+    if compresion is None:
+        compresion = {}
+    nivel = compresion.get('niveles', {}).get(codec, CODECS[codec]['nivel'])
+    return CODECS[codec]['crear_compresor'](nivel, compresion)
+
+
+def comprimir_datos(datos, codec, compresion):
+    """Comprime datos en memoria con el codec y el nivel configurados."""
+    inicio = time.perf_counter()
+    compresor = crear_compresor(codec, compresion)
+    comprimido = compresor.compress(datos) + compresor.flush()
+    sumar_tiempo('compresion', inicio)
+    sumar_compresion(codec, len(datos), len(comprimido))
+    return comprimido
+
+
+def buscar_variante(ruta, stat, cache, codec):
+    """
+    Devuelve la variante ya comprimida con codec para esta versión del archivo
+    (de la cache o del sidecar), o None.
+    """
+    if cache is None:
+        return None
+    clave = (ruta, stat.st_mtime_ns, stat.st_size, codec)
+    datos = cache.obtener(clave)
+    if datos is None and cache.usar_sidecar:
+        datos = leer_sidecar(ruta, stat, CODECS[codec]['extension'])
+        if datos is not None:
+            cache.guardar(clave, datos)
+    return datos
+
+
+def comprimir_archivo(ruta, archivo, stat, cache, codec, compresion=None):
+    """
+    Devuelve el contenido de un archivo comprimido con codec, reutilizando la variante de la cache
+    (o del sidecar en disco) si ya se comprimió esta misma versión del archivo.
+    Requiere: ruta: str, archivo: archivo abierto en modo binario, stat: os.stat_result del archivo,
+              cache: CacheComprimidos o None, codec: str, compresion: dict con niveles y ventana o None
+    """
+    datos = buscar_variante(ruta, stat, cache, codec)
+    if datos is not None:
+        return datos
+
+    inicio = time.perf_counter()
+    contenido = archivo.read()
+    sumar_tiempo('disco_lectura', inicio)
+    datos = comprimir_datos(contenido, codec, compresion)
+    if cache is not None:
+        if cache.usar_sidecar:
+            escribir_sidecar(ruta, stat, CODECS[codec]['extension'], datos)
+        cache.guardar((ruta, stat.st_mtime_ns, stat.st_size, codec), datos)
+    return datos
+
+
+class PartesReservadas:
+    """
+    Itera las partes de un generador y, al terminar o al cerrarse (aunque no se haya empezado a
+    iterar), libera la reserva de la variante en CacheComprimidos.
+    """
+
+    def __init__(self, partes, cache, clave):
+        self.partes = partes
+        self.cache = cache
+        self.clave = clave
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.partes)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        self.partes.close()
+        if self.cache is not None:
+            self.cache.liberar(self.clave)
+            self.cache = None
+
+
+def generar_comprimido_por_partes(ruta, archivo, stat, cache, codec, compresion=None):
+    """
+    Generador que lee el archivo por bloques y va devolviendo los pedazos comprimidos,
+    así el primer byte sale enseguida y la memoria usada no depende del tamaño del archivo.
+    Si el resultado completo entra en la cache (y se llega al final) se guarda para los
+    próximos requests; con sidecar activado también se va escribiendo en disco.
+    Cierra el archivo al terminar (o si se cierra el generador antes de tiempo).
+    """
+    compresor = crear_compresor(codec, compresion)
+    extension = CODECS[codec]['extension']
+    guardados = [] if cache is not None else None
+    total_guardado = 0
+    sidecar = None
+    ruta_temporal = None
+    completo = False
+    try:
+        if cache is not None and cache.usar_sidecar:
+            ruta_comprimida = ruta_sidecar(ruta, extension)
+            os.makedirs(os.path.dirname(ruta_comprimida), exist_ok=True)
+            fd, ruta_temporal = tempfile.mkstemp(prefix=".sidecar-", dir=os.path.dirname(ruta_comprimida))
+            sidecar = os.fdopen(fd, 'wb')
+
+        buffer = bytearray(TAMAÑO_BLOQUE)
+        vista = memoryview(buffer)
+        while True:
+            inicio = time.perf_counter()
+            leidos = archivo.readinto(buffer)
+            sumar_tiempo('disco_lectura', inicio)
+            inicio = time.perf_counter()
+            if leidos:
+                comprimido = compresor.compress(vista[:leidos])
+            else:
+                comprimido = compresor.flush()
+            sumar_tiempo('compresion', inicio)
+            sumar_compresion(codec, leidos, len(comprimido))
+            if comprimido:
+                if sidecar is not None:
+                    inicio = time.perf_counter()
+                    sidecar.write(comprimido)
+                    sumar_tiempo('disco_escritura', inicio)
+                if guardados is not None:
+                    total_guardado += len(comprimido)
+                    if total_guardado > cache.max_bytes:
+                        # No va a entrar en la cache: dejar de acumular
+                        guardados = None
+                    else:
+                        guardados.append(comprimido)
+                yield comprimido
+            if not leidos:
+                break
+        completo = True
+    finally:
+        archivo.close()
+        if sidecar is not None:
+            sidecar.close()
+            if completo:
+                os.utime(ruta_temporal, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                os.replace(ruta_temporal, ruta_sidecar(ruta, extension))
+            else:
+                os.remove(ruta_temporal)
+        if completo and guardados is not None:
+            cache.guardar((ruta, stat.st_mtime_ns, stat.st_size, codec), b"".join(guardados))
+
+
+class Respuesta:
+    """
+    Respuesta HTTP armada por partes, sin concatenar bytes: la status line y los headers se
+    serializan una sola vez (encabezado()) y el body queda como una lista de bytes.
+    Al enviarla, cabecera y body salen juntos en un sendmsg (writev) sin copiarlos a un buffer nuevo.
+    - codigo: int, el status HTTP
+    - headers: list de tuplas (nombre, valor); el Content-Length se agrega al serializar
+    - cuerpo: bytes o list de bytes con el body
+    - con_longitud: bool, si lleva Content-Length (un 304 no lo lleva)
+    """
+
+    def __init__(self, codigo, headers=None, cuerpo=b"", con_longitud=True):
+        self.codigo = codigo
+        self.headers = headers if headers is not None else []
+        if isinstance(cuerpo, (bytes, bytearray, memoryview)):
+            cuerpo = [cuerpo] if cuerpo else []
+        self.cuerpo = cuerpo
+        self.con_longitud = con_longitud
+        self._encabezado = None
+
+    def obtener_header(self, nombre):
+        """Devuelve el valor del header nombre (sin distinguir mayúsculas), o None si no está."""
+        nombre = nombre.lower()
+        for clave, valor in self.headers:
+            if clave.lower() == nombre:
+                return valor
+        return None
+
+    def longitud_cuerpo(self):
+        return sum(len(parte) for parte in self.cuerpo)
+
+    def encabezado(self):
+        """
+        Devuelve: tuple (status_line: bytes, headers: bytes terminados en la línea vacía).
+        Se serializa la primera vez y después se reutiliza. Van separados para poder mandar
+        los headers de la conexión en el medio sin copiar nada.
+        """
+        if self._encabezado is None:
+            lineas = [f"{nombre}: {valor}\r\n" for nombre, valor in self.headers]
+            if self.con_longitud:
+                lineas.append(f"Content-Length: {self.longitud_cuerpo()}\r\n")
+            lineas.append("\r\n")
+            self._encabezado = (f"HTTP/1.1 {self.codigo} {MENSAJES_ESTADO[self.codigo]}\r\n".encode('utf-8'),
+                                "".join(lineas).encode('utf-8'))
+        return self._encabezado
+
+    def sin_cuerpo(self):
+        """Devuelve una respuesta con la misma status line y headers pero sin body (para HEAD)."""
+        respuesta = Respuesta(self.codigo)
+        respuesta._encabezado = self.encabezado()
+        self.cerrar()
+        return respuesta
+
+    def __len__(self):
+        status, headers = self.encabezado()
+        return len(status) + len(headers) + self.longitud_cuerpo()
+
+    def cerrar(self):
+        pass
+
+
+def respuesta_fija(codigo, headers=None, cuerpo=b""):
+    """Crea una respuesta que no cambia entre requests y la serializa ya, al iniciar el servidor."""
+    respuesta = Respuesta(codigo, headers, cuerpo)
+    respuesta.encabezado()
+    return respuesta
+
+
+# Errores sin body, listos para enviar
+RESPUESTAS_ERROR = {codigo: respuesta_fija(codigo) for codigo in (400, 404, 411, 413, 416, 431, 500)}
+
+
+class RespuestaStreaming(Respuesta):
+    """
+    Respuesta cuyo body se genera mientras se envía y va con Transfer-Encoding: chunked
+    (el tamaño total no se conoce de antemano).
+    - partes: iterador de bytes con el body; cada pedazo se manda como un chunk
+    - chunked: bool; si es False (cliente HTTP/1.0) el body sale tal cual y el final lo marca el
+      cierre de la conexión, que entonces no se mantiene
+    """
+
+    def __init__(self, codigo, headers, partes, chunked=True):
+        if chunked:
+            headers = headers + [('Transfer-Encoding', 'chunked')]
+        super().__init__(codigo, headers, con_longitud=False)
+        self.partes = partes
+        self.chunked = chunked
+        self.enviados = 0
+
+    def longitud_cuerpo(self):
+        return self.enviados
+
+    def cerrar(self):
+        cerrar = getattr(self.partes, 'close', None)
+        if cerrar is not None:
+            cerrar()
+
+
+class RespuestaArchivo(Respuesta):
+    """
+    Respuesta cuyo body se envía directo desde un archivo abierto, sin cargarlo en memoria.
+    - archivo: archivo abierto en modo binario (se cierra después de enviarlo)
+    - segmentos: list con las partes del body en orden; cada una es bytes (se manda tal cual)
+      o una tupla (offset, longitud) con una porción del archivo
+    """
+
+    def __init__(self, codigo, headers, archivo, segmentos):
+        super().__init__(codigo, headers)
+        self.archivo = archivo
+        self.segmentos = segmentos
+
+    def longitud_cuerpo(self):
+        return sum(len(segmento) if isinstance(segmento, bytes) else segmento[1] for segmento in self.segmentos)
+
+    def cerrar(self):
+        self.archivo.close()
+
+
+def calcular_etag(stat):
+    """
+    Requiere: stat: os.stat_result del archivo
+    Devuelve: str, un ETag fuerte (entre comillas) armado con el tamaño y la fecha de modificación
+    """
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def disposicion_adjunto(nombre):
+    """
+    Devuelve: str, el valor del header Content-Disposition para descargar un archivo llamado nombre.
+    filename lleva una versión ASCII sin comillas ni caracteres de control; si el nombre tiene otros
+    caracteres va también filename* (RFC 5987) con el nombre completo codificado en UTF-8.
+    """
+    ascii = ''.join(c if 32 <= ord(c) < 127 and c not in '"\\' else '_' for c in nombre)
+    if ascii == nombre:
+        return f'attachment; filename="{nombre}"'
+    return f"attachment; filename=\"{ascii}\"; filename*=UTF-8''{quote(nombre, safe='')}"
+
+
+def parsear_range(valor, tamaño):
+    """
+    Interpreta un header Range de bytes.
+    Requiere: valor: str, el header Range, tamaño: int, tamaño del archivo
+    Devuelve: list de tuplas (inicio, fin) inclusivas con los rangos satisfacibles,
+              [] si ninguno lo es (hay que responder 416),
+              o None si el header es inválido y hay que ignorarlo (responder 200)
+    """
+    unidad, _, especificacion = valor.partition("=")
+    if unidad.strip().lower() != "bytes" or not especificacion.strip():
+        return None
+    partes = especificacion.split(",")
+    if len(partes) > MAX_RANGOS:
+        # Demasiados rangos: más barato mandar el archivo entero
+        return None
+
+    rangos = []
+    for parte in partes:
+        parte = parte.strip()
+        if not parte:
+            continue
+        inicio_txt, guion, fin_txt = parte.partition("-")
+        inicio_txt, fin_txt = inicio_txt.strip(), fin_txt.strip()
+        if not guion or not (inicio_txt.isdigit() or inicio_txt == "") or not (fin_txt.isdigit() or fin_txt == ""):
+            return None
+        if inicio_txt == "":
+            # bytes=-N: los últimos N bytes
+            if fin_txt == "":
+                return None
+            sufijo = int(fin_txt)
+            if sufijo == 0 or tamaño == 0:
+                continue
+            rangos.append((max(0, tamaño - sufijo), tamaño - 1))
+        else:
+            inicio = int(inicio_txt)
+            if fin_txt and int(fin_txt) < inicio:
+                return None
+            if inicio >= tamaño:
+                # Empieza después del final (por ejemplo retomar una descarga que ya estaba completa)
+                continue
+            fin = int(fin_txt) if fin_txt else tamaño - 1
+            rangos.append((inicio, min(fin, tamaño - 1)))
+    return rangos
+
+
+def if_range_coincide(valor, etag, mtime):
+    """
+    Requiere: valor: str, el header If-Range, etag: str, ETag actual, mtime: float, fecha de modificación
+    Devuelve: bool, True si el cliente tiene la misma versión del archivo (entonces se respeta el Range)
+    """
+    valor = valor.strip()
+    if valor.startswith('"') or valor.startswith('W/'):
+        # If-Range solo admite comparación fuerte: un ETag débil nunca coincide
+        return not valor.startswith('W/') and valor == etag
+    if time.time() - mtime < 1:
+        # Una fecha solo sirve como validador fuerte si el archivo no cambió en el mismo segundo
+        # (RFC 9110, 8.8.2.2): si no, dos versiones distintas pueden tener la misma Last-Modified
+        return False
+    try:
+        fecha = email.utils.parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return False
+    return int(fecha.timestamp()) == int(mtime)
+
+
+def hash_contenido(ruta, archivo, stat):
+    """
+    Requiere: ruta: str, archivo: archivo abierto en modo binario, stat: os.stat_result del archivo
+    Devuelve: str, el SHA-256 (hex) del contenido. Se calcula una sola vez por versión del archivo
+              (ruta, inodo, tamaño y mtime) y queda guardado en HASHES_CONTENIDO.
+    Deja el archivo posicionado al principio.
+    """
+    clave = (ruta, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with LOCK_HASHES:
+        digest = HASHES_CONTENIDO.get(clave)
+        if digest is not None:
+            HASHES_CONTENIDO.move_to_end(clave)
+            return digest
+
+    h = hashlib.sha256()
+    buffer = bytearray(TAMAÑO_BLOQUE)
+    vista = memoryview(buffer)
+    archivo.seek(0)
+    while True:
+        leidos = archivo.readinto(buffer)
+        if not leidos:
+            break
+        h.update(vista[:leidos])
+    archivo.seek(0)
+    digest = h.hexdigest()
+
+    with LOCK_HASHES:
+        HASHES_CONTENIDO[clave] = digest
+        while len(HASHES_CONTENIDO) > MAX_HASHES_CONTENIDO:
+            HASHES_CONTENIDO.popitem(last=False)
+    return digest
+
+
+def calcular_etag_contenido(ruta, archivo, stat):
+    """Devuelve un ETag fuerte con el SHA-256 del contenido (ver hash_contenido)."""
+    return f'"{hash_contenido(ruta, archivo, stat)}"'
+
+
+def etag_con_codificacion(etag, codec):
+    """
+    Devuelve el ETag de la variante comprimida con codec (o el mismo si codec es None):
+    los bytes enviados son otros, así que el ETag fuerte tiene que ser distinto.
+    """
+    if codec is None:
+        return etag
+    return f'{etag[:-1]}-{codec}"'
+
+
+def no_fue_modificado(headers, etag, mtime):
+    """
+    Evalúa los headers condicionales de un GET/HEAD.
+    Requiere: headers: dict con claves en minúsculas, etag: str, ETag de la representación a enviar,
+              mtime: float o None, fecha de modificación
+    Devuelve: bool, True si el cliente ya tiene esta versión y hay que responder 304
+    """
+    if 'if-none-match' in headers:
+        # Si viene If-None-Match se ignora If-Modified-Since; acá vale la comparación débil
+        valor = headers['if-none-match'].strip()
+        if valor == '*':
+            return True
+        buscado = etag[2:] if etag.startswith('W/') else etag
+        for candidato in valor.split(','):
+            candidato = candidato.strip()
+            if candidato.startswith('W/'):
+                candidato = candidato[2:]
+            if candidato == buscado:
+                return True
+        return False
+    if 'if-modified-since' in headers and mtime is not None:
+        fecha = email.utils.parsedate_tz(headers['if-modified-since'])
+        if fecha is None:
+            return False
+        # Las fechas HTTP tienen resolución de segundos
+        return int(mtime) <= email.utils.mktime_tz(fecha)
+    return False
+
+
+def headers_validacion(etag, mtime, cache_control, vary):
+    """
+    Requiere: etag: str o None, mtime: float o None, cache_control: str o None,
+              vary: bool, si la respuesta depende del Accept-Encoding
+    Devuelve: list de tuplas (nombre, valor) con ETag, Last-Modified, Cache-Control y Vary (se repiten en el 304)
+    """
+    headers = []
+    if etag is not None:
+        headers.append(('ETag', etag))
+    if mtime is not None:
+        headers.append(('Last-Modified', email.utils.formatdate(mtime, usegmt=True)))
+    if cache_control:
+        headers.append(('Cache-Control', cache_control))
+    if vary:
+        headers.append(('Vary', 'Accept-Encoding'))
+    return headers
+
+
+def respuesta_no_modificado(validacion):
+    """Devuelve la respuesta 304 Not Modified (sin body) con los headers de validación."""
+    return Respuesta(304, validacion, con_longitud=False)
+
+
+def armar_rangos(rangos, tamaño, content_type):
+    """
+    Requiere: rangos: list no vacía de tuplas (inicio, fin) inclusivas (ver parsear_range),
+              tamaño: int, tamaño del archivo, content_type: str
+    Devuelve: tuple (headers, segmentos) de la respuesta 206: con un rango, Content-Range y un segmento;
+              con varios, un multipart/byteranges. segmentos es como en RespuestaArchivo
+    """
+    if len(rangos) == 1:
+        inicio, fin = rangos[0]
+        return ([('Content-Type', content_type), ('Content-Range', f'bytes {inicio}-{fin}/{tamaño}')],
+                [(inicio, fin - inicio + 1)])
+
+    # Varios rangos: cada uno va como una parte de un multipart/byteranges
+    limite = uuid.uuid4().hex
+    segmentos = []
+    for inicio, fin in rangos:
+        segmentos.append((f"\r\n--{limite}\r\n"
+                          f"Content-Type: {content_type}\r\n"
+                          f"Content-Range: bytes {inicio}-{fin}/{tamaño}\r\n\r\n").encode('utf-8'))
+        segmentos.append((inicio, fin - inicio + 1))
+    segmentos.append(f"\r\n--{limite}--\r\n".encode('utf-8'))
+    return [('Content-Type', f'multipart/byteranges; boundary={limite}')], segmentos
+
+
+class ArchivoEnCache:
+    """
+    Un archivo de CacheArchivos con lo necesario para responderlo sin abrirlo ni leerlo.
+    - version: (inodo, tamaño, mtime) del archivo guardado; si en disco cambia, la entrada se descarta
+    - datos: bytes (archivo chico) o mmap de solo lectura (archivo grande); vista es un memoryview sobre
+      datos para servir rangos sin copiar
+    - completa y no_modificado: las respuestas 200 y 304, con la cabecera ya serializada
+    El mmap no se cierra a mano: se libera cuando la última respuesta que lo usa termina de enviarse.
+    """
+
+    def __init__(self, ruta, stat, datos, content_type, etag, validacion, cache_control, comprimible):
+        self.ruta = ruta
+        self.stat = stat
+        self.version = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        self.datos = datos
+        self.vista = memoryview(datos)
+        self.content_type = content_type
+        self.etag = etag
+        self.validacion = validacion
+        self.cache_control = cache_control
+        self.comprimible = comprimible
+        self.disposicion = ('Content-Disposition', disposicion_adjunto(os.path.basename(ruta)))
+        self.completa = respuesta_fija(200, [('Content-Type', content_type), ('Accept-Ranges', 'bytes')]
+                                       + validacion + [self.disposicion], self.vista)
+        self.no_modificado = respuesta_no_modificado(validacion)
+        self.no_modificado.encabezado()
+
+    def __len__(self):
+        return self.stat.st_size
+
+
+class CacheArchivos:
+    """
+    Cache de los archivos que más se descargan, para no abrir, leer ni adivinar el tipo MIME en cada pedido.
+    Los chicos (hasta umbral_memoria) se guardan enteros en memoria y los medianos (hasta max_mapeado)
+    se mapean con mmap; en los dos casos se sirven como memoryview, también los rangos. Los más grandes
+    no entran: ahí el open por pedido no pesa y sendfile los manda sin copiarlos. Cada acierto cuesta
+    un solo os.stat para ver que el archivo no cambió (inodo, tamaño y mtime).
+    Admisión por frecuencia: se cuenta cada pedido y un archivo entra recién cuando se pidió
+    min_frecuencia veces. Si no hay lugar en max_bytes se desalojan los menos pedidos, pero solo si
+    se pidieron menos que el que entra (un archivo que se pide una vez no echa a uno caliente).
+    Es seguro usarla desde varios hilos.
+    """
+
+    def __init__(self, max_bytes, umbral_memoria=UMBRAL_ARCHIVO_EN_MEMORIA, max_mapeado=MAX_ARCHIVO_MAPEADO,
+                 min_frecuencia=MIN_FRECUENCIA_CACHE, ventana=VENTANA_FRECUENCIAS_CACHE):
+        self.max_bytes = max_bytes
+        self.umbral_memoria = umbral_memoria
+        self.max_mapeado = max_mapeado
+        self.min_frecuencia = min_frecuencia
+        self.ventana = ventana
+        self.entradas = {}
+        self.frecuencias = {}
+        self.pedidos = 0
+        self.bytes_usados = 0
+        self.lock = threading.Lock()
+
+    def obtener(self, ruta):
+        """Cuenta el pedido y devuelve la ArchivoEnCache de ruta si sigue al día, o None."""
+        with self.lock:
+            self.frecuencias[ruta] = self.frecuencias.get(ruta, 0) + 1
+            self.pedidos += 1
+            if self.pedidos >= self.ventana:
+                self._envejecer()
+            entrada = self.entradas.get(ruta)
+        if entrada is None:
+            return None
+        try:
+            stat = os.stat(ruta)
+        except OSError:
+            stat = None
+        if stat is None or (stat.st_ino, stat.st_size, stat.st_mtime_ns) != entrada.version:
+            self.descartar(ruta, entrada)
+            return None
+        return entrada
+
+    def conviene_admitir(self, ruta, tamaño):
+        """Devuelve: bool, si ruta ya se pidió lo suficiente como para guardarla (y hay lugar para ella)."""
+        with self.lock:
+            return ruta not in self.entradas and self._desalojables(ruta, tamaño) is not None
+
+    def guardar(self, ruta, archivo, stat, content_type, etag, validacion, cache_control=None, comprimible=False):
+        """
+        Lee (o mapea) el archivo abierto y lo guarda, desalojando lo necesario.
+        Requiere: archivo: abierto en modo binario sobre la versión descripta por stat
+        Devuelve: la ArchivoEnCache nueva, o None si no se guardó (el archivo cambió mientras se leía o ya no hay lugar)
+        """
+        inicio = time.perf_counter()
+        try:
+            if stat.st_size <= self.umbral_memoria:
+                archivo.seek(0)
+                datos = archivo.read()
+            else:
+                datos = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        finally:
+            sumar_tiempo('disco_lectura', inicio)
+        if len(datos) != stat.st_size:
+            return None
+        entrada = ArchivoEnCache(ruta, stat, datos, content_type, etag, validacion, cache_control, comprimible)
+
+        with self.lock:
+            desalojados = self._desalojables(ruta, stat.st_size)
+            if desalojados is None:
+                return None
+            for nombre in desalojados:
+                self.bytes_usados -= len(self.entradas.pop(nombre))
+            anterior = self.entradas.pop(ruta, None)
+            if anterior is not None:
+                self.bytes_usados -= len(anterior)
+            self.entradas[ruta] = entrada
+            self.bytes_usados += len(entrada)
+        return entrada
+
+    def descartar(self, ruta, entrada):
+        """Saca entrada de la cache (si todavía es la guardada para ruta)."""
+        with self.lock:
+            if self.entradas.get(ruta) is entrada:
+                del self.entradas[ruta]
+                self.bytes_usados -= len(entrada)
+
+    def _desalojables(self, ruta, tamaño):
+        # Se llama con el lock tomado. Devuelve las rutas a desalojar para que entre ruta, o None si no conviene
+        frecuencia = self.frecuencias.get(ruta, 0)
+        if frecuencia < self.min_frecuencia or tamaño > min(self.max_bytes, self.max_mapeado):
+            return None
+        anterior = self.entradas.get(ruta)
+        faltan = self.bytes_usados - (len(anterior) if anterior is not None else 0) + tamaño - self.max_bytes
+        desalojados = []
+        if faltan > 0:
+            candidatos = sorted((nombre for nombre in self.entradas if nombre != ruta),
+                                key=lambda nombre: self.frecuencias.get(nombre, 0))
+            for nombre in candidatos:
+                if faltan <= 0:
+                    break
+                if self.frecuencias.get(nombre, 0) >= frecuencia:
+                    return None
+                desalojados.append(nombre)
+                faltan -= len(self.entradas[nombre])
+            if faltan > 0:
+                return None
+        return desalojados
+
+    def _envejecer(self):
+        # Se llama con el lock tomado: así las frecuencias no crecen sin límite y los archivos
+        # que dejaron de pedirse terminan cediendo su lugar
+        self.pedidos = 0
+        self.frecuencias = {ruta: frecuencia // 2 for ruta, frecuencia in self.frecuencias.items()
+                            if frecuencia > 1 or ruta in self.entradas}
+
+
+def respuesta_desde_cache(entrada, headers, cache_comprimidos=None, compresion=None):
+    """
+    Responde un GET de un archivo que está en CacheArchivos, con los mismos criterios que manejar_descarga
+    (304, Range, If-Range y compresión) pero sin tocar el disco.
+    Requiere: entrada: ArchivoEnCache, headers: dict con claves en minúsculas
+    Devuelve: Respuesta, o None si hay que seguir por manejar_descarga (una variante comprimida
+              que todavía no está en cache_comprimidos)
+    """
+    mtime = entrada.stat.st_mtime
+    tamaño = entrada.stat.st_size
+    if entrada.comprimible and 'range' not in headers:
+        codec = negociar_codificacion(headers, compresion or {})
+        if codec is not None:
+            etag = etag_con_codificacion(entrada.etag, codec)
+            validacion = headers_validacion(etag, mtime, entrada.cache_control, True)
+            if no_fue_modificado(headers, etag, mtime):
+                return respuesta_no_modificado(validacion)
+            variante = buscar_variante(entrada.ruta, entrada.stat, cache_comprimidos, codec)
+            if variante is None:
+                return None
+            return Respuesta(200, [('Content-Type', entrada.content_type), ('Content-Encoding', codec)]
+                             + validacion + [entrada.disposicion], variante)
+
+    if no_fue_modificado(headers, entrada.etag, mtime):
+        return entrada.no_modificado
+
+    rangos = None
+    if 'range' in headers:
+        if 'if-range' not in headers or if_range_coincide(headers['if-range'], entrada.etag, mtime):
+            rangos = parsear_range(headers['range'], tamaño)
+    if rangos is None:
+        return entrada.completa
+    if not rangos:
+        return Respuesta(416, [('Content-Range', f'bytes */{tamaño}')])
+
+    headers_respuesta, segmentos = armar_rangos(rangos, tamaño, entrada.content_type)
+    cuerpo = [segmento if isinstance(segmento, bytes) else entrada.vista[segmento[0]:segmento[0] + segmento[1]]
+              for segmento in segmentos]
+    return Respuesta(206, headers_respuesta + [('Accept-Ranges', 'bytes')] + entrada.validacion + [entrada.disposicion],
+                     cuerpo)
+
+
+def manejar_descarga(archivo, request_line, headers=None, comprimir_gzip=False, cache_comprimidos=None, compresion=None,
+                     cache_control=None, etag_por_hash=False, cache_archivos=None):
+    """
+    Genera una respuesta HTTP con el archivo solicitado.
+    Si el archivo no existe debe devolver un error.
+    Debe incluir los headers: Content-Type, Content-Length y Content-Disposition.
+    Si comprimir_gzip=True comprime el contenido con la codificación que prefiera el cliente
+    entre las habilitadas (zstd, br, gzip), reutilizando la variante guardada en cache_comprimidos
+    si se pasa una CacheComprimidos.
+    compresion es un dict con 'codecs', 'niveles', 'ventana' y 'umbral_streaming': los archivos a
+    partir de ese tamaño que no están en la cache se comprimen mientras se envían (Transfer-Encoding: chunked).
+    Sin compresión el archivo no se lee acá: se devuelve una RespuestaArchivo para
+    enviarlo con sendfile, y el Content-Length sale de os.fstat.
+    Soporta descargas parciales (Range / If-Range): un rango responde 206 con Content-Range,
+    varios rangos responden 206 multipart/byteranges y un rango fuera del archivo responde 416.
+    Las respuestas llevan ETag y Last-Modified; si el cliente manda If-None-Match o If-Modified-Since
+    y ya tiene esta versión se responde 304 sin body. cache_control es el valor del header
+    Cache-Control (None para no mandarlo) y con etag_por_hash=True el ETag es el SHA-256 del contenido.
+    Con una CacheArchivos en cache_archivos, los archivos que se piden seguido se responden desde memoria
+    (o desde un mmap) con la cabecera ya armada, sin abrirlos ni leerlos (ver respuesta_desde_cache).
+    """
+    if headers is None:
+        headers = {}
+
+    if archivo is not None and cache_archivos is not None:
+        entrada = cache_archivos.obtener(archivo)
+        if entrada is not None:
+            response = respuesta_desde_cache(entrada, headers, cache_comprimidos, compresion)
+            if response is not None:
+                return response
+
+    # Verificar si el archivo existe
+    if archivo is None or not os.path.isfile(archivo):
+        # Archivo no encontrado - devolver 404
+        return respuesta_error(404)
+
+    try:
+        # Obtener el nombre del archivo para Content-Disposition
+        filename = os.path.basename(archivo)
+
+        # Determinar el Content-Type usando mimetypes
+        content_type, _ = mimetypes.guess_type(archivo)
+        if content_type is None:
+            content_type = 'application/octet-stream'  # Tipo por defecto para archivos desconocidos
+
+        if compresion is None:
+            compresion = {}
+
+        # Abrir el archivo y tomar tamaño y fecha del mismo descriptor que se va a enviar
+        f = open(archivo, 'rb')
+        try:
+            stat = os.fstat(f.fileno())
+            etag = calcular_etag_contenido(archivo, f, stat) if etag_por_hash else calcular_etag(stat)
+        except Exception:
+            f.close()
+            raise
+        tamaño = stat.st_size
+
+        # Los formatos que ya vienen comprimidos (jpg, pdf, zip...) se mandan tal cual.
+        # Para el resto la respuesta depende del Accept-Encoding, y los caches tienen que saberlo (Vary).
+        comprimible = comprimir_gzip and es_comprimible(content_type)
+
+        # Elegir la codificación según lo que acepte el cliente.
+        # Los pedidos con Range se sirven sin comprimir: los rangos se refieren a los bytes del archivo.
+        codec = None
+        if comprimible and 'range' not in headers:
+            codec = negociar_codificacion(headers, compresion)
+
+        # Si el cliente ya tiene esta versión no hace falta leer (ni comprimir) nada
+        validacion = headers_validacion(etag_con_codificacion(etag, codec), stat.st_mtime, cache_control, comprimible)
+        if no_fue_modificado(headers, etag_con_codificacion(etag, codec), stat.st_mtime):
+            f.close()
+            return respuesta_no_modificado(validacion)
+
+        # Reutilizar la variante ya comprimida si existe. Si no, la comprime un solo request: si otro ya
+        # la está comprimiendo (por ejemplo varios clientes piden el mismo archivo a la vez) este request
+        # recibe el archivo sin comprimir en vez de repetir el trabajo
+        file_content = None
+        clave_variante = None
+        if codec is not None:
+            file_content = buscar_variante(archivo, stat, cache_comprimidos, codec)
+            if file_content is None and cache_comprimidos is not None:
+                clave_variante = (archivo, stat.st_mtime_ns, stat.st_size, codec)
+                if not cache_comprimidos.reservar(clave_variante):
+                    codec = None
+                    clave_variante = None
+                    validacion = headers_validacion(etag, stat.st_mtime, cache_control, comprimible)
+
+        if codec is not None:
+            try:
+                # Headers de la respuesta
+                headers_respuesta = [('Content-Type', content_type), ('Content-Encoding', codec)]
+                headers_respuesta += validacion
+                headers_respuesta.append(('Content-Disposition', disposicion_adjunto(filename)))
+
+                if (file_content is None and request_line.rstrip().endswith("HTTP/1.1")
+                        and stat.st_size >= compresion.get('umbral_streaming', UMBRAL_STREAMING_GZIP)):
+                    # Archivo grande: comprimir mientras se envía, con chunked porque el tamaño final no se conoce
+                    partes = generar_comprimido_por_partes(archivo, f, stat, cache_comprimidos, codec, compresion)
+                    if clave_variante is not None:
+                        partes = PartesReservadas(partes, cache_comprimidos, clave_variante)
+                    # Ahora el archivo lo cierra el generador y la reserva la libera PartesReservadas
+                    f = None
+                    clave_variante = None
+                    return RespuestaStreaming(200, headers_respuesta, partes)
+
+                if file_content is None:
+                    file_content = comprimir_archivo(archivo, f, stat, cache_comprimidos, codec, compresion)
+            finally:
+                if f is not None:
+                    f.close()
+                if clave_variante is not None:
+                    cache_comprimidos.liberar(clave_variante)
+
+            # El Content-Length (del contenido comprimido) se calcula al serializar
+            return Respuesta(200, headers_respuesta, file_content)
+
+        # Un archivo que se pide seguido pasa a la cache y desde ahora se responde desde ahí
+        if cache_archivos is not None and cache_archivos.conviene_admitir(archivo, tamaño):
+            entrada = cache_archivos.guardar(archivo, f, stat, content_type, etag, validacion, cache_control, comprimible)
+            if entrada is not None:
+                response = respuesta_desde_cache(entrada, headers, cache_comprimidos, compresion)
+                # None si el cliente acepta una variante comprimida que otro request todavía está comprimiendo:
+                # entonces sigue por acá y recibe el archivo sin comprimir
+                if response is not None:
+                    f.close()
+                    return response
+
+        # Ver si se pidió una parte del archivo
+        rangos = None
+        if 'range' in headers:
+            if 'if-range' not in headers or if_range_coincide(headers['if-range'], etag, stat.st_mtime):
+                rangos = parsear_range(headers['range'], tamaño)
+
+        if rangos is not None and not rangos:
+            # Ningún rango cae dentro del archivo
+            f.close()
+            return Respuesta(416, [('Content-Range', f'bytes */{tamaño}')])
+
+        if rangos is None:
+            codigo = 200
+            segmentos = [(0, tamaño)]
+            headers_respuesta = [('Content-Type', content_type)]
+        else:
+            codigo = 206
+            headers_respuesta, segmentos = armar_rangos(rangos, tamaño, content_type)
+
+        # Solo los headers; el body se manda después, directo desde el archivo (Content-Length sale de los segmentos)
+        headers_respuesta.append(('Accept-Ranges', 'bytes'))
+        headers_respuesta += validacion
+        headers_respuesta.append(('Content-Disposition', disposicion_adjunto(filename)))
+        return RespuestaArchivo(codigo, headers_respuesta, f, segmentos)
+
+    except Exception as e:
+        # Error al leer el archivo -> devolver 500
+        print(f"Error al leer el archivo: {e}")
+        return respuesta_error(500)
+
+
+class SalidaPorPartes:
+    """
+    Archivo de solo escritura que junta lo que se le escribe para irlo entregando por pedazos.
+    Sirve para que zipfile arme un zip sin un archivo real: como no tiene seek(), zipfile escribe
+    cada entrada de corrido (con data descriptor) y al final el directorio central.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.pendientes = 0
+        self.posicion = 0
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self.partes.append(datos)
+        self.pendientes += len(datos)
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self, minimo=TAMAÑO_BLOQUE):
+        """Devuelve lo juntado hasta ahora (una lista con un solo bytes), o [] si hay menos de minimo."""
+        if not self.pendientes or self.pendientes < minimo:
+            return []
+        datos = b"".join(self.partes)
+        self.partes = []
+        self.pendientes = 0
+        return [datos]
+
+
+def parece_comprimido(muestra):
+    """
+    Requiere: muestra: bytes, el comienzo de un archivo
+    Devuelve: bool, True si deflate casi no la achica (contenido ya comprimido o aleatorio)
+    """
+    muestra = muestra[:64 * 1024]
+    return len(muestra) >= 4096 and len(zlib.compress(muestra, 1)) > 0.9 * len(muestra)
+
+
+def generar_zip(archivos, nivel=NIVEL_GZIP):
+    """
+    Generador que arma un zip con los archivos a medida que se envía: cada archivo se lee por bloques
+    y se comprime con deflate, salvo los que ya vienen comprimidos, que van sin recomprimir (stored).
+    Eso se decide por el tipo (es_comprimible) y, si el tipo no lo dice, probando comprimir el primer
+    bloque. La memoria usada no depende del tamaño de los archivos.
+    Requiere: archivos: list de tuplas (nombre, ruta)
+    """
+    salida = SalidaPorPartes()
+    with zipfile.ZipFile(salida, 'w', compresslevel=nivel) as zip_salida:
+        for nombre, ruta in archivos:
+            try:
+                archivo = open(ruta, 'rb')
+            except OSError:
+                # Se borró después de armar la lista: ya no se puede avisar, se saltea
+                continue
+            with archivo:
+                stat = os.fstat(archivo.fileno())
+                # zip no puede guardar fechas anteriores a 1980
+                fecha = max(time.localtime(stat.st_mtime)[:6], (1980, 1, 1, 0, 0, 0))
+                info = zipfile.ZipInfo(nombre, date_time=fecha)
+                info.external_attr = 0o644 << 16
+                inicio = time.perf_counter()
+                bloque = archivo.read(TAMAÑO_BLOQUE)
+                sumar_tiempo('disco_lectura', inicio)
+                content_type = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+                comprimir = es_comprimible(content_type) and not parece_comprimido(bloque)
+                info.compress_type = zipfile.ZIP_DEFLATED if comprimir else zipfile.ZIP_STORED
+                # Con el tamaño zipfile sabe de antemano si la entrada necesita zip64
+                info.file_size = stat.st_size
+                with zip_salida.open(info, 'w') as destino:
+                    while bloque:
+                        destino.write(bloque)
+                        yield from salida.vaciar()
+                        inicio = time.perf_counter()
+                        bloque = archivo.read(TAMAÑO_BLOQUE)
+                        sumar_tiempo('disco_lectura', inicio)
+    # Al cerrarse el zip se escribe el directorio central
+    yield from salida.vaciar(minimo=1)
+
+
+def generar_tar(archivos):
+    """
+    Generador que arma un tar (formato pax) con los archivos a medida que se envía, sin comprimir.
+    Cada entrada es la cabecera (con el tamaño del stat) y el contenido leído por bloques; si el
+    archivo cambió de tamaño mientras se leía se completa con ceros o se corta, para que el tar
+    siga siendo válido.
+    Requiere: archivos: list de tuplas (nombre, ruta)
+    """
+    for nombre, ruta in archivos:
+        try:
+            archivo = open(ruta, 'rb')
+        except OSError:
+            continue
+        with archivo:
+            stat = os.fstat(archivo.fileno())
+            info = tarfile.TarInfo(nombre)
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = 0o644
+            yield info.tobuf(tarfile.PAX_FORMAT)
+            restantes = stat.st_size
+            while restantes:
+                inicio = time.perf_counter()
+                bloque = archivo.read(min(TAMAÑO_BLOQUE, restantes))
+                sumar_tiempo('disco_lectura', inicio)
+                if not bloque:
+                    bloque = bytes(min(TAMAÑO_BLOQUE, restantes))
+                restantes -= len(bloque)
+                yield bloque
+            relleno = -stat.st_size % tarfile.BLOCKSIZE
+            if relleno:
+                yield bytes(relleno)
+    # Fin del tar: dos bloques de ceros
+    yield bytes(2 * tarfile.BLOCKSIZE)
+
+
+# Formatos de /download-bundle: Content-Type y extensión
+FORMATOS_PAQUETE = {
+    'zip': ('application/zip', '.zip'),
+    'tar': ('application/x-tar', '.tar'),
+}
+
+
+def manejar_descarga_paquete(solicitud, config):
+    """
+    GET /download-bundle: descarga varios archivos juntos en un zip (por defecto) o un tar que se arma
+    mientras se envía, con Transfer-Encoding: chunked (en HTTP/1.0, que no lo tiene, el final lo marca
+    el cierre de la conexión).
+    - ?archivo=NOMBRE (se puede repetir): los archivos a incluir; sin ninguno van todos los del listado
+    - ?formato=zip|tar
+    Devuelve: RespuestaStreaming, o 404 si algún archivo pedido no existe o el formato no es válido
+    """
+    formato = solicitud.query_params.get('formato', 'zip')
+    if formato not in FORMATOS_PAQUETE:
+        return respuesta_error(404)
+
+    pedidos = solicitud.query.get('archivo')
+    if pedidos is not None:
+        nombres = list(dict.fromkeys(pedidos))
+        for nombre in nombres:
+            # Solo nombres de archivo dentro de archivos_servidor (sin '..' ni subdirectorios) y no los ocultos
+            if not nombre_archivo_valido(nombre) or not os.path.isfile(os.path.join("archivos_servidor", nombre)):
+                return respuesta_error(404)
+    elif config['modo_upload']:
+        indice = config['indice']
+        indice.revisar()
+        nombres = [nombre for nombre, _ in indice.listar()]
+    elif config['archivo_descarga'] is not None and os.path.isfile(config['archivo_descarga']):
+        nombres = [os.path.basename(config['archivo_descarga'])]
+    else:
+        nombres = []
+
+    content_type, extension = FORMATOS_PAQUETE[formato]
+    archivos = [(nombre, os.path.join("archivos_servidor", nombre)) for nombre in nombres]
+    if formato == 'zip':
+        partes = generar_zip(archivos, config['compresion'].get('niveles', {}).get('gzip', NIVEL_GZIP))
+    else:
+        partes = generar_tar(archivos)
+    headers_respuesta = [
+        ('Content-Type', content_type),
+        ('Content-Disposition', f'attachment; filename="archivos{extension}"'),
+        ('Cache-Control', 'no-store'),
+    ]
+    return RespuestaStreaming(200, headers_respuesta, partes, chunked=solicitud.version == "HTTP/1.1")
+
+
+# Respuesta de una subida en la que no venía ningún archivo
+RESPUESTA_CARGA_VACIA = respuesta_fija(400, [('Content-Type', 'text/html')], """
+            <html>
               <head><title>Error</title></head>
               <body><h1>400 Bad Request</h1><p>No se pudo procesar el archivo.</p></body>
             </html>
-            """
-            error_html_bytes = error_html.encode('utf-8')
-            response = b"HTTP/1.1 400 Bad Request\r\n"
-            response += b"Content-Type: text/html\r\n"
-            response += f"Content-Length: {len(error_html_bytes)}\r\n".encode('utf-8')
-            response += b"\r\n"
-            response += error_html_bytes
-            return response
-        
-        # Asegurar que el directorio destino existe
-        if not os.path.exists(directorio_destino):
-            os.makedirs(directorio_destino, exist_ok=True)
-        
-        # Construir la ruta completa del archivo
-        ruta_archivo = os.path.join(directorio_destino, filename)
-        
-        # Guardar el archivo en el directorio destino
-        with open(ruta_archivo, 'wb') as f:
-            f.write(file_content)
-        
+            """.encode('utf-8'))
+
+
+def respuesta_archivos_guardados(archivos, codigo=200, error=None):
+    """
+    Requiere: archivos: list de tuplas (nombre, ruta, tamaño) como las de ParserMultipart.finalizar
+    Devuelve: Respuesta JSON {"archivos": [{"nombre", "tamaño"}, ...]} (con "error" si hubo uno)
+    """
+    datos = {'archivos': [{'nombre': nombre, 'tamaño': tamaño} for nombre, _, tamaño in archivos]}
+    if error is not None:
+        datos['error'] = error
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+    return Respuesta(codigo, [('Content-Type', 'application/json; charset=utf-8')], cuerpo)
+
+
+def manejar_carga(body, boundary, directorio_destino=".", indice=None, como_json=False):
+    """
+    Procesa un POST con multipart/form-data, guarda los archivos y devuelve una página de confirmación
+    (o, si como_json, la lista de archivos guardados en JSON, para clientes que no son navegadores).
+    body puede ser el body completo (bytes) o un ParserMultipart que ya lo recibió por pedazos;
+    en ese caso los archivos ya están escritos en disco y solo falta finalizar el parser.
+    Si se pasa un IndiceDirectorio, los archivos guardados se agregan al listado.
+    """
+    try:
+        if isinstance(body, ParserMultipart):
+            parser = body
+        else:
+            # Asegurar que el directorio destino existe
+            if not os.path.exists(directorio_destino):
+                os.makedirs(directorio_destino, exist_ok=True)
+            parser = ParserMultipart(boundary, directorio_destino)
+            parser.feed(body)
+        archivos = parser.finalizar()
+        if indice is not None:
+            for filename, _, _ in archivos:
+                indice.registrar(filename)
+
+        # Verificar que se pudo extraer al menos un archivo
+        if not archivos:
+            # No se pudo parsear el archivo -> devolver 400 Bad Request
+            if como_json:
+                return respuesta_archivos_guardados(archivos, 400, "no venía ningún archivo")
+            return RESPUESTA_CARGA_VACIA
+        if como_json:
+            return respuesta_archivos_guardados(archivos)
+
+        if len(archivos) == 1:
+            titulo = "✓ Archivo subido exitosamente"
+        else:
+            titulo = f"✓ {len(archivos)} archivos subidos exitosamente"
+        detalle_archivos = "".join(f"""
+            <p><strong>Nombre del archivo:</strong> {escape(filename)}</p>
+            <p><strong>Tamaño:</strong> {tamaño} bytes</p>
+            <p><strong>Guardado en:</strong> {escape(ruta_archivo)}</p>""" for filename, ruta_archivo, tamaño in archivos)
+
         # Generar página de confirmación HTML
         confirmacion_html = f"""
         <html>
@@ -336,80 +2741,2419 @@ def manejar_carga(body, boundary, directorio_destino="."):
             </style>
           </head>
           <body>
-            <h1 class="success">✓ Archivo subido exitosamente</h1>
-            <p><strong>Nombre del archivo:</strong> {filename}</p>
-            <p><strong>Tamaño:</strong> {len(file_content)} bytes</p>
-            <p><strong>Guardado en:</strong> {ruta_archivo}</p>
+            <h1 class="success">{titulo}</h1>{detalle_archivos}
           </body>
         </html>
         """
         confirmacion_html_bytes = confirmacion_html.encode('utf-8')
         
         # Construir la respuesta HTTP 200 OK
-        response = b"HTTP/1.1 200 OK\r\n"
-        response += b"Content-Type: text/html\r\n"
-        response += f"Content-Length: {len(confirmacion_html_bytes)}\r\n".encode('utf-8')
-        response += b"\r\n"
-        response += confirmacion_html_bytes
-        
+        return Respuesta(200, [('Content-Type', 'text/html')], confirmacion_html_bytes)
+    
+    except Exception as e:
+        # Error al procesar o guardar el archivo -> devolver 500 Internal Server Error
+        print(f"Error al procesar la carga del archivo: {e}")
+        error_html = f"""
+        <html>
+          <head><title>Error</title></head>
+          <body>
+            <h1>500 Internal Server Error</h1>
+            <p>Error al guardar el archivo: {str(e)}</p>
+          </body>
+        </html>
+        """
+        return Respuesta(500, [('Content-Type', 'text/html')], error_html.encode('utf-8'))
+
+
+def manejar_extraccion_tar(parser, indice=None):
+    """
+    Termina un POST /upload-tar: el ParserTar ya fue extrayendo los archivos a medida que llegaba el body.
+    Devuelve: Respuesta JSON con los archivos guardados; si el tar venía dañado o cortado, con el código
+              de error (400, o 415 si la compresión no está soportada) y los que se llegaron a guardar
+    """
+    archivos = parser.finalizar()
+    if indice is not None:
+        for nombre, _, _ in archivos:
+            indice.registrar(nombre)
+    if parser.error is not None:
+        codigo, mensaje = parser.error
+        return respuesta_archivos_guardados(archivos, codigo, mensaje)
+    return respuesta_archivos_guardados(archivos)
+
+
+# La respuesta 401 es siempre la misma: se arma una sola vez
+RESPUESTA_NO_AUTORIZADO = respuesta_fija(401, [('WWW-Authenticate', 'Bearer'), ('Content-Type', 'text/html')], """
+                        <html>
+                          <head><title>401 Unauthorized</title></head>
+                          <body>
+                            <h1>401 Unauthorized</h1>
+                            <p>Se requiere autenticación. Use el header: Authorization: Bearer {contraseña}</p>
+                          </body>
+                        </html>
+                        """.encode('utf-8'))
+
+
+def verificar_autenticacion(headers, password):
+    """
+    Requiere: headers: dict, headers del request (claves en minúsculas), password: str o None
+    Devuelve: Respuesta 401 si la autenticación falla, None si el request puede seguir
+    """
+    if password is None:
+        return None
+
+    # Comparación en tiempo constante: no deja adivinar la contraseña midiendo cuánto tarda el 401
+    auth_header = headers.get('authorization', '').encode('utf-8')
+    if hmac.compare_digest(auth_header, f"Bearer {password}".encode('utf-8')):
+        return None
+
+    # No autenticado - devolver 401 Unauthorized
+    return RESPUESTA_NO_AUTORIZADO
+
+
+RESPUESTA_SOBRECARGA = respuesta_fija(503, [('Retry-After', str(ESPERA_REINTENTO)), ('Content-Type', 'text/plain; charset=utf-8')],
+                                      "Servidor ocupado, reintentá en unos segundos\n".encode('utf-8'))
+
+
+class ControlAdmision:
+    """
+    Límite de requests en curso y de bytes de subidas en curso. admitir() se llama con la cabecera
+    ya parseada, antes de leer el body: si el request no entra hay que responder 503 enseguida
+    (RESPUESTA_SOBRECARGA) y si entra hay que llamar a liberar() cuando se termina de responder.
+    - max_requests: requests en curso como mucho (None sin límite)
+    - max_bytes_subida: suma máxima de los Content-Length en curso (None sin límite); una subida
+      sola siempre entra, aunque sea más grande
+    Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, max_requests=MAX_REQUESTS_EN_CURSO, max_bytes_subida=MAX_SUBIDAS_EN_CURSO_MB * 1024 * 1024):
+        self.max_requests = max_requests
+        self.max_bytes_subida = max_bytes_subida
+        self.requests = 0
+        self.bytes_subida = 0
+        self.lock = threading.Lock()
+
+    def admitir(self, content_length):
+        """Devuelve: bool, True si el request entra (y queda contado como en curso)."""
+        with self.lock:
+            if self.max_requests is not None and self.requests >= self.max_requests:
+                return False
+            if (self.max_bytes_subida is not None and content_length and self.bytes_subida
+                    and self.bytes_subida + content_length > self.max_bytes_subida):
+                return False
+            self.requests += 1
+            self.bytes_subida += content_length
+            return True
+
+    def liberar(self, content_length):
+        with self.lock:
+            self.requests -= 1
+            self.bytes_subida -= content_length
+
+
+class CabeceraInvalida(Exception):
+    """
+    El request no se puede atender tal como llegó.
+    - codigo: int, el status HTTP a responder (400 o 431)
+    """
+
+    def __init__(self, codigo, mensaje):
+        super().__init__(mensaje)
+        self.codigo = codigo
+
+
+class Solicitud:
+    """
+    Request HTTP ya parseado: request line, headers y query se interpretan una sola vez.
+    El body no forma parte: se lee aparte, por pedazos, con el receptor que corresponda.
+    - method, target (path con query), version: str de la request line
+    - path: str, la ruta sin query string
+    - query: dict nombre -> list de valores (parse_qs); query_params: dict nombre -> último valor
+    - headers: dict con claves en minúsculas (los headers repetidos quedan unidos por comas)
+    - tamaño_cabecera: int, bytes de la cabecera recibida
+    """
+
+    def __init__(self, method, target, version, headers, tamaño_cabecera=0):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.request_line = f"{method} {target} {version}"
+        self.path, _, self.query_string = target.partition('?')
+        try:
+            self.query = parse_qs(self.query_string, keep_blank_values=True, max_num_fields=MAX_PARAMETROS_QUERY)
+        except ValueError:
+            raise CabeceraInvalida(400, "demasiados parámetros en la query")
+        self.query_params = {nombre: valores[-1] for nombre, valores in self.query.items()}
+        self.headers = headers
+        self.tamaño_cabecera = tamaño_cabecera
+
+    def con_metodo(self, method):
+        """Devuelve una copia del request con otro método (HEAD se resuelve como GET)."""
+        copia = copy.copy(self)
+        copia.method = method
+        return copia
+
+
+def parsear_solicitud(cabecera):
+    """
+    Parsea la cabecera de un request HTTP (request line y headers), trabajando sobre bytes.
+    Requiere: cabecera: bytes, desde la request line hasta la línea vacía inclusive
+    Devuelve: Solicitud
+    Lanza CabeceraInvalida si la request line es inválida o hay demasiados headers o parámetros.
+    """
+    fin_linea = cabecera.find(b'\n')
+    if fin_linea == -1:
+        fin_linea = len(cabecera)
+    request_line = cabecera[:fin_linea].rstrip(b'\r').decode("utf-8", errors="replace")
+
+    # Extraer el método, el target y la versión de la request line
+    partes = request_line.split(" ")
+    if len(partes) == 2:
+        # Request sin versión (estilo HTTP/1.0 antiguo)
+        partes.append("HTTP/1.0")
+    if len(partes) != 3 or not partes[0] or not partes[1] or not partes[2].startswith("HTTP/"):
+        raise CabeceraInvalida(400, "request line inválida")
+    method, target, version = partes
+
+    headers, _ = parsear_headers_y_body(cabecera, MAX_CANTIDAD_HEADERS)
+    return Solicitud(method, target, version, headers, len(cabecera))
+
+
+def respuesta_error(codigo):
+    """Devuelve la respuesta de error sin body (ya serializada) para el código pedido."""
+    return RESPUESTAS_ERROR[codigo]
+
+
+def buscar_fin_headers(data, desde=0):
+    """
+    Requiere: data: bytes, el comienzo de un request, desde: int, posición desde donde buscar
+              (lo ya revisado en una búsqueda anterior no se vuelve a recorrer)
+    Devuelve: int, la posición siguiente al separador headers/body (\\r\\n\\r\\n o \\n\\n), -1 si todavía no llegó
+    """
+    fin = data.find(b"\r\n\r\n", desde)
+    if fin != -1:
+        return fin + 4
+    fin = data.find(b"\n\n", desde)
+    if fin != -1:
+        return fin + 2
+    return -1
+
+
+class LectorHTTP:
+    """
+    Lector con buffer sobre el socket de una conexión. Trabaja siempre con bytes: busca el fin de
+    la cabecera sin decodificar nada y entrega el body por pedazos sin juntarlo en memoria.
+    Lo que llega de más (por ejemplo el próximo request en pipeline) queda en el buffer.
+    - max_cabecera: tamaño máximo de la cabecera; si se pasa se lanza CabeceraInvalida(431)
+    - plazo_cabecera: segundos para que llegue la cabecera completa desde su primer byte (None sin plazo)
+    - tasa_minima, gracia: pasados gracia segundos, el body tiene que venir llegando a tasa_minima
+      bytes/s en promedio (None sin mínimo)
+    Si un plazo vence se lanza TimeoutError (el que espera entre requests lo pone quien usa el lector,
+    con settimeout sobre el socket).
+    """
+
+    def __init__(self, client_socket, max_cabecera=MAX_TAMAÑO_CABECERA, plazo_cabecera=None, tasa_minima=None,
+                 gracia=PLAZO_INACTIVIDAD):
+        self.socket = client_socket
+        self.max_cabecera = max_cabecera
+        self.plazo_cabecera = plazo_cabecera
+        self.tasa_minima = tasa_minima
+        self.gracia = gracia
+        self.buffer = bytearray()
+
+    def disponibles(self):
+        """Devuelve la cantidad de bytes ya recibidos y todavía no consumidos."""
+        return len(self.buffer)
+
+    def leer_cabecera(self):
+        """
+        Lee hasta tener la cabecera completa del próximo request (aunque llegue en varios pedazos).
+        Devuelve: bytes con la cabecera, o None si el cliente cerró la conexión
+        """
+        buffer = self.buffer
+        desde = 0
+        vencimiento = None
+        while True:
+            # Líneas vacías antes de la request line (por ejemplo un CRLF extra después de un POST) se ignoran
+            vacias = 0
+            while vacias < len(buffer) and buffer[vacias] in b"\r\n":
+                vacias += 1
+            if vacias:
+                del buffer[:vacias]
+                desde = 0
+            fin = buscar_fin_headers(buffer, desde)
+            if (fin if fin != -1 else len(buffer)) > self.max_cabecera:
+                raise CabeceraInvalida(431, "cabecera demasiado larga")
+            if fin != -1:
+                cabecera = bytes(buffer[:fin])
+                del buffer[:fin]
+                return cabecera
+            # El separador puede haber quedado partido entre dos recv: retroceder 3 bytes
+            desde = max(0, len(buffer) - 3)
+            if buffer and self.plazo_cabecera is not None:
+                # Ya empezó a llegar un request: la cabecera completa tiene que llegar a tiempo aunque
+                # el cliente mande de a un byte (slowloris)
+                if vencimiento is None:
+                    vencimiento = time.monotonic() + self.plazo_cabecera
+                restante = vencimiento - time.monotonic()
+                if restante <= 0:
+                    raise TimeoutError("la cabecera no llegó a tiempo")
+                self.socket.settimeout(restante)
+            chunk = self.socket.recv(TAMAÑO_LECTURA)
+            if not chunk:
+                return None
+            buffer += chunk
+
+    def leer_body(self, receptor, content_length):
+        """
+        Lee el body según Content-Length y se lo pasa por pedazos al receptor.
+        Requiere: receptor: objeto con feed(chunk) o None para descartar el body, content_length: int
+        Devuelve: int, bytes recibidos (menos que content_length si el cliente cerró antes)
+        """
+        # Primero lo que ya estaba en el buffer
+        recibidos = min(len(self.buffer), content_length)
+        if recibidos:
+            if receptor is not None:
+                with memoryview(self.buffer) as vista:
+                    receptor.feed(vista[:recibidos])
+            del self.buffer[:recibidos]
+
+        # Nunca se lee de más: lo que venga después es el próximo request de la conexión
+        buffer = bytearray(min(TAMAÑO_BLOQUE, max(content_length - recibidos, 0)))
+        vista = memoryview(buffer)
+        inicio = time.monotonic()
+        while recibidos < content_length:
+            leidos = self.socket.recv_into(vista, min(len(buffer), content_length - recibidos))
+            if not leidos:
+                break
+            if receptor is not None:
+                receptor.feed(vista[:leidos])
+            recibidos += leidos
+            if self.tasa_minima is not None:
+                verificar_tasa_minima(recibidos, time.monotonic() - inicio, self.tasa_minima, self.gracia)
+        return recibidos
+
+
+def verificar_tasa_minima(recibidos, transcurrido, tasa_minima, gracia):
+    """Lanza TimeoutError si pasados gracia segundos el body viene llegando a menos de tasa_minima bytes/s."""
+    if transcurrido > gracia and recibidos < (transcurrido - gracia) * tasa_minima:
+        raise TimeoutError("el body llega demasiado lento")
+
+
+class Vigilante:
+    """
+    Plazos de una conexión del event loop: si vence el plazo programado se aborta el transporte, y lo
+    que estaba esperando (leer la cabecera, el body o el drain de una respuesta) termina con EOF o error.
+    motivo dice qué se estaba esperando cuando venció (None si era solo la espera entre requests).
+    Es un único timer del loop por conexión, más barato que envolver cada operación en asyncio.wait_for:
+    renovar el plazo solo anota el nuevo vencimiento y el timer se reprograma cuando salta antes de tiempo.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+        self.timer = None
+        self.vencimiento = None
+        self.vencido = False
+        self.motivo = None
+
+    def plazo(self, segundos, motivo=None):
+        """Programa el vencimiento dentro de segundos (reemplaza al anterior); None lo cancela."""
+        self.motivo = motivo
+        if segundos is None:
+            self.vencimiento = None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            return
+        self.vencimiento = self.loop.time() + segundos
+        if self.timer is not None and self.timer.when() > self.vencimiento:
+            self.timer.cancel()
+            self.timer = None
+        if self.timer is None:
+            self.timer = self.loop.call_at(self.vencimiento, self._revisar)
+
+    def _revisar(self):
+        self.timer = None
+        if self.vencimiento is None:
+            return
+        if self.loop.time() < self.vencimiento:
+            # Se renovó mientras tanto
+            self.timer = self.loop.call_at(self.vencimiento, self._revisar)
+            return
+        self.vencido = True
+        self.transport.abort()
+
+
+async def leer_cabecera_async(reader, al_empezar=None):
+    """
+    Lee del StreamReader línea por línea hasta la línea vacía que cierra los headers.
+    Lo que sigue (body o el próximo request en pipeline) queda en el buffer del reader.
+    al_empezar se llama cuando llega la request line (para pasar del plazo de espera al de la cabecera).
+    Devuelve: bytes con la cabecera completa, o None si el cliente cerró la conexión
+    Lanza CabeceraInvalida(431) si la cabecera supera MAX_TAMAÑO_CABECERA o MAX_CANTIDAD_HEADERS líneas.
+    """
+    cabecera = bytearray()
+    lineas = 0
+    while True:
+        try:
+            linea = await reader.readline()
+        except ValueError:
+            # Línea más larga que el límite del StreamReader
+            raise CabeceraInvalida(431, "línea de la cabecera demasiado larga")
+        if not linea:
+            return None
+        if linea in (b"\r\n", b"\n"):
+            if not cabecera:
+                # Líneas vacías antes de la request line: se ignoran
+                continue
+            cabecera += linea
+            return bytes(cabecera)
+        if not cabecera and al_empezar is not None:
+            al_empezar()
+        cabecera += linea
+        lineas += 1
+        if len(cabecera) > MAX_TAMAÑO_CABECERA or lineas > MAX_CANTIDAD_HEADERS + 1:
+            raise CabeceraInvalida(431, "cabecera demasiado larga")
+
+
+def obtener_content_length(headers):
+    """
+    Requiere: headers: dict con claves en minúsculas
+    Devuelve: int, el Content-Length (0 si no está), o None si el valor es inválido
+    """
+    try:
+        content_length = int(headers.get("content-length", "0"))
+    except ValueError:
+        return None
+    if content_length < 0:
+        return None
+    return content_length
+
+
+def debe_mantener_conexion(request_line, headers):
+    """
+    Decide si la conexión sigue abierta después de responder.
+    En HTTP/1.1 la conexión es persistente salvo 'Connection: close';
+    en HTTP/1.0 solo si el cliente pide 'Connection: keep-alive'.
+    """
+    tokens = [t.strip() for t in headers.get('connection', '').lower().split(',')]
+    if 'close' in tokens:
+        return False
+    if request_line.rstrip().endswith("HTTP/1.1"):
+        return True
+    return 'keep-alive' in tokens
+
+
+def crear_receptor_body(solicitud, config):
+    """
+    Decide qué hacer con el body de un request a medida que llega.
+    Requiere: solicitud: Solicitud, config: dict con la configuración del servidor
+    Devuelve: un ParserMultipart si es una subida de archivos, un ParserTar si es un tar a extraer,
+              un ReceptorFragmento si es un fragmento de una subida reanudable, None si el body se descarta
+    """
+    if solicitud.method == "PUT" and solicitud.path.startswith("/uploads/"):
+        sesion = SesionSubida.abrir("archivos_servidor", solicitud.path[len("/uploads/"):])
+        if sesion is not None:
+            offset, error = offset_fragmento(solicitud, sesion)
+            if error is None:
+                try:
+                    return ReceptorFragmento(sesion, offset)
+                except FileNotFoundError:
+                    # La sesión se borró recién: el PUT responde 404
+                    pass
+        return None
+    if solicitud.method == "POST" and solicitud.path == "/upload-tar":
+        os.makedirs("archivos_servidor", exist_ok=True)
+        return ParserTar("archivos_servidor", config['almacen'])
+    if solicitud.method == "POST" and solicitud.path in ("/", ""):
+        boundary = extraer_boundary(solicitud.headers)
+        if boundary:
+            # Asegurar directorio de destino para guardar archivos
+            if not os.path.exists("archivos_servidor"):
+                os.makedirs("archivos_servidor", exist_ok=True)
+            return ParserMultipart(boundary, "archivos_servidor", config['almacen'])
+    return None
+
+
+async def recibir_body_async(reader, receptor, content_length, control=None, vigilante=None, config=None):
+    """
+    Igual que LectorHTTP.leer_body pero leyendo de un asyncio.StreamReader.
+    control es el ControlAncho de la conexión, o None si no hay límites de ancho de banda.
+    Con un Vigilante cada pedazo tiene que llegar antes de config['plazo_inactividad'] segundos
+    y el promedio no puede bajar de config['tasa_minima_body'] (ver verificar_tasa_minima).
+    El receptor escribe en disco en un hilo aparte, así no frena al event loop.
+    """
+    recibidos = 0
+    bloque = TAMAÑO_BLOQUE if control is None else PORCION_LIMITADA
+    inicio = time.monotonic()
+    while recibidos < content_length:
+        if vigilante is not None:
+            vigilante.plazo(config['plazo_inactividad'], "el body no llegó a tiempo")
+        chunk = await reader.read(min(bloque, content_length - recibidos))
+        if not chunk:
+            break
+        if receptor is not None:
+            await asyncio.to_thread(receptor.feed, chunk)
+        recibidos += len(chunk)
+        if vigilante is not None and config['tasa_minima_body'] is not None:
+            verificar_tasa_minima(recibidos, time.monotonic() - inicio, config['tasa_minima_body'],
+                                  config['plazo_inactividad'])
+        if control is not None:
+            await control.esperar_async(len(chunk))
+    if vigilante is not None and vigilante.vencido:
+        raise TimeoutError(vigilante.motivo)
+    return recibidos
+
+
+def generar_respuesta_html(headers, config, query_params=None):
+    """
+    Genera la respuesta con la interfaz HTML según el modo del servidor.
+    Si está en modo upload, muestra ambas opciones (subir y descargar).
+    El listado sale del IndiceDirectorio (paginado y ordenado según query_params) y cada página
+    se guarda ya renderizada y comprimida, con su ETag, hasta que cambie el directorio.
+    """
+    if query_params is None:
+        query_params = {}
+    indice = config['indice']
+    modo_actual = 'both' if config['modo_upload'] else 'download'
+
+    # Elegir la codificación según lo que acepte el cliente
+    codec = None
+    if config['comprimir_gzip']:
+        codec = negociar_codificacion(headers, config['compresion'])
+
+    if modo_actual == 'both':
+        indice.revisar()
+        pagina, por_pagina, orden, descendente = parametros_indice(query_params, config['por_pagina'])
+        clave = (modo_actual, pagina, por_pagina, orden, descendente, codec)
+    else:
+        clave = (modo_actual, codec)
+
+    entrada = indice.obtener_pagina(clave)
+    if entrada is None:
+        version = indice.version
+        mtime = None
+        if modo_actual == 'both':
+            # En modo 'both' la página lista los archivos: cambia cuando cambia el índice
+            mtime = indice.modificado
+            archivos = indice.listar(orden, descendente)
+            total_paginas = max(1, -(-len(archivos) // por_pagina))
+            pagina = min(pagina, total_paginas)
+            navegacion = generar_navegacion_indice(pagina, total_paginas, por_pagina, orden, descendente)
+            inicio = (pagina - 1) * por_pagina
+            html_content = generar_html_interfaz(modo_actual, archivos=archivos[inicio:inicio + por_pagina],
+                                                 navegacion=navegacion)
+        else:
+            html_content = generar_html_interfaz(modo_actual)
+        html_bytes = html_content.encode('utf-8')
+        etag = etag_con_codificacion(f'"{hashlib.blake2b(html_bytes, digest_size=8).hexdigest()}"', codec)
+
+        # Comprimir HTML si está habilitado y el cliente lo acepta
+        headers_respuesta = [('Content-Type', 'text/html')]
+        if codec is not None:
+            html_bytes = comprimir_datos(html_bytes, codec, config['compresion'])
+            headers_respuesta.append(('Content-Encoding', codec))
+
+        # La página cambia con cada subida: siempre se revalida
+        validacion = headers_validacion(etag, mtime, CACHE_CONTROL_DEFECTO, config['comprimir_gzip'])
+        # Se guarda la respuesta ya serializada: se reenvía tal cual mientras no cambie el índice
+        entrada = (respuesta_fija(200, headers_respuesta + validacion, html_bytes), etag, mtime, validacion)
+        indice.guardar_pagina(clave, version, entrada)
+    respuesta, etag, mtime, validacion = entrada
+
+    if no_fue_modificado(headers, etag, mtime):
+        return respuesta_no_modificado(validacion)
+    return respuesta
+
+
+def respuesta_listado(solicitud, config):
+    """
+    GET /list: los archivos que se pueden descargar, en JSON, para clientes que no usan la página.
+    Con sha256=1 cada archivo trae también su SHA-256 (calculado una vez por versión, ver hash_contenido)
+    y con uno o más archivo=NOMBRE se listan solo esos.
+    Devuelve: Respuesta con {"archivos": [{"nombre", "tamaño", "sha256"}, ...]}
+    """
+    if config['modo_upload']:
+        indice = config['indice']
+        indice.revisar()
+        archivos = indice.listar()
+    else:
+        # En modo download solo se ofrece el archivo elegido al lanzar el servidor
+        archivos = []
+        try:
+            archivos.append((os.path.basename(config['archivo_descarga']), os.path.getsize(config['archivo_descarga'])))
+        except (OSError, TypeError):
+            pass
+
+    pedidos = solicitud.query.get('archivo')
+    if pedidos is not None:
+        pedidos = set(pedidos)
+        archivos = [(nombre, tamaño) for nombre, tamaño in archivos if nombre in pedidos]
+
+    listado = []
+    for nombre, tamaño in archivos:
+        entrada = {'nombre': nombre, 'tamaño': tamaño}
+        if solicitud.query_params.get('sha256') == '1':
+            ruta = os.path.join("archivos_servidor", nombre)
+            try:
+                with open(ruta, 'rb') as archivo:
+                    stat = os.fstat(archivo.fileno())
+                    # Con --dedup el hash de lo subido ya se conoce sin leer el archivo
+                    digest = config['almacen'].hash_de(nombre, stat) if config['almacen'] is not None else None
+                    if digest is None:
+                        inicio = time.perf_counter()
+                        digest = hash_contenido(ruta, archivo, stat)
+                        sumar_tiempo('disco_lectura', inicio)
+                    entrada['sha256'] = digest
+                    # El tamaño que corresponde al hash es el del archivo abierto
+                    entrada['tamaño'] = stat.st_size
+            except OSError:
+                # Se borró entre el listado y ahora
+                continue
+        listado.append(entrada)
+
+    cuerpo = json.dumps({'archivos': listado}, ensure_ascii=False).encode('utf-8')
+    response = Respuesta(200, [('Content-Type', 'application/json; charset=utf-8'), ('Cache-Control', 'no-store')],
+                         cuerpo)
+    return comprimir_respuesta(response, solicitud.headers, config)
+
+
+def es_sha256(valor):
+    """Devuelve True si valor es un SHA-256 en hexadecimal (64 dígitos en minúscula)."""
+    return len(valor) == 64 and all(c in '0123456789abcdef' for c in valor)
+
+
+def nombre_archivo_valido(nombre):
+    """
+    Devuelve True si nombre sirve para guardar un archivo en archivos_servidor: un nombre solo (sin
+    directorios), no vacío, no oculto (los ocultos son del servidor: .sesiones, .blobs, temporales) y
+    sin caracteres de control ni comillas dobles, que después irían a parar a headers de la respuesta.
+    """
+    return (nombre != "" and nombre == os.path.basename(nombre) and not nombre.startswith('.')
+            and '"' not in nombre and not any(ord(c) < 32 or 127 <= ord(c) < 160 for c in nombre))
+
+
+def respuesta_json(codigo, datos):
+    """Devuelve: Respuesta con datos serializados en JSON (sin guardar en caches)."""
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode('utf-8')
+    return Respuesta(codigo, [('Content-Type', 'application/json; charset=utf-8'), ('Cache-Control', 'no-store')], cuerpo)
+
+
+def offset_fragmento(solicitud, sesion):
+    """
+    Requiere: solicitud: un PUT /uploads/<id>, sesion: SesionSubida
+    Devuelve: tuple (offset donde va el body, None) o (None, código de error: 400 o 416)
+    """
+    try:
+        offset = int(solicitud.query_params.get('offset', ''))
+    except ValueError:
+        return None, 400
+    if offset < 0:
+        return None, 400
+    if offset + (obtener_content_length(solicitud.headers) or 0) > sesion.tamaño:
+        return None, 416
+    return offset, None
+
+
+def manejar_subida_reanudable(solicitud, body, config):
+    """
+    Subidas reanudables (/uploads), para archivos grandes sobre conexiones que se cortan:
+    - POST /uploads?nombre=N&tamaño=T[&sha256=H]: crea la sesión (201), o con sha256 devuelve la que ya
+      había para ese mismo archivo (200) con lo que ya se recibió
+    - PUT /uploads/ID?offset=O: escribe el body a partir de O (se pueden mandar varios en paralelo)
+    - GET|HEAD /uploads/ID: estado de la sesión con los rangos recibidos y cuánto falta
+    - POST /uploads/ID/complete[?sha256=H]: verifica que no falte nada y el SHA-256, y guarda el archivo
+    - DELETE /uploads/ID: descarta la sesión
+    Requiere: body: el ReceptorFragmento que recibió el body de un PUT (ver crear_receptor_body) o None
+    Devuelve: Respuesta (JSON con el estado de la sesión, salvo errores sin body)
+    """
+    partes = solicitud.path.strip('/').split('/')
+    method = solicitud.method
+    query_params = solicitud.query_params
+
+    if len(partes) == 1:
+        if method != "POST":
+            return respuesta_error(404)
+        nombre = query_params.get('nombre', '')
+        sha256 = query_params.get('sha256') or None
+        try:
+            tamaño = int(query_params.get('tamaño', ''))
+        except ValueError:
+            return respuesta_error(400)
+        if not nombre_archivo_valido(nombre) or tamaño < 0 or (sha256 is not None and not es_sha256(sha256)):
+            return respuesta_error(400)
+        if tamaño > min(MAX_TAMAÑO_SESION, shutil.disk_usage("archivos_servidor").free):
+            return respuesta_error(413)
+        try:
+            sesion, creada = SesionSubida.crear("archivos_servidor", nombre, tamaño, sha256)
+        except OSError as e:
+            return respuesta_error(413 if e.errno in (errno.EFBIG, errno.ENOSPC) else 500)
+        response = respuesta_json(201 if creada else 200, sesion.describir())
+        response.headers.append(('Location', f"/uploads/{sesion.id}"))
+        return response
+
+    sesion = SesionSubida.abrir("archivos_servidor", partes[1])
+    if sesion is None or len(partes) > 3 or (len(partes) == 3 and partes[2] != "complete"):
+        return respuesta_error(404)
+
+    if method == "PUT" and len(partes) == 2:
+        if body is None:
+            _, error = offset_fragmento(solicitud, sesion)
+            return respuesta_error(error or 400)
+        try:
+            if body.finalizar():
+                return respuesta_json(200, sesion.describir())
+        except FileNotFoundError:
+            pass
+        # La sesión se borró (DELETE) o se completó mientras llegaba el fragmento
+        return respuesta_error(404)
+
+    if method == "GET" and len(partes) == 2:
+        return respuesta_json(200, sesion.describir())
+
+    if method == "DELETE" and len(partes) == 2:
+        shutil.rmtree(sesion.directorio, ignore_errors=True)
+        return respuesta_json(200, {'id': sesion.id})
+
+    if method == "POST" and len(partes) == 3:
+        estado = sesion.describir()
+        if estado['faltan']:
+            return respuesta_json(409, dict(estado, error="todavía faltan datos"))
+        esperado = query_params.get('sha256') or sesion.sha256
+        # Renombrar la sesión la reserva: si llegan dos complete a la vez, el segundo recibe 404
+        reservada = os.path.join(os.path.dirname(sesion.directorio), f".completando-{sesion.id}")
+        try:
+            os.rename(sesion.directorio, reservada)
+        except OSError:
+            return respuesta_error(404)
+        ruta_datos = os.path.join(reservada, "datos")
+        inicio = time.perf_counter()
+        digest = hash_archivo(ruta_datos)
+        sumar_tiempo('disco_lectura', inicio)
+        if esperado is not None and digest != esperado:
+            # Algún fragmento llegó mal: se descarta lo recibido para que el cliente lo vuelva a mandar
+            open(os.path.join(reservada, "rangos.log"), 'wb').close()
+            os.rename(reservada, sesion.directorio)
+            return respuesta_json(409, dict(sesion.describir(), error="el SHA-256 no coincide", sha256_recibido=digest))
+        ruta_archivo = os.path.join("archivos_servidor", sesion.nombre)
+        if config['almacen'] is not None:
+            config['almacen'].guardar(ruta_datos, sesion.nombre, digest)
+        else:
+            os.replace(ruta_datos, ruta_archivo)
+        shutil.rmtree(reservada, ignore_errors=True)
+        config['indice'].registrar(sesion.nombre)
+        return respuesta_archivos_guardados([(sesion.nombre, ruta_archivo, sesion.tamaño)])
+
+    return respuesta_error(404)
+
+
+def manejar_blob(solicitud, config):
+    """
+    /blob, solo con --dedup, para que un cliente no mande contenido que el servidor ya tiene:
+    - GET|HEAD /blob?sha256=HEX: 200 (JSON con el tamaño) si el almacén tiene ese contenido, 404 si no
+    - POST /blob?sha256=HEX&nombre=NOMBRE (sin body): guarda NOMBRE con ese contenido sin subirlo;
+      responde como una subida (JSON con el archivo guardado) o 404 si el almacén no lo tiene
+    """
+    almacen = config['almacen']
+    digest = solicitud.query_params.get('sha256', '')
+    if almacen is None or not es_sha256(digest):
+        return respuesta_error(404)
+
+    if solicitud.method == "POST":
+        nombre = solicitud.query_params.get('nombre', '')
+        if not nombre_archivo_valido(nombre):
+            return respuesta_error(400)
+        tamaño = almacen.enlazar(digest, nombre)
+        if tamaño is None:
+            return respuesta_error(404)
+        config['indice'].registrar(nombre)
+        return respuesta_archivos_guardados([(nombre, os.path.join("archivos_servidor", nombre), tamaño)])
+
+    tamaño = almacen.tamaño(digest)
+    if tamaño is None:
+        return respuesta_error(404)
+    cuerpo = json.dumps({'sha256': digest, 'tamaño': tamaño}, ensure_ascii=False).encode('utf-8')
+    return Respuesta(200, [('Content-Type', 'application/json; charset=utf-8'), ('Cache-Control', 'no-store')], cuerpo)
+
+
+def ruta_descarga(query_params, config):
+    """
+    Devuelve: str, la ruta del archivo que pide un GET /download: el parámetro archivo si está, si no
+              archivo_descarga; None si el nombre no es válido o no hay ninguno
+    """
+    if 'archivo' not in query_params:
+        return config['archivo_descarga']
+    nombre_archivo = query_params['archivo']
+    # Solo nombres de archivo dentro de archivos_servidor (sin '..' ni subdirectorios) y no los ocultos,
+    # que son del servidor (subidas en curso, sesiones, blobs)
+    if not nombre_archivo_valido(nombre_archivo):
+        return None
+    return os.path.join("archivos_servidor", nombre_archivo)
+
+
+def respuesta_en_memoria(solicitud, config):
+    """
+    Devuelve la respuesta de un GET|HEAD /download que se puede armar sin leer el disco (el archivo
+    está en CacheArchivos y, si se pide comprimido, su variante en la cache de comprimidos), o None.
+    El modo async la prueba antes de mandar generar_respuesta a un hilo aparte.
+    """
+    if solicitud.method not in ("GET", "HEAD") or solicitud.path != "/download" or config['cache_archivos'] is None:
+        return None
+    ruta = ruta_descarga(solicitud.query_params, config)
+    entrada = config['cache_archivos'].obtener(ruta) if ruta is not None else None
+    if entrada is None:
+        return None
+    response = respuesta_desde_cache(entrada, solicitud.headers, config['cache_comprimidos'], config['compresion'])
+    if response is not None and solicitud.method == "HEAD":
+        response = quitar_body(response)
+    return response
+
+
+def generar_respuesta(solicitud, body, config):
+    """
+    Determina la respuesta para un request ya recibido. Es el ruteo común a todos los modos de concurrencia.
+    Requiere: solicitud: Solicitud, body: el receptor que recibió el body (ver crear_receptor_body) o None,
+              config: dict con la configuración del servidor
+    Devuelve: Respuesta (o RespuestaArchivo / RespuestaStreaming)
+    """
+    comprimir_gzip = config['comprimir_gzip']
+    method, path = solicitud.method, solicitud.path
+    query_params, headers = solicitud.query_params, solicitud.headers
+
+    if method == "HEAD":
+        # Igual que GET pero sin body (lo usan los gestores de descarga para ver tamaño y Accept-Ranges)
+        return quitar_body(generar_respuesta(solicitud.con_metodo("GET"), body, config))
+
+    if method == "GET":
+        if path == "/":
+            response = generar_respuesta_html(headers, config, query_params)
+        elif path == "/metrics":
+            response = respuesta_metricas(config)
+        elif path == "/list":
+            response = respuesta_listado(solicitud, config)
+        elif path == "/download-bundle":
+            response = manejar_descarga_paquete(solicitud, config)
+        elif path == "/blob":
+            response = manejar_blob(solicitud, config)
+        elif path.startswith("/uploads/"):
+            response = manejar_subida_reanudable(solicitud, body, config)
+        elif path == "/download":
+            response = manejar_descarga(ruta_descarga(query_params, config), solicitud.request_line, headers=headers, comprimir_gzip=comprimir_gzip,
+                                        cache_comprimidos=config['cache_comprimidos'], compresion=config['compresion'],
+                                        cache_control=config['cache_control'], etag_por_hash=config['etag_por_hash'],
+                                        cache_archivos=config['cache_archivos'])
+        else:
+            # Ruta no encontrada
+            response = respuesta_error(404)
+
+    elif method == "POST":
+        if path == "/" or path == "":
+            boundary = extraer_boundary(headers)
+
+            if boundary and body:
+                # Procesar los archivos subidos (body es el ParserMultipart que los fue guardando)
+                como_json = 'application/json' in headers.get('accept', '')
+                response = manejar_carga(body, boundary, directorio_destino="archivos_servidor", indice=config['indice'],
+                                         como_json=como_json)
+
+                # Comprimir la confirmación si está habilitado y el cliente lo acepta
+                response = comprimir_respuesta(response, headers, config)
+            else:
+                # No había boundary o body -> no se pudo procesar el POST
+                response = respuesta_error(400)
+
+        elif path == "/blob":
+            response = manejar_blob(solicitud, config)
+
+        elif path == "/uploads" or path.startswith("/uploads/"):
+            response = manejar_subida_reanudable(solicitud, body, config)
+
+        elif path == "/upload-tar":
+            # Archivos extraídos de un tar (body es el ParserTar que los fue guardando)
+            response = comprimir_respuesta(manejar_extraccion_tar(body, indice=config['indice']), headers, config)
+
+        else:
+            # Si hacen POST a otra ruta, devolvés el HTML normal
+            response = generar_respuesta_html(headers, config)
+
+    elif method in ("PUT", "DELETE") and path.startswith("/uploads/"):
+        response = manejar_subida_reanudable(solicitud, body, config)
+
+    else:
+        response = respuesta_error(404)
+
+    return response
+
+
+def comprimir_respuesta(response, headers, config):
+    """
+    Etapa de compresión para las respuestas generadas en memoria, antes de serializarlas.
+    Requiere: response: Respuesta, headers: dict del request, config: dict con la configuración del servidor
+    Devuelve: una Respuesta nueva con el body comprimido (y Content-Encoding), o la misma si no corresponde
+    """
+    if not config['comprimir_gzip'] or not response.cuerpo or response.obtener_header('Content-Encoding'):
         return response
-    
-    except Exception as e:
-        # Error al procesar o guardar el archivo -> devolver 500 Internal Server Error
-        print(f"Error al procesar la carga del archivo: {e}")
-        error_html = f"""
-        <html>
-          <head><title>Error</title></head>
-          <body>
-            <h1>500 Internal Server Error</h1>
-            <p>Error al guardar el archivo: {str(e)}</p>
-          </body>
-        </html>
-        """
-        error_html_bytes = error_html.encode('utf-8')
-        response = b"HTTP/1.1 500 Internal Server Error\r\n"
-        response += b"Content-Type: text/html\r\n"
-        response += f"Content-Length: {len(error_html_bytes)}\r\n".encode('utf-8')
-        response += b"\r\n"
-        response += error_html_bytes
+    content_type = response.obtener_header('Content-Type')
+    if content_type is None or not es_comprimible(content_type):
         return response
+    headers_respuesta = response.headers + [('Vary', 'Accept-Encoding')]
+    codec = negociar_codificacion(headers, config['compresion'])
+    if codec is None:
+        return Respuesta(response.codigo, headers_respuesta, response.cuerpo)
+    comprimido = comprimir_datos(b"".join(response.cuerpo), codec, config['compresion'])
+    return Respuesta(response.codigo, headers_respuesta + [('Content-Encoding', codec)], comprimido)
+
+
+def quitar_body(response):
+    """
+    Requiere: response: Respuesta (o RespuestaArchivo / RespuestaStreaming)
+    Devuelve: Respuesta con solo la status line y los headers (para responder a HEAD)
+    """
+    return response.sin_cuerpo()
+
+
+class MedicionRequest:
+    """
+    Tiempos y contadores de un request mientras se atiende.
+    - fases: dict fase -> segundos acumulados (accept, parseo, body, respuesta, disco_lectura,
+      disco_escritura, compresion, envio)
+    - compresion: dict codec -> [bytes de entrada, bytes de salida]
+    Las funciones que hacen el trabajo suman su parte con sumar_tiempo() / sumar_compresion()
+    sobre el request actual (MEDICION_ACTUAL), así no hace falta pasarles la medición.
+    """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fases = {}
+        self.compresion = {}
+
+    def sumar(self, fase, segundos):
+        self.fases[fase] = self.fases.get(fase, 0.0) + segundos
+
+
+# Medición del request que se está atendiendo en este hilo o tarea de asyncio
+MEDICION_ACTUAL = contextvars.ContextVar('medicion_actual', default=None)
+
+
+def sumar_tiempo(fase, inicio):
+    """Suma al request actual el tiempo transcurrido desde inicio (time.perf_counter()) en la fase indicada."""
+    medicion = MEDICION_ACTUAL.get()
+    if medicion is not None:
+        medicion.sumar(fase, time.perf_counter() - inicio)
+
+
+def sumar_compresion(codec, entrada, salida):
+    """Suma al request actual los bytes que entraron y salieron del compresor."""
+    medicion = MEDICION_ACTUAL.get()
+    if medicion is not None:
+        totales = medicion.compresion.setdefault(codec, [0, 0])
+        totales[0] += entrada
+        totales[1] += salida
+
+
+def ruta_metrica(path):
+    """Agrupa las rutas para las etiquetas de las métricas (así una URL inventada no crea series nuevas)."""
+    if path.startswith("/uploads/"):
+        # Las sesiones de subida se agrupan (si no cada id sería una serie)
+        return "/uploads"
+    return path if path in RUTAS_METRICAS else "otra"
+
+
+def codigo_respuesta(response):
+    """Devuelve el código de estado (str de 3 dígitos) de una respuesta ya armada."""
+    return str(response.codigo)
+
+
+class Histograma:
+    """Histograma acumulativo al estilo Prometheus con límites fijos (en segundos)."""
+
+    def __init__(self, limites=LIMITES_HISTOGRAMA):
+        self.limites = limites
+        self.cuentas = [0] * len(limites)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.cuentas[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+
+    def combinar(self, cuentas, suma, total):
+        """Suma los valores de otro histograma con los mismos límites (por ejemplo de otro worker)."""
+        for i, cuenta in enumerate(cuentas):
+            self.cuentas[i] += cuenta
+        self.suma += suma
+        self.total += total
+
+    def exportar(self, nombre, etiquetas):
+        """Devuelve las líneas _bucket, _sum y _count en formato de texto de Prometheus."""
+        lineas = []
+        acumulado = 0
+        for limite, cuenta in zip(self.limites, self.cuentas):
+            acumulado += cuenta
+            lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite:g}"}} {acumulado}')
+        lineas.append(f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {self.total}')
+        lineas.append(f'{nombre}_sum{{{etiquetas}}} {self.suma:.6f}')
+        lineas.append(f'{nombre}_count{{{etiquetas}}} {self.total}')
+        return lineas
+
+
+class Metricas:
+    """
+    Contadores e histogramas del servidor, expuestos en /metrics (formato de texto de Prometheus).
+    Si se pasa ruta_access_log, además escribe una línea JSON por request ('-' es la salida estándar).
+    Es seguro usarla desde varios hilos.
+    Con varios procesos (--workers) cada worker tiene la suya y la publica cada tanto como JSON en
+    directorio_workers (ver publicar); exportar_total junta las de todos.
+    """
+
+    def __init__(self, ruta_access_log=None):
+        self.lock = threading.Lock()
+        self.inicio = time.time()
+        self.requests = {}
+        self.duraciones = {}
+        self.fases = {}
+        self.bytes_recibidos = 0
+        self.bytes_enviados = 0
+        self.compresion = {}
+        self.conexiones_activas = 0
+        self.conexiones_totales = 0
+        self.rechazos = {}
+        self.handshakes = {}
+        self.directorio_workers = None
+        self.access_log = None
+        if ruta_access_log == '-':
+            self.access_log = sys.stdout
+        elif ruta_access_log:
+            self.access_log = open(ruta_access_log, 'a', encoding='utf-8', buffering=1)
+
+    def conexion_abierta(self):
+        with self.lock:
+            self.conexiones_activas += 1
+            self.conexiones_totales += 1
+
+    def conexion_cerrada(self):
+        with self.lock:
+            self.conexiones_activas -= 1
+
+    def rechazo(self, motivo):
+        """Cuenta un request o conexión cortada por protección: 'sobrecarga', 'conexiones' o 'lento'."""
+        with self.lock:
+            self.rechazos[motivo] = self.rechazos.get(motivo, 0) + 1
+
+    def handshake_tls(self, reanudado):
+        """Cuenta un handshake TLS terminado: 'reanudado' si se retomó una sesión (ticket), si no 'completo'."""
+        tipo = 'reanudado' if reanudado else 'completo'
+        with self.lock:
+            self.handshakes[tipo] = self.handshakes.get(tipo, 0) + 1
+
+    def registrar(self, medicion, cliente, method, path, codigo, recibidos, enviados):
+        """
+        Agrega un request terminado a los totales y lo escribe en el access log.
+        Requiere: medicion: MedicionRequest, cliente: dirección del cliente, method, path, codigo: str,
+                  recibidos, enviados: int, bytes del request y de la respuesta
+        """
+        duracion = time.perf_counter() - medicion.inicio
+        ruta = ruta_metrica(path)
+        with self.lock:
+            clave = (method, ruta, codigo)
+            self.requests[clave] = self.requests.get(clave, 0) + 1
+            self.duraciones.setdefault((method, ruta), Histograma()).observar(duracion)
+            for fase, segundos in medicion.fases.items():
+                self.fases.setdefault(fase, Histograma()).observar(segundos)
+            self.bytes_recibidos += recibidos
+            self.bytes_enviados += enviados
+            for codec, (entrada, salida) in medicion.compresion.items():
+                totales = self.compresion.setdefault(codec, [0, 0])
+                totales[0] += entrada
+                totales[1] += salida
+
+            if self.access_log is not None:
+                registro = {
+                    'ts': round(time.time(), 3),
+                    'cliente': cliente[0] if isinstance(cliente, tuple) else str(cliente),
+                    'metodo': method,
+                    'ruta': path,
+                    'codigo': int(codigo) if codigo.isdigit() else codigo,
+                    'bytes_recibidos': recibidos,
+                    'bytes_enviados': enviados,
+                    'duracion_ms': round(duracion * 1000, 3),
+                    'fases_ms': {fase: round(segundos * 1000, 3) for fase, segundos in medicion.fases.items()},
+                }
+                if medicion.compresion:
+                    registro['compresion'] = {codec: {'entrada': entrada, 'salida': salida}
+                                              for codec, (entrada, salida) in medicion.compresion.items()}
+                try:
+                    self.access_log.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                except (OSError, ValueError) as e:
+                    print(f"No se pudo escribir el access log: {e}")
+
+    def exportar(self):
+        """Devuelve str con todas las métricas en formato de texto de Prometheus."""
+        with self.lock:
+            lineas = [
+                "# HELP servidor_inicio_segundos Momento en que arrancó el servidor (epoch).",
+                "# TYPE servidor_inicio_segundos gauge",
+                f"servidor_inicio_segundos {self.inicio:.3f}",
+                "# HELP servidor_conexiones_activas Conexiones abiertas en este momento.",
+                "# TYPE servidor_conexiones_activas gauge",
+                f"servidor_conexiones_activas {self.conexiones_activas}",
+                "# HELP servidor_conexiones_total Conexiones aceptadas.",
+                "# TYPE servidor_conexiones_total counter",
+                f"servidor_conexiones_total {self.conexiones_totales}",
+                "# HELP servidor_rechazos_total Requests respondidos con 503 y conexiones cortadas por lentas, por motivo.",
+                "# TYPE servidor_rechazos_total counter",
+            ]
+            for motivo, cantidad in sorted(self.rechazos.items()):
+                lineas.append(f'servidor_rechazos_total{{motivo="{motivo}"}} {cantidad}')
+            lineas += [
+                "# HELP servidor_tls_handshakes_total Handshakes TLS terminados, completos o con la sesión retomada.",
+                "# TYPE servidor_tls_handshakes_total counter",
+            ]
+            for tipo, cantidad in sorted(self.handshakes.items()):
+                lineas.append(f'servidor_tls_handshakes_total{{tipo="{tipo}"}} {cantidad}')
+            lineas += [
+                "# HELP http_requests_total Requests respondidos por método, ruta y código.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, ruta, codigo), cantidad in sorted(self.requests.items()):
+                lineas.append(f'http_requests_total{{metodo="{method}",ruta="{ruta}",codigo="{codigo}"}} {cantidad}')
+            lineas += [
+                "# HELP http_bytes_recibidos_total Bytes recibidos (headers y body de los requests).",
+                "# TYPE http_bytes_recibidos_total counter",
+                f"http_bytes_recibidos_total {self.bytes_recibidos}",
+                "# HELP http_bytes_enviados_total Bytes enviados (headers y body de las respuestas).",
+                "# TYPE http_bytes_enviados_total counter",
+                f"http_bytes_enviados_total {self.bytes_enviados}",
+                "# HELP http_request_duracion_segundos Tiempo desde que llega la cabecera hasta terminar de enviar la respuesta.",
+                "# TYPE http_request_duracion_segundos histogram",
+            ]
+            for (method, ruta), histograma in sorted(self.duraciones.items()):
+                lineas += histograma.exportar("http_request_duracion_segundos", f'metodo="{method}",ruta="{ruta}"')
+            lineas += [
+                "# HELP servidor_fase_segundos Tiempo de cada etapa de un request.",
+                "# TYPE servidor_fase_segundos histogram",
+            ]
+            for fase, histograma in sorted(self.fases.items()):
+                lineas += histograma.exportar("servidor_fase_segundos", f'fase="{fase}"')
+            lineas += [
+                "# HELP compresion_bytes_entrada_total Bytes que entraron al compresor.",
+                "# TYPE compresion_bytes_entrada_total counter",
+            ]
+            for codec, (entrada, _) in sorted(self.compresion.items()):
+                lineas.append(f'compresion_bytes_entrada_total{{codec="{codec}"}} {entrada}')
+            lineas += [
+                "# HELP compresion_bytes_salida_total Bytes que salieron del compresor.",
+                "# TYPE compresion_bytes_salida_total counter",
+            ]
+            for codec, (_, salida) in sorted(self.compresion.items()):
+                lineas.append(f'compresion_bytes_salida_total{{codec="{codec}"}} {salida}')
+            lineas += [
+                "# HELP compresion_ratio Bytes comprimidos sobre bytes originales.",
+                "# TYPE compresion_ratio gauge",
+            ]
+            for codec, (entrada, salida) in sorted(self.compresion.items()):
+                if entrada:
+                    lineas.append(f'compresion_ratio{{codec="{codec}"}} {salida / entrada:.4f}')
+        return "\n".join(lineas) + "\n"
+
+    def estado(self):
+        """Devuelve los totales como un dict serializable en JSON (para juntar los de varios workers)."""
+        with self.lock:
+            return {
+                'inicio': self.inicio,
+                'conexiones_activas': self.conexiones_activas,
+                'conexiones_totales': self.conexiones_totales,
+                'rechazos': [[motivo, cantidad] for motivo, cantidad in self.rechazos.items()],
+                'handshakes': [[tipo, cantidad] for tipo, cantidad in self.handshakes.items()],
+                'requests': [[method, ruta, codigo, cantidad]
+                             for (method, ruta, codigo), cantidad in self.requests.items()],
+                'duraciones': [[method, ruta, h.cuentas, h.suma, h.total]
+                               for (method, ruta), h in self.duraciones.items()],
+                'fases': [[fase, h.cuentas, h.suma, h.total] for fase, h in self.fases.items()],
+                'bytes_recibidos': self.bytes_recibidos,
+                'bytes_enviados': self.bytes_enviados,
+                'compresion': [[codec, entrada, salida] for codec, (entrada, salida) in self.compresion.items()],
+            }
+
+    def combinar(self, estado):
+        """Suma a estas métricas un estado devuelto por estado() (de esta u otra instancia)."""
+        with self.lock:
+            self.inicio = min(self.inicio, estado['inicio'])
+            self.conexiones_activas += estado['conexiones_activas']
+            self.conexiones_totales += estado['conexiones_totales']
+            for motivo, cantidad in estado.get('rechazos', []):
+                self.rechazos[motivo] = self.rechazos.get(motivo, 0) + cantidad
+            for tipo, cantidad in estado.get('handshakes', []):
+                self.handshakes[tipo] = self.handshakes.get(tipo, 0) + cantidad
+            for method, ruta, codigo, cantidad in estado['requests']:
+                clave = (method, ruta, codigo)
+                self.requests[clave] = self.requests.get(clave, 0) + cantidad
+            for method, ruta, cuentas, suma, total in estado['duraciones']:
+                self.duraciones.setdefault((method, ruta), Histograma()).combinar(cuentas, suma, total)
+            for fase, cuentas, suma, total in estado['fases']:
+                self.fases.setdefault(fase, Histograma()).combinar(cuentas, suma, total)
+            self.bytes_recibidos += estado['bytes_recibidos']
+            self.bytes_enviados += estado['bytes_enviados']
+            for codec, entrada, salida in estado['compresion']:
+                totales = self.compresion.setdefault(codec, [0, 0])
+                totales[0] += entrada
+                totales[1] += salida
+
+    def publicar(self):
+        """Escribe el estado de este proceso en directorio_workers (reemplazando el anterior de una vez)."""
+        if self.directorio_workers is None:
+            return
+        ruta = os.path.join(self.directorio_workers, f"worker-{os.getpid()}.json")
+        try:
+            fd, ruta_temporal = tempfile.mkstemp(prefix=".worker-", dir=self.directorio_workers)
+            with os.fdopen(fd, 'w', encoding='utf-8') as archivo:
+                json.dump(self.estado(), archivo)
+            os.replace(ruta_temporal, ruta)
+        except OSError as e:
+            print(f"No se pudieron publicar las métricas del worker: {e}")
+
+    def iniciar_publicacion(self, directorio, intervalo=INTERVALO_METRICAS_WORKERS):
+        """Publica el estado en directorio cada intervalo segundos desde un hilo en segundo plano."""
+        self.directorio_workers = directorio
+
+        def publicar_periodicamente():
+            while True:
+                time.sleep(intervalo)
+                self.publicar()
+
+        self.publicar()
+        threading.Thread(target=publicar_periodicamente, name="metricas", daemon=True).start()
+
+    def exportar_total(self):
+        """
+        Igual que exportar, pero con varios workers suma las métricas de todos: las de este proceso
+        al momento y las de los demás según lo último que publicaron (como mucho un intervalo atrás).
+        """
+        if self.directorio_workers is None:
+            return self.exportar()
+        total = Metricas()
+        total.combinar(self.estado())
+        for estado in leer_estados_workers(self.directorio_workers, excluir_pid=os.getpid()):
+            total.combinar(estado)
+        return total.exportar()
+
+    def cerrar(self):
+        self.publicar()
+        if self.access_log is not None and self.access_log is not sys.stdout:
+            self.access_log.close()
+
+
+def leer_estados_workers(directorio, excluir_pid=None):
+    """
+    Requiere: directorio: str donde publican los workers, excluir_pid: int o None
+    Devuelve: list con los estados publicados (ver Metricas.estado), salvo el del proceso excluir_pid
+    """
+    estados = []
+    for nombre in os.listdir(directorio):
+        if not nombre.startswith("worker-") or nombre == f"worker-{excluir_pid}.json":
+            continue
+        try:
+            with open(os.path.join(directorio, nombre), encoding='utf-8') as archivo:
+                estados.append(json.load(archivo))
+        except (OSError, ValueError):
+            # Se está reemplazando justo ahora o quedó a medias: se cuenta en la próxima
+            continue
+    return estados
+
+
+def retirar_worker(directorio, pid):
+    """
+    Marca como cerradas las conexiones del último estado publicado por un worker que terminó.
+    Sus contadores se siguen sumando, así los totales de /metrics no bajan cuando se lo reinicia.
+    """
+    ruta = os.path.join(directorio, f"worker-{pid}.json")
+    try:
+        with open(ruta, encoding='utf-8') as archivo:
+            estado = json.load(archivo)
+        estado['conexiones_activas'] = 0
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump(estado, archivo)
+    except (OSError, ValueError):
+        pass
+
+
+def respuesta_metricas(config):
+    """Genera la respuesta de GET /metrics."""
+    cuerpo = config['metricas'].exportar_total().encode('utf-8')
+    return Respuesta(200, [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                           ('Cache-Control', 'no-store')], cuerpo)
+
+
+def finalizar_medicion(config, medicion, cliente, solicitud, response, recibidos):
+    """Registra en las métricas un request ya respondido (method y path son '-' si no se pudo parsear)."""
+    if solicitud is None:
+        method, path = "-", "-"
+    else:
+        method, path = solicitud.method, solicitud.path
+    config['metricas'].registrar(medicion, cliente, method, path, codigo_respuesta(response), recibidos, len(response))
+
+
+def registrar_envio(duracion, tamaño_respuesta):
+    print(f"[MEDICIÓN] Tiempo de envío: {duracion:.20f} s | Tamaño respuesta: {tamaño_respuesta} bytes")
+
+
+def headers_conexion(mantener, restantes, config):
+    """
+    Requiere: mantener: bool, si la conexión sigue abierta, restantes: int, requests que todavía se aceptan
+    Devuelve: bytes con los headers Connection (y Keep-Alive) de la respuesta
+    """
+    if mantener:
+        return (b"Connection: keep-alive\r\n"
+                + f"Keep-Alive: timeout={config['keepalive_timeout']:g}, max={restantes}\r\n".encode('utf-8'))
+    return b"Connection: close\r\n"
+
+
+class CuboTokens:
+    """
+    Token bucket: se llena a tasa bytes por segundo hasta rafaga bytes. reservar() descuenta lo que
+    se va a transferir aunque no alcance (queda en deuda) y devuelve cuánto hay que esperar antes,
+    así el que reserva después espera detrás. Es seguro usarlo desde varios hilos.
+    """
+
+    def __init__(self, tasa, rafaga=PORCION_LIMITADA):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.tokens = rafaga
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reservar(self, cantidad, esperar=True):
+        """
+        Requiere: cantidad: int, bytes a transferir, esperar: bool, False para tomarlos sin esperar (solo deuda)
+        Devuelve: float, segundos a esperar antes de transferirlos
+        """
+        with self.lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.rafaga, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.tokens -= cantidad
+            if self.tokens >= 0 or not esperar:
+                return 0.0
+            return -self.tokens / self.tasa
+
+
+class PlanificadorAncho:
+    """
+    Reparte el ancho de banda del servidor entre los clientes.
+    - tasa_global: bytes/s para todo el servidor (None sin límite). Todo lo que se manda o se recibe
+      pasa por un CuboTokens global y, además, cada cliente (IP) con una transferencia grande en curso
+      tiene su CuboTokens con una parte igual del total: un cliente con una descarga enorme (o con
+      muchas conexiones) no se queda con todo, y los demás no esperan detrás de él.
+    - tasa_conexion: bytes/s por conexión (None sin límite).
+    Las transferencias chicas (hasta UMBRAL_TRANSFERENCIA_CHICA: páginas, archivos chicos, cabeceras)
+    no esperan su parte ni al cubo global: lo que usan queda como deuda del global y lo pagan las
+    grandes, así salen primero aunque haya descargas grandes en curso.
+    """
+
+    def __init__(self, tasa_global=None, tasa_conexion=None):
+        self.tasa_global = tasa_global
+        self.tasa_conexion = tasa_conexion
+        self.cubo_global = CuboTokens(tasa_global) if tasa_global else None
+        # cliente -> [CuboTokens, transferencias grandes en curso]
+        self.clientes = {}
+        self.lock = threading.Lock()
+
+    def conexion(self, cliente):
+        """Devuelve el ControlAncho de una conexión nueva de cliente (su IP)."""
+        return ControlAncho(self, cliente)
+
+    def activar(self, cliente):
+        """Registra una transferencia grande de cliente y devuelve el CuboTokens con su parte del total."""
+        with self.lock:
+            entrada = self.clientes.get(cliente)
+            if entrada is None:
+                entrada = self.clientes[cliente] = [CuboTokens(self.tasa_global), 0]
+            entrada[1] += 1
+            self._repartir()
+            return entrada[0]
+
+    def desactivar(self, cliente):
+        with self.lock:
+            entrada = self.clientes[cliente]
+            entrada[1] -= 1
+            if not entrada[1]:
+                del self.clientes[cliente]
+                self._repartir()
+
+    def _repartir(self):
+        # Se llama con el lock tomado
+        for cubo, _ in self.clientes.values():
+            cubo.tasa = self.tasa_global / len(self.clientes)
+
+
+class ControlAncho:
+    """
+    Límites de una conexión: su CuboTokens (si hay límite por conexión) y, mientras hace una
+    transferencia grande, la parte del global de su cliente (ver PlanificadorAncho).
+    """
+
+    def __init__(self, planificador, cliente):
+        self.planificador = planificador
+        self.cliente = cliente
+        self.cubo = CuboTokens(planificador.tasa_conexion) if planificador.tasa_conexion else None
+        self.cubo_cliente = None
+
+    @contextlib.contextmanager
+    def transferencia(self, tamaño):
+        """Marca una transferencia de tamaño bytes (None si no se sabe de antemano) mientras dura el with."""
+        if self.planificador.cubo_global is not None and (tamaño is None or tamaño > UMBRAL_TRANSFERENCIA_CHICA):
+            self.cubo_cliente = self.planificador.activar(self.cliente)
+        try:
+            yield self
+        finally:
+            if self.cubo_cliente is not None:
+                self.cubo_cliente = None
+                self.planificador.desactivar(self.cliente)
+
+    def demora(self, cantidad):
+        """Reserva cantidad bytes y devuelve los segundos a esperar antes de transferirlos."""
+        demora = self.cubo.reservar(cantidad) if self.cubo is not None else 0.0
+        cubo_global = self.planificador.cubo_global
+        if cubo_global is not None:
+            if self.cubo_cliente is None:
+                # Transferencia chica: pasa adelante
+                cubo_global.reservar(cantidad, esperar=False)
+            else:
+                demora = max(demora, self.cubo_cliente.reservar(cantidad), cubo_global.reservar(cantidad))
+        return demora
+
+    def esperar(self, cantidad):
+        demora = self.demora(cantidad)
+        if demora > 0:
+            time.sleep(demora)
+
+    async def esperar_async(self, cantidad):
+        demora = self.demora(cantidad)
+        if demora > 0:
+            await asyncio.sleep(demora)
+
+
+def transferencia(control, tamaño):
+    """Devuelve control.transferencia(tamaño), o un context manager que no hace nada si no hay límites."""
+    return control.transferencia(tamaño) if control is not None else contextlib.nullcontext()
+
+
+def tamaño_envio(response):
+    """Devuelve: int, bytes de la respuesta, o None si se genera mientras se envía."""
+    return None if isinstance(response, RespuestaStreaming) else len(response)
+
+
+class SocketLimitado:
+    """
+    Envuelve el socket de una conexión para que respete los límites de su ControlAncho: cada operación
+    mueve como mucho PORCION_LIMITADA bytes y se espera lo que indique el control antes de mandar
+    (o después de recibir: así el cliente nota el límite por el control de flujo de TCP).
+    Tiene solo los métodos que usan LectorHTTP y enviar_respuesta.
+    """
+
+    def __init__(self, sock, control):
+        self.socket = sock
+        self.control = control
+
+    def settimeout(self, segundos):
+        self.socket.settimeout(segundos)
+
+    def recv(self, cantidad):
+        datos = self.socket.recv(min(cantidad, PORCION_LIMITADA))
+        self.control.esperar(len(datos))
+        return datos
+
+    def recv_into(self, buffer, cantidad=0):
+        leidos = self.socket.recv_into(buffer, min(cantidad or len(buffer), PORCION_LIMITADA))
+        self.control.esperar(leidos)
+        return leidos
+
+    def sendmsg(self, buffers):
+        porcion = []
+        total = 0
+        for buffer in buffers:
+            if total >= PORCION_LIMITADA:
+                break
+            buffer = memoryview(buffer)[:PORCION_LIMITADA - total]
+            porcion.append(buffer)
+            total += len(buffer)
+        self.control.esperar(total)
+        if not hasattr(self.socket, 'sendmsg'):
+            for buffer in porcion:
+                self.socket.sendall(buffer)
+            return total
+        return self.socket.sendmsg(porcion)
+
+    def sendall(self, datos):
+        vista = memoryview(datos)
+        for inicio in range(0, len(vista), PORCION_LIMITADA):
+            porcion = vista[inicio:inicio + PORCION_LIMITADA]
+            self.control.esperar(len(porcion))
+            self.socket.sendall(porcion)
+
+    def sendfile(self, archivo, offset, longitud):
+        for inicio in range(offset, offset + longitud, PORCION_LIMITADA):
+            porcion = min(PORCION_LIMITADA, offset + longitud - inicio)
+            self.control.esperar(porcion)
+            self.socket.sendfile(archivo, inicio, porcion)
+
+
+def kernel_cifra(tls_socket):
+    """Devuelve True si el kernel cifra lo que se manda por el socket (kTLS), así sendfile sale cifrado."""
+    try:
+        tls_socket.getsockopt(SOL_TLS, TLS_TX, 64)
+    except OSError:
+        return False
+    return True
+
+
+class SocketTLS:
+    """
+    Envuelve un ssl.SSLSocket para que enviar_respuesta lo use como a un socket común.
+    TLS no tiene sendmsg: las partes chicas (status line, headers, body chico) se juntan en una sola
+    escritura, así salen en un mismo registro TLS en vez de uno por parte. Los archivos se leen de a
+    TAMAÑO_BLOQUE y salen en registros llenos; si el kernel cifra la conexión (kTLS, ver
+    crear_contexto_tls) salen con sendfile sin pasar por Python.
+    Tiene solo los métodos que usan LectorHTTP, SocketLimitado y enviar_respuesta.
+    """
+
+    def __init__(self, tls_socket):
+        self.socket = tls_socket
+        self.ktls = kernel_cifra(tls_socket)
+
+    def settimeout(self, segundos):
+        self.socket.settimeout(segundos)
+
+    def recv(self, cantidad):
+        return self.socket.recv(cantidad)
+
+    def recv_into(self, buffer, cantidad=0):
+        return self.socket.recv_into(buffer, cantidad)
+
+    def sendmsg(self, buffers):
+        juntas = []
+        total = 0
+        for buffer in buffers:
+            if len(buffer) >= TAMAÑO_BLOQUE:
+                if juntas:
+                    self.socket.sendall(b"".join(juntas))
+                    juntas = []
+                self.socket.sendall(buffer)
+            else:
+                juntas.append(buffer)
+            total += len(buffer)
+        if juntas:
+            self.socket.sendall(b"".join(juntas))
+        return total
+
+    def sendall(self, datos):
+        self.socket.sendall(datos)
+
+    def sendfile(self, archivo, offset, longitud):
+        if self.ktls:
+            # Con kTLS SSLSocket.sendfile usa os.sendfile y el kernel cifra
+            self.socket.sendfile(archivo, offset, longitud)
+            return
+        buffer = bytearray(TAMAÑO_BLOQUE)
+        vista = memoryview(buffer)
+        archivo.seek(offset)
+        restantes = longitud
+        while restantes > 0:
+            leidos = archivo.readinto(vista[:min(TAMAÑO_BLOQUE, restantes)])
+            if not leidos:
+                break
+            self.socket.sendall(vista[:leidos])
+            restantes -= leidos
+
+
+def enviar_partes(client_socket, partes):
+    """
+    Envía varios buffers con sendmsg (writev): el kernel los toma en una sola llamada sin que haga
+    falta juntarlos antes en un bytes nuevo. Si se envía solo una parte, sigue desde donde quedó.
+    """
+    pendientes = [memoryview(parte) for parte in partes if len(parte)]
+    if not hasattr(client_socket, 'sendmsg'):
+        for parte in pendientes:
+            client_socket.sendall(parte)
+        return
+    while pendientes:
+        enviados = client_socket.sendmsg(pendientes[:MAX_PARTES_SENDMSG])
+        # Sacar los buffers que salieron completos y recortar el que quedó por la mitad
+        while pendientes and enviados >= len(pendientes[0]):
+            enviados -= len(pendientes[0])
+            del pendientes[0]
+        if enviados:
+            pendientes[0] = pendientes[0][enviados:]
+
+
+def enviar_archivo(client_socket, archivo, offset, longitud):
+    """
+    Envía una porción de un archivo por el socket sin pasarla por memoria de Python.
+    Usa sendfile (zero-copy en el kernel) si el sistema lo tiene; si no, manda bloques
+    de tamaño fijo leídos con readinto sobre un único buffer reutilizado.
+    """
+    if hasattr(os, 'sendfile'):
+        client_socket.sendfile(archivo, offset, longitud)
+        return
+
+    buffer = bytearray(TAMAÑO_BLOQUE)
+    vista = memoryview(buffer)
+    archivo.seek(offset)
+    restantes = longitud
+    while restantes > 0:
+        leidos = archivo.readinto(vista[:min(TAMAÑO_BLOQUE, restantes)])
+        if not leidos:
+            break
+        client_socket.sendall(vista[:leidos])
+        restantes -= leidos
+
+
+def enviar_respuesta(client_socket, response, extra_headers):
+    """
+    Envía una Respuesta (o RespuestaArchivo / RespuestaStreaming) agregando extra_headers después
+    de la status line. La cabecera y lo que haya del body en memoria salen en un mismo sendmsg.
+    """
+    try:
+        status, headers = response.encabezado()
+        partes = [status, extra_headers, headers]
+        if isinstance(response, RespuestaArchivo):
+            for segmento in response.segmentos:
+                if isinstance(segmento, bytes):
+                    partes.append(segmento)
+                else:
+                    enviar_partes(client_socket, partes)
+                    partes = []
+                    enviar_archivo(client_socket, response.archivo, segmento[0], segmento[1])
+        elif isinstance(response, RespuestaStreaming):
+            # Los headers salen enseguida, sin esperar al primer pedazo comprimido
+            enviar_partes(client_socket, partes)
+            for parte in response.partes:
+                if response.chunked:
+                    # Cada pedazo va como un chunk: tamaño en hexadecimal, datos y CRLF
+                    enviar_partes(client_socket, (b"%x\r\n" % len(parte), parte, b"\r\n"))
+                else:
+                    enviar_partes(client_socket, (parte,))
+                response.enviados += len(parte)
+            partes = [b"0\r\n\r\n"] if response.chunked else []
+        else:
+            partes += response.cuerpo
+        enviar_partes(client_socket, partes)
+    finally:
+        response.cerrar()
+
+
+async def escribir_async(writer, partes, control=None, vigilante=None, plazo=None):
+    """
+    Escribe partes en writer y espera a que se vacíe el buffer. Las partes grandes (por ejemplo un
+    archivo mapeado con mmap) salen por bloques, así el transporte no se queda con una copia entera
+    en su buffer; con un ControlAncho todo sale por porciones de PORCION_LIMITADA, esperando entre ellas.
+    Con un Vigilante cada bloque tiene que salir antes de plazo segundos.
+    """
+    limite = TAMAÑO_BLOQUE if control is None else PORCION_LIMITADA
+    if vigilante is not None:
+        vigilante.plazo(plazo, "dejó de recibir la respuesta")
+    # Con TLS cada write es al menos un registro: las partes chicas se juntan en uno solo (ver SocketTLS)
+    escribir = writer.writelines if writer.get_extra_info('ssl_object') is None else \
+        (lambda juntas: writer.write(b"".join(juntas)))
+    juntas = []
+    for parte in partes:
+        if len(parte) <= limite:
+            juntas.append(parte)
+            continue
+        if juntas:
+            if control is not None:
+                await control.esperar_async(sum(len(junta) for junta in juntas))
+            escribir(juntas)
+            juntas = []
+        vista = memoryview(parte)
+        for inicio in range(0, len(vista), limite):
+            porcion = vista[inicio:inicio + limite]
+            if control is not None:
+                await control.esperar_async(len(porcion))
+            writer.write(porcion)
+            await writer.drain()
+            if vigilante is not None:
+                vigilante.plazo(plazo, "dejó de recibir la respuesta")
+    if juntas:
+        if control is not None:
+            await control.esperar_async(sum(len(junta) for junta in juntas))
+        escribir(juntas)
+    await writer.drain()
+
+
+async def copiar_archivo_async(writer, archivo, offset, longitud):
+    """
+    Envía una porción de un archivo leyéndola de a TAMAÑO_BLOQUE en un hilo aparte. Es para TLS, donde
+    no hay os.sendfile y loop.sendfile copia de a 16 KB pasando cada bloque por un hilo.
+    """
+    loop = asyncio.get_running_loop()
+
+    def leer(inicio, cantidad):
+        archivo.seek(inicio)
+        return archivo.read(cantidad)
+
+    for inicio in range(offset, offset + longitud, TAMAÑO_BLOQUE):
+        datos = await loop.run_in_executor(None, leer, inicio, min(TAMAÑO_BLOQUE, offset + longitud - inicio))
+        if not datos:
+            break
+        writer.write(datos)
+        await writer.drain()
+
+
+async def enviar_archivo_async(writer, archivo, offset, longitud, control=None, vigilante=None, plazo=None):
+    """
+    Envía una porción de un archivo con loop.sendfile (os.sendfile cuando el transporte lo permite,
+    si no copia por bloques); con un ControlAncho va por porciones respetando sus límites.
+    Con un Vigilante va por porciones de PORCION_VIGILADA y cada una tiene que salir antes de plazo segundos.
+    Con TLS copia con copiar_archivo_async.
+    """
+    loop = asyncio.get_running_loop()
+    if writer.get_extra_info('ssl_object') is not None:
+        enviar = copiar_archivo_async
+    else:
+        enviar = lambda writer, archivo, inicio, porcion: loop.sendfile(writer.transport, archivo, inicio, porcion)
+    if control is None and vigilante is None:
+        await enviar(writer, archivo, offset, longitud)
+        return
+    tamaño = PORCION_LIMITADA if control is not None else PORCION_VIGILADA
+    for inicio in range(offset, offset + longitud, tamaño):
+        porcion = min(tamaño, offset + longitud - inicio)
+        if control is not None:
+            await control.esperar_async(porcion)
+        if vigilante is not None:
+            vigilante.plazo(plazo, "dejó de recibir la respuesta")
+        await enviar(writer, archivo, inicio, porcion)
+
+
+async def enviar_respuesta_async(writer, response, extra_headers, control=None, vigilante=None, plazo=None):
+    """
+    Igual que enviar_respuesta pero sobre un asyncio.StreamWriter: las partes se pasan juntas con
+    writelines y el body de un archivo sale con loop.sendfile (ver escribir_async y enviar_archivo_async).
+    control es el ControlAncho de la conexión, o None si no hay límites de ancho de banda.
+    vigilante es el Vigilante de la conexión: el cliente tiene que ir recibiendo sin trabarse más de plazo segundos.
+    Las partes de una RespuestaStreaming se generan en un hilo aparte (leen y comprimen de a bloques).
+    """
+    try:
+        status, headers = response.encabezado()
+        partes = [status, extra_headers, headers]
+        if isinstance(response, RespuestaArchivo):
+            for segmento in response.segmentos:
+                if isinstance(segmento, bytes):
+                    partes.append(segmento)
+                else:
+                    await escribir_async(writer, partes, control, vigilante, plazo)
+                    partes = []
+                    await enviar_archivo_async(writer, response.archivo, segmento[0], segmento[1], control,
+                                               vigilante, plazo)
+        elif isinstance(response, RespuestaStreaming):
+            await escribir_async(writer, partes, control, vigilante, plazo)
+            generador = iter(response.partes)
+            while True:
+                parte = await asyncio.to_thread(next, generador, None)
+                if parte is None:
+                    break
+                if response.chunked:
+                    await escribir_async(writer, (b"%x\r\n" % len(parte), parte, b"\r\n"), control, vigilante, plazo)
+                else:
+                    await escribir_async(writer, (parte,), control, vigilante, plazo)
+                response.enviados += len(parte)
+            partes = [b"0\r\n\r\n"] if response.chunked else []
+        else:
+            partes += response.cuerpo
+        await escribir_async(writer, partes, control, vigilante, plazo)
+    finally:
+        response.cerrar()
+
+
+def procesar_cabecera(cabecera, atendidos, config, body_disponible=0):
+    """
+    Parsea la cabecera de un request y decide qué hacer con el body y con la conexión.
+    Requiere: cabecera: bytes, atendidos: int, requests atendidos en esta conexión contando el actual,
+              body_disponible: int, bytes del body que ya están recibidos (se pueden descartar sin esperar)
+    Devuelve: tuple (solicitud, response, mantener, content_length)
+              - solicitud es None si la cabecera no se pudo parsear
+              - response es distinto de None si ya se puede responder sin leer el body (400, 401, 431, 503)
+    Si response es None el request quedó admitido: hay que llamar a config['admision'].liberar(content_length)
+    después de responderlo (ver ControlAdmision).
+    """
+    try:
+        solicitud = parsear_solicitud(cabecera)
+    except CabeceraInvalida as e:
+        return None, respuesta_error(e.codigo), False, 0
+    headers = solicitud.headers
+
+    mantener = debe_mantener_conexion(solicitud.request_line, headers) and atendidos < config['max_requests']
+
+    # Verificar autenticación antes que nada: un request sin contraseña no lee el body ni ocupa un lugar
+    response = verificar_autenticacion(headers, config['password'])
+
+    # Sin un Content-Length válido no se sabe dónde termina el body ni dónde empieza el próximo request
+    content_length = obtener_content_length(headers)
+    if content_length is None:
+        return solicitud, response or respuesta_error(400), False, 0
+    if 'transfer-encoding' in headers:
+        return solicitud, response or respuesta_error(411), False, 0
+
+    # Con el servidor lleno se responde 503 enseguida, sin leer el body
+    if response is None and config['admision'] is not None and not config['admision'].admitir(content_length):
+        config['metricas'].rechazo('sobrecarga')
+        response = RESPUESTA_SOBRECARGA
+
+    if response is not None and content_length > body_disponible:
+        # El body no se va a leer, así que la conexión no se puede reutilizar
+        mantener = False
+    return solicitud, response, mantener, content_length
+
+
+def atender_cliente(client_socket, client_address, config, momento_accept=None):
+    """
+    Atiende una conexión completa de forma bloqueante: recv, parseo, ruteo, send y close.
+    Con keep-alive atiende varios requests sobre el mismo socket (incluso en pipeline)
+    hasta que el cliente cierre, pida 'Connection: close', pase el timeout de inactividad
+    o se llegue al máximo de requests por conexión.
+    Se usa tanto en el modo secuencial como desde los hilos del pool.
+    momento_accept es el time.perf_counter() del accept, para medir la espera hasta el primer request.
+    """
+    print(f"Se estableció una conexión con {client_address} ✨")
+    metricas = config['metricas']
+    metricas.conexion_abierta()
+    try:
+        # Los headers chicos (status line, Keep-Alive) no tienen que esperar a Nagle
+        client_socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+        canal = client_socket
+        if config['tls'] is not None:
+            # El handshake se hace acá, en el hilo de la conexión, y no en el que hace accept
+            client_socket.settimeout(config['plazo_cabecera'])
+            client_socket = config['tls'].wrap_socket(client_socket, server_side=True)
+            metricas.handshake_tls(client_socket.session_reused)
+            canal = SocketTLS(client_socket)
+
+        # Con límites de ancho de banda todo lo que se lee y se manda pasa por el control de la conexión
+        control = None
+        if config['ancho'] is not None:
+            control = config['ancho'].conexion(client_address[0])
+            canal = SocketLimitado(canal, control)
+
+        lector = LectorHTTP(canal, plazo_cabecera=config['plazo_cabecera'], tasa_minima=config['tasa_minima_body'],
+                            gracia=config['plazo_inactividad'])
+        atendidos = 0
+        mantener = True
+        while mantener:
+            # Esperar el próximo request como mucho keepalive_timeout segundos
+            client_socket.settimeout(config['keepalive_timeout'])
+            try:
+                cabecera = lector.leer_cabecera()
+            except TimeoutError:
+                if lector.disponibles():
+                    # Había empezado un request que no terminó de llegar a tiempo (slowloris)
+                    metricas.rechazo('lento')
+                break
+            except CabeceraInvalida as e:
+                # No se sabe dónde termina este request: responder el error y cerrar
+                client_socket.settimeout(config['plazo_inactividad'])
+                response = respuesta_error(e.codigo)
+                enviar_respuesta(canal, response, headers_conexion(False, 0, config))
+                finalizar_medicion(config, MedicionRequest(), client_address, None, response, lector.disponibles())
+                break
+            if cabecera is None:
+                break
+            # Leer el body y mandar la respuesta no puede quedar trabado más de plazo_inactividad segundos
+            client_socket.settimeout(config['plazo_inactividad'])
+            atendidos += 1
+            medicion = MedicionRequest()
+            MEDICION_ACTUAL.set(medicion)
+            if atendidos == 1 and momento_accept is not None:
+                medicion.sumar('accept', medicion.inicio - momento_accept)
+            recibidos = len(cabecera)
+
+            inicio = time.perf_counter()
+            solicitud, response, mantener, content_length = procesar_cabecera(
+                cabecera, atendidos, config, lector.disponibles())
+            sumar_tiempo('parseo', inicio)
+            admitido = response is None and config['admision'] is not None
+            try:
+                if response is not None and mantener and content_length:
+                    # Se responde sin usar el body (401, 503) pero ya llegó entero: descartarlo y seguir
+                    recibidos += lector.leer_body(None, content_length)
+                if response is None:
+                    body = crear_receptor_body(solicitud, config)
+                    inicio = time.perf_counter()
+                    try:
+                        with transferencia(control, content_length):
+                            recibidos_body = lector.leer_body(body, content_length)
+                        if recibidos_body < content_length:
+                            # El cliente cerró antes de mandar todo el body
+                            mantener = False
+                    except BaseException:
+                        # No dejar temporales a medio escribir
+                        if body is not None:
+                            body.abortar()
+                        raise
+                    if content_length:
+                        sumar_tiempo('body', inicio)
+                    recibidos += recibidos_body
+                    inicio = time.perf_counter()
+                    response = generar_respuesta(solicitud, body, config)
+                    sumar_tiempo('respuesta', inicio)
+
+                if isinstance(response, RespuestaStreaming) and not response.chunked:
+                    # Sin chunked el final del body lo marca el cierre de la conexión
+                    mantener = False
+
+                # Enviar la respuesta al cliente
+                inicio = time.perf_counter()
+                with transferencia(control, tamaño_envio(response)):
+                    enviar_respuesta(canal, response, headers_conexion(mantener, config['max_requests'] - atendidos, config))
+                sumar_tiempo('envio', inicio)
+            finally:
+                if admitido:
+                    config['admision'].liberar(content_length)
+            if config['medir_tiempo']:
+                registrar_envio(time.perf_counter() - inicio, len(response))
+            finalizar_medicion(config, medicion, client_address, solicitud, response, recibidos)
+
+    except ConnectionResetError:
+        # El cliente cerró la conexión abruptamente
+        print(f"Conexión cerrada por el cliente")
+    except TimeoutError as e:
+        # El cliente dejó de mandar o de recibir: se corta para no ocupar un hilo indefinidamente
+        metricas.rechazo('lento')
+        print(f"Se cortó la conexión con {client_address}: {e or 'sin progreso'}")
+    except ssl.SSLError as e:
+        # Handshake fallido (por ejemplo un request http:// a un servidor con --tls) o registro inválido
+        print(f"Error de TLS con {client_address}: {e.reason or e}")
+    except Exception as e:
+        # Cualquier otro error
+        print(f"Error al procesar la solicitud: {e}")
+    finally:
+        metricas.conexion_cerrada()
+        # Cerrar la conexión
+        try:
+            client_socket.close()
+        except:
+            pass
+
+
+async def atender_cliente_async(reader, writer, config):
+    """
+    Versión para el event loop de atender_cliente: mismo parseo, ruteo y manejo de keep-alive,
+    pero la lectura y la escritura no bloquean al resto de las conexiones. generar_respuesta corre
+    en un hilo aparte (asyncio.to_thread, que copia MEDICION_ACTUAL): puede leer, hashear o comprimir
+    archivos enteros y mientras tanto el event loop sigue atendiendo a los demás. Solo las descargas
+    que ya están en memoria se responden directo (ver respuesta_en_memoria).
+    """
+    momento_accept = time.perf_counter()
+    client_address = writer.get_extra_info('peername')
+    print(f"Se estableció una conexión con {client_address} ✨")
+    metricas = config['metricas']
+    metricas.conexion_abierta()
+    # Todos los plazos de la conexión (keep-alive, cabecera, body y envío) los controla un único timer
+    vigilante = Vigilante(writer.transport)
+    plazo = config['plazo_inactividad']
+    try:
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        control = config['ancho'].conexion(client_address[0]) if config['ancho'] is not None else None
+        tls_object = writer.get_extra_info('ssl_object')
+        if tls_object is not None:
+            metricas.handshake_tls(tls_object.session_reused)
+
+        atendidos = 0
+        mantener = True
+        while mantener:
+            vigilante.plazo(config['keepalive_timeout'])
+            try:
+                cabecera = await leer_cabecera_async(
+                    reader, lambda: vigilante.plazo(config['plazo_cabecera'], "la cabecera no llegó a tiempo"))
+            except CabeceraInvalida as e:
+                # No se sabe dónde termina este request: responder el error y cerrar
+                response = respuesta_error(e.codigo)
+                await enviar_respuesta_async(writer, response, headers_conexion(False, 0, config), control,
+                                             vigilante, plazo)
+                finalizar_medicion(config, MedicionRequest(), client_address, None, response, 0)
+                break
+            if cabecera is None:
+                if vigilante.motivo is not None and vigilante.vencido:
+                    raise TimeoutError(vigilante.motivo)
+                break
+            atendidos += 1
+            medicion = MedicionRequest()
+            MEDICION_ACTUAL.set(medicion)
+            if atendidos == 1:
+                medicion.sumar('accept', medicion.inicio - momento_accept)
+            recibidos = len(cabecera)
+
+            # El body queda en el buffer del reader y se lee después de decidir qué hacer con él
+            inicio = time.perf_counter()
+            solicitud, response, mantener, content_length = procesar_cabecera(cabecera, atendidos, config)
+            sumar_tiempo('parseo', inicio)
+            admitido = response is None and config['admision'] is not None
+            try:
+                if response is None:
+                    body = crear_receptor_body(solicitud, config)
+                    inicio = time.perf_counter()
+                    try:
+                        with transferencia(control, content_length):
+                            recibidos_body = await recibir_body_async(reader, body, content_length, control,
+                                                                      vigilante, config)
+                        if recibidos_body < content_length:
+                            mantener = False
+                    except BaseException:
+                        if body is not None:
+                            body.abortar()
+                        raise
+                    if content_length:
+                        sumar_tiempo('body', inicio)
+                    recibidos += recibidos_body
+                    inicio = time.perf_counter()
+                    response = respuesta_en_memoria(solicitud, config) if body is None else None
+                    if response is None:
+                        response = await asyncio.to_thread(generar_respuesta, solicitud, body, config)
+                    sumar_tiempo('respuesta', inicio)
+                if isinstance(response, RespuestaStreaming) and not response.chunked:
+                    # Sin chunked el final del body lo marca el cierre de la conexión
+                    mantener = False
+
+                inicio = time.perf_counter()
+                with transferencia(control, tamaño_envio(response)):
+                    await enviar_respuesta_async(writer, response,
+                                                 headers_conexion(mantener, config['max_requests'] - atendidos, config),
+                                                 control, vigilante, plazo)
+                sumar_tiempo('envio', inicio)
+            finally:
+                if admitido:
+                    config['admision'].liberar(content_length)
+            if config['medir_tiempo']:
+                registrar_envio(time.perf_counter() - inicio, len(response))
+            finalizar_medicion(config, medicion, client_address, solicitud, response, recibidos)
+
+    except TimeoutError as e:
+        metricas.rechazo('lento')
+        print(f"Se cortó la conexión con {client_address}: {e}")
+    except Exception as e:
+        if vigilante.vencido:
+            # Lo abortó el Vigilante mientras se mandaba la respuesta
+            metricas.rechazo('lento')
+            print(f"Se cortó la conexión con {client_address}: {vigilante.motivo}")
+        elif isinstance(e, ConnectionResetError):
+            print(f"Conexión cerrada por el cliente")
+        else:
+            print(f"Error al procesar la solicitud: {e}")
+    finally:
+        vigilante.plazo(None)
+        metricas.conexion_cerrada()
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+def servir_secuencial(server_socket, config):
+    """Atiende un cliente a la vez (comportamiento original)."""
+    while True:
+        client_socket, client_address = server_socket.accept()
+        atender_cliente(client_socket, client_address, config, time.perf_counter())
+
+
+def rechazar_conexion(client_socket):
+    """
+    Responde 503 (RESPUESTA_SOBRECARGA) y cierra una conexión que no se puede atender, sin bloquear:
+    no se espera al request, solo se descarta lo que ya haya llegado (si quedara algo sin leer,
+    close mandaría un RST y el cliente podría no ver la respuesta).
+    """
+    try:
+        client_socket.setblocking(False)
+        try:
+            client_socket.recv(TAMAÑO_LECTURA)
+        except BlockingIOError:
+            pass
+        status, headers = RESPUESTA_SOBRECARGA.encabezado()
+        client_socket.send(b"".join([status, b"Connection: close\r\n", headers, *RESPUESTA_SOBRECARGA.cuerpo]))
+        client_socket.shutdown(SHUT_WR)
+    except OSError:
+        pass
+    finally:
+        client_socket.close()
+
+
+def servir_con_hilos(server_socket, config):
+    """
+    Atiende los clientes con un pool acotado de hilos.
+    Como mucho hay max_hilos conexiones en proceso y otras max_hilos esperando un hilo libre;
+    a las que llegan con todos los cupos ocupados se les responde 503 enseguida (ver rechazar_conexion)
+    en vez de dejarlas esperando sin saber hasta cuándo.
+    """
+    max_hilos = config['max_hilos']
+    cupos = threading.BoundedSemaphore(max_hilos * 2)
+    metricas = config['metricas']
+
+    def liberar_cupo(_futuro):
+        cupos.release()
+
+    with ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="cliente") as executor:
+        while True:
+            client_socket, client_address = server_socket.accept()
+            if not cupos.acquire(blocking=False):
+                metricas.rechazo('conexiones')
+                if config['tls'] is None:
+                    rechazar_conexion(client_socket)
+                else:
+                    # Responder 503 requeriría hacer el handshake en este hilo: se cierra directamente
+                    client_socket.close()
+                continue
+            futuro = executor.submit(atender_cliente, client_socket, client_address, config, time.perf_counter())
+            futuro.add_done_callback(liberar_cupo)
+
+
+def servir_async(server_socket, config):
+    """Atiende todos los clientes desde un único event loop de asyncio (selectors por debajo)."""
+
+    async def principal():
+        server = await asyncio.start_server(
+            lambda reader, writer: atender_cliente_async(reader, writer, config),
+            sock=server_socket,
+            backlog=config['backlog'],
+            ssl=config['tls'],
+            ssl_handshake_timeout=config['plazo_cabecera'] if config['tls'] is not None else None,
+        )
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(principal())
+
+
+def servir(server_socket, modo_concurrencia, config):
+    """Atiende las conexiones de server_socket con el modo de concurrencia elegido (no vuelve)."""
+    if modo_concurrencia == "sequential":
+        servir_secuencial(server_socket, config)
+    elif modo_concurrencia == "threads":
+        servir_con_hilos(server_socket, config)
+    else:
+        servir_async(server_socket, config)
+
+
+def soporta_workers():
+    """Devuelve True si el sistema permite el modo multiproceso (fork y SO_REUSEPORT)."""
+    return hasattr(os, 'fork') and 'SO_REUSEPORT' in globals()
+
+
+def crear_socket_servidor(ip_server, puerto, backlog=None, reutilizar_puerto=False):
+    """
+    Crea el socket TCP del servidor y lo asocia a (ip_server, puerto).
+    Con reutilizar_puerto=True activa SO_REUSEPORT: varios procesos pueden escuchar en el mismo
+    puerto y el kernel reparte las conexiones nuevas entre ellos.
+    Si backlog es None el socket queda asociado pero sin escuchar.
+    Una ip_server IPv6 crea un socket IPv6; '::' además acepta IPv4 (dual-stack).
+    """
+    server_socket = socket(AF_INET6 if ':' in ip_server else AF_INET, SOCK_STREAM)
+    if os.name == 'posix':
+        # Poder reiniciar enseguida en el mismo puerto aunque queden conexiones viejas en TIME_WAIT
+        server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    if ip_server == '::':
+        server_socket.setsockopt(IPPROTO_IPV6, IPV6_V6ONLY, 0)
+    if reutilizar_puerto:
+        server_socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+    server_socket.bind((ip_server, puerto))
+    if backlog is not None:
+        server_socket.listen(backlog)
+    return server_socket
+
+
+def crear_contexto_tls(certificado, clave):
+    """
+    Requiere: certificado, clave: str, rutas a los archivos PEM del certificado (con su cadena) y de la clave
+    Devuelve: ssl.SSLContext de servidor para atender HTTPS:
+    - TLS 1.2 o más nuevo y ALPN 'http/1.1'
+    - sesiones retomables con tickets (el default de OpenSSL; el contexto se crea antes del fork, así
+      que todos los workers comparten la clave de los tickets y un cliente puede retomar en cualquiera)
+    - kTLS si el módulo ssl lo soporta (ssl.OP_ENABLE_KTLS, Python 3.12 o más nuevo): el kernel cifra
+      y los archivos vuelven a salir con sendfile (ver SocketTLS)
+    """
+    contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    contexto.minimum_version = ssl.TLSVersion.TLSv1_2
+    contexto.load_cert_chain(certificado, clave)
+    contexto.set_alpn_protocols(PROTOCOLOS_ALPN)
+    contexto.options &= ~ssl.OP_NO_TICKET
+    if hasattr(ssl, 'OP_ENABLE_KTLS'):
+        contexto.options |= ssl.OP_ENABLE_KTLS
+    return contexto
+
+
+def interrumpir_worker(signum, frame):
+    """Handler de SIGINT/SIGTERM en los workers: la primera señal corta el servidor y las demás se ignoran."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def vigilar_supervisor(pid_supervisor):
+    """
+    Hilo de cada worker: si el supervisor desaparece sin avisar (por ejemplo con kill -9),
+    el worker se manda SIGTERM a sí mismo para no quedar atendiendo como huérfano.
+    """
+    while os.getppid() == pid_supervisor:
+        time.sleep(INTERVALO_METRICAS_WORKERS)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def ejecutar_worker(numero, ip_server, puerto, modo_concurrencia, config, reserva):
+    """
+    Cuerpo de un proceso worker (después del fork): abre su propio socket de escucha en el puerto
+    compartido y atiende como un servidor de un solo proceso. Nunca vuelve: termina con os._exit.
+    """
+    codigo = 0
+    pid_supervisor = os.getppid()
+    try:
+        signal.signal(signal.SIGINT, interrumpir_worker)
+        signal.signal(signal.SIGTERM, interrumpir_worker)
+        reserva.close()
+        threading.Thread(target=vigilar_supervisor, args=(pid_supervisor,), name="supervisor", daemon=True).start()
+        server_socket = crear_socket_servidor(ip_server, puerto, config['backlog'], reutilizar_puerto=True)
+        config['metricas'].iniciar_publicacion(config['directorio_workers'])
+        print(f"Worker {numero} listo (pid {os.getpid()})")
+        try:
+            servir(server_socket, modo_concurrencia, config)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server_socket.close()
+            config['metricas'].cerrar()
+    except BaseException:
+        traceback.print_exc()
+        codigo = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(codigo)
+
+
+def supervisar_workers(cantidad, ip_server, puerto, modo_concurrencia, config, reserva):
+    """
+    Lanza cantidad procesos worker con fork y los mantiene vivos: si uno termina se lanza otro en su
+    lugar (esperando ESPERA_REINICIO_WORKER si se cayó apenas arrancó, para no reiniciarlo en bucle).
+    Con Ctrl+C o SIGTERM les pide a todos que terminen, les da tiempo a cerrar las conexiones
+    en curso y mata a los que no terminaron.
+    """
+    hijos = {}
+
+    def lanzar(numero):
+        pid = os.fork()
+        if pid == 0:
+            ejecutar_worker(numero, ip_server, puerto, modo_concurrencia, config, reserva)
+        hijos[pid] = (numero, time.monotonic())
+
+    # SIGTERM al supervisor también apaga a los workers (si no, quedarían atendiendo huérfanos)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for numero in range(cantidad):
+            lanzar(numero)
+        while True:
+            pid, estado = os.wait()
+            if pid not in hijos:
+                continue
+            numero, inicio = hijos.pop(pid)
+            retirar_worker(config['directorio_workers'], pid)
+            print(f"El worker {numero} (pid {pid}) terminó con código {os.waitstatus_to_exitcode(estado)}; reiniciándolo")
+            if time.monotonic() - inicio < ESPERA_REINICIO_WORKER:
+                time.sleep(ESPERA_REINICIO_WORKER)
+            lanzar(numero)
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for pid in hijos:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        limite = time.monotonic() + config['keepalive_timeout'] + PLAZO_CIERRE_WORKERS
+        while hijos and time.monotonic() < limite:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                time.sleep(0.05)
+            else:
+                hijos.pop(pid, None)
+        for pid in hijos:
+            print(f"El worker pid {pid} no terminó a tiempo; se lo mata")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
 
 
-def start_server(archivo_descarga=None, modo_upload=False, comprimir_gzip=False, password=None, medir_tiempo=False):
+def start_server(archivo_descarga=None, modo_upload=False, comprimir_gzip=False, password=None, medir_tiempo=False,
+                 modo_concurrencia="threads", max_hilos=16, backlog=128, keepalive_timeout=5.0, max_requests=100,
+                 cache_gzip_mb=64, gzip_sidecar=False, nivel_gzip=NIVEL_GZIP, ventana_gzip=VENTANA_GZIP,
+                 umbral_streaming_gzip=UMBRAL_STREAMING_GZIP, codecs=None, nivel_zstd=NIVEL_ZSTD,
+                 nivel_brotli=NIVEL_BROTLI, cache_control=CACHE_CONTROL_DEFECTO, etag_por_hash=False,
+                 refresco_indice=REFRESCO_INDICE, por_pagina=POR_PAGINA_DEFECTO, access_log=None, workers=1,
+                 dedup=False, cache_archivos_mb=CACHE_ARCHIVOS_MB, limite_global_mb=0, limite_conexion_mb=0,
+                 plazo_cabecera=PLAZO_CABECERA, plazo_inactividad=PLAZO_INACTIVIDAD, tasa_minima_body=TASA_MINIMA_BODY,
+                 max_en_curso=MAX_REQUESTS_EN_CURSO, max_subidas_mb=MAX_SUBIDAS_EN_CURSO_MB, direccion=None, mostrar_qr=True,
+                 tls=None):
     """
     Inicia el servidor TCP.
     - Si se especifica archivo_descarga, se inicia en modo 'download'.
     - Si modo_upload=True, se inicia en modo 'upload'.
-    - Si comprimir_gzip=True, comprime las respuestas con gzip si el cliente lo acepta.
+    - Si comprimir_gzip=True, comprime las respuestas con la mejor codificación que acepte el cliente.
     - Si password no es None, requiere autenticación Bearer token.
     - Si medir_tiempo=True, imprime mediciones de tiempo para análisis.
+    - modo_concurrencia: 'sequential' (un cliente a la vez), 'threads' (pool de max_hilos hilos)
+      o 'async' (event loop no bloqueante).
+    - backlog: tamaño de la cola de conexiones pendientes del listen.
+    - keepalive_timeout: segundos que una conexión persistente puede quedar inactiva.
+    - max_requests: máximo de requests atendidos por conexión (1 desactiva keep-alive).
+    - cache_gzip_mb: megabytes de memoria para guardar variantes ya comprimidas (0 la desactiva).
+    - Si gzip_sidecar=True, las variantes comprimidas de los archivos también se guardan en disco.
+    - nivel_gzip (1-9) y ventana_gzip (9-15): parámetros de zlib para comprimir.
+    - umbral_streaming_gzip: tamaño en bytes a partir del cual un archivo se comprime mientras se envía.
+    - codecs: list de codificaciones a ofrecer en orden de preferencia (None: zstd, br y gzip);
+      zstd y br solo se usan si están instalados los módulos zstandard y brotli.
+    - nivel_zstd (1-22) y nivel_brotli (0-11): niveles de compresión de esos codecs.
+    - cache_control: valor del header Cache-Control de las descargas (None o "" para no mandarlo).
+    - Si etag_por_hash=True, el ETag de las descargas es el SHA-256 del contenido en vez de tamaño y fecha.
+    - refresco_indice: cada cuántos segundos se revisa si archivos_servidor cambió por fuera del servidor
+      (None: solo se ven los cambios hechos por las subidas).
+    - por_pagina: cantidad de archivos por página en el listado.
+    - access_log: archivo donde escribir una línea JSON por request ('-' para la salida estándar, None para no escribir).
+      Las métricas agregadas siempre están disponibles en GET /metrics.
+    - workers: cantidad de procesos que atienden en el mismo puerto (SO_REUSEPORT). Con más de uno,
+      un supervisor los lanza con fork, reinicia los que se caen y /metrics suma las métricas de todos.
+    - Si dedup=True, las subidas se guardan en un almacén por contenido (AlmacenContenido): el mismo
+      contenido ocupa lugar una sola vez y /blob permite no volver a mandarlo.
+    - cache_archivos_mb: megabytes para los archivos que más se descargan (en memoria o con mmap, 0 la desactiva).
+    - limite_global_mb y limite_conexion_mb: MB/s que puede usar todo el servidor (repartidos en partes
+      iguales entre los clientes, ver PlanificadorAncho) y cada conexión, subidas y descargas; 0 sin límite.
+      Con varios workers cada uno tiene su parte del límite global.
+    - plazo_cabecera: segundos para que llegue la cabecera de un request una vez que empezó.
+    - plazo_inactividad: segundos que puede estar trabada la lectura de un body o el envío de una respuesta.
+    - tasa_minima_body: bytes/s promedio por debajo de los cuales se corta una subida (0 sin mínimo).
+    - max_en_curso y max_subidas_mb: requests y MB de subidas en curso como mucho; pasado eso se responde
+      503 con Retry-After (0 sin límite). Con varios workers cada uno tiene su parte.
+    - direccion: dónde escuchar: una IP, 'all' (todas las interfaces IPv4), 'dual' (IPv6 e IPv4)
+      o None para la variable de entorno HOST o, si no está, la IP de la red (ver get_wifi_ip).
+      Escuchando en todas se muestra una URL (y un QR) por cada dirección de la máquina.
+    - Si mostrar_qr=False no se dibujan los códigos QR (ni se importa qrcode).
+    - tls: tuple (certificado, clave) con las rutas de los PEM para atender por HTTPS (ver crear_contexto_tls),
+      o None para HTTP sin cifrar.
     """
+    if modo_concurrencia not in MODOS_CONCURRENCIA:
+        raise ValueError(f"Modo de concurrencia desconocido: {modo_concurrencia}")
+    if workers > 1 and not soporta_workers():
+        print("Aviso: este sistema no tiene fork o SO_REUSEPORT, se usa un solo proceso")
+        workers = 1
+    # Con un certificado inválido conviene fallar antes de abrir el puerto
+    contexto_tls = crear_contexto_tls(*tls) if tls is not None else None
+    if workers > 1 and refresco_indice is None:
+        # Cada worker tiene su índice: sin revisar el directorio no verían las subidas de los otros
+        print(f"Aviso: con varios workers el listado se revisa cada {REFRESCO_INDICE:g} s")
+        refresco_indice = REFRESCO_INDICE
 
     # 1. Obtener IP local y poner al servidor a escuchar en un puerto aleatorio
 
-    ip_server = get_wifi_ip()
-    # Permitir especificar puerto mediante variable de entorno (opcional)
+    # Permitir especificar IP y puerto mediante variables de entorno (opcional)
+    ip_server = DIRECCIONES_BIND.get(direccion, direccion) or os.environ.get("HOST") or get_wifi_ip()
     puerto = int(os.environ.get("PUERTO", 0))
 
-    method = None
+    def abrir_socket(ip):
+        if workers > 1:
+            # El supervisor solo reserva el puerto (no escucha): cada worker abre su propio socket en él
+            return crear_socket_servidor(ip, puerto, reutilizar_puerto=True)
+        return crear_socket_servidor(ip, puerto, backlog)
 
-    server_socket = socket(AF_INET, SOCK_STREAM)
-    server_socket.bind((ip_server, puerto))
+    try:
+        server_socket = abrir_socket(ip_server)
+    except OSError as e:
+        if ip_server != '::':
+            raise
+        print(f"Aviso: no se puede escuchar en IPv6 ({e}), se escucha solo en IPv4")
+        ip_server = '0.0.0.0'
+        server_socket = abrir_socket(ip_server)
     # Obtener el puerto real asignado por el sistema
     puerto = server_socket.getsockname()[1]
-    server_socket.listen(1)
 
     # 2. Mostrar información del servidor y el código QR
-    url = f"http://{ip_server}:{puerto}"
-    print(f"El server está listo! La URL es: {url}")
-    imprimir_qr_en_terminal(url)
+    urls = urls_servidor(ip_server, puerto, 'https' if contexto_tls is not None else 'http')
+    print(f"El server está listo! La URL es: {urls[0]}")
+    if len(urls) > 1:
+        print(f"También se puede entrar desde: {', '.join(urls[1:])}")
+    if mostrar_qr:
+        for url in urls:
+            imprimir_qr_en_terminal(url)
 
+    if contexto_tls is not None:
+        # Si el kernel realmente cifra se sabe recién en cada conexión (ver kernel_cifra)
+        print(f"HTTPS activado (kTLS {'pedido' if hasattr(ssl, 'OP_ENABLE_KTLS') else 'no disponible en este Python'})")
+    elif password is not None:
+        print("Aviso: sin --tls la contraseña viaja sin cifrar por la red")
     if modo_upload:
         print("El server está en modo upload (también permite descargar archivos)")
     else:
         print("El server está en modo download")
+    print(f"Modo de concurrencia: {modo_concurrencia}")
+    if workers > 1:
+        print(f"Procesos worker: {workers}")
+
+    # En modo secuencial una conexión persistente inactiva bloquearía a todos los demás clientes
+    if modo_concurrencia == "sequential":
+        max_requests = 1
+
+    config = {
+        'archivo_descarga': archivo_descarga,
+        'modo_upload': modo_upload,
+        'comprimir_gzip': comprimir_gzip,
+        'password': password,
+        'medir_tiempo': medir_tiempo,
+        'max_hilos': max_hilos,
+        'backlog': backlog,
+        'keepalive_timeout': keepalive_timeout,
+        'max_requests': max(1, max_requests),
+        'cache_comprimidos': None,
+        'cache_archivos': CacheArchivos(cache_archivos_mb * 1024 * 1024) if cache_archivos_mb > 0 else None,
+        'ancho': None,
+        'plazo_cabecera': plazo_cabecera,
+        'plazo_inactividad': plazo_inactividad,
+        'tasa_minima_body': tasa_minima_body or None,
+        'admision': None,
+        'tls': contexto_tls,
+        'cache_control': cache_control,
+        'etag_por_hash': etag_por_hash,
+        'indice': IndiceDirectorio("archivos_servidor", refresco_indice),
+        'almacen': None,
+        'por_pagina': min(max(1, por_pagina), MAX_POR_PAGINA),
+        'metricas': Metricas(access_log),
+        'directorio_workers': tempfile.mkdtemp(prefix="metricas-workers-") if workers > 1 else None,
+        'compresion': {
+            'codecs': codecs_disponibles(codecs),
+            'niveles': {'gzip': nivel_gzip, 'zstd': nivel_zstd, 'br': nivel_brotli},
+            'ventana': ventana_gzip,
+            'umbral_streaming': umbral_streaming_gzip,
+        },
+    }
+    if comprimir_gzip and (cache_gzip_mb > 0 or gzip_sidecar):
+        config['cache_comprimidos'] = CacheComprimidos(max(0, cache_gzip_mb) * 1024 * 1024, usar_sidecar=gzip_sidecar)
+    if comprimir_gzip:
+        print(f"Codificaciones ofrecidas: {', '.join(config['compresion']['codecs']) or 'ninguna'}")
+    if limite_global_mb > 0 or limite_conexion_mb > 0:
+        config['ancho'] = PlanificadorAncho(limite_global_mb * 1024 * 1024 / workers if limite_global_mb > 0 else None,
+                                            limite_conexion_mb * 1024 * 1024 if limite_conexion_mb > 0 else None)
+        print(f"Límite de ancho de banda: {f'{limite_global_mb:g} MB/s en total' if limite_global_mb > 0 else 'sin límite total'}, "
+              f"{f'{limite_conexion_mb:g} MB/s por conexión' if limite_conexion_mb > 0 else 'sin límite por conexión'}")
+    if max_en_curso > 0 or max_subidas_mb > 0:
+        config['admision'] = ControlAdmision(max(1, max_en_curso // workers) if max_en_curso > 0 else None,
+                                             max_subidas_mb * 1024 * 1024 // workers if max_subidas_mb > 0 else None)
+    # Sesiones de subida que quedaron de antes: se retoman, salvo las abandonadas hace mucho
+    limpiar_sesiones("archivos_servidor")
+    if dedup:
+        try:
+            config['almacen'] = AlmacenContenido("archivos_servidor")
+            print(f"Deduplicación activada: {len(config['almacen'].nombres)} archivos en el almacén por contenido")
+        except OSError as e:
+            print(f"Aviso: no se pudo activar --dedup, el sistema de archivos no soporta hard links ({e})")
 
-    # 3. Esperar conexiones y atender un cliente (accept, recv, decode, determine, generate, send, close)
+    # 3. Esperar conexiones y atenderlas según el modo de concurrencia
     # - aceptar la conexión (accept)
     # - recibir los datos (recv)
     # - decodificar la solicitud HTTP
@@ -418,294 +5162,891 @@ def start_server(archivo_descarga=None, modo_upload=False, comprimir_gzip=False,
     # - enviar la respuesta al cliente
     # - cerrar la conexión
 
-    try:
-        while True: 
-            client_socket = None
-            try:
-                # Aceptar la conexión
-                client_socket, client_address = server_socket.accept()
-                print(f"Se estableció una conexión con {client_address} ✨")
-
-                # Recibir los datos
-                data = client_socket.recv(65535)
-                
-                # Si no se recibieron datos, cerrar la conexión y continuar
-                if not data:
-                    client_socket.close()
-                    continue
-                
-                # Extraer solo la request line (primera línea) sin decodificar todo el body
-                # porque el body puede contener datos binarios
-                first_line_end = data.find(b'\r\n')
-                if first_line_end == -1:
-                    first_line_end = data.find(b'\n')
-                if first_line_end == -1:
-                    first_line_end = len(data)
-                
-                # Decodificar solo la request line
-                request_line = data[:first_line_end].decode("utf-8", errors="ignore")
-                
-                # Extraer el método y el path de la request line
-                parts = request_line.split(" ", 2)
-                if len(parts) < 2:
-                    response = b"HTTP/1.1 400 Bad Request\r\n\r\n"
-                    client_socket.sendall(response)
-                    client_socket.close()
-                    continue
-                
-                method = parts[0]
-                path_full = parts[1]
-                
-                # Parsear path y query string
-                path_parts = path_full.split('?', 1)
-                path = path_parts[0]
-                query_string = path_parts[1] if len(path_parts) > 1 else ""
-                
-                # Parsear query string para obtener parámetros
-                query_params = {}
-                if query_string:
-                    for param in query_string.split('&'):
-                        if '=' in param:
-                            key, value = param.split('=', 1)
-                            # Decodificar el valor (puede venir URL-encoded)
-                            value = unquote(value)
-                            query_params[key] = value
-
-                # Parsear headers para todas las solicitudes
-                headers = {}
-                body_inicial = b""
-                try:
-                    headers, _ = parsear_headers_y_body(data)
-                except:
-                    headers, body_inicial = {}, b""
-                
-                # Verificar autenticación si está habilitada
-                if password is not None:
-                    auth_header = headers.get('authorization', '')
-                    expected_auth = f"Bearer {password}"
-                    if auth_header != expected_auth:
-                        # No autenticado - devolver 401 Unauthorized
-                        response = b"HTTP/1.1 401 Unauthorized\r\n"
-                        response += b"WWW-Authenticate: Bearer\r\n"
-                        response += b"Content-Type: text/html\r\n"
-                        error_html = """
-                        <html>
-                          <head><title>401 Unauthorized</title></head>
-                          <body>
-                            <h1>401 Unauthorized</h1>
-                            <p>Se requiere autenticación. Use el header: Authorization: Bearer {contraseña}</p>
-                          </body>
-                        </html>
-                        """
-                        error_html_bytes = error_html.encode('utf-8')
-                        response += f"Content-Length: {len(error_html_bytes)}\r\n".encode('utf-8')
-                        response += b"\r\n"
-                        response += error_html_bytes
-                        client_socket.sendall(response)
-                        client_socket.close()
-                        continue
-                
-                if method == "GET":
-                    if path == "/":
-                        # Generar HTML según el modo del servidor
-                        # Si está en modo upload, mostrar ambas opciones
-                        modo_actual = 'both' if modo_upload else 'download'
-                        html_content = generar_html_interfaz(modo_actual, directorio_archivos="archivos_servidor")
-                        html_bytes = html_content.encode('utf-8')
-                        
-                        # Verificar si el cliente acepta compresión gzip
-                        acepta_gzip = False
-                        if comprimir_gzip:
-                            accept_encoding = headers.get('accept-encoding', '')
-                            if 'gzip' in accept_encoding.lower():
-                                acepta_gzip = True
-                        
-                        # Comprimir HTML si está habilitado y el cliente lo acepta
-                        if acepta_gzip:
-                            html_bytes = gzip.compress(html_bytes)
-                        
-                        # Construir respuesta HTTP con el HTML
-                        response = b"HTTP/1.1 200 OK\r\n"
-                        response += b"Content-Type: text/html\r\n"
-                        if acepta_gzip:
-                            response += b"Content-Encoding: gzip\r\n"
-                        response += f"Content-Length: {len(html_bytes)}\r\n".encode('utf-8')
-                        response += b"\r\n"
-                        response += html_bytes
-                    elif path == "/download":
-                        # Si hay un parámetro archivo en la query, usarlo; sino usar archivo_descarga
-                        archivo_a_descargar = archivo_descarga
-                        if 'archivo' in query_params:
-                            nombre_archivo = query_params['archivo']
-                            archivo_a_descargar = os.path.join("archivos_servidor", nombre_archivo)
-                        response = manejar_descarga(archivo_a_descargar, request_line, headers=headers, comprimir_gzip=comprimir_gzip)
-                    else:
-                        # Ruta no encontrada
-                        response = b"HTTP/1.1 404 Not Found\r\n\r\n"
-                    body_completo = None
-
-                elif method == "POST":
-                    # 1) Asegurar lectura COMPLETA del body según content-length:
-                    #    headers y body_inicial ya fueron parseados arriba con parsear_headers_y_body
-                    body_completo = body_inicial
-                    try:
-                        content_length = int(headers.get("content-length", "0"))
-                    except ValueError:
-                        content_length = 0
-
-                    # Leer lo que falta si el body no llegó todo en el primer recv
-                    bytes_faltantes = content_length - len(body_completo)
-                    while bytes_faltantes > 0:
-                        chunk = client_socket.recv(min(65535, bytes_faltantes))
-                        if not chunk:
-                            break
-                        body_completo += chunk
-                        bytes_faltantes -= len(chunk)
-
-                    # 2) Procesar la ruta
-                    if path == "/" or path == "":
-                        boundary = extraer_boundary(headers)
-
-                        if boundary and body_completo:
-                            # Asegurar directorio de destino para guardar archivos
-                            if not os.path.exists("archivos_servidor"):
-                                os.makedirs("archivos_servidor", exist_ok=True)
-
-                            # Procesar el archivo subido
-                            response = manejar_carga(body_completo, boundary, directorio_destino="archivos_servidor")
-
-                            # 3) Si GZIP está habilitado y el cliente lo admite -> comprimir respuesta HTML
-                            if comprimir_gzip:
-                                accept_encoding = headers.get('accept-encoding', '')
-                                if 'gzip' in accept_encoding.lower():
-                                    # Sacar headers y body
-                                    response_parts = response.split(b'\r\n\r\n', 1)
-                                    if len(response_parts) == 2:
-                                        headers_resp, body_resp = response_parts
-                                        body_comprimido = gzip.compress(body_resp)
-
-                                        # Actualizar Content-Length en los headers
-                                        headers_resp = headers_resp.replace(
-                                            f'Content-Length: {len(body_resp)}'.encode('utf-8'),
-                                            f'Content-Length: {len(body_comprimido)}'.encode('utf-8')
-                                        )
-                                        # Agregar Content-Encoding si no está
-                                        if b'Content-Encoding: gzip' not in headers_resp:
-                                            headers_resp = headers_resp.replace(
-                                                b'Content-Type: text/html\r\n',
-                                                b'Content-Type: text/html\r\nContent-Encoding: gzip\r\n'
-                                            )
-
-                                        response = headers_resp + b'\r\n\r\n' + body_comprimido
-                        else:
-                            # No había boundary o body -> no se pudo procesar el POST
-                            response = b"HTTP/1.1 400 Bad Request\r\n\r\n"
-
-                    else:
-                        # Si hacen POST a otra ruta, devolvés el HTML normal
-                        modo_actual = 'both' if modo_upload else 'download'
-                        html_content = generar_html_interfaz(modo_actual, directorio_archivos="archivos_servidor")
-                        html_bytes = html_content.encode('utf-8')
-
-                        # Compresión si aplica
-                        acepta_gzip = False
-                        if comprimir_gzip:
-                            accept_encoding = headers.get('accept-encoding', '')
-                            if 'gzip' in accept_encoding.lower():
-                                acepta_gzip = True
-                        if acepta_gzip:
-                            html_bytes = gzip.compress(html_bytes)
-
-                        response = b"HTTP/1.1 200 OK\r\n"
-                        response += b"Content-Type: text/html\r\n"
-                        if acepta_gzip:
-                            response += b"Content-Encoding: gzip\r\n"
-                        response += f"Content-Length: {len(html_bytes)}\r\n".encode('utf-8')
-                        response += b"\r\n"
-                        response += html_bytes
+    # Con varios workers el índice y las caches se arman acá una sola vez y cada worker las hereda con el fork
 
-                # Enviar la respuesta al cliente
-                if medir_tiempo:
-                    inicio = time.perf_counter()
-                    client_socket.sendall(response)
-                    duracion = time.perf_counter() - inicio
-                    tamaño_respuesta = len(response)
-                    print(f"[MEDICIÓN] Tiempo de envío: {duracion:.20f} s | Tamaño respuesta: {tamaño_respuesta} bytes")
-                else:
-                    client_socket.sendall(response)
-                # Cerrar la conexión
-                client_socket.close()
-                
-            except ConnectionResetError:
-                # El cliente cerró la conexión abruptamente
-                try:
-                    print(f"Conexión cerrada por el cliente")
-                    if client_socket:
-                        client_socket.close()
-                except:
-                    pass
-                continue
-            except Exception as e:
-                # Cualquier otro error
-                print(f"Error al procesar la solicitud: {e}")
-                try:
-                    if client_socket:
-                        client_socket.close()
-                except:
-                    pass
-                continue
+    try:
+        if workers > 1:
+            supervisar_workers(workers, ip_server, puerto, modo_concurrencia, config, server_socket)
+        else:
+            servir(server_socket, modo_concurrencia, config)
     except KeyboardInterrupt:
         # El usuario interrumpió el servidor con Ctrl+C
         print("\nServidor detenido por el usuario.")
-        server_socket.close()
     finally:
         # Asegurar que el socket se cierre correctamente
         try:
             server_socket.close()
         except:
             pass
+        config['metricas'].cerrar()
+        if config['directorio_workers'] is not None:
+            shutil.rmtree(config['directorio_workers'], ignore_errors=True)
+
+
+#CLIENTE
+
+class ErrorCliente(Exception):
+    """Falla de una transferencia del cliente (status inesperado, conexión cortada o checksum distinto)."""
+
+
+def parsear_url_servidor(url):
+    """
+    Requiere: url: str como 'http://192.168.0.10:8080' o 'https://...' (el esquema es opcional)
+    Devuelve: tuple (host, puerto, tls: bool)
+    """
+    if '://' not in url:
+        url = 'http://' + url
+    partes = urlparse(url)
+    if partes.scheme not in ('http', 'https') or not partes.hostname:
+        raise ValueError(f"URL inválida: {url}")
+    tls = partes.scheme == 'https'
+    return partes.hostname, partes.port or (443 if tls else 80), tls
+
+
+class ConexionCliente:
+    """Conexión HTTP/1.1 persistente del cliente sobre asyncio (un request a la vez)."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reutilizable = True
+        # Pasa a True apenas llega la status line: desde ahí un error ya no se puede reintentar
+        self.respondio = False
+
+    async def pedir(self, method, target, headers, cuerpo=None, destino=None):
+        """
+        Manda un request y lee la respuesta completa.
+        Requiere: headers: dict, cuerpo: None, bytes o iterable de bytes que se va mandando a medida
+                  que se genera (headers tiene que traer el Content-Length),
+                  destino: None para devolver el body entero, o una función (codigo, headers) que
+                  devuelve la función que recibe cada pedazo del body (o None para descartarlo)
+        Devuelve: tuple (codigo: int, headers: dict con claves en minúsculas, body: bytes, vacío si se usó destino)
+        """
+        self.respondio = False
+        lineas = [f"{method} {target} HTTP/1.1\r\n"]
+        lineas += [f"{nombre}: {valor}\r\n" for nombre, valor in headers.items()]
+        lineas.append("\r\n")
+        self.writer.write("".join(lineas).encode('utf-8'))
+        enviados = 0
+        if isinstance(cuerpo, (bytes, bytearray)):
+            self.writer.write(cuerpo)
+            enviados = len(cuerpo)
+        elif cuerpo is not None:
+            for parte in cuerpo:
+                self.writer.write(parte)
+                enviados += len(parte)
+                await self.writer.drain()
+        await self.writer.drain()
+
+        cabecera = await self.reader.readuntil(b"\r\n\r\n")
+        self.respondio = True
+        status_line, _, resto = cabecera.decode('utf-8', errors='replace').partition("\r\n")
+        partes = status_line.split(" ", 2)
+        if len(partes) < 2 or not partes[1].isdigit():
+            raise ErrorCliente(f"respuesta inválida: {status_line!r}")
+        codigo = int(partes[1])
+        headers_respuesta = {}
+        for linea in resto.split("\r\n"):
+            if ":" in linea:
+                clave, valor = linea.split(":", 1)
+                headers_respuesta[clave.strip().lower()] = valor.strip()
+        if 'close' in headers_respuesta.get('connection', '').lower():
+            self.reutilizable = False
+
+        guardados = []
+        recibir = guardados.append if destino is None else destino(codigo, headers_respuesta)
+        if recibir is None:
+            recibir = lambda datos: None
+        recibidos = 0
+        if method == "HEAD" or codigo in (204, 304):
+            pass
+        elif headers_respuesta.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                tamaño = int((await self.reader.readline()).split(b";")[0], 16)
+                if tamaño == 0:
+                    # Saltear los trailers hasta la línea vacía
+                    while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                recibir(await self.reader.readexactly(tamaño))
+                recibidos += tamaño
+                await self.reader.readexactly(2)
+        elif 'content-length' in headers_respuesta:
+            restantes = int(headers_respuesta['content-length'])
+            while restantes > 0:
+                datos = await self.reader.read(min(restantes, TAMAÑO_BLOQUE))
+                if not datos:
+                    raise ErrorCliente("la conexión se cerró antes de terminar la respuesta")
+                recibir(datos)
+                recibidos += len(datos)
+                restantes -= len(datos)
+        else:
+            # Sin longitud el body termina cuando el servidor cierra la conexión
+            self.reutilizable = False
+            while datos := await self.reader.read(TAMAÑO_BLOQUE):
+                recibir(datos)
+                recibidos += len(datos)
+        self.enviados, self.recibidos = enviados, recibidos
+        return codigo, headers_respuesta, b"".join(guardados)
+
+    def cerrar(self):
+        self.writer.close()
+
+
+class PoolConexiones:
+    """
+    Conexiones persistentes a un servidor, como mucho 'cantidad' usándose a la vez.
+    Las libres se reutilizan (keep-alive). Si una reutilizada ya estaba cerrada por el servidor
+    (se venció su keep-alive) y no llegó a responder, el request se reintenta en una conexión nueva.
+    - bytes_enviados / bytes_recibidos: bodies transferidos (lo que pasó por la red, comprimido o no)
+    - contexto_tls: ssl.SSLContext para conectarse por HTTPS, o None
+    """
+
+    def __init__(self, host, puerto, cantidad, headers_base=None, contexto_tls=None):
+        self.host = host
+        self.puerto = puerto
+        self.contexto_tls = contexto_tls
+        self.cupos = asyncio.Semaphore(cantidad)
+        self.libres = []
+        self.headers_base = {'Host': f"{host}:{puerto}"}
+        self.headers_base.update(headers_base or {})
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+
+    async def pedir(self, method, target, headers=None, cuerpo=None, destino=None):
+        """
+        Igual que ConexionCliente.pedir, pero cuerpo también puede ser una función sin argumentos
+        que devuelve el iterable de bytes (así se puede volver a generar si hay que reintentar).
+        """
+        todos = dict(self.headers_base)
+        todos.update(headers or {})
+        async with self.cupos:
+            while True:
+                reutilizada = bool(self.libres)
+                if reutilizada:
+                    conexion = self.libres.pop()
+                else:
+                    reader, writer = await asyncio.open_connection(self.host, self.puerto, ssl=self.contexto_tls)
+                    conexion = ConexionCliente(reader, writer)
+                try:
+                    resultado = await conexion.pedir(method, target, todos, cuerpo() if callable(cuerpo) else cuerpo,
+                                                     destino)
+                except (ConnectionError, asyncio.IncompleteReadError) as e:
+                    conexion.cerrar()
+                    if reutilizada and not conexion.respondio:
+                        continue
+                    raise ErrorCliente(f"se cortó la conexión ({e.__class__.__name__})") from e
+                except BaseException:
+                    conexion.cerrar()
+                    raise
+                self.bytes_enviados += conexion.enviados
+                self.bytes_recibidos += conexion.recibidos
+                if conexion.reutilizable:
+                    self.libres.append(conexion)
+                else:
+                    conexion.cerrar()
+                return resultado
+
+    def cerrar(self):
+        for conexion in self.libres:
+            conexion.cerrar()
+        self.libres = []
+
+
+async def pedir_listado(pool, nombres=None, con_hash=True):
+    """
+    Pide GET /list al servidor (en tandas, para no pasar el límite de parámetros de la query).
+    Devuelve: list de dicts con 'nombre', 'tamaño' y, si con_hash, 'sha256'
+    """
+    tandas = [None] if not nombres else [nombres[i:i + 50] for i in range(0, len(nombres), 50)]
+    archivos = []
+    for tanda in tandas:
+        parametros = ["sha256=1"] if con_hash else []
+        parametros += [f"archivo={quote(nombre)}" for nombre in tanda or ()]
+        codigo, _, cuerpo = await pool.pedir("GET", "/list?" + "&".join(parametros))
+        if codigo == 401:
+            raise ErrorCliente("el servidor pide contraseña (--password)")
+        if codigo != 200:
+            raise ErrorCliente(f"GET /list respondió {codigo}")
+        archivos += json.loads(cuerpo)['archivos']
+    return archivos
+
+
+async def descargar_segmento(pool, target, fd, inicio, fin, tamaño):
+    """Baja los bytes inicio..fin (inclusive) de un archivo con un Range y los escribe en su lugar de fd."""
+    posicion = inicio
+
+    def al_responder(codigo, headers):
+        if codigo != 206 or headers.get('content-range') != f"bytes {inicio}-{fin}/{tamaño}":
+            return None
+
+        def escribir(datos):
+            nonlocal posicion
+            escribir_en(fd, datos, posicion)
+            posicion += len(datos)
+        return escribir
+
+    codigo, headers, _ = await pool.pedir("GET", target, {'Range': f"bytes={inicio}-{fin}"}, destino=al_responder)
+    if codigo != 206:
+        raise ErrorCliente(f"el rango {inicio}-{fin} respondió {codigo}")
+    if posicion != fin + 1:
+        raise ErrorCliente(f"el rango {inicio}-{fin} llegó incompleto")
+
+
+async def descargar_archivo(pool, archivo, directorio, tamaño_segmento, aceptar_gzip):
+    """
+    Baja un archivo del listado a directorio. Si es grande se pide en segmentos con Range que se
+    bajan en paralelo (cada uno por su conexión); si no, en un solo GET, comprimido si se acepta gzip.
+    Se escribe en un temporal que se renombra al terminar bien.
+    Devuelve: str, el SHA-256 del contenido bajado
+    """
+    nombre, tamaño = archivo['nombre'], archivo['tamaño']
+    if not nombre_archivo_valido(nombre):
+        # El nombre viene del servidor: no se le deja escribir fuera de directorio ni pisar ocultos
+        raise ErrorCliente(f"el servidor mandó un nombre de archivo inválido: {nombre!r}")
+    ruta_parcial = os.path.join(directorio, f".{nombre}.parcial")
+    target = f"/download?archivo={quote(nombre)}"
+    fd = os.open(ruta_parcial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if tamaño_segmento > 0 and tamaño > tamaño_segmento:
+            os.ftruncate(fd, tamaño)
+            await asyncio.gather(*(descargar_segmento(pool, target, fd, inicio, min(inicio + tamaño_segmento, tamaño) - 1,
+                                                      tamaño)
+                                   for inicio in range(0, tamaño, tamaño_segmento)))
+            digest = hash_archivo(ruta_parcial)
+        else:
+            h = hashlib.sha256()
+            posicion = 0
+            descompresor = None
+
+            def al_responder(codigo, headers):
+                nonlocal descompresor
+                if codigo != 200:
+                    return None
+                if headers.get('content-encoding', '').lower() == 'gzip':
+                    descompresor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+                def escribir(datos):
+                    nonlocal posicion
+                    if descompresor is not None:
+                        datos = descompresor.decompress(datos)
+                    h.update(datos)
+                    escribir_en(fd, datos, posicion)
+                    posicion += len(datos)
+                return escribir
+
+            headers = {'Accept-Encoding': 'gzip' if aceptar_gzip else 'identity'}
+            codigo, _, _ = await pool.pedir("GET", target, headers, destino=al_responder)
+            if codigo != 200:
+                raise ErrorCliente(f"GET respondió {codigo}")
+            if descompresor is not None:
+                resto = descompresor.flush()
+                h.update(resto)
+                escribir_en(fd, resto, posicion)
+                if not descompresor.eof:
+                    raise ErrorCliente("el contenido gzip llegó cortado")
+            digest = h.hexdigest()
+    except BaseException:
+        os.close(fd)
+        os.remove(ruta_parcial)
+        raise
+    os.close(fd)
+    if archivo.get('sha256') and archivo['sha256'] != digest:
+        os.remove(ruta_parcial)
+        raise ErrorCliente("el SHA-256 no coincide con el del servidor")
+    os.replace(ruta_parcial, os.path.join(directorio, nombre))
+    return digest
+
+
+async def subir_lote(pool, lote):
+    """
+    Sube varios archivos en un mismo POST multipart/form-data, leyéndolos por bloques mientras se envían.
+    Requiere: lote: list de tuplas (ruta, nombre, tamaño)
+    Devuelve: dict nombre -> SHA-256 del contenido enviado
+    """
+    limite = uuid.uuid4().hex
+    partes = []
+    for numero, (ruta, nombre, tamaño) in enumerate(lote):
+        # Cada parte después de la primera empieza con el CRLF que cierra la anterior
+        separador = "\r\n" if numero else ""
+        inicio = (f'{separador}--{limite}\r\n'
+                  f'Content-Disposition: form-data; name="file"; filename="{nombre}"\r\n'
+                  'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8')
+        partes.append((inicio, ruta, nombre))
+    fin = f"\r\n--{limite}--\r\n".encode('utf-8')
+    hashes = {}
+
+    def cuerpo():
+        for inicio, ruta, nombre in partes:
+            h = hashlib.sha256()
+            hashes[nombre] = h
+            yield inicio
+            with open(ruta, 'rb') as archivo:
+                while bloque := archivo.read(TAMAÑO_BLOQUE):
+                    h.update(bloque)
+                    yield bloque
+        yield fin
+
+    longitud = sum(len(inicio) for inicio, _, _ in partes) + sum(tamaño for _, _, tamaño in lote) + len(fin)
+    headers = {'Content-Type': f'multipart/form-data; boundary={limite}', 'Content-Length': str(longitud),
+               'Accept': 'application/json'}
+    codigo, _, respuesta = await pool.pedir("POST", "/", headers, cuerpo)
+    if codigo != 200:
+        raise ErrorCliente(f"POST respondió {codigo}")
+    guardados = {archivo['nombre'] for archivo in json.loads(respuesta)['archivos']}
+    faltantes = [nombre for _, _, nombre in partes if nombre not in guardados]
+    if faltantes:
+        raise ErrorCliente(f"el servidor no guardó {', '.join(faltantes)}")
+    return {nombre: h.hexdigest() for nombre, h in hashes.items()}
+
+
+async def subir_fragmento(pool, destino, ruta, inicio, fin):
+    """Manda los bytes [inicio, fin) de un archivo local a la sesión de subida destino."""
+    def cuerpo():
+        with open(ruta, 'rb') as archivo:
+            archivo.seek(inicio)
+            restantes = fin - inicio
+            while restantes:
+                bloque = archivo.read(min(TAMAÑO_BLOQUE, restantes))
+                if not bloque:
+                    raise ErrorCliente("el archivo local cambió durante la subida")
+                restantes -= len(bloque)
+                yield bloque
+
+    codigo, _, _ = await pool.pedir("PUT", f"{destino}?offset={inicio}", {'Content-Length': str(fin - inicio)}, cuerpo)
+    if codigo != 200:
+        raise ErrorCliente(f"el fragmento {inicio}-{fin} respondió {codigo}")
+
+
+async def subir_reanudable(pool, ruta, nombre, tamaño, tamaño_fragmento):
+    """
+    Sube un archivo grande con las subidas reanudables del servidor (/uploads): crea la sesión (o retoma
+    la que quedó de una corrida anterior), manda en paralelo los fragmentos que faltan y, si alguno se
+    corta, vuelve a preguntar qué falta y lo reintenta. El servidor verifica el SHA-256 al completarla.
+    Devuelve: str, el SHA-256 del archivo
+    """
+    digest = await asyncio.to_thread(hash_archivo, ruta)
+    codigo, _, cuerpo = await pool.pedir(
+        "POST", f"/uploads?nombre={quote(nombre)}&{quote('tamaño')}={tamaño}&sha256={digest}", {'Content-Length': '0'})
+    if codigo == 404:
+        # Servidor sin subidas reanudables: un POST común
+        return (await subir_lote(pool, [(ruta, nombre, tamaño)]))[nombre]
+    if codigo not in (200, 201):
+        raise ErrorCliente(f"crear la subida respondió {codigo}")
+    sesion = json.loads(cuerpo)
+    destino = f"/uploads/{sesion['id']}"
+
+    for intento in range(INTENTOS_CLIENTE):
+        fragmentos = [(posicion, min(posicion + tamaño_fragmento, fin))
+                      for inicio, fin in rangos_faltantes(sesion['recibidos'], tamaño)
+                      for posicion in range(inicio, fin, tamaño_fragmento)]
+        if not fragmentos:
+            break
+        if intento:
+            await asyncio.sleep(1)
+        resultados = await asyncio.gather(*(subir_fragmento(pool, destino, ruta, inicio, fin)
+                                            for inicio, fin in fragmentos), return_exceptions=True)
+        for resultado in resultados:
+            if isinstance(resultado, BaseException) and not isinstance(resultado, (ErrorCliente, OSError)):
+                raise resultado
+        codigo, _, cuerpo = await pool.pedir("GET", destino)
+        if codigo != 200:
+            raise ErrorCliente(f"consultar la subida respondió {codigo}")
+        sesion = json.loads(cuerpo)
+    if sesion['faltan']:
+        raise ErrorCliente(f"después de {INTENTOS_CLIENTE} intentos todavía faltan {sesion['faltan']} bytes")
+
+    codigo, _, _ = await pool.pedir("POST", f"{destino}/complete", {'Content-Length': '0'})
+    if codigo != 200:
+        raise ErrorCliente(f"completar la subida respondió {codigo}")
+    return digest
+
+
+def armar_lotes(archivos, max_archivos=MAX_LOTE_CLIENTE, max_bytes=TAMAÑO_LOTE_CLIENTE):
+    """
+    Agrupa los archivos para subir muchos chicos en pocos requests; los que pasan max_bytes van solos.
+    Requiere: archivos: list de tuplas (ruta, nombre)
+    Devuelve: list de lotes, cada uno una list de tuplas (ruta, nombre, tamaño)
+    """
+    lotes = []
+    actual = []
+    bytes_actual = 0
+    for ruta, nombre in archivos:
+        tamaño = os.path.getsize(ruta)
+        if actual and (len(actual) >= max_archivos or bytes_actual + tamaño > max_bytes):
+            lotes.append(actual)
+            actual = []
+            bytes_actual = 0
+        actual.append((ruta, nombre, tamaño))
+        bytes_actual += tamaño
+    if actual:
+        lotes.append(actual)
+    return lotes
+
+
+def archivos_a_subir(rutas):
+    """
+    Requiere: rutas: list de archivos o directorios locales (los directorios se recorren enteros, sin los ocultos)
+    Devuelve: list de tuplas (ruta, nombre); el servidor guarda todo en un solo directorio, así
+              que el nombre es el del archivo sin los directorios. Termina si dos se llaman igual o si
+              alguno tiene un nombre que el servidor no acepta (ver nombre_archivo_valido).
+    """
+    archivos = []
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for raiz, directorios, nombres in os.walk(ruta):
+                # Los ocultos se saltean: el servidor no los lista
+                directorios[:] = sorted(nombre for nombre in directorios if not nombre.startswith('.'))
+                archivos += [(os.path.join(raiz, nombre), nombre) for nombre in sorted(nombres)
+                             if not nombre.startswith('.')]
+        elif os.path.isfile(ruta):
+            archivos.append((ruta, os.path.basename(ruta)))
+        else:
+            print(f"Error: no existe {ruta}")
+            sys.exit(1)
+    vistos = {}
+    for ruta, nombre in archivos:
+        if not nombre_archivo_valido(nombre):
+            print(f"Error: el servidor no acepta el nombre de {ruta} (oculto, o con comillas o caracteres de control)")
+            sys.exit(1)
+        if nombre in vistos:
+            print(f"Error: {vistos[nombre]} y {ruta} se guardarían con el mismo nombre en el servidor")
+            sys.exit(1)
+        vistos[nombre] = ruta
+    return archivos
+
+
+async def transferir(tarea, etiqueta, tamaño, errores):
+    """
+    Corre la transferencia de un archivo, informa cómo le fue y anota el error si falló.
+    Devuelve: int, los bytes transferidos, o None si falló
+    """
+    inicio = time.perf_counter()
+    try:
+        await tarea
+    except (ErrorCliente, OSError, ValueError, zlib.error) as e:
+        errores.append((etiqueta, str(e)))
+        print(f"  ✗ {etiqueta}: {e}")
+        return None
+    duracion = time.perf_counter() - inicio
+    print(f"  ✓ {etiqueta} ({tamaño / (1024 * 1024):.2f} MB en {duracion:.2f} s)")
+    return tamaño
+
+
+async def enlazar_existente(pool, ruta, nombre):
+    """
+    Si el servidor ya tiene el contenido de ruta (almacén de --dedup), guarda nombre sin mandarlo.
+    Devuelve: str, el SHA-256 si no hizo falta subirlo, o None
+    """
+    digest = await asyncio.to_thread(hash_archivo, ruta)
+    codigo, _, _ = await pool.pedir("POST", f"/blob?sha256={digest}&nombre={quote(nombre)}", {'Content-Length': '0'})
+    return digest if codigo == 200 else None
+
+
+async def ejecutar_cliente(comando, url, argumentos, password=None, conexiones=CONEXIONES_CLIENTE,
+                           tamaño_segmento=TAMAÑO_SEGMENTO_CLIENTE, aceptar_gzip=False, verificar=True, dedup=False,
+                           certificado_ca=None):
+    """
+    Cliente de línea de comandos:
+    - get: argumentos = [directorio_destino, nombres...]; baja los archivos nombrados (o todos) del servidor
+    - put: argumentos = archivos o directorios locales a subir; con dedup primero se pregunta por el
+      SHA-256 de cada uno y los que el servidor ya tiene no se mandan
+    Las transferencias van en paralelo sobre un pool de conexiones persistentes y, con verificar=True,
+    se comparan los SHA-256 con los que informa el servidor en /list.
+    Con una URL https:// el certificado del servidor se verifica contra certificado_ca (por ejemplo el
+    mismo certificado autofirmado del servidor) o, si es None, contra las autoridades del sistema.
+    Devuelve: int, el código de salida (0 si todo salió bien)
+    """
+    host, puerto, tls = parsear_url_servidor(url)
+    headers_base = {'Authorization': f"Bearer {password}"} if password is not None else {}
+    contexto_tls = None
+    if tls:
+        contexto_tls = ssl.create_default_context(cafile=certificado_ca)
+        contexto_tls.set_alpn_protocols(PROTOCOLOS_ALPN)
+    pool = PoolConexiones(host, puerto, conexiones, headers_base, contexto_tls)
+    errores = []
+    inicio = time.perf_counter()
+    try:
+        if comando == "get":
+            directorio = argumentos[0] if argumentos else "."
+            nombres = argumentos[1:]
+            archivos = await pedir_listado(pool, nombres, con_hash=verificar)
+            for nombre in sorted(set(nombres) - {archivo['nombre'] for archivo in archivos}):
+                errores.append((nombre, "no está en el servidor"))
+                print(f"  ✗ {nombre}: no está en el servidor")
+            os.makedirs(directorio, exist_ok=True)
+            totales = await asyncio.gather(*(
+                transferir(descargar_archivo(pool, archivo, directorio, tamaño_segmento, aceptar_gzip),
+                           archivo['nombre'], archivo['tamaño'], errores)
+                for archivo in archivos))
+            accion = "Descargados"
+        else:
+            archivos = archivos_a_subir(argumentos)
+            # Verificar la contraseña antes de empezar a mandar bytes
+            await pedir_listado(pool, [archivos[0][1]] if archivos else None, con_hash=False)
+            hashes = {}
+            if dedup:
+                existentes = await asyncio.gather(*(enlazar_existente(pool, ruta, nombre) for ruta, nombre in archivos))
+                for (ruta, nombre), digest in zip(archivos, existentes):
+                    if digest is not None:
+                        hashes[nombre] = digest
+                archivos = [(ruta, nombre) for ruta, nombre in archivos if nombre not in hashes]
+                if hashes:
+                    print(f"  {len(hashes)} archivos ya estaban en el servidor: no se mandaron")
+
+            async def subir(lote):
+                hashes.update(await subir_lote(pool, lote))
+
+            async def subir_grande(ruta, nombre, tamaño):
+                hashes[nombre] = await subir_reanudable(pool, ruta, nombre, tamaño, tamaño_segmento)
+
+            # Los archivos grandes van por fragmentos reanudables; los chicos, de a muchos por POST
+            # (miles de archivos son unos pocos requests)
+            tamaños = {nombre: os.path.getsize(ruta) for ruta, nombre in archivos}
+            grandes = [(ruta, nombre) for ruta, nombre in archivos if 0 < tamaño_segmento < tamaños[nombre]]
+            chicos = [(ruta, nombre) for ruta, nombre in archivos if not 0 < tamaño_segmento < tamaños[nombre]]
+            tareas = [transferir(subir_grande(ruta, nombre, tamaños[nombre]), nombre, tamaños[nombre], errores)
+                      for ruta, nombre in grandes]
+            tareas += [transferir(subir(lote), lote[0][1] if len(lote) == 1 else f"{len(lote)} archivos ({lote[0][1]}, ...)",
+                                  sum(tamaño for _, _, tamaño in lote), errores)
+                       for lote in armar_lotes(chicos)]
+            totales = await asyncio.gather(*tareas)
+            subidos = len(hashes)
+            if verificar and hashes:
+                for archivo in await pedir_listado(pool, sorted(hashes)):
+                    if archivo['nombre'] in hashes and archivo.get('sha256') != hashes.pop(archivo['nombre']):
+                        errores.append((archivo['nombre'], "el SHA-256 guardado en el servidor no coincide"))
+                for nombre in hashes:
+                    errores.append((nombre, "no aparece en el servidor después de subirlo"))
+            accion = "Subidos"
+    except ErrorCliente as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        pool.cerrar()
+
+    duracion = time.perf_counter() - inicio
+    completos = [tamaño for tamaño in totales if tamaño is not None]
+    total = sum(completos)
+    cantidad = len(completos) if comando == "get" else subidos
+    en_red = pool.bytes_recibidos if comando == "get" else pool.bytes_enviados
+    print(f"{accion} {cantidad} archivos ({total / (1024 * 1024):.2f} MB, "
+          f"{en_red / (1024 * 1024):.2f} MB por la red) en {duracion:.2f} s: "
+          f"{total / (1024 * 1024) / duracion:.2f} MB/s con {conexiones} conexiones")
+    if errores:
+        print(f"{len(errores)} con errores:")
+        for nombre, motivo in errores:
+            print(f"  {nombre}: {motivo}")
+        return 1
+    return 0
+
+
+#LINEA DE COMANDOS
+
+def extraer_flag(argumentos, *nombres):
+    """
+    Requiere: argumentos: list de str (se modifica), nombres: alias del flag
+    Ejecuta: quita de argumentos todas las apariciones del flag
+    Devuelve: bool, True si el flag estaba presente
+    """
+    presente = False
+    for nombre in nombres:
+        while nombre in argumentos:
+            argumentos.remove(nombre)
+            presente = True
+    return presente
+
+
+def extraer_opcion(argumentos, nombre, defecto=None):
+    """
+    Requiere: argumentos: list de str (se modifica), nombre: str, el flag que lleva un valor
+    Ejecuta: quita de argumentos el flag y su valor; termina el programa si falta el valor
+    Devuelve: str con el valor, o defecto si el flag no está
+    """
+    if nombre not in argumentos:
+        return defecto
+    indice = argumentos.index(nombre)
+    if indice + 1 >= len(argumentos):
+        print(f"Error: {nombre} requiere un valor")
+        sys.exit(1)
+    valor = argumentos[indice + 1]
+    del argumentos[indice:indice + 2]
+    return valor
+
+
+def extraer_opcion_par(argumentos, nombre):
+    """
+    Igual que extraer_opcion pero para un flag que lleva dos valores (por ejemplo --tls CERT KEY).
+    Devuelve: tuple de dos str, o None si el flag no está
+    """
+    if nombre not in argumentos:
+        return None
+    indice = argumentos.index(nombre)
+    if indice + 2 >= len(argumentos):
+        print(f"Error: {nombre} requiere dos valores")
+        sys.exit(1)
+    valores = (argumentos[indice + 1], argumentos[indice + 2])
+    del argumentos[indice:indice + 3]
+    return valores
+
+
+def extraer_opcion_entera(argumentos, nombre, defecto):
+    """Igual que extraer_opcion pero convierte el valor a int (termina el programa si no es un número)."""
+    valor = extraer_opcion(argumentos, nombre)
+    if valor is None:
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        print(f"Error: {nombre} requiere un número entero")
+        sys.exit(1)
+
+
+def extraer_opcion_real(argumentos, nombre, defecto):
+    """Igual que extraer_opcion pero convierte el valor a float (termina el programa si no es un número)."""
+    valor = extraer_opcion(argumentos, nombre)
+    if valor is None:
+        return defecto
+    try:
+        return float(valor)
+    except ValueError:
+        print(f"Error: {nombre} requiere un número")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Uso:")
-        print("  python codigo_base.py upload [--gzip] [--password CONTRASEÑA] [--measure]                         # Servidor para subir archivos")
-        print("  python codigo_base.py download archivo.txt [--gzip] [--password CONTRASEÑA] [--measure]          # Servidor para descargar un archivo")
+        print("  python codigo_base.py upload [--gzip] [--password CONTRASEÑA] [--measure] [--rate-limit MB/s] [opciones]     # Servidor para subir archivos")
+        print("  python codigo_base.py download archivo.txt [--gzip] [--password CONTRASEÑA] [--measure] [opciones]          # Servidor para descargar un archivo")
+        print("  python codigo_base.py get URL [DESTINO] [ARCHIVOS...] [--gzip] [--password CONTRASEÑA] [opciones]          # Bajar archivos de un servidor")
+        print("  python codigo_base.py put URL ARCHIVOS_O_DIRECTORIOS... [--password CONTRASEÑA] [opciones]                # Subir archivos a un servidor")
+        print("Opciones:")
+        print("  --rate-limit MB/s                        Ancho de banda total del servidor, repartido entre los clientes (por defecto sin límite)")
+        print("  --conn-rate-limit MB/s                   Ancho de banda de cada conexión (por defecto sin límite)")
+        print("  --concurrency sequential|threads|async   Modo de concurrencia (por defecto threads)")
+        print("  --threads N                              Cantidad de hilos del pool (por defecto 16)")
+        print("  --backlog N                              Conexiones pendientes en el listen (por defecto 128)")
+        print("  --keepalive-timeout S                    Segundos de inactividad antes de cerrar una conexión (por defecto 5)")
+        print("  --max-requests N                         Requests por conexión persistente (por defecto 100, 1 la desactiva)")
+        print("  --header-timeout S                       Segundos para recibir la cabecera una vez que empezó (por defecto 10)")
+        print("  --io-timeout S                           Segundos que puede trabarse la lectura de un body o un envío (por defecto 30)")
+        print("  --min-body-rate KB/s                     Velocidad mínima de una subida pasado --io-timeout (por defecto 1, 0 sin mínimo)")
+        print("  --max-inflight N                         Requests en curso antes de responder 503 (por defecto 256, 0 sin límite)")
+        print("  --max-upload-inflight-mb N               MB de subidas en curso antes de responder 503 (por defecto 1024, 0 sin límite)")
+        print("  --gzip-cache-mb N                        Memoria para variantes ya comprimidas (por defecto 64, 0 la desactiva)")
+        print("  --gzip-sidecar                           Guardar también en disco las variantes comprimidas")
+        print("  --file-cache-mb N                        Memoria para los archivos más descargados (por defecto 64, 0 la desactiva)")
+        print("  --gzip-level N                           Nivel de compresión de 1 a 9 (por defecto 6)")
+        print("  --gzip-window N                          Ventana de zlib de 9 a 15 (por defecto 15)")
+        print("  --gzip-stream-mb N                       Tamaño desde el que se comprime mientras se envía (por defecto 1)")
+        print("  --codecs zstd,br,gzip                    Codificaciones a ofrecer, en orden de preferencia")
+        print("  --zstd-level N                           Nivel de zstd de 1 a 22 (por defecto 3)")
+        print("  --br-level N                             Nivel de brotli de 0 a 11 (por defecto 5)")
+        print("  --cache-control VALOR                    Header Cache-Control de las descargas (por defecto no-cache, 'none' lo omite)")
+        print("  --etag-hash                              Usar el SHA-256 del contenido como ETag")
+        print("  --index-refresh S|off                    Cada cuántos segundos revisar cambios en archivos_servidor (por defecto 1)")
+        print("  --page-size N                            Archivos por página en el listado (por defecto 100)")
+        print("  --access-log ARCHIVO|-                   Escribir una línea JSON por request (- es la salida estándar)")
+        print("  --workers N                              Procesos que atienden en el mismo puerto (por defecto 1)")
+        print("  --bind IP|all|dual                       Dónde escuchar: una IP, todas las interfaces IPv4 o IPv6 e IPv4 (por defecto la IP de la red)")
+        print("  --no-qr                                  No dibujar los códigos QR")
+        print("  --tls CERT KEY                           Atender por HTTPS con ese certificado y esa clave (PEM)")
+        print("  --dedup                                  Guardar las subidas por contenido (lo repetido ocupa lugar una vez)")
+        print("Opciones del cliente (get/put):")
+        print("  --connections N                          Conexiones en paralelo (por defecto 8)")
+        print("  --segment-mb N                           Tamaño de los segmentos en que se baja o sube un archivo grande (por defecto 8, 0 no segmenta)")
+        print("  --no-verify                              No comparar los SHA-256 con los del servidor")
+        print("  --gzip                                   Pedir las descargas comprimidas con gzip")
+        print("  --dedup                                  No mandar lo que el servidor (con --dedup) ya tiene")
+        print("  --cacert ARCHIVO                         Certificado (PEM) con el que verificar un servidor https://")
         sys.exit(1)
 
+    argumentos = sys.argv[1:]
+
     # Verificar si se solicitó compresión gzip
-    comprimir_gzip = '--gzip' in sys.argv or '-g' in sys.argv
-    
+    comprimir_gzip = extraer_flag(argumentos, '--gzip', '-g')
+
     # Verificar si se solicitó medición de tiempo
-    medir_tiempo = '--measure' in sys.argv or '--timing' in sys.argv
-    
+    medir_tiempo = extraer_flag(argumentos, '--measure', '--timing')
+
+    # Límites de ancho de banda (MB/s)
+    limite_global_mb = extraer_opcion_real(argumentos, '--rate-limit', 0)
+    limite_conexion_mb = extraer_opcion_real(argumentos, '--conn-rate-limit', 0)
+    if limite_global_mb < 0 or limite_conexion_mb < 0:
+        print("Error: --rate-limit y --conn-rate-limit requieren un número positivo")
+        sys.exit(1)
+
     # Verificar si se especificó contraseña
-    password = None
-    if '--password' in sys.argv:
+    password = extraer_opcion(argumentos, '--password')
+
+    # Cliente: get/put contra un servidor que ya está corriendo
+    if argumentos and argumentos[0].lower() in ("get", "put"):
+        conexiones = extraer_opcion_entera(argumentos, '--connections', CONEXIONES_CLIENTE)
+        tamaño_segmento = int(extraer_opcion_real(argumentos, '--segment-mb', TAMAÑO_SEGMENTO_CLIENTE / (1024 * 1024)) * 1024 * 1024)
+        verificar = not extraer_flag(argumentos, '--no-verify')
+        dedup = extraer_flag(argumentos, '--dedup')
+        certificado_ca = extraer_opcion(argumentos, '--cacert')
+        if conexiones < 1 or len(argumentos) < 2 or (argumentos[0].lower() == "put" and len(argumentos) < 3):
+            print("Uso: python codigo_base.py get URL [DESTINO] [ARCHIVOS...] | put URL ARCHIVOS_O_DIRECTORIOS...")
+            sys.exit(1)
         try:
-            password_index = sys.argv.index('--password')
-            if password_index + 1 < len(sys.argv):
-                password = sys.argv[password_index + 1]
-            else:
-                print("Error: --password requiere un valor")
+            codigo_salida = asyncio.run(ejecutar_cliente(argumentos[0].lower(), argumentos[1], argumentos[2:], password,
+                                                         conexiones, tamaño_segmento, comprimir_gzip, verificar, dedup,
+                                                         certificado_ca))
+        except ValueError as e:
+            print(f"Error: {e}")
+            codigo_salida = 1
+        except OSError as e:
+            print(f"Error: no se pudo conectar ({e})")
+            codigo_salida = 1
+        except KeyboardInterrupt:
+            codigo_salida = 1
+        sys.exit(codigo_salida)
+
+    # Motor de concurrencia
+    modo_concurrencia = extraer_opcion(argumentos, '--concurrency', 'threads')
+    if modo_concurrencia not in MODOS_CONCURRENCIA:
+        print(f"Error: --concurrency debe ser uno de {', '.join(MODOS_CONCURRENCIA)}")
+        sys.exit(1)
+    max_hilos = extraer_opcion_entera(argumentos, '--threads', 16)
+    backlog = extraer_opcion_entera(argumentos, '--backlog', 128)
+    workers = extraer_opcion_entera(argumentos, '--workers', 1)
+    if workers < 1:
+        print("Error: --workers requiere un número mayor o igual a 1")
+        sys.exit(1)
+
+    # Conexiones persistentes (keep-alive)
+    keepalive_timeout = extraer_opcion_real(argumentos, '--keepalive-timeout', 5.0)
+    max_requests = extraer_opcion_entera(argumentos, '--max-requests', 100)
+
+    # Plazos y protección contra sobrecarga
+    plazo_cabecera = extraer_opcion_real(argumentos, '--header-timeout', PLAZO_CABECERA)
+    plazo_inactividad = extraer_opcion_real(argumentos, '--io-timeout', PLAZO_INACTIVIDAD)
+    tasa_minima_body = int(extraer_opcion_real(argumentos, '--min-body-rate', TASA_MINIMA_BODY / 1024) * 1024)
+    max_en_curso = extraer_opcion_entera(argumentos, '--max-inflight', MAX_REQUESTS_EN_CURSO)
+    max_subidas_mb = extraer_opcion_entera(argumentos, '--max-upload-inflight-mb', MAX_SUBIDAS_EN_CURSO_MB)
+    if plazo_cabecera <= 0 or plazo_inactividad <= 0 or tasa_minima_body < 0 or max_en_curso < 0 or max_subidas_mb < 0:
+        print("Error: --header-timeout e --io-timeout requieren un número positivo y los límites no pueden ser negativos")
+        sys.exit(1)
+
+    # Cache de archivos calientes
+    cache_archivos_mb = extraer_opcion_entera(argumentos, '--file-cache-mb', CACHE_ARCHIVOS_MB)
+
+    # Cache de variantes comprimidas
+    cache_gzip_mb = extraer_opcion_entera(argumentos, '--gzip-cache-mb', 64)
+    gzip_sidecar = extraer_flag(argumentos, '--gzip-sidecar')
+    nivel_gzip = extraer_opcion_entera(argumentos, '--gzip-level', NIVEL_GZIP)
+    ventana_gzip = extraer_opcion_entera(argumentos, '--gzip-window', VENTANA_GZIP)
+    if not 1 <= nivel_gzip <= 9 or not 9 <= ventana_gzip <= 15:
+        print("Error: --gzip-level va de 1 a 9 y --gzip-window de 9 a 15")
+        sys.exit(1)
+    umbral_streaming_gzip = int(extraer_opcion_real(argumentos, '--gzip-stream-mb', UMBRAL_STREAMING_GZIP / (1024 * 1024)) * 1024 * 1024)
+
+    # Codificaciones ofrecidas y sus niveles
+    codecs = extraer_opcion(argumentos, '--codecs')
+    if codecs is not None:
+        codecs = [nombre.strip().lower() for nombre in codecs.split(',') if nombre.strip()]
+        for nombre in codecs:
+            if nombre not in PREFERENCIA_CODECS:
+                print(f"Error: codec desconocido '{nombre}' (opciones: {', '.join(PREFERENCIA_CODECS)})")
                 sys.exit(1)
+            if nombre not in CODECS:
+                print(f"Aviso: el codec '{nombre}' no está instalado y no se va a ofrecer")
+    nivel_zstd = extraer_opcion_entera(argumentos, '--zstd-level', NIVEL_ZSTD)
+    nivel_brotli = extraer_opcion_entera(argumentos, '--br-level', NIVEL_BROTLI)
+    if not 1 <= nivel_zstd <= 22 or not 0 <= nivel_brotli <= 11:
+        print("Error: --zstd-level va de 1 a 22 y --br-level de 0 a 11")
+        sys.exit(1)
+
+    # Validación de caches (ETag / Last-Modified)
+    cache_control = extraer_opcion(argumentos, '--cache-control', CACHE_CONTROL_DEFECTO)
+    if cache_control.lower() == 'none':
+        cache_control = None
+    etag_por_hash = extraer_flag(argumentos, '--etag-hash')
+
+    # Listado de archivos
+    refresco_indice = extraer_opcion(argumentos, '--index-refresh', str(REFRESCO_INDICE))
+    if refresco_indice.lower() == 'off':
+        refresco_indice = None
+    else:
+        try:
+            refresco_indice = float(refresco_indice)
         except ValueError:
-            pass
-    
-    # Filtrar argumentos de opciones
-    opciones_a_filtrar = ['--gzip', '-g', '--password', '--measure', '--timing']
-    if password is not None:
-        opciones_a_filtrar.append(password)
-    args = [arg for arg in sys.argv[1:] if arg not in opciones_a_filtrar]
-    
+            print("Error: --index-refresh requiere un número o 'off'")
+            sys.exit(1)
+    por_pagina = extraer_opcion_entera(argumentos, '--page-size', POR_PAGINA_DEFECTO)
+
+    # Métricas
+    access_log = extraer_opcion(argumentos, '--access-log')
+
+    # Almacén por contenido
+    dedup = extraer_flag(argumentos, '--dedup')
+
+    # Dónde escuchar y cómo mostrar la URL
+    direccion = extraer_opcion(argumentos, '--bind')
+    if direccion is not None and direccion not in DIRECCIONES_BIND:
+        try:
+            direccion = str(ipaddress.ip_address(direccion.strip('[]')))
+        except ValueError:
+            print("Error: --bind requiere una IP, 'all' o 'dual'")
+            sys.exit(1)
+    mostrar_qr = not extraer_flag(argumentos, '--no-qr')
+
+    # HTTPS
+    tls = extraer_opcion_par(argumentos, '--tls')
+    if tls is not None and not all(os.path.isfile(ruta) for ruta in tls):
+        print("Error: --tls requiere las rutas de un certificado y una clave existentes")
+        sys.exit(1)
+
+    opciones = {
+        'comprimir_gzip': comprimir_gzip,
+        'password': password,
+        'medir_tiempo': medir_tiempo,
+        'modo_concurrencia': modo_concurrencia,
+        'max_hilos': max_hilos,
+        'backlog': backlog,
+        'keepalive_timeout': keepalive_timeout,
+        'max_requests': max_requests,
+        'cache_gzip_mb': cache_gzip_mb,
+        'gzip_sidecar': gzip_sidecar,
+        'nivel_gzip': nivel_gzip,
+        'ventana_gzip': ventana_gzip,
+        'umbral_streaming_gzip': umbral_streaming_gzip,
+        'codecs': codecs,
+        'nivel_zstd': nivel_zstd,
+        'nivel_brotli': nivel_brotli,
+        'cache_control': cache_control,
+        'etag_por_hash': etag_por_hash,
+        'refresco_indice': refresco_indice,
+        'por_pagina': por_pagina,
+        'access_log': access_log,
+        'workers': workers,
+        'dedup': dedup,
+        'cache_archivos_mb': cache_archivos_mb,
+        'limite_global_mb': limite_global_mb,
+        'limite_conexion_mb': limite_conexion_mb,
+        'plazo_cabecera': plazo_cabecera,
+        'plazo_inactividad': plazo_inactividad,
+        'tasa_minima_body': tasa_minima_body,
+        'max_en_curso': max_en_curso,
+        'max_subidas_mb': max_subidas_mb,
+        'direccion': direccion,
+        'mostrar_qr': mostrar_qr,
+        'tls': tls,
+    }
+
+    # Lo que queda son los argumentos posicionales
+    args = argumentos
+
     if len(args) < 1:
         print("Comando no reconocido")
         sys.exit(1)
-    
+
     comando = args[0].lower()
 
     if comando == "upload":
-        start_server(archivo_descarga=None, modo_upload=True, comprimir_gzip=comprimir_gzip, password=password, medir_tiempo=medir_tiempo)
+        start_server(archivo_descarga=None, modo_upload=True, **opciones)
 
     elif comando == "download" and len(args) > 1:
         archivo = args[1]
@@ -713,7 +6054,7 @@ if __name__ == "__main__":
         if not os.path.exists("archivos_servidor"):
             os.makedirs("archivos_servidor", exist_ok=True)
         ruta_archivo = os.path.join("archivos_servidor", archivo)
-        start_server(archivo_descarga=ruta_archivo, modo_upload=False, comprimir_gzip=comprimir_gzip, password=password, medir_tiempo=medir_tiempo)
+        start_server(archivo_descarga=ruta_archivo, modo_upload=False, **opciones)
 
     else:
         print("Comando no reconocido o archivo faltante")
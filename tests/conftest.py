@@ -0,0 +1,153 @@
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+# codigo_base.py es un solo módulo en la raíz del repositorio
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+class Servidor:
+    """
+    Un servidor real (python codigo_base.py ...) corriendo en otro proceso, con directorio como
+    directorio de trabajo (archivos_servidor queda adentro) y escuchando en un puerto libre de 127.0.0.1.
+    """
+
+    def __init__(self, directorio, argumentos, entorno=None):
+        self.directorio = directorio
+        self.archivos = os.path.join(directorio, "archivos_servidor")
+        os.makedirs(self.archivos, exist_ok=True)
+        self.ruta_log = os.path.join(directorio, "servidor.log")
+        env = dict(os.environ, PUERTO="0", PYTHONUNBUFFERED="1", **(entorno or {}))
+        env.pop("HOST", None)
+        with open(self.ruta_log, 'wb') as log:
+            self.proceso = subprocess.Popen(
+                [sys.executable, os.path.join(RAIZ, "codigo_base.py"), *argumentos, "--bind", "127.0.0.1"],
+                cwd=directorio, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.esquema, self.puerto = self._esperar_url()
+
+    def _esperar_url(self):
+        limite = time.monotonic() + 15
+        while time.monotonic() < limite:
+            encontrada = re.search(r"La URL es: (https?)://127\.0\.0\.1:(\d+)", self.log())
+            if encontrada:
+                return encontrada.group(1), int(encontrada.group(2))
+            if self.proceso.poll() is not None:
+                break
+            time.sleep(0.02)
+        self.detener()
+        raise RuntimeError(f"el servidor no arrancó:\n{self.log()}")
+
+    @property
+    def url(self):
+        return f"{self.esquema}://127.0.0.1:{self.puerto}"
+
+    def log(self):
+        with open(self.ruta_log, encoding='utf-8', errors='replace') as archivo:
+            return archivo.read()
+
+    def conectar(self, timeout=10):
+        return socket.create_connection(("127.0.0.1", self.puerto), timeout=timeout)
+
+    def pedir(self, crudo, timeout=10):
+        """Manda crudo (bytes) por una conexión nueva y devuelve todo lo recibido hasta que se cierra."""
+        with self.conectar(timeout) as conexion:
+            conexion.sendall(crudo)
+            return recibir_todo(conexion)
+
+    def request(self, method, target, headers=None, body=b"", timeout=10):
+        """
+        Hace un request por una conexión nueva (que se cierra después).
+        Devuelve: tuple (codigo, headers, body) como leer_respuesta
+        """
+        lineas = [f"{method} {target} HTTP/1.1", "Host: 127.0.0.1", "Connection: close"]
+        lineas += [f"{nombre}: {valor}" for nombre, valor in (headers or {}).items()]
+        if body:
+            lineas.append(f"Content-Length: {len(body)}")
+        with self.conectar(timeout) as conexion:
+            conexion.sendall(("\r\n".join(lineas) + "\r\n\r\n").encode('utf-8') + body)
+            with conexion.makefile('rb') as archivo:
+                return leer_respuesta(archivo, method)
+
+    def get(self, target, headers=None):
+        return self.request("GET", target, headers)
+
+    def detener(self):
+        if self.proceso.poll() is None:
+            self.proceso.terminate()
+            try:
+                self.proceso.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proceso.kill()
+                self.proceso.wait()
+
+
+def correr_cliente(*argumentos):
+    """Corre python codigo_base.py get|put ... y devuelve el subprocess.CompletedProcess (con stdout y stderr)."""
+    return subprocess.run([sys.executable, os.path.join(RAIZ, "codigo_base.py"), *argumentos],
+                          capture_output=True, text=True, timeout=60)
+
+
+def recibir_todo(conexion):
+    datos = bytearray()
+    while True:
+        recibido = conexion.recv(65536)
+        if not recibido:
+            return bytes(datos)
+        datos += recibido
+
+
+def leer_respuesta(archivo, method="GET"):
+    """
+    Lee una respuesta HTTP de archivo (socket.makefile('rb')), con Content-Length, chunked o hasta el cierre.
+    Devuelve: tuple (codigo: int, headers: dict con claves en minúscula, body: bytes)
+    """
+    status = archivo.readline()
+    if not status:
+        raise ConnectionError("la conexión se cerró sin respuesta")
+    codigo = int(status.split()[1])
+    headers = {}
+    while True:
+        linea = archivo.readline().rstrip(b"\r\n")
+        if not linea:
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(":")
+        headers[nombre.strip().lower()] = valor.strip()
+    if method == "HEAD" or codigo == 304:
+        return codigo, headers, b""
+    if headers.get('transfer-encoding') == 'chunked':
+        body = bytearray()
+        while True:
+            tamaño = int(archivo.readline().split(b";")[0], 16)
+            if tamaño == 0:
+                archivo.readline()
+                return codigo, headers, bytes(body)
+            body += archivo.read(tamaño)
+            archivo.readline()
+    if 'content-length' in headers:
+        return codigo, headers, archivo.read(int(headers['content-length']))
+    return codigo, headers, archivo.read()
+
+
+@pytest.fixture
+def iniciar_servidor(tmp_path):
+    """Devuelve una función que arranca un Servidor con los argumentos dados; se detienen al terminar el test."""
+    servidores = []
+
+    def iniciar(*argumentos, archivos=None, entorno=None):
+        directorio = tmp_path / f"servidor{len(servidores)}"
+        os.makedirs(directorio / "archivos_servidor")
+        for nombre, contenido in (archivos or {}).items():
+            (directorio / "archivos_servidor" / nombre).write_bytes(contenido)
+        servidor = Servidor(str(directorio), argumentos, entorno)
+        servidores.append(servidor)
+        return servidor
+
+    yield iniciar
+    for servidor in servidores:
+        servidor.detener()
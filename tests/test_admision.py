@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import pytest
+
+from codigo_base import ControlAdmision
+from conftest import leer_respuesta, recibir_todo
+
+GRANDE = os.urandom(1024 * 1024)
+
+
+def test_control_de_admision():
+    control = ControlAdmision(max_requests=2, max_bytes_subida=100)
+    assert control.admitir(0) and control.admitir(80)
+    assert not control.admitir(0)
+    control.liberar(0)
+    # No entra otra subida que pase el total, pero sí un request sin body
+    assert not control.admitir(30)
+    assert control.admitir(0)
+    control.liberar(0)
+    control.liberar(80)
+    # Una subida sola siempre entra, aunque sea más grande que el total
+    assert control.admitir(500)
+
+
+def pedido_post(content_length):
+    return (f"POST / HTTP/1.1\r\nHost: x\r\nContent-Type: multipart/form-data; boundary=b\r\n"
+            f"Content-Length: {content_length}\r\n\r\n").encode()
+
+
+@pytest.fixture(params=["threads", "async"])
+def modo(request):
+    return request.param
+
+
+def test_503_con_demasiados_requests_en_curso(iniciar_servidor, modo):
+    # Con la descarga limitada a 0.5 MB/s el primer request sigue en curso unos 2 segundos
+    servidor = iniciar_servidor("upload", "--concurrency", modo, "--max-inflight", "1", "--conn-rate-limit", "0.5",
+                                archivos={"grande.bin": GRANDE})
+    resultado = []
+    descarga = threading.Thread(target=lambda: resultado.append(servidor.get("/download?archivo=grande.bin")))
+    descarga.start()
+    time.sleep(0.3)
+    inicio = time.monotonic()
+    codigo, headers, body = servidor.get("/")
+    assert codigo == 503 and time.monotonic() - inicio < 0.5
+    assert headers['retry-after'] == "1"
+    assert "reintentá" in body.decode('utf-8')
+    descarga.join()
+    assert resultado[0][2] == GRANDE
+    # Terminada la descarga vuelve a atender, y el rechazo quedó contado
+    codigo, _, body = servidor.get("/metrics")
+    assert codigo == 200 and 'servidor_rechazos_total{motivo="sobrecarga"} 1' in body.decode('utf-8')
+
+
+def test_503_sin_leer_el_body_de_una_subida(iniciar_servidor, modo):
+    servidor = iniciar_servidor("upload", "--concurrency", modo, "--max-upload-inflight-mb", "1")
+    with servidor.conectar() as primera:
+        # Una subida en curso que todavía no terminó de mandar su body
+        primera.sendall(pedido_post(800 * 1024) + b"--b\r\n")
+        time.sleep(0.3)
+        with servidor.conectar() as segunda, segunda.makefile('rb') as archivo:
+            segunda.sendall(pedido_post(800 * 1024))
+            codigo, headers, _ = leer_respuesta(archivo)
+            assert codigo == 503
+            # El body no se leyó: la conexión no se puede reutilizar
+            assert headers['connection'] == "close"
+        # Un request sin body sí entra
+        assert servidor.get("/")[0] == 200
+
+
+def test_401_antes_de_leer_el_body(iniciar_servidor, modo):
+    servidor = iniciar_servidor("upload", "--concurrency", modo, "--password", "clave")
+    with servidor.conectar() as conexion, conexion.makefile('rb') as archivo:
+        # Nunca se manda el body de 100 MB: la respuesta llega igual
+        conexion.sendall(pedido_post(100 * 1024 * 1024))
+        codigo, headers, _ = leer_respuesta(archivo)
+        assert codigo == 401 and headers['connection'] == "close"
+
+
+def test_cabecera_lenta_se_corta(iniciar_servidor, modo):
+    servidor = iniciar_servidor("upload", "--concurrency", modo, "--header-timeout", "1")
+    with servidor.conectar() as conexion:
+
+        def gotear():
+            # Slowloris: un byte cada tanto, sin completar nunca la cabecera
+            try:
+                for byte in b"GET / HTTP/1.1\r\n" + b"X: y\r\n" * 20:
+                    conexion.sendall(bytes([byte]))
+                    time.sleep(0.1)
+            except OSError:
+                pass
+
+        emisor = threading.Thread(target=gotear, daemon=True)
+        inicio = time.monotonic()
+        emisor.start()
+        assert recibir_todo(conexion) == b""
+        assert 0.8 < time.monotonic() - inicio < 5
+    assert 'servidor_rechazos_total{motivo="lento"} 1' in servidor.get("/metrics")[2].decode('utf-8')
+
+
+def test_body_que_no_llega_se_corta(iniciar_servidor, modo):
+    servidor = iniciar_servidor("upload", "--concurrency", modo, "--io-timeout", "1")
+    with servidor.conectar() as conexion:
+        conexion.sendall(pedido_post(1000) + b"--b\r\n")
+        inicio = time.monotonic()
+        recibir_todo(conexion)
+        assert 0.8 < time.monotonic() - inicio < 5
+
+
+def test_un_cliente_trabado_no_bloquea_el_modo_secuencial(iniciar_servidor):
+    servidor = iniciar_servidor("upload", "--concurrency", "sequential", "--header-timeout", "1",
+                                archivos={"a.txt": b"a"})
+    with servidor.conectar() as trabado:
+        trabado.sendall(b"GET / HT")
+        time.sleep(0.1)
+        inicio = time.monotonic()
+        assert servidor.get("/download?archivo=a.txt")[2] == b"a"
+        assert time.monotonic() - inicio < 5
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+import pytest
+
+from codigo_base import PORCION_LIMITADA, UMBRAL_TRANSFERENCIA_CHICA, CuboTokens, PlanificadorAncho
+
+MB = 1024 * 1024
+GRANDE = os.urandom(MB)
+
+
+def test_cubo_de_tokens():
+    cubo = CuboTokens(1000, rafaga=500)
+    assert cubo.reservar(500) == 0.0
+    # Sin tokens: hay que esperar lo que falta a la tasa del cubo
+    assert cubo.reservar(250) == pytest.approx(0.25, abs=0.01)
+    # El siguiente espera detrás del anterior
+    assert cubo.reservar(250) == pytest.approx(0.5, abs=0.01)
+    # Sin esperar se toma igual y queda como deuda
+    assert cubo.reservar(1000, esperar=False) == 0.0
+    assert cubo.reservar(1) == pytest.approx(1.501, abs=0.01)
+
+
+def test_el_total_se_reparte_entre_los_clientes():
+    planificador = PlanificadorAncho(tasa_global=1000)
+    uno = planificador.activar("10.0.0.1")
+    assert uno.tasa == 1000
+    otro = planificador.activar("10.0.0.2")
+    # Varias transferencias del mismo cliente comparten su parte
+    assert planificador.activar("10.0.0.2") is otro
+    assert uno.tasa == otro.tasa == 500
+    planificador.desactivar("10.0.0.2")
+    assert uno.tasa == 500
+    planificador.desactivar("10.0.0.2")
+    assert uno.tasa == 1000 and "10.0.0.2" not in planificador.clientes
+
+
+def test_las_transferencias_chicas_no_esperan():
+    planificador = PlanificadorAncho(tasa_global=1000)
+    control = planificador.conexion("10.0.0.1")
+    with control.transferencia(UMBRAL_TRANSFERENCIA_CHICA):
+        assert control.demora(10 ** 6) == 0.0
+    with control.transferencia(UMBRAL_TRANSFERENCIA_CHICA + 1):
+        # Y lo que usaron lo pagan las grandes
+        assert control.demora(1) > 900
+
+
+def test_limite_por_conexion():
+    control = PlanificadorAncho(tasa_conexion=1000).conexion("10.0.0.1")
+    # El límite por conexión vale también para las transferencias chicas
+    with control.transferencia(10):
+        assert control.demora(PORCION_LIMITADA) == 0.0
+        assert control.demora(1000) == pytest.approx(1, abs=0.01)
+
+
+def descargar(servidor, nombre):
+    """Devuelve (segundos, body) de una descarga."""
+    inicio = time.monotonic()
+    _, _, body = servidor.get(f"/download?archivo={nombre}")
+    return time.monotonic() - inicio, body
+
+
+@pytest.mark.parametrize("modo", ["threads", "async"])
+def test_descarga_limitada_por_conexion(iniciar_servidor, modo):
+    servidor = iniciar_servidor("upload", "--concurrency", modo, "--conn-rate-limit", "1", archivos={"grande.bin": GRANDE})
+    duracion, body = descargar(servidor, "grande.bin")
+    assert body == GRANDE
+    # 1 MB a 1 MB/s, menos la ráfaga inicial
+    assert duracion > 0.8
+
+
+@pytest.mark.parametrize("modo", ["threads", "async"])
+def test_pagina_no_espera_detras_de_una_descarga_grande(iniciar_servidor, modo):
+    servidor = iniciar_servidor("upload", "--concurrency", modo, "--rate-limit", "0.5",
+                                archivos={"grande.bin": GRANDE, "chico.txt": b"chico"})
+    resultado = []
+    descarga = threading.Thread(target=lambda: resultado.append(descargar(servidor, "grande.bin")))
+    descarga.start()
+    time.sleep(0.3)
+    duracion, body = descargar(servidor, "chico.txt")
+    assert body == b"chico" and duracion < 0.5
+    inicio = time.monotonic()
+    assert servidor.get("/")[0] == 200
+    assert time.monotonic() - inicio < 0.5
+    descarga.join()
+    duracion, body = resultado[0]
+    assert body == GRANDE and duracion > 1.5
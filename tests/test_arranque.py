@@ -0,0 +1,96 @@
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import codigo_base
+from codigo_base import dibujar_qr, get_wifi_ip, urls_servidor
+from conftest import RAIZ, leer_respuesta
+
+INTERFACES = [('lo', '127.0.0.1'), ('docker0', '172.17.0.1'), ('eth0', '192.168.1.5'),
+              ('wlan0', '10.0.0.3'), ('wlan0', '2001:db8::3')]
+
+
+def test_qrcode_no_se_importa_al_iniciar():
+    salida = subprocess.run([sys.executable, "-c", "import sys, codigo_base; print('qrcode' in sys.modules)"],
+                            cwd=RAIZ, capture_output=True, text=True, timeout=30)
+    assert salida.stdout.strip() == "False"
+
+
+def test_sin_qrcode_no_hay_dibujo(tmp_path, monkeypatch):
+    monkeypatch.setattr(codigo_base, "DIRECTORIO_QR", str(tmp_path))
+    monkeypatch.setitem(sys.modules, "qrcode", None)
+    assert dibujar_qr("http://10.0.0.3:8000") is None
+
+
+def test_qr_dibujado_se_reutiliza(tmp_path, monkeypatch):
+    pytest.importorskip("qrcode")
+    monkeypatch.setattr(codigo_base, "DIRECTORIO_QR", str(tmp_path))
+    dibujo = dibujar_qr("http://10.0.0.3:8000")
+    assert "██" in dibujo and len(os.listdir(tmp_path)) == 1
+    # La segunda vez sale del archivo guardado, aunque qrcode ya no se pueda importar
+    monkeypatch.setitem(sys.modules, "qrcode", None)
+    assert dibujar_qr("http://10.0.0.3:8000") == dibujo
+
+
+def test_ip_sin_salir_a_la_red(monkeypatch):
+    monkeypatch.setattr(codigo_base, "interfaces_locales", lambda: INTERFACES)
+    # Wi-Fi antes que cableada; las virtuales y loopback al final
+    assert get_wifi_ip() == "10.0.0.3"
+    monkeypatch.setattr(codigo_base, "interfaces_locales", lambda: [])
+    assert get_wifi_ip() == "127.0.0.1"
+
+
+def test_una_url_por_interfaz(monkeypatch):
+    monkeypatch.setattr(codigo_base, "interfaces_locales", lambda: INTERFACES)
+    assert urls_servidor("0.0.0.0", 8000) == ["http://10.0.0.3:8000", "http://192.168.1.5:8000", "http://172.17.0.1:8000"]
+    assert urls_servidor("::", 8000, "https")[:2] == ["https://10.0.0.3:8000", "https://[2001:db8::3]:8000"]
+    assert urls_servidor("10.0.0.3", 8000) == ["http://10.0.0.3:8000"]
+    monkeypatch.setattr(codigo_base, "interfaces_locales", lambda: [('lo', '127.0.0.1')])
+    assert urls_servidor("0.0.0.0", 8000) == ["http://127.0.0.1:8000"]
+
+
+def test_sin_qr(iniciar_servidor):
+    log = iniciar_servidor("upload").log()
+    assert "(instalá qrcode" in log or "██" in log
+    log = iniciar_servidor("upload", "--no-qr").log()
+    assert "qrcode" not in log and "██" not in log
+
+
+def pedir(familia, direccion, puerto):
+    with socket.socket(familia, socket.SOCK_STREAM) as conexion:
+        conexion.settimeout(10)
+        conexion.connect((direccion, puerto))
+        conexion.sendall(b"GET /download?archivo=a.txt HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        with conexion.makefile('rb') as archivo:
+            return leer_respuesta(archivo)[2]
+
+
+@pytest.mark.skipif(not socket.has_ipv6, reason="sin IPv6")
+def test_dual_stack(tmp_path):
+    (tmp_path / "archivos_servidor").mkdir()
+    (tmp_path / "archivos_servidor" / "a.txt").write_bytes(b"a")
+    inicio = time.monotonic()
+    proceso = subprocess.Popen([sys.executable, os.path.join(RAIZ, "codigo_base.py"), "upload", "--bind", "dual", "--no-qr"],
+                               cwd=tmp_path, env=dict(os.environ, PUERTO="0", PYTHONUNBUFFERED="1"),
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        for linea in proceso.stdout:
+            encontrada = re.search(r"La URL es: http://\S+:(\d+)", linea)
+            if encontrada or "no se puede escuchar en IPv6" in linea:
+                break
+        if not encontrada:
+            pytest.skip("no se puede escuchar en IPv6")
+        assert time.monotonic() - inicio < 5
+        puerto = int(encontrada.group(1))
+        # Un mismo socket atiende IPv4 e IPv6
+        assert pedir(socket.AF_INET, "127.0.0.1", puerto) == b"a"
+        assert pedir(socket.AF_INET6, "::1", puerto) == b"a"
+    finally:
+        proceso.terminate()
+        proceso.wait(5)
+        proceso.stdout.close()
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import armar_escenarios, generar_contenido, parsear_tamaño, percentil
+from conftest import RAIZ
+
+
+@pytest.mark.parametrize("texto, esperado", [("512", 512), ("64k", 65536), ("1M", 1024 ** 2), ("1.5G", 3 * 1024 ** 3 // 2)])
+def test_parsear_tamaño(texto, esperado):
+    assert parsear_tamaño(texto) == esperado
+
+
+def test_percentil():
+    valores = list(range(1, 101))
+    assert [percentil(valores, p) for p in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert percentil([], 50) is None
+
+
+def test_contenido_reproducible():
+    assert generar_contenido(1000, 'texto', 3) == generar_contenido(1000, 'texto', 3)
+    assert len(generar_contenido(1000, 'aleatorio')) == 1000
+
+
+def test_armar_escenarios():
+    opciones = {'cargas': ['index', 'download'], 'tamaños': [1, 2], 'concurrencias': [1, 8], 'gzip': [False, True],
+                'modos': ['threads'], 'workers': [1], 'tls': [False]}
+    escenarios = armar_escenarios(opciones)
+    # La página principal no depende del tamaño: 1*2*2 + 2*2*2
+    assert len(escenarios) == 12
+    assert {escenario['tamaño'] for escenario in escenarios if escenario['carga'] == 'index'} == {None}
+
+
+def correr_benchmark(*argumentos, cwd):
+    return subprocess.run([sys.executable, os.path.join(RAIZ, "benchmark.py"), *argumentos],
+                          cwd=cwd, capture_output=True, text=True, timeout=120)
+
+
+def test_benchmark_corto_y_comparacion(tmp_path):
+    salida = correr_benchmark("--workloads", "index,download,upload", "--sizes", "4K", "--concurrency", "2",
+                              "--gzip", "off", "--duration", "0.5", "--warmup", "0.1", "--listing-files", "5",
+                              "--output", "actual.json", cwd=tmp_path)
+    assert salida.returncode == 0, salida.stdout + salida.stderr
+    with open(tmp_path / "actual.json", encoding='utf-8') as archivo:
+        resultado = json.load(archivo)
+    assert [medicion['carga'] for medicion in resultado['resultados']] == ['index', 'download', 'upload']
+    for medicion in resultado['resultados']:
+        assert medicion['requests'] > 0 and medicion['errores'] == 0
+        latencias = medicion['latencia_ms']
+        assert latencias['p50'] <= latencias['p95'] <= latencias['p99']
+        assert medicion['cpu_servidor_porcentaje'] is not None
+
+    comparacion = correr_benchmark("--compare", "actual.json", "actual.json", cwd=tmp_path)
+    assert comparacion.returncode == 0
+    assert comparacion.stdout.count("(+0.0%)") == 6
+
+
+def test_opcion_desconocida(tmp_path):
+    salida = correr_benchmark("--otra", cwd=tmp_path)
+    assert salida.returncode == 1
+    assert "Opciones no reconocidas: --otra" in salida.stdout
@@ -0,0 +1,112 @@
+import mmap
+import os
+import time
+
+import pytest
+
+from codigo_base import CacheArchivos
+
+CHICO = b"chico " * 100
+MEDIANO = os.urandom(300000)
+ARCHIVOS = {"chico.txt": CHICO, "mediano.bin": MEDIANO}
+
+
+def pedir_y_guardar(cache, ruta):
+    """Hace lo que manejar_descarga: cuenta el pedido y, si conviene, guarda el archivo."""
+    entrada = cache.obtener(ruta)
+    if entrada is not None:
+        return entrada
+    stat = os.stat(ruta)
+    if not cache.conviene_admitir(ruta, stat.st_size):
+        return None
+    with open(ruta, 'rb') as archivo:
+        return cache.guardar(ruta, archivo, stat, "application/octet-stream", '"x"', [('ETag', '"x"')])
+
+
+@pytest.fixture
+def rutas(tmp_path):
+    rutas = {}
+    for nombre, contenido in (("chico", CHICO), ("mediano", MEDIANO), ("otro", CHICO), ("tercero", CHICO)):
+        rutas[nombre] = str(tmp_path / nombre)
+        with open(rutas[nombre], 'wb') as archivo:
+            archivo.write(contenido)
+    return rutas
+
+
+def test_entra_recien_al_segundo_pedido(rutas):
+    cache = CacheArchivos(10 ** 6, umbral_memoria=100000)
+    assert pedir_y_guardar(cache, rutas["chico"]) is None
+    entrada = pedir_y_guardar(cache, rutas["chico"])
+    assert isinstance(entrada.datos, bytes) and entrada.vista == CHICO
+    assert cache.obtener(rutas["chico"]) is entrada
+    # Los que pasan umbral_memoria se mapean en vez de leerse
+    pedir_y_guardar(cache, rutas["mediano"])
+    entrada = pedir_y_guardar(cache, rutas["mediano"])
+    assert isinstance(entrada.datos, mmap.mmap) and entrada.vista[1000:2000] == MEDIANO[1000:2000]
+    assert cache.bytes_usados == len(CHICO) + len(MEDIANO)
+
+
+def test_archivo_modificado_se_descarta(rutas):
+    cache = CacheArchivos(10 ** 6)
+    pedir_y_guardar(cache, rutas["chico"])
+    assert pedir_y_guardar(cache, rutas["chico"]) is not None
+    with open(rutas["chico"], 'ab') as archivo:
+        archivo.write(b"mas")
+    assert cache.obtener(rutas["chico"]) is None
+    assert cache.bytes_usados == 0
+    os.remove(rutas["chico"])
+    assert cache.obtener(rutas["chico"]) is None
+
+
+def test_un_archivo_frio_no_desaloja_a_uno_caliente(rutas):
+    cache = CacheArchivos(len(CHICO) * 2)
+    for _ in range(5):
+        pedir_y_guardar(cache, rutas["chico"])
+    for _ in range(3):
+        pedir_y_guardar(cache, rutas["otro"])
+    # No hay lugar para el tercero: entra solo cuando se pide más que el menos pedido ("otro")
+    for _ in range(3):
+        assert pedir_y_guardar(cache, rutas["tercero"]) is None
+    assert pedir_y_guardar(cache, rutas["tercero"]) is not None
+    assert set(cache.entradas) == {rutas["chico"], rutas["tercero"]}
+
+
+def test_demasiado_grande_no_entra(rutas):
+    cache = CacheArchivos(10 ** 6, max_mapeado=100000)
+    for _ in range(3):
+        assert pedir_y_guardar(cache, rutas["mediano"]) is None
+
+
+def test_las_frecuencias_envejecen(rutas):
+    cache = CacheArchivos(10 ** 6, ventana=4)
+    for _ in range(3):
+        cache.obtener(rutas["chico"])
+    cache.obtener(rutas["otro"])
+    assert cache.frecuencias == {rutas["chico"]: 1}
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, "--file-cache-mb", "8",
+                            archivos=ARCHIVOS)
+
+
+@pytest.mark.parametrize("nombre", ARCHIVOS)
+def test_descargas_repetidas_desde_la_cache(servidor, nombre):
+    contenido = ARCHIVOS[nombre]
+    respuestas = [servidor.get(f"/download?archivo={nombre}") for _ in range(4)]
+    for codigo, headers, body in respuestas:
+        assert (codigo, body) == (200, contenido)
+        assert headers['etag'] == respuestas[0][1]['etag']
+    assert servidor.get(f"/download?archivo={nombre}", {'Range': "bytes=10-19"})[2] == contenido[10:20]
+    assert servidor.get(f"/download?archivo={nombre}", {'If-None-Match': respuestas[0][1]['etag']})[0] == 304
+
+
+def test_archivo_reemplazado_no_se_sirve_viejo(servidor):
+    for _ in range(3):
+        servidor.get("/download?archivo=chico.txt")
+    ruta = os.path.join(servidor.archivos, "chico.txt")
+    with open(ruta, 'wb') as archivo:
+        archivo.write(b"nuevo")
+    os.utime(ruta, (time.time() + 5,) * 2)
+    assert servidor.get("/download?archivo=chico.txt")[2] == b"nuevo"
@@ -0,0 +1,62 @@
+import asyncio
+import os
+
+import pytest
+
+from codigo_base import ErrorCliente, archivos_a_subir, descargar_archivo
+from conftest import correr_cliente
+
+
+def test_put_y_get(iniciar_servidor, tmp_path):
+    servidor = iniciar_servidor("upload")
+    locales = tmp_path / "locales"
+    (locales / "sub").mkdir(parents=True)
+    contenidos = {"chico.txt": b"hola" * 100, "grande.bin": os.urandom(3 * 1024 * 1024 + 17)}
+    (locales / "chico.txt").write_bytes(contenidos["chico.txt"])
+    (locales / "sub" / "grande.bin").write_bytes(contenidos["grande.bin"])
+    (locales / ".oculto").write_bytes(b"no se sube")
+
+    # Con segmentos de 1 MB el archivo grande va por una subida reanudable en paralelo
+    resultado = correr_cliente("put", servidor.url, str(locales), "--segment-mb", "1")
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    assert sorted(nombre for nombre in os.listdir(servidor.archivos) if not nombre.startswith('.')) == \
+        ["chico.txt", "grande.bin"]
+    # La sesión de la subida reanudable se borró al completarla
+    assert os.listdir(os.path.join(servidor.archivos, ".sesiones")) == []
+
+    destino = tmp_path / "bajados"
+    resultado = correr_cliente("get", servidor.url, str(destino), "--segment-mb", "1")
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    assert {nombre: (destino / nombre).read_bytes() for nombre in os.listdir(destino)} == contenidos
+
+
+def test_get_de_un_archivo_que_no_esta(iniciar_servidor, tmp_path):
+    servidor = iniciar_servidor("upload", archivos={"a.txt": b"a"})
+    resultado = correr_cliente("get", servidor.url, str(tmp_path / "bajados"), "a.txt", "b.txt")
+    assert resultado.returncode != 0
+    assert "b.txt: no está en el servidor" in resultado.stdout
+    assert (tmp_path / "bajados" / "a.txt").read_bytes() == b"a"
+
+
+def test_put_con_contraseña(iniciar_servidor, tmp_path):
+    servidor = iniciar_servidor("upload", "--password", "secreta")
+    (tmp_path / "a.txt").write_bytes(b"a")
+    resultado = correr_cliente("put", servidor.url, str(tmp_path / "a.txt"))
+    assert resultado.returncode != 0
+    assert "--password" in resultado.stdout + resultado.stderr
+    resultado = correr_cliente("put", servidor.url, str(tmp_path / "a.txt"), "--password", "secreta")
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+
+
+@pytest.mark.parametrize("nombre", ['con"comilla.txt', "con\nsalto.txt", ".oculto"])
+def test_put_rechaza_nombres_que_el_servidor_no_acepta(tmp_path, nombre):
+    (tmp_path / nombre).write_bytes(b"x")
+    with pytest.raises(SystemExit):
+        archivos_a_subir([str(tmp_path / nombre)])
+
+
+@pytest.mark.parametrize("nombre", ["../afuera.txt", "/etc/passwd", ".bashrc", "", "a/b"])
+def test_get_rechaza_nombres_inseguros_del_servidor(tmp_path, nombre):
+    with pytest.raises(ErrorCliente):
+        asyncio.run(descargar_archivo(None, {'nombre': nombre, 'tamaño': 1}, str(tmp_path), 0, False))
+    assert os.listdir(tmp_path) == []
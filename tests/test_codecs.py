@@ -0,0 +1,72 @@
+import gzip
+import zlib
+
+import pytest
+
+import codigo_base
+from codigo_base import (CODECS, codecs_disponibles, comprimir_datos, negociar_codificacion,
+                         parsear_accept_encoding, registrar_codec)
+
+TEXTO = b"texto para comprimir, texto para comprimir\n" * 2000
+
+
+def test_parsear_accept_encoding():
+    assert parsear_accept_encoding("gzip, br;q=0.5, ZSTD;q=0, x-gzip;q=0.9, *;q=0.1, raro;q=abc") == {
+        'gzip': 0.9, 'br': 0.5, 'zstd': 0.0, '*': 0.1, 'raro': 0.0}
+
+
+@pytest.mark.parametrize("aceptado, esperado", [
+    ("gzip, zstd, br", 'zstd'),           # mismo q: gana el orden del servidor
+    ("gzip, zstd;q=0.5, br;q=0.8", 'gzip'),
+    ("br;q=0.9, gzip;q=0.1", 'br'),
+    ("*", 'zstd'),
+    ("*, zstd;q=0", 'br'),
+    ("gzip;q=0", None),
+    ("identity", None),
+])
+def test_negociar_codificacion(aceptado, esperado):
+    compresion = {'codecs': ['zstd', 'br', 'gzip']}
+    assert negociar_codificacion({'accept-encoding': aceptado}, compresion) == esperado
+
+
+def test_sin_accept_encoding_no_se_comprime():
+    assert negociar_codificacion({}, {'codecs': ['gzip']}) is None
+
+
+def test_solo_se_ofrecen_los_codecs_instalados(monkeypatch):
+    monkeypatch.setattr(codigo_base, "CODECS", {'gzip': CODECS['gzip']})
+    assert codecs_disponibles() == ['gzip']
+    assert codecs_disponibles(['br', 'gzip']) == ['gzip']
+
+
+def test_registrar_un_codec(monkeypatch):
+    monkeypatch.setattr(codigo_base, "CODECS", dict(CODECS))
+    registrar_codec('deflate', '.zz', 6, lambda nivel, compresion: zlib.compressobj(nivel))
+    assert 'deflate' in codigo_base.CODECS
+    assert zlib.decompress(comprimir_datos(TEXTO, 'deflate', None)) == TEXTO
+
+
+def test_el_servidor_avisa_de_codecs_no_instalados(iniciar_servidor):
+    servidor = iniciar_servidor("upload", "--gzip", "--codecs", "zstd,br,gzip", archivos={"texto.txt": TEXTO})
+    esperados = codecs_disponibles(['zstd', 'br', 'gzip'])
+    assert f"Codificaciones ofrecidas: {', '.join(esperados)}" in servidor.log()
+    for nombre in {'zstd', 'br'} - set(esperados):
+        assert f"el codec '{nombre}' no está instalado" in servidor.log()
+    # Un cliente que acepta todos recibe el preferido de los que hay
+    _, headers, body = servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'zstd, br, gzip'})
+    assert headers['content-encoding'] == esperados[0]
+    if esperados[0] == 'gzip':
+        assert gzip.decompress(body) == TEXTO
+
+
+def test_el_servidor_con_zstd(iniciar_servidor):
+    zstandard = pytest.importorskip("zstandard")
+    servidor = iniciar_servidor("upload", "--gzip", "--codecs", "zstd,gzip", archivos={"texto.txt": TEXTO})
+    _, headers, body = servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip, zstd'})
+    assert headers['content-encoding'] == 'zstd'
+    assert zstandard.ZstdDecompressor().decompress(body, max_output_size=len(TEXTO)) == TEXTO
+
+
+def test_codec_desconocido(iniciar_servidor):
+    with pytest.raises(RuntimeError, match="codec desconocido 'lzma'"):
+        iniciar_servidor("upload", "--gzip", "--codecs", "lzma")
@@ -0,0 +1,118 @@
+import gzip
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from codigo_base import CacheComprimidos
+
+TEXTO = b"una linea de texto que se repite bastante\n" * 5000
+
+
+def test_cache_desaloja_lo_menos_usado():
+    cache = CacheComprimidos(100)
+    cache.guardar("a", b"a" * 40)
+    cache.guardar("b", b"b" * 40)
+    assert cache.obtener("a") == b"a" * 40
+    # No entra: sale "b", que es la menos usada
+    cache.guardar("c", b"c" * 40)
+    assert cache.obtener("b") is None
+    assert cache.obtener("a") is not None and cache.obtener("c") is not None
+    assert cache.bytes_usados == 80
+    # Más grande que todo el presupuesto: no se guarda
+    cache.guardar("d", b"d" * 101)
+    assert cache.obtener("d") is None and cache.bytes_usados == 80
+
+
+def test_cache_una_sola_compresion_por_variante():
+    cache = CacheComprimidos(100)
+    assert cache.reservar("a")
+    assert not cache.reservar("a")
+    cache.liberar("a")
+    assert cache.reservar("a")
+
+
+@pytest.fixture
+def servidor(iniciar_servidor):
+    return iniciar_servidor("upload", "--gzip", "--gzip-sidecar",
+                            archivos={"texto.txt": TEXTO, "foto.jpg": os.urandom(50000)})
+
+
+def test_descarga_comprimida(servidor):
+    codigo, headers, body = servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip'})
+    assert codigo == 200
+    assert headers['content-encoding'] == "gzip"
+    assert headers['vary'] == "Accept-Encoding"
+    assert int(headers['content-length']) == len(body) < len(TEXTO) / 10
+    assert gzip.decompress(body) == TEXTO
+
+
+def test_variante_guardada_en_disco(servidor):
+    _, _, comprimido = servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip'})
+    sidecar = os.path.join(servidor.archivos, ".comprimidos", "texto.txt.gz")
+    with open(sidecar, 'rb') as archivo:
+        assert archivo.read() == comprimido
+    # El sidecar no aparece en el listado
+    assert b".comprimidos" not in servidor.get("/list")[2]
+
+
+def test_archivo_modificado_no_usa_la_variante_vieja(servidor):
+    servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip'})
+    ruta = os.path.join(servidor.archivos, "texto.txt")
+    with open(ruta, 'wb') as archivo:
+        archivo.write(TEXTO[::-1])
+    os.utime(ruta, (time.time() + 5,) * 2)
+    _, _, body = servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(body) == TEXTO[::-1]
+
+
+@pytest.mark.parametrize("nombre, aceptar", [("texto.txt", None), ("texto.txt", "identity"), ("foto.jpg", "gzip")])
+def test_sin_comprimir(servidor, nombre, aceptar):
+    codigo, headers, body = servidor.get(f"/download?archivo={nombre}", {'Accept-Encoding': aceptar} if aceptar else {})
+    assert codigo == 200
+    assert 'content-encoding' not in headers
+    with open(os.path.join(servidor.archivos, nombre), 'rb') as archivo:
+        assert body == archivo.read()
+
+
+def test_pagina_comprimida(servidor):
+    codigo, headers, body = servidor.get("/", {'Accept-Encoding': 'gzip'})
+    assert codigo == 200
+    assert headers['content-encoding'] == "gzip"
+    assert b"texto.txt" in gzip.decompress(body)
+
+
+# Archivos grandes: se comprimen mientras se envían
+
+@pytest.fixture(params=["threads", "async"])
+def servidor_streaming(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, "--gzip", "--gzip-stream-mb", "1",
+                            archivos={"grande.txt": TEXTO * 10})
+
+
+def test_comprimido_mientras_se_envia(servidor_streaming):
+    codigo, headers, body = servidor_streaming.get("/download?archivo=grande.txt", {'Accept-Encoding': 'gzip'})
+    assert codigo == 200
+    assert headers['transfer-encoding'] == "chunked"
+    assert headers['content-encoding'] == "gzip"
+    assert 'content-length' not in headers
+    assert gzip.decompress(body) == TEXTO * 10
+
+
+def test_comprimido_entero_para_http_1_0(servidor_streaming):
+    respuesta = servidor_streaming.pedir(b"GET /download?archivo=grande.txt HTTP/1.0\r\nAccept-Encoding: gzip\r\n\r\n")
+    cabecera, _, body = respuesta.partition(b"\r\n\r\n")
+    assert b"Transfer-Encoding" not in cabecera
+    assert f"Content-Length: {len(body)}".encode() in cabecera
+    assert gzip.decompress(body) == TEXTO * 10
+
+
+def test_varios_pedidos_a_la_vez_del_mismo_archivo(servidor_streaming):
+    pedir = lambda _: servidor_streaming.get("/download?archivo=grande.txt", {'Accept-Encoding': 'gzip'})
+    with ThreadPoolExecutor(6) as pool:
+        resultados = list(pool.map(pedir, range(6)))
+    # Uno comprime y los demás reciben el archivo sin comprimir mientras tanto, o la variante ya guardada
+    for codigo, headers, body in resultados:
+        assert codigo == 200
+        assert (gzip.decompress(body) if headers.get('content-encoding') == "gzip" else body) == TEXTO * 10
@@ -0,0 +1,48 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from codigo_base import CacheArchivos, CacheComprimidos, manejar_descarga
+
+CONTENIDO = b"x" * 200000
+
+
+@pytest.fixture(params=["sequential", "threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, archivos={"a.bin": CONTENIDO})
+
+
+def test_requests_en_paralelo(servidor):
+    with ThreadPoolExecutor(16) as pool:
+        resultados = list(pool.map(lambda _: servidor.get("/download?archivo=a.bin"), range(48)))
+    assert all(codigo == 200 and body == CONTENIDO for codigo, _, body in resultados)
+
+
+@pytest.mark.parametrize("modo", ["threads", "async"])
+def test_un_cliente_trabado_no_frena_a_los_demas(iniciar_servidor, modo):
+    servidor = iniciar_servidor("upload", "--concurrency", modo, archivos={"a.bin": CONTENIDO})
+    # Un cliente que manda media cabecera y se queda esperando
+    with servidor.conectar() as trabado:
+        trabado.sendall(b"GET /download?archivo=a.bin HTTP/1.1\r\nHost: x\r\n")
+        inicio = time.monotonic()
+        codigo, _, body = servidor.get("/download?archivo=a.bin")
+        assert codigo == 200 and body == CONTENIDO
+        assert time.monotonic() - inicio < 2
+
+
+def test_variante_en_curso_con_el_archivo_entrando_a_la_cache(tmp_path):
+    # Otro request está comprimiendo la variante y este es el que hace entrar el archivo a CacheArchivos:
+    # tiene que recibir el archivo sin comprimir, no quedarse sin respuesta
+    ruta = str(tmp_path / "texto.txt")
+    with open(ruta, 'wb') as archivo:
+        archivo.write(CONTENIDO)
+    stat = os.stat(ruta)
+    comprimidos = CacheComprimidos(1024 * 1024)
+    assert comprimidos.reservar((ruta, stat.st_mtime_ns, stat.st_size, 'gzip'))
+    response = manejar_descarga(ruta, "GET /download HTTP/1.1", {'accept-encoding': 'gzip'}, True, comprimidos,
+                                {'codecs': ['gzip']}, cache_archivos=CacheArchivos(1024 * 1024, min_frecuencia=1))
+    assert response.codigo == 200
+    assert response.obtener_header('Content-Encoding') is None
+    response.cerrar()
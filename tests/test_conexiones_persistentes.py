@@ -0,0 +1,78 @@
+import socket
+import time
+
+import pytest
+
+from conftest import leer_respuesta, recibir_todo
+
+ARCHIVOS = {"uno.txt": b"uno", "dos.txt": b"dos" * 1000, "tres.txt": b"tres"}
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, "--keepalive-timeout", "1",
+                            "--max-requests", "3", archivos=ARCHIVOS)
+
+
+def pedido(nombre, version="HTTP/1.1", extra=""):
+    return f"GET /download?archivo={nombre} {version}\r\nHost: x\r\n{extra}\r\n".encode()
+
+
+def test_varios_requests_por_la_misma_conexion(servidor):
+    with servidor.conectar() as conexion, conexion.makefile('rb') as archivo:
+        for nombre in ("uno.txt", "dos.txt"):
+            conexion.sendall(pedido(nombre))
+            codigo, headers, body = leer_respuesta(archivo)
+            assert (codigo, body) == (200, ARCHIVOS[nombre])
+            assert headers['connection'] == "keep-alive"
+        assert headers['keep-alive'] == "timeout=1, max=1"
+
+
+def test_pipelining(servidor):
+    with servidor.conectar() as conexion, conexion.makefile('rb') as archivo:
+        # Los tres requests van juntos, antes de leer ninguna respuesta
+        conexion.sendall(b"".join(pedido(nombre) for nombre in ARCHIVOS))
+        for nombre, contenido in ARCHIVOS.items():
+            assert leer_respuesta(archivo)[2] == contenido
+
+
+def test_max_requests_cierra_la_conexion(servidor):
+    with servidor.conectar() as conexion:
+        conexion.sendall(pedido("uno.txt") * 4)
+        respuesta = recibir_todo(conexion)
+    # Se atienden tres y se cierra: el cuarto queda sin respuesta
+    assert respuesta.count(b"HTTP/1.1 200 OK") == 3
+    assert respuesta.count(b"Connection: close") == 1
+
+
+@pytest.mark.parametrize("version, extra, se_mantiene", [
+    ("HTTP/1.1", "", True),
+    ("HTTP/1.1", "Connection: close\r\n", False),
+    ("HTTP/1.0", "", False),
+    ("HTTP/1.0", "Connection: keep-alive\r\n", True),
+])
+def test_connection_segun_la_version(servidor, version, extra, se_mantiene):
+    with servidor.conectar() as conexion, conexion.makefile('rb') as archivo:
+        conexion.sendall(pedido("uno.txt", version, extra))
+        _, headers, _ = leer_respuesta(archivo)
+        assert headers['connection'] == ("keep-alive" if se_mantiene else "close")
+        if not se_mantiene:
+            assert archivo.read() == b""
+
+
+def test_conexion_inactiva_se_cierra(servidor):
+    with servidor.conectar() as conexion:
+        conexion.sendall(pedido("uno.txt"))
+        inicio = time.monotonic()
+        # Después de la respuesta la conexión queda inactiva hasta que vence --keepalive-timeout
+        respuesta = recibir_todo(conexion)
+    assert respuesta.endswith(b"uno")
+    assert 0.5 < time.monotonic() - inicio < 5
+
+
+def test_request_partido_en_muchos_pedazos(servidor):
+    with servidor.conectar() as conexion, conexion.makefile('rb') as archivo:
+        conexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for byte in pedido("tres.txt"):
+            conexion.sendall(bytes([byte]))
+        assert leer_respuesta(archivo)[2] == b"tres"
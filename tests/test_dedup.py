@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from codigo_base import AlmacenContenido
+from conftest import correr_cliente
+
+FOTO = os.urandom(200000)
+DIGEST = hashlib.sha256(FOTO).hexdigest()
+
+
+def escribir_temporal(directorio, contenido):
+    ruta = directorio / f".subida-{os.urandom(4).hex()}.tmp"
+    ruta.write_bytes(contenido)
+    return str(ruta)
+
+
+def test_el_mismo_contenido_se_guarda_una_vez(tmp_path):
+    almacen = AlmacenContenido(str(tmp_path))
+    almacen.guardar(escribir_temporal(tmp_path, FOTO), "foto.jpg", DIGEST)
+    almacen.guardar(escribir_temporal(tmp_path, FOTO), "copia.jpg", DIGEST)
+    uno, otro = os.stat(tmp_path / "foto.jpg"), os.stat(tmp_path / "copia.jpg")
+    assert uno.st_ino == otro.st_ino == os.stat(almacen.ruta_blob(DIGEST)).st_ino
+    assert uno.st_nlink == 3
+    assert almacen.tamaño(DIGEST) == len(FOTO)
+    assert almacen.hash_de("foto.jpg", uno) == DIGEST
+    # Las subidas temporales no quedan
+    assert sorted(os.listdir(tmp_path)) == [".blobs", "copia.jpg", "foto.jpg"]
+
+
+def test_indice_al_iniciar(tmp_path):
+    almacen = AlmacenContenido(str(tmp_path))
+    almacen.guardar(escribir_temporal(tmp_path, FOTO), "foto.jpg", DIGEST)
+    otro = hashlib.sha256(b"otro").hexdigest()
+    almacen.guardar(escribir_temporal(tmp_path, b"otro"), "otro.txt", otro)
+    # Un archivo reemplazado a mano deja de estar en el almacén y su blob huérfano se borra
+    os.remove(tmp_path / "otro.txt")
+    (tmp_path / "otro.txt").write_bytes(b"distinto")
+    almacen = AlmacenContenido(str(tmp_path))
+    assert almacen.nombres == {"foto.jpg": (DIGEST, os.stat(tmp_path / "foto.jpg").st_ino)}
+    assert almacen.tamaño(otro) is None
+    assert almacen.hash_de("otro.txt", os.stat(tmp_path / "otro.txt")) is None
+
+
+def subir(servidor, nombre, contenido):
+    frontera = "frontera"
+    body = (f"--{frontera}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{nombre}\"\r\n\r\n".encode()
+            + contenido + f"\r\n--{frontera}--\r\n".encode())
+    return servidor.request("POST", "/", {'Content-Type': f"multipart/form-data; boundary={frontera}"}, body)
+
+
+@pytest.fixture
+def servidor(iniciar_servidor):
+    return iniciar_servidor("upload", "--dedup")
+
+
+def test_subidas_repetidas_comparten_el_contenido(servidor):
+    assert subir(servidor, "foto.jpg", FOTO)[0] == 200
+    assert subir(servidor, "copia.jpg", FOTO)[0] == 200
+    assert os.stat(os.path.join(servidor.archivos, "foto.jpg")).st_ino == \
+        os.stat(os.path.join(servidor.archivos, "copia.jpg")).st_ino
+    assert servidor.get("/download?archivo=copia.jpg")[2] == FOTO
+
+
+def test_blob(servidor):
+    assert servidor.get(f"/blob?sha256={DIGEST}")[0] == 404
+    assert servidor.request("POST", f"/blob?sha256={DIGEST}&nombre=foto.jpg")[0] == 404
+    subir(servidor, "foto.jpg", FOTO)
+    codigo, _, body = servidor.get(f"/blob?sha256={DIGEST}")
+    assert codigo == 200 and json.loads(body) == {'sha256': DIGEST, 'tamaño': len(FOTO)}
+    assert servidor.request("HEAD", f"/blob?sha256={DIGEST}")[0] == 200
+    # Guardar otro nombre con el mismo contenido sin mandarlo
+    assert servidor.request("POST", f"/blob?sha256={DIGEST}&nombre=sin-subir.jpg")[0] == 200
+    assert servidor.get("/download?archivo=sin-subir.jpg")[2] == FOTO
+    assert "sin-subir.jpg" in servidor.get("/")[2].decode('utf-8')
+    assert servidor.request("POST", f"/blob?sha256={DIGEST}&nombre=.oculto")[0] == 400
+    assert servidor.get("/blob?sha256=no-es-un-hash")[0] == 404
+
+
+def test_sin_dedup_no_hay_blob(iniciar_servidor):
+    assert iniciar_servidor("upload").get(f"/blob?sha256={DIGEST}")[0] == 404
+
+
+def test_cliente_no_manda_lo_que_el_servidor_ya_tiene(servidor, tmp_path):
+    (tmp_path / "foto.jpg").write_bytes(FOTO)
+    (tmp_path / "otra.jpg").write_bytes(FOTO)
+    resultado = correr_cliente("put", servidor.url, str(tmp_path / "foto.jpg"), "--dedup")
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    resultado = correr_cliente("put", servidor.url, str(tmp_path / "otra.jpg"), "--dedup")
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    assert "1 archivos ya estaban en el servidor: no se mandaron" in resultado.stdout
+    with open(os.path.join(servidor.archivos, "otra.jpg"), 'rb') as archivo:
+        assert archivo.read() == FOTO
@@ -0,0 +1,63 @@
+import os
+import socket
+import threading
+
+import pytest
+
+import codigo_base
+from codigo_base import enviar_archivo
+from conftest import recibir_todo
+
+GRANDE = os.urandom(5 * 1024 * 1024 + 3)
+
+
+@pytest.mark.parametrize("con_sendfile", [True, False])
+def test_enviar_archivo_una_porcion(tmp_path, monkeypatch, con_sendfile):
+    if not con_sendfile:
+        # Sin os.sendfile se manda por bloques leídos con readinto
+        monkeypatch.delattr(codigo_base.os, "sendfile")
+    ruta = tmp_path / "grande.bin"
+    ruta.write_bytes(GRANDE)
+    emisor, receptor = socket.socketpair()
+    recibido = []
+    lector = threading.Thread(target=lambda: recibido.append(recibir_todo(receptor)))
+    lector.start()
+    with open(ruta, 'rb') as archivo, emisor:
+        enviar_archivo(emisor, archivo, 1000, 3 * 1024 * 1024)
+    lector.join()
+    receptor.close()
+    assert recibido[0] == GRANDE[1000:1000 + 3 * 1024 * 1024]
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, archivos={"grande.bin": GRANDE})
+
+
+def test_descarga_grande(servidor):
+    codigo, headers, body = servidor.get("/download?archivo=grande.bin")
+    assert codigo == 200
+    assert headers['content-length'] == str(len(GRANDE))
+    assert headers['content-disposition'] == 'attachment; filename="grande.bin"'
+    assert body == GRANDE
+
+
+def test_head_sin_body(servidor):
+    with servidor.conectar() as conexion:
+        conexion.sendall(b"HEAD /download?archivo=grande.bin HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        respuesta = recibir_todo(conexion)
+    cabecera, _, body = respuesta.partition(b"\r\n\r\n")
+    assert cabecera.startswith(b"HTTP/1.1 200")
+    assert f"Content-Length: {len(GRANDE)}".encode() in cabecera
+    assert body == b""
+
+
+def test_modo_download(iniciar_servidor, tmp_path):
+    ruta = tmp_path / "compartido.bin"
+    ruta.write_bytes(GRANDE[:100000])
+    servidor = iniciar_servidor("download", str(ruta))
+    codigo, headers, body = servidor.get("/download")
+    assert codigo == 200
+    assert headers['content-disposition'] == 'attachment; filename="compartido.bin"'
+    assert body == GRANDE[:100000]
+    assert servidor.get("/download?archivo=no-existe.bin")[0] == 404
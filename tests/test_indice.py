@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+import re
+import time
+
+import pytest
+
+from codigo_base import IndiceDirectorio, parametros_indice
+
+ARCHIVOS = {"b.txt": b"bb", "a.txt": b"aaaa", "C.txt": b"c", ".oculto": b"no se lista"}
+
+
+def nombres_listados(html):
+    return re.findall(r'<a href="/download\?archivo=[^"]*">([^<]*)</a>', html.decode('utf-8'))
+
+
+def test_indice_registrar_y_ordenar(tmp_path):
+    for nombre, contenido in ARCHIVOS.items():
+        (tmp_path / nombre).write_bytes(contenido)
+    indice = IndiceDirectorio(str(tmp_path), None)
+    assert indice.listar() == [("a.txt", 4), ("b.txt", 2), ("C.txt", 1)]
+    assert indice.listar('tamaño') == [("C.txt", 1), ("b.txt", 2), ("a.txt", 4)]
+    assert [nombre for nombre, _ in indice.listar('nombre', True)] == ["C.txt", "b.txt", "a.txt"]
+    version = indice.version
+    (tmp_path / "d.txt").write_bytes(b"ddddd")
+    indice.registrar("d.txt")
+    assert indice.version == version + 1
+    assert indice.listar('tamaño', True)[0] == ("d.txt", 5)
+
+
+def test_indice_revisa_el_directorio(tmp_path):
+    indice = IndiceDirectorio(str(tmp_path), 0)
+    assert indice.listar() == []
+    # Un archivo copiado a mano aparece cuando cambia el mtime del directorio
+    (tmp_path / "a.txt").write_bytes(b"a")
+    os.utime(tmp_path, ns=(time.time_ns() + 10**9,) * 2)
+    indice.revisar()
+    assert indice.listar() == [("a.txt", 1)]
+
+
+def test_pagina_guardada_se_descarta_con_cambios(tmp_path):
+    indice = IndiceDirectorio(str(tmp_path), None)
+    version = indice.version
+    indice.guardar_pagina("clave", version, "pagina")
+    assert indice.obtener_pagina("clave") == "pagina"
+    (tmp_path / "a.txt").write_bytes(b"a")
+    indice.registrar("a.txt")
+    assert indice.obtener_pagina("clave") is None
+    # Si el índice cambió mientras se generaba, la página vieja no se guarda
+    indice.guardar_pagina("clave", version, "pagina")
+    assert indice.obtener_pagina("clave") is None
+
+
+@pytest.mark.parametrize("query, esperado", [
+    ({}, (1, 100, 'nombre', False)),
+    ({'pagina': '3', 'por_pagina': '5', 'orden': 'tamano', 'dir': 'desc'}, (3, 5, 'tamaño', True)),
+    ({'pagina': '-2', 'por_pagina': '999999', 'orden': 'otro'}, (1, 1000, 'nombre', False)),
+    ({'pagina': 'x', 'por_pagina': 'y'}, (1, 100, 'nombre', False)),
+])
+def test_parametros_indice(query, esperado):
+    assert parametros_indice(query) == esperado
+
+
+@pytest.fixture
+def servidor(iniciar_servidor):
+    return iniciar_servidor("upload", "--gzip", "--index-refresh", "0", archivos=ARCHIVOS)
+
+
+def test_listado(servidor):
+    codigo, headers, body = servidor.get("/")
+    assert codigo == 200
+    assert nombres_listados(body) == ["a.txt", "b.txt", "C.txt"]
+    assert 'etag' in headers
+
+
+def test_paginado_y_orden(servidor):
+    _, _, body = servidor.get("/?por_pagina=2&orden=tamano")
+    assert nombres_listados(body) == ["C.txt", "b.txt"]
+    assert "Página 1 de 2" in body.decode('utf-8')
+    _, _, body = servidor.get("/?pagina=2&por_pagina=2&orden=tamano")
+    assert nombres_listados(body) == ["a.txt"]
+    # Una página más allá del final muestra la última
+    assert nombres_listados(servidor.get("/?pagina=9&por_pagina=2&dir=desc")[2]) == ["a.txt"]
+
+
+def test_nombres_escapados(servidor):
+    with open(os.path.join(servidor.archivos, "<b>&.txt"), 'wb') as archivo:
+        archivo.write(b"x")
+    body = servidor.get("/")[2].decode('utf-8')
+    assert "&lt;b&gt;&amp;.txt" in body and "<b>&" not in body
+    assert "archivo=%3Cb%3E%26.txt" in body
+
+
+def test_pagina_comprimida_y_304(servidor):
+    _, plano, body_plano = servidor.get("/")
+    _, comprimido, body_comprimido = servidor.get("/", {'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(body_comprimido) == body_plano
+    assert comprimido['etag'] != plano['etag']
+    assert servidor.get("/", {'If-None-Match': plano['etag']})[0] == 304
+
+
+def test_subida_y_archivo_agregado_a_mano(servidor):
+    _, headers, _ = servidor.get("/")
+    frontera = "frontera"
+    body = (f"--{frontera}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"subido.txt\"\r\n\r\n"
+            f"hola\r\n--{frontera}--\r\n").encode()
+    assert servidor.request("POST", "/", {'Content-Type': f"multipart/form-data; boundary={frontera}"}, body)[0] == 200
+    _, nuevos, body = servidor.get("/", {'If-None-Match': headers['etag']})
+    assert "subido.txt" in nombres_listados(body)
+    with open(os.path.join(servidor.archivos, "manual.txt"), 'wb') as archivo:
+        archivo.write(b"m")
+    os.utime(servidor.archivos, (time.time() + 10,) * 2)
+    codigo, _, body = servidor.get("/", {'If-None-Match': nuevos['etag']})
+    assert codigo == 200 and "manual.txt" in nombres_listados(body)
+
+
+def test_listado_json(servidor):
+    codigo, headers, body = servidor.get("/list")
+    assert codigo == 200
+    assert headers['content-type'].startswith("application/json")
+    archivos = json.loads(body)["archivos"]
+    assert [(archivo["nombre"], archivo["tamaño"]) for archivo in archivos] == [("a.txt", 4), ("b.txt", 2), ("C.txt", 1)]
@@ -0,0 +1,119 @@
+import socket
+import threading
+
+import pytest
+
+from codigo_base import (MAX_CANTIDAD_HEADERS, MAX_TAMAÑO_CABECERA, CabeceraInvalida, LectorHTTP,
+                         parsear_headers_y_body, parsear_solicitud)
+from conftest import leer_respuesta
+
+
+def test_parsear_solicitud():
+    solicitud = parsear_solicitud(b"GET /download?archivo=a%20b.txt&x=1&x=2&vacio= HTTP/1.1\r\n"
+                                  b"Host: x\r\nAccept: a\r\naccept:  b \r\n\r\n")
+    assert (solicitud.method, solicitud.path, solicitud.version) == ("GET", "/download", "HTTP/1.1")
+    assert solicitud.query == {'archivo': ["a b.txt"], 'x': ["1", "2"], 'vacio': [""]}
+    assert solicitud.query_params['x'] == "2"
+    # Los headers repetidos se juntan con comas
+    assert solicitud.headers == {'host': "x", 'accept': "a, b"}
+
+
+def test_request_sin_version_es_http_1_0():
+    assert parsear_solicitud(b"GET /\r\n\r\n").version == "HTTP/1.0"
+
+
+@pytest.mark.parametrize("cabecera", [b"\r\n\r\n", b"GET\r\n\r\n", b"GET / FTP/1.0\r\n\r\n", b"GET  / HTTP/1.1\r\n\r\n"])
+def test_request_line_invalida(cabecera):
+    with pytest.raises(CabeceraInvalida) as error:
+        parsear_solicitud(cabecera)
+    assert error.value.codigo == 400
+
+
+def test_demasiados_headers():
+    headers = b"".join(b"X-%d: v\r\n" % i for i in range(MAX_CANTIDAD_HEADERS + 1))
+    with pytest.raises(CabeceraInvalida) as error:
+        parsear_solicitud(b"GET / HTTP/1.1\r\n" + headers + b"\r\n")
+    assert error.value.codigo == 431
+
+
+def test_body_binario_no_se_decodifica():
+    # Las posiciones se cuentan en bytes: un header no ASCII no corre el comienzo del body
+    body = bytes(range(256))
+    headers, resto = parsear_headers_y_body("POST / HTTP/1.1\r\nX-Nombre: ñandú\r\n\r\n".encode() + body)
+    assert headers['x-nombre'] == "ñandú"
+    assert resto == body
+
+
+class Receptor:
+    def __init__(self):
+        self.datos = bytearray()
+
+    def feed(self, chunk):
+        self.datos += chunk
+
+
+def lector_con(*pedazos):
+    """Devuelve un LectorHTTP sobre un socket por el que llegan pedazos (en recv separados) y después EOF."""
+    servidor, cliente = socket.socketpair()
+
+    def mandar():
+        for pedazo in pedazos:
+            cliente.sendall(pedazo)
+        cliente.close()
+
+    threading.Thread(target=mandar).start()
+    return LectorHTTP(servidor)
+
+
+def test_cabecera_en_pedazos_y_pipeline():
+    lector = lector_con(b"\r\nGET /a HTTP/1.1\r", b"\nHost: x\r\n\r", b"\nPOST /b HTTP/1.1\r\nContent-Length: 5\r\n\r\nhola!",
+                        b"GET /c HTTP/1.1\r\n\r\n")
+    assert lector.leer_cabecera() == b"GET /a HTTP/1.1\r\nHost: x\r\n\r\n"
+    assert parsear_solicitud(lector.leer_cabecera()).path == "/b"
+    receptor = Receptor()
+    assert lector.leer_body(receptor, 5) == 5
+    assert receptor.datos == b"hola!"
+    # El próximo request no se consumió con el body
+    assert lector.leer_cabecera() == b"GET /c HTTP/1.1\r\n\r\n"
+    assert lector.leer_cabecera() is None
+
+
+def test_body_incompleto():
+    lector = lector_con(b"POST / HTTP/1.1\r\nContent-Length: 10\r\n\r\n", b"abc")
+    lector.leer_cabecera()
+    assert lector.leer_body(None, 10) == 3
+
+
+def test_cabecera_demasiado_larga():
+    lector = lector_con(b"GET / HTTP/1.1\r\nX: " + b"a" * MAX_TAMAÑO_CABECERA)
+    with pytest.raises(CabeceraInvalida) as error:
+        lector.leer_cabecera()
+    assert error.value.codigo == 431
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, archivos={"a.txt": b"a"})
+
+
+@pytest.mark.parametrize("crudo, codigo", [
+    (b"GET / HTTP/1.1\r\nX: " + b"a" * MAX_TAMAÑO_CABECERA + b"\r\n\r\n", 431),
+    (b"GET / HTTP/1.1\r\n" + b"X: v\r\n" * (MAX_CANTIDAD_HEADERS + 1) + b"\r\n", 431),
+    (b"BASURA\r\n\r\n", 400),
+    (b"POST / HTTP/1.1\r\nContent-Length: -3\r\n\r\n", 400),
+    (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n", 411),
+])
+def test_requests_rechazados(servidor, crudo, codigo):
+    with servidor.conectar() as conexion, conexion.makefile('rb') as archivo:
+        conexion.sendall(crudo)
+        respuesta = leer_respuesta(archivo)
+        assert respuesta[0] == codigo
+        # Después de un request inválido no se sabe dónde empieza el próximo: se cierra la conexión
+        assert respuesta[1]['connection'] == "close"
+        assert archivo.read() == b""
+
+
+def test_query_con_caracteres_codificados(servidor):
+    with open(f"{servidor.archivos}/año 1.txt", 'wb') as archivo:
+        archivo.write(b"contenido")
+    assert servidor.get("/download?archivo=a%C3%B1o%201.txt")[2] == b"contenido"
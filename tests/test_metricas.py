@@ -0,0 +1,108 @@
+import gzip
+import json
+import re
+import time
+
+import pytest
+
+from codigo_base import Histograma, MedicionRequest, Metricas, ruta_metrica
+
+TEXTO = b"texto comprimible " * 5000
+
+
+def valor(metricas, serie):
+    """Devuelve el valor de una serie (nombre con etiquetas, tal cual aparece) en el texto de /metrics."""
+    encontrado = re.search(rf"^{re.escape(serie)} (\S+)$", metricas, re.MULTILINE)
+    return float(encontrado.group(1)) if encontrado else None
+
+
+def esperar(condicion, limite=5):
+    """Repite condicion() hasta que devuelva algo verdadero: cada request se registra después de enviar la respuesta."""
+    fin = time.monotonic() + limite
+    while True:
+        resultado = condicion()
+        if resultado or time.monotonic() > fin:
+            return resultado
+        time.sleep(0.02)
+
+
+def test_histograma_acumulativo():
+    histograma = Histograma((0.1, 1.0))
+    for segundos in (0.05, 0.5, 0.7, 3.0):
+        histograma.observar(segundos)
+    assert histograma.exportar("h", 'a="b"') == [
+        'h_bucket{a="b",le="0.1"} 1', 'h_bucket{a="b",le="1"} 3', 'h_bucket{a="b",le="+Inf"} 4',
+        'h_sum{a="b"} 4.250000', 'h_count{a="b"} 4']
+
+
+def test_rutas_agrupadas():
+    assert ruta_metrica("/download") == "/download"
+    assert ruta_metrica("/uploads/abc123") == "/uploads"
+    assert ruta_metrica("/cualquier/cosa") == "otra"
+
+
+def test_combinar_el_estado_de_otro_worker():
+    metricas = Metricas()
+    medicion = MedicionRequest()
+    medicion.sumar('envio', 0.002)
+    medicion.compresion['gzip'] = [1000, 100]
+    metricas.conexion_abierta()
+    metricas.registrar(medicion, ("127.0.0.1", 1), "GET", "/download", "200", 50, 150)
+    total = Metricas()
+    total.combinar(metricas.estado())
+    total.combinar(json.loads(json.dumps(metricas.estado())))
+    texto = total.exportar()
+    assert valor(texto, 'http_requests_total{metodo="GET",ruta="/download",codigo="200"}') == 2
+    assert valor(texto, 'http_bytes_enviados_total') == 300
+    assert valor(texto, 'servidor_conexiones_activas') == 2
+    assert valor(texto, 'servidor_fase_segundos_count{fase="envio"}') == 2
+    assert valor(texto, 'compresion_ratio{codec="gzip"}') == 0.1
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, "--gzip", "--access-log", "accesos.jsonl",
+                            archivos={"texto.txt": TEXTO})
+
+
+def test_metricas_del_servidor(servidor):
+    servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip'})
+    servidor.get("/download?archivo=no-existe.txt")
+    servidor.get("/una/ruta/inventada")
+    codigo, headers, body = servidor.get("/metrics")
+    assert codigo == 200
+    assert headers['content-type'].startswith("text/plain; version=0.0.4")
+
+    def leer_metricas():
+        texto = servidor.get("/metrics")[2].decode('utf-8')
+        return texto if valor(texto, 'http_request_duracion_segundos_count{metodo="GET",ruta="/download"}') == 2 else None
+
+    texto = esperar(leer_metricas)
+    assert valor(texto, 'http_requests_total{metodo="GET",ruta="/download",codigo="200"}') == 1
+    assert valor(texto, 'http_requests_total{metodo="GET",ruta="/download",codigo="404"}') == 1
+    assert valor(texto, 'http_requests_total{metodo="GET",ruta="otra",codigo="404"}') == 1
+    # La conexión del /metrics que se está atendiendo cuenta como activa
+    assert valor(texto, 'servidor_conexiones_activas') >= 1
+    assert valor(texto, 'servidor_conexiones_total') >= 5
+    assert valor(texto, 'compresion_bytes_entrada_total{codec="gzip"}') == len(TEXTO)
+    assert 0 < valor(texto, 'compresion_ratio{codec="gzip"}') < 0.1
+    assert valor(texto, 'http_bytes_enviados_total') > 0
+
+
+def test_access_log(servidor):
+    _, _, body = servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip'})
+    servidor.get("/download?archivo=no-existe.txt")
+
+    def leer_registros():
+        with open(f"{servidor.directorio}/accesos.jsonl", encoding='utf-8') as archivo:
+            registros = [json.loads(linea) for linea in archivo]
+        return registros if len(registros) == 2 else None
+
+    registros = esperar(leer_registros)
+    assert sorted((registro['metodo'], registro['codigo']) for registro in registros) == [("GET", 200), ("GET", 404)]
+    primero = next(registro for registro in registros if registro['codigo'] == 200)
+    assert primero['ruta'] == "/download" and primero['cliente'] == "127.0.0.1"
+    assert primero['bytes_enviados'] > len(body) == primero['compresion']['gzip']['salida']
+    assert primero['compresion']['gzip']['entrada'] == len(TEXTO)
+    assert gzip.decompress(body) == TEXTO
+    assert {'parseo', 'envio'} <= set(primero['fases_ms'])
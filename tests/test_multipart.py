@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from codigo_base import ParserMultipart, manejar_carga
+
+
+BOUNDARY = "----limite1234"
+
+
+def armar_multipart(partes):
+    """partes: list de tuplas (filename o None, contenido)"""
+    body = b"preambulo\r\n"
+    for filename, contenido in partes:
+        body += f"--{BOUNDARY}\r\n".encode()
+        if filename is None:
+            body += b'Content-Disposition: form-data; name="campo"\r\n\r\n'
+        else:
+            body += f'Content-Disposition: form-data; name="archivo"; filename="{filename}"\r\n'.encode()
+            body += b"Content-Type: application/octet-stream\r\n\r\n"
+        body += contenido + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def subir_multipart(directorio, body, tamaño_pedazo):
+    parser = ParserMultipart(BOUNDARY, str(directorio))
+    for i in range(0, len(body), tamaño_pedazo):
+        parser.feed(body[i:i + tamaño_pedazo])
+    return parser.finalizar()
+
+
+@pytest.mark.parametrize("tamaño_pedazo", list(range(1, len(BOUNDARY) + 8)) + [64, 4096])
+def test_delimitador_partido_entre_pedazos(tmp_path, tamaño_pedazo):
+    # El contenido tiene cosas parecidas al delimitador, que no lo son
+    uno = b"hola\r\n--" + BOUNDARY[:-1].encode() + b"\r\nchau"
+    dos = os.urandom(3000)
+    body = armar_multipart([(None, b"valor"), ("uno.txt", uno), ("dos.bin", dos)])
+    archivos = subir_multipart(tmp_path, body, tamaño_pedazo)
+    assert [(nombre, tamaño) for nombre, _, tamaño in archivos] == [("uno.txt", len(uno)), ("dos.bin", len(dos))]
+    assert (tmp_path / "uno.txt").read_bytes() == uno
+    assert (tmp_path / "dos.bin").read_bytes() == dos
+    assert sorted(os.listdir(tmp_path)) == ["dos.bin", "uno.txt"]
+
+
+def test_cortado_no_deja_temporales(tmp_path):
+    body = armar_multipart([("uno.txt", b"x" * 1000)])
+    assert subir_multipart(tmp_path, body[:-200], 100) == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_saltea_nombres_invalidos(tmp_path):
+    body = armar_multipart([(".oculto", b"x"), ("bien.txt", b"y")])
+    assert [nombre for nombre, _, _ in subir_multipart(tmp_path, body, 7)] == ["bien.txt"]
+    assert os.listdir(tmp_path) == ["bien.txt"]
+
+
+def test_confirmacion_escapa_los_nombres(tmp_path):
+    nombre = "<img src=x onerror=alert(1)>.txt"
+    body = armar_multipart([(nombre, b"x"), ("otro.txt", b"y")])
+    response = manejar_carga(body, BOUNDARY, str(tmp_path))
+    html = b"".join(response.cuerpo).decode('utf-8')
+    assert response.codigo == 200
+    assert "<img" not in html
+    assert "&lt;img src=x onerror=alert(1)&gt;.txt" in html
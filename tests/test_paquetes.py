@@ -0,0 +1,54 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+ARCHIVOS = {"a.txt": b"hola " * 1000, "b.bin": bytes(range(256)) * 40}
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, archivos=dict(ARCHIVOS, **{".subida-x.tmp": b"a medio subir"}))
+
+
+def test_zip_con_todo_el_listado(servidor):
+    codigo, headers, body = servidor.get("/download-bundle")
+    assert codigo == 200
+    assert headers['transfer-encoding'] == 'chunked'
+    with zipfile.ZipFile(io.BytesIO(body)) as paquete:
+        assert sorted(paquete.namelist()) == sorted(ARCHIVOS)
+        assert all(paquete.read(nombre) == contenido for nombre, contenido in ARCHIVOS.items())
+
+
+def test_tar_con_los_archivos_pedidos(servidor):
+    codigo, headers, body = servidor.get("/download-bundle?formato=tar&archivo=b.bin")
+    assert codigo == 200
+    with tarfile.open(fileobj=io.BytesIO(body)) as paquete:
+        assert paquete.getnames() == ["b.bin"]
+        assert paquete.extractfile("b.bin").read() == ARCHIVOS["b.bin"]
+
+
+def test_http_1_0_sin_chunked(servidor):
+    respuesta = servidor.pedir(b"GET /download-bundle?formato=tar&archivo=a.txt HTTP/1.0\r\n"
+                               b"Connection: keep-alive\r\n\r\n")
+    cabecera, _, body = respuesta.partition(b"\r\n\r\n")
+    assert cabecera.startswith(b"HTTP/1.1 200")
+    assert b"Transfer-Encoding" not in cabecera
+    assert b"Connection: close" in cabecera
+    # El servidor cerró la conexión al terminar: el body es el tar tal cual
+    with tarfile.open(fileobj=io.BytesIO(body)) as paquete:
+        assert paquete.extractfile("a.txt").read() == ARCHIVOS["a.txt"]
+
+
+@pytest.mark.parametrize("target", [
+    "/download-bundle?formato=tar&archivo=.subida-x.tmp",
+    "/download-bundle?archivo=../archivos_servidor/a.txt",
+    "/download-bundle?archivo=no-existe.txt",
+    "/download-bundle?formato=rar",
+    "/download?archivo=.subida-x.tmp",
+])
+def test_nombres_invalidos_u_ocultos(servidor, target):
+    codigo, _, body = servidor.get(target)
+    assert codigo == 404
+    assert b"a medio subir" not in body
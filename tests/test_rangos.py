@@ -0,0 +1,103 @@
+import email.utils
+import os
+import time
+
+import pytest
+
+from codigo_base import MAX_RANGOS, if_range_coincide, parsear_range
+
+CONTENIDO = bytes(range(256)) * 4
+
+def test_range_simple_y_recortado_al_final():
+    assert parsear_range("bytes=0-4", 10) == [(0, 4)]
+    assert parsear_range("bytes=5-99", 10) == [(5, 9)]
+
+
+def test_range_sufijo():
+    assert parsear_range("bytes=-3", 10) == [(7, 9)]
+    # Un sufijo más largo que el archivo es el archivo entero
+    assert parsear_range("bytes=-50", 10) == [(0, 9)]
+    assert parsear_range("bytes=-0", 10) == []
+
+
+def test_range_abierto():
+    assert parsear_range("bytes=4-", 10) == [(4, 9)]
+    assert parsear_range("bytes=9-", 10) == [(9, 9)]
+
+
+def test_range_despues_del_final():
+    assert parsear_range("bytes=10-", 10) == []
+    assert parsear_range("bytes=50-", 10) == []
+    assert parsear_range("bytes=10-20", 10) == []
+    assert parsear_range("bytes=0-", 0) == []
+
+
+def test_range_varios():
+    assert parsear_range("bytes=0-1, 4-5,-2", 10) == [(0, 1), (4, 5), (8, 9)]
+    # Los que no se pueden satisfacer se descartan y quedan los otros
+    assert parsear_range("bytes=0-0,50-", 10) == [(0, 0)]
+    assert parsear_range("bytes=" + ",".join(["0-0"] * (MAX_RANGOS + 1)), 10) is None
+
+
+@pytest.mark.parametrize("valor", ["items=0-1", "bytes=", "bytes=5-3", "bytes=a-b", "bytes=1", "bytes=-"])
+def test_range_invalido_se_ignora(valor):
+    assert parsear_range(valor, 10) is None
+
+
+def test_if_range_con_etag():
+    assert if_range_coincide('"abc"', '"abc"', 0)
+    assert not if_range_coincide('"abd"', '"abc"', 0)
+    # If-Range solo admite comparación fuerte
+    assert not if_range_coincide('W/"abc"', 'W/"abc"', 0)
+
+
+def test_if_range_con_fecha():
+    mtime = time.time() - 60
+    assert if_range_coincide(email.utils.formatdate(mtime, usegmt=True), '"x"', mtime)
+    assert not if_range_coincide(email.utils.formatdate(mtime - 5, usegmt=True), '"x"', mtime)
+    assert not if_range_coincide("no es una fecha", '"x"', mtime)
+
+
+def test_if_range_con_fecha_de_un_archivo_recien_modificado():
+    # Modificado en este mismo segundo: la fecha no distingue versiones, se manda el archivo entero
+    mtime = time.time()
+    assert not if_range_coincide(email.utils.formatdate(mtime, usegmt=True), '"x"', mtime)
+
+
+# Contra el servidor
+
+@pytest.fixture
+def servidor(iniciar_servidor):
+    servidor = iniciar_servidor("upload", archivos={"datos.bin": CONTENIDO})
+    # Que el archivo no sea "recién modificado" para If-Range con fecha
+    os.utime(os.path.join(servidor.archivos, "datos.bin"), (time.time() - 60,) * 2)
+    return servidor
+
+
+def test_servidor_un_rango(servidor):
+    codigo, headers, body = servidor.get("/download?archivo=datos.bin", {'Range': 'bytes=10-19'})
+    assert codigo == 206
+    assert headers['content-range'] == f"bytes 10-19/{len(CONTENIDO)}"
+    assert body == CONTENIDO[10:20]
+
+
+def test_servidor_varios_rangos(servidor):
+    codigo, headers, body = servidor.get("/download?archivo=datos.bin", {'Range': 'bytes=0-3,-4'})
+    assert codigo == 206
+    assert headers['content-type'].startswith("multipart/byteranges; boundary=")
+    assert CONTENIDO[:4] in body and CONTENIDO[-4:] in body
+    assert f"Content-Range: bytes 0-3/{len(CONTENIDO)}".encode() in body
+
+
+def test_servidor_rango_despues_del_final(servidor):
+    codigo, headers, _ = servidor.get("/download?archivo=datos.bin", {'Range': f'bytes={len(CONTENIDO)}-'})
+    assert codigo == 416
+    assert headers['content-range'] == f"bytes */{len(CONTENIDO)}"
+
+
+def test_servidor_if_range(servidor):
+    _, headers, _ = servidor.get("/download?archivo=datos.bin")
+    for validador, esperado in [(headers['etag'], 206), (headers['last-modified'], 206), ('"otro"', 200)]:
+        codigo, _, body = servidor.get("/download?archivo=datos.bin", {'Range': 'bytes=0-9', 'If-Range': validador})
+        assert codigo == esperado
+        assert body == (CONTENIDO[:10] if esperado == 206 else CONTENIDO)
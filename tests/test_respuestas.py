@@ -0,0 +1,108 @@
+import socket
+import threading
+
+import pytest
+
+from codigo_base import (MAX_PARTES_SENDMSG, Respuesta, RespuestaStreaming, enviar_partes, enviar_respuesta,
+                         respuesta_error, respuesta_fija, respuesta_no_modificado)
+from conftest import recibir_todo
+
+
+def serializar(respuesta, extra=b""):
+    status, headers = respuesta.encabezado()
+    return status + extra + headers + b"".join(respuesta.cuerpo)
+
+
+def test_respuesta_serializada():
+    respuesta = Respuesta(200, [('Content-Type', 'text/plain')], [b"ho", b"la"])
+    assert serializar(respuesta) == b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 4\r\n\r\nhola"
+    assert len(respuesta) == len(serializar(respuesta))
+    assert respuesta.obtener_header("content-type") == "text/plain"
+    assert respuesta.obtener_header("etag") is None
+
+
+def test_respuesta_sin_cuerpo_conserva_los_headers():
+    respuesta = Respuesta(200, [('Content-Type', 'text/plain')], b"hola")
+    head = respuesta.sin_cuerpo()
+    assert serializar(head) == b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 4\r\n\r\n"
+
+
+def test_304_sin_content_length():
+    assert serializar(respuesta_no_modificado([('ETag', '"x"')])) == b"HTTP/1.1 304 Not Modified\r\nETag: \"x\"\r\n\r\n"
+
+
+def test_respuestas_fijas_se_serializan_una_vez():
+    respuesta = respuesta_fija(404)
+    assert respuesta._encabezado is not None
+    assert respuesta.encabezado() is respuesta.encabezado()
+    assert respuesta_error(404).encabezado() == (b"HTTP/1.1 404 Not Found\r\n", b"Content-Length: 0\r\n\r\n")
+
+
+class SocketLento:
+    """Socket falso con sendmsg que acepta como mucho 'porcion' bytes por llamada."""
+
+    def __init__(self, porcion):
+        self.porcion = porcion
+        self.recibido = bytearray()
+        self.buffers_por_llamada = []
+
+    def sendmsg(self, buffers):
+        self.buffers_por_llamada.append(len(buffers))
+        datos = b"".join(bytes(buffer) for buffer in buffers)[:self.porcion]
+        self.recibido += datos
+        return len(datos)
+
+
+@pytest.mark.parametrize("porcion", [1, 3, 7, 1000])
+def test_enviar_partes_con_envios_parciales(porcion):
+    partes = [b"abc", b"", b"defgh", b"i", bytearray(b"jklmnop")]
+    destino = SocketLento(porcion)
+    enviar_partes(destino, partes)
+    assert destino.recibido == b"abcdefghijklmnop"
+
+
+def test_enviar_partes_respeta_el_maximo_de_buffers():
+    destino = SocketLento(10 ** 6)
+    enviar_partes(destino, [b"x"] * (MAX_PARTES_SENDMSG * 2 + 1))
+    assert destino.recibido == b"x" * (MAX_PARTES_SENDMSG * 2 + 1)
+    assert destino.buffers_por_llamada == [MAX_PARTES_SENDMSG, MAX_PARTES_SENDMSG, 1]
+
+
+def enviar_por_socket(respuesta, extra):
+    emisor, receptor = socket.socketpair()
+    recibido = []
+    lector = threading.Thread(target=lambda: recibido.append(recibir_todo(receptor)))
+    lector.start()
+    with emisor:
+        enviar_respuesta(emisor, respuesta, extra)
+    lector.join()
+    receptor.close()
+    return recibido[0]
+
+
+def test_enviar_respuesta_con_headers_de_conexion():
+    respuesta = Respuesta(200, [('Content-Type', 'text/plain')], [b"uno", b"dos"])
+    assert enviar_por_socket(respuesta, b"Connection: close\r\n") == (
+        b"HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Type: text/plain\r\nContent-Length: 6\r\n\r\nunodos")
+
+
+def test_enviar_respuesta_streaming():
+    respuesta = RespuestaStreaming(200, [('Content-Type', 'text/plain')], iter([b"hola", b"chau"]))
+    assert enviar_por_socket(respuesta, b"") == (
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nTransfer-Encoding: chunked\r\n\r\n"
+        b"4\r\nhola\r\n4\r\nchau\r\n0\r\n\r\n")
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param, "--password", "clave", archivos={"a.txt": b"a"})
+
+
+def test_errores_del_servidor(servidor):
+    codigo, headers, body = servidor.get("/download?archivo=a.txt")
+    assert codigo == 401
+    assert headers['www-authenticate'] == "Bearer"
+    autorizacion = {'Authorization': "Bearer clave"}
+    assert servidor.get("/download?archivo=a.txt", autorizacion)[2] == b"a"
+    codigo, headers, body = servidor.get("/download?archivo=otro.txt", autorizacion)
+    assert (codigo, headers['content-length'], body) == (404, "0", b"")
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import shutil
+
+import pytest
+
+from codigo_base import SesionSubida
+
+
+def test_junta_rangos(tmp_path):
+    sesion, creada = SesionSubida.crear(str(tmp_path), "a.bin", 100)
+    assert creada
+    for inicio, fin in [(50, 60), (0, 10), (20, 30), (5, 22), (30, 40), (70, 70)]:
+        assert sesion.registrar(inicio, fin)
+    assert sesion.rangos() == [[0, 40], [50, 60]]
+    assert sesion.faltantes() == [[40, 50], [60, 100]]
+    assert sesion.describir()['faltan'] == 50
+
+
+def test_con_sha256_se_retoma(tmp_path):
+    sha256 = "ab" * 32
+    sesion, creada = SesionSubida.crear(str(tmp_path), "a.bin", 10, sha256)
+    sesion.registrar(0, 4)
+    otra, creada = SesionSubida.crear(str(tmp_path), "a.bin", 10, sha256)
+    assert not creada and otra.id == sesion.id
+    assert otra.rangos() == [[0, 4]]
+
+
+def test_borrada_mientras_llega_un_fragmento(tmp_path):
+    sesion, _ = SesionSubida.crear(str(tmp_path), "a.bin", 10)
+    shutil.rmtree(sesion.directorio)
+    assert not sesion.registrar(0, 5)
+
+
+# Contra el servidor
+
+CONTENIDO = os.urandom(300000)
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param)
+
+
+def crear_sesion(servidor, nombre="grande.bin", tamaño=len(CONTENIDO), sha256=None):
+    target = f"/uploads?nombre={nombre}&tamaño={tamaño}" + (f"&sha256={sha256}" if sha256 else "")
+    codigo, headers, body = servidor.request("POST", target)
+    return codigo, headers, json.loads(body) if body else None
+
+
+def mandar(servidor, id_sesion, inicio, fin):
+    codigo, _, body = servidor.request("PUT", f"/uploads/{id_sesion}?offset={inicio}", body=CONTENIDO[inicio:fin])
+    return codigo, json.loads(body) if codigo == 200 else None
+
+
+def test_servidor_subida_en_desorden(servidor):
+    sha256 = hashlib.sha256(CONTENIDO).hexdigest()
+    codigo, headers, estado = crear_sesion(servidor, sha256=sha256)
+    assert codigo == 201
+    assert headers['location'] == f"/uploads/{estado['id']}"
+    assert estado['faltan'] == len(CONTENIDO)
+
+    assert mandar(servidor, estado['id'], 200000, len(CONTENIDO))[0] == 200
+    codigo, estado_parcial = mandar(servidor, estado['id'], 0, 100000)
+    assert estado_parcial['recibidos'] == [[0, 100000], [200000, len(CONTENIDO)]]
+
+    # Todavía falta el medio
+    codigo, _, body = servidor.request("POST", f"/uploads/{estado['id']}/complete")
+    assert codigo == 409
+    assert json.loads(body)['faltan'] == 100000
+
+    # Un cliente que se reinició retoma la misma sesión por el SHA-256
+    codigo, _, retomada = crear_sesion(servidor, sha256=sha256)
+    assert codigo == 200 and retomada['id'] == estado['id'] and retomada['faltan'] == 100000
+
+    mandar(servidor, estado['id'], 100000, 200000)
+    codigo, _, body = servidor.request("POST", f"/uploads/{estado['id']}/complete")
+    assert codigo == 200
+    assert json.loads(body) == {'archivos': [{'nombre': "grande.bin", 'tamaño': len(CONTENIDO)}]}
+    with open(os.path.join(servidor.archivos, "grande.bin"), 'rb') as archivo:
+        assert archivo.read() == CONTENIDO
+    assert os.listdir(os.path.join(servidor.archivos, ".sesiones")) == []
+
+
+def test_servidor_sha256_distinto(servidor):
+    _, _, estado = crear_sesion(servidor)
+    mandar(servidor, estado['id'], 0, len(CONTENIDO))
+    codigo, _, body = servidor.request("POST", f"/uploads/{estado['id']}/complete?sha256={'0' * 64}")
+    assert codigo == 409
+    # Lo recibido se descarta para volver a mandarlo
+    assert json.loads(body)['faltan'] == len(CONTENIDO)
+
+
+def test_servidor_fragmento_de_una_sesion_borrada(servidor):
+    _, _, estado = crear_sesion(servidor)
+    assert servidor.request("DELETE", f"/uploads/{estado['id']}")[0] == 200
+    assert mandar(servidor, estado['id'], 0, 10)[0] == 404
+    assert servidor.get(f"/uploads/{estado['id']}")[0] == 404
+
+
+@pytest.mark.parametrize("query, esperado", [
+    ("nombre=.oculto&tamaño=10", 400),
+    ("nombre=a%22b&tamaño=10", 400),
+    ("nombre=a.bin&tamaño=-1", 400),
+    ("nombre=a.bin&tamaño=diez", 400),
+    ("nombre=a.bin&tamaño=10&sha256=xyz", 400),
+    (f"nombre=a.bin&tamaño={2 ** 70}", 413),
+])
+def test_servidor_sesion_invalida(servidor, query, esperado):
+    assert servidor.request("POST", f"/uploads?{query}")[0] == esperado
+    # No queda ninguna sesión, ni siquiera a medio crear
+    sesiones = os.path.join(servidor.archivos, ".sesiones")
+    assert not os.path.isdir(sesiones) or os.listdir(sesiones) == []
+
+
+def test_servidor_fragmento_fuera_del_archivo(servidor):
+    _, _, estado = crear_sesion(servidor, tamaño=10)
+    assert servidor.request("PUT", f"/uploads/{estado['id']}?offset=5", body=b"x" * 10)[0] == 416
+    assert servidor.request("PUT", f"/uploads/{estado['id']}?offset=-1", body=b"x")[0] == 400
+    _, _, body = servidor.get(f"/uploads/{estado['id']}")
+    assert json.loads(body)['recibidos'] == []
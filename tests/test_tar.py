@@ -0,0 +1,112 @@
+import io
+import json
+import os
+import tarfile
+import zlib
+
+import pytest
+
+from codigo_base import ParserTar
+
+
+def armar_tar(entradas, formato=tarfile.USTAR_FORMAT):
+    """entradas: list de tuplas (nombre, contenido)"""
+    salida = io.BytesIO()
+    with tarfile.open(fileobj=salida, mode='w', format=formato) as tar:
+        for nombre, contenido in entradas:
+            info = tarfile.TarInfo(nombre)
+            info.size = len(contenido)
+            tar.addfile(info, io.BytesIO(contenido))
+    return salida.getvalue()
+
+
+def extraer_tar(directorio, datos, tamaño_pedazo=333):
+    parser = ParserTar(str(directorio))
+    for i in range(0, len(datos), tamaño_pedazo):
+        parser.feed(datos[i:i + tamaño_pedazo])
+    return parser, parser.finalizar()
+
+
+def test_extrae_sin_directorios(tmp_path):
+    datos = armar_tar([("dir/uno.txt", b"uno"), ("dos.bin", os.urandom(2000)), ("vacio", b"")])
+    parser, archivos = extraer_tar(tmp_path, datos)
+    assert parser.error is None
+    assert [nombre for nombre, _, _ in archivos] == ["uno.txt", "dos.bin", "vacio"]
+    assert (tmp_path / "uno.txt").read_bytes() == b"uno"
+    assert (tmp_path / "vacio").read_bytes() == b""
+
+
+def test_pax_con_nombre_largo(tmp_path):
+    nombre = "carpeta/" + "ñ" * 120 + ".txt"
+    datos = armar_tar([(nombre, b"contenido")], formato=tarfile.PAX_FORMAT)
+    parser, archivos = extraer_tar(tmp_path, datos, 100)
+    assert parser.error is None
+    assert [nombre for nombre, _, _ in archivos] == ["ñ" * 120 + ".txt"]
+    assert (tmp_path / ("ñ" * 120 + ".txt")).read_bytes() == b"contenido"
+
+
+def test_gzip(tmp_path):
+    datos = armar_tar([("uno.txt", b"uno" * 1000)])
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    parser, archivos = extraer_tar(tmp_path, compresor.compress(datos) + compresor.flush(), 50)
+    assert parser.error is None
+    assert (tmp_path / "uno.txt").read_bytes() == b"uno" * 1000
+
+
+def test_checksum_incorrecto(tmp_path):
+    datos = bytearray(armar_tar([("uno.txt", b"uno")]))
+    datos[0] ^= 1
+    parser, archivos = extraer_tar(tmp_path, bytes(datos))
+    assert archivos == []
+    assert parser.error[0] == 400
+    assert os.listdir(tmp_path) == []
+
+
+def test_cortado(tmp_path):
+    datos = armar_tar([("uno.txt", b"uno"), ("dos.bin", b"x" * 5000)])
+    parser, archivos = extraer_tar(tmp_path, datos[:512 * 3 + 1000])
+    assert [nombre for nombre, _, _ in archivos] == ["uno.txt"]
+    assert parser.error == (400, "el tar llegó incompleto")
+    assert os.listdir(tmp_path) == ["uno.txt"]
+
+
+def test_saltea_nombres_invalidos(tmp_path):
+    datos = armar_tar([(".oculto", b"x"), ("a/", b""), ('mal"nombre', b"x"), ("bien.txt", b"y")])
+    parser, archivos = extraer_tar(tmp_path, datos)
+    assert parser.error is None
+    assert os.listdir(tmp_path) == ["bien.txt"]
+
+
+# Contra el servidor
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor):
+    return iniciar_servidor("upload", "--concurrency", request.param)
+
+
+def test_servidor_upload_tar(servidor):
+    datos = armar_tar([("dir/uno.txt", b"uno"), ("dos.bin", os.urandom(100000))])
+    codigo, _, body = servidor.request("POST", "/upload-tar", {'Content-Type': 'application/x-tar'}, datos)
+    assert codigo == 200
+    assert json.loads(body) == {'archivos': [{'nombre': "uno.txt", 'tamaño': 3}, {'nombre': "dos.bin", 'tamaño': 100000}]}
+    _, _, listado = servidor.get("/list")
+    assert sorted(archivo['nombre'] for archivo in json.loads(listado)['archivos']) == ["dos.bin", "uno.txt"]
+
+
+def test_servidor_upload_tar_cortado(servidor):
+    datos = armar_tar([("uno.txt", b"uno"), ("dos.bin", b"x" * 5000)])
+    codigo, _, body = servidor.request("POST", "/upload-tar", {}, datos[:512 * 3 + 1000])
+    assert codigo == 400
+    assert json.loads(body) == {'archivos': [{'nombre': "uno.txt", 'tamaño': 3}], 'error': "el tar llegó incompleto"}
+
+
+def test_servidor_multipart_con_varios_archivos(servidor):
+    limite = "limite"
+    body = b"".join(f'--{limite}\r\nContent-Disposition: form-data; name="archivo"; filename="{nombre}"\r\n\r\n'
+                    .encode() + contenido + b"\r\n" for nombre, contenido in [("a.txt", b"a"), ("b.txt", b"bb")])
+    body += f"--{limite}--\r\n".encode()
+    codigo, headers, respuesta = servidor.request(
+        "POST", "/", {'Content-Type': f'multipart/form-data; boundary={limite}', 'Accept': 'application/json'}, body)
+    assert codigo == 200
+    assert headers['content-type'].startswith("application/json")
+    assert json.loads(respuesta) == {'archivos': [{'nombre': "a.txt", 'tamaño': 1}, {'nombre': "b.txt", 'tamaño': 2}]}
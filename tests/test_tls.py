@@ -0,0 +1,77 @@
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+
+import pytest
+
+from conftest import correr_cliente, leer_respuesta
+
+CONTENIDO = os.urandom(2 * 1024 * 1024 + 5)
+
+
+@pytest.fixture(scope="module")
+def certificado(tmp_path_factory):
+    """Certificado autofirmado para 127.0.0.1: tuple (ruta del certificado, ruta de la clave)."""
+    if shutil.which("openssl") is None:
+        pytest.skip("hace falta openssl para generar el certificado")
+    directorio = tmp_path_factory.mktemp("tls")
+    certificado, clave = str(directorio / "cert.pem"), str(directorio / "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+                    "-keyout", clave, "-out", certificado], check=True, capture_output=True)
+    return certificado, clave
+
+
+@pytest.fixture(params=["threads", "async"])
+def servidor(request, iniciar_servidor, certificado):
+    return iniciar_servidor("upload", "--concurrency", request.param, "--tls", *certificado,
+                            archivos={"datos.bin": CONTENIDO})
+
+
+def conectar_tls(servidor, contexto, sesion=None):
+    conexion = socket.create_connection(("127.0.0.1", servidor.puerto), timeout=10)
+    return contexto.wrap_socket(conexion, server_hostname="127.0.0.1", session=sesion)
+
+
+def contexto_cliente(certificado):
+    contexto = ssl.create_default_context(cafile=certificado[0])
+    contexto.set_alpn_protocols(["http/1.1"])
+    # Con TLS 1.3 el ticket llega después del handshake: TLS 1.2 hace la reanudación predecible
+    contexto.maximum_version = ssl.TLSVersion.TLSv1_2
+    return contexto
+
+
+def test_descarga_por_https(servidor, certificado):
+    assert servidor.esquema == "https"
+    assert "HTTPS activado (kTLS " in servidor.log()
+    with conectar_tls(servidor, contexto_cliente(certificado)) as conexion:
+        assert conexion.selected_alpn_protocol() == "http/1.1"
+        archivo = conexion.makefile('rb')
+        # Dos requests por la misma conexión: uno entero y uno con Range
+        conexion.sendall(b"GET /download?archivo=datos.bin HTTP/1.1\r\nHost: x\r\n\r\n"
+                         b"GET /download?archivo=datos.bin HTTP/1.1\r\nHost: x\r\nRange: bytes=-10\r\n\r\n")
+        codigo, _, body = leer_respuesta(archivo)
+        assert codigo == 200 and body == CONTENIDO
+        codigo, _, body = leer_respuesta(archivo)
+        assert codigo == 206 and body == CONTENIDO[-10:]
+
+
+def test_sesion_retomada(servidor, certificado):
+    contexto = contexto_cliente(certificado)
+    with conectar_tls(servidor, contexto) as conexion:
+        conexion.sendall(b"GET /list HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        assert leer_respuesta(conexion.makefile('rb'))[0] == 200
+        sesion = conexion.session
+    with conectar_tls(servidor, contexto, sesion) as conexion:
+        assert conexion.session_reused
+
+
+def test_cliente_con_cacert(servidor, certificado, tmp_path):
+    resultado = correr_cliente("get", servidor.url, str(tmp_path), "--cacert", certificado[0])
+    assert resultado.returncode == 0, resultado.stdout + resultado.stderr
+    assert (tmp_path / "datos.bin").read_bytes() == CONTENIDO
+    # Sin el certificado la verificación falla
+    resultado = correr_cliente("get", servidor.url, str(tmp_path / "otro"))
+    assert resultado.returncode != 0
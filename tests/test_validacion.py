@@ -0,0 +1,75 @@
+import email.utils
+import hashlib
+import os
+import time
+
+import pytest
+
+from codigo_base import no_fue_modificado
+
+CONTENIDO = b"contenido que se valida\n" * 500
+MTIME = time.time() - 3600
+
+
+@pytest.mark.parametrize("headers, esperado", [
+    ({'if-none-match': '"abc"'}, True),
+    ({'if-none-match': 'W/"abc"'}, True),
+    ({'if-none-match': '"x", "abc"'}, True),
+    ({'if-none-match': '*'}, True),
+    ({'if-none-match': '"x"'}, False),
+    ({'if-modified-since': email.utils.formatdate(MTIME, usegmt=True)}, True),
+    ({'if-modified-since': email.utils.formatdate(MTIME - 10, usegmt=True)}, False),
+    ({'if-modified-since': "cualquier cosa"}, False),
+    # If-None-Match manda aunque la fecha coincida
+    ({'if-none-match': '"x"', 'if-modified-since': email.utils.formatdate(MTIME, usegmt=True)}, False),
+    ({}, False),
+])
+def test_no_fue_modificado(headers, esperado):
+    assert no_fue_modificado(headers, '"abc"', MTIME) == esperado
+
+
+@pytest.fixture
+def servidor(iniciar_servidor):
+    servidor = iniciar_servidor("upload", "--gzip", "--cache-control", "max-age=60", archivos={"a.txt": CONTENIDO})
+    os.utime(os.path.join(servidor.archivos, "a.txt"), (MTIME, MTIME))
+    return servidor
+
+
+def test_304_con_etag_y_con_fecha(servidor):
+    codigo, headers, _ = servidor.get("/download?archivo=a.txt")
+    assert codigo == 200
+    assert headers['cache-control'] == "max-age=60"
+    assert headers['last-modified'] == email.utils.formatdate(int(MTIME), usegmt=True)
+    for condicion in ({'If-None-Match': headers['etag']}, {'If-Modified-Since': headers['last-modified']}):
+        codigo, headers_304, body = servidor.get("/download?archivo=a.txt", condicion)
+        assert codigo == 304 and body == b""
+        assert headers_304['etag'] == headers['etag']
+        assert 'content-length' not in headers_304
+
+
+def test_la_variante_comprimida_tiene_otro_etag(servidor):
+    _, identidad, _ = servidor.get("/download?archivo=a.txt")
+    _, comprimida, _ = servidor.get("/download?archivo=a.txt", {'Accept-Encoding': 'gzip'})
+    assert comprimida['content-encoding'] == "gzip"
+    assert comprimida['etag'] != identidad['etag']
+    assert servidor.get("/download?archivo=a.txt", {'Accept-Encoding': 'gzip', 'If-None-Match': comprimida['etag']})[0] == 304
+    assert servidor.get("/download?archivo=a.txt", {'If-None-Match': comprimida['etag']})[0] == 200
+
+
+def test_archivo_modificado(servidor):
+    _, headers, _ = servidor.get("/download?archivo=a.txt")
+    ruta = os.path.join(servidor.archivos, "a.txt")
+    with open(ruta, 'ab') as archivo:
+        archivo.write(b"mas")
+    codigo, nuevos, body = servidor.get("/download?archivo=a.txt", {'If-None-Match': headers['etag']})
+    assert codigo == 200 and body == CONTENIDO + b"mas"
+    assert nuevos['etag'] != headers['etag']
+
+
+def test_etag_por_contenido(iniciar_servidor):
+    servidor = iniciar_servidor("upload", "--etag-hash", archivos={"a.txt": CONTENIDO})
+    _, headers, _ = servidor.get("/download?archivo=a.txt")
+    assert headers['etag'] == f'"{hashlib.sha256(CONTENIDO).hexdigest()}"'
+    # Con el mismo contenido el ETag no cambia aunque cambie la fecha
+    os.utime(os.path.join(servidor.archivos, "a.txt"), (MTIME, MTIME))
+    assert servidor.get("/download?archivo=a.txt", {'If-None-Match': headers['etag']})[0] == 304
@@ -0,0 +1,77 @@
+import gzip
+import os
+import re
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from codigo_base import soporta_workers
+
+pytestmark = pytest.mark.skipif(not soporta_workers(), reason="hace falta fork y SO_REUSEPORT")
+
+TEXTO = b"texto para comprimir en varios procesos\n" * 20000
+
+
+def esperar_en_el_log(servidor, patron, cantidad=1, limite=10):
+    """Espera a que patron aparezca cantidad veces en el log del servidor y devuelve las coincidencias."""
+    fin = time.monotonic() + limite
+    while True:
+        coincidencias = re.findall(patron, servidor.log())
+        if len(coincidencias) >= cantidad or time.monotonic() > fin:
+            return coincidencias
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def servidor(iniciar_servidor):
+    servidor = iniciar_servidor("upload", "--workers", "2", "--gzip", archivos={"texto.txt": TEXTO})
+    # La URL se muestra antes de que los workers abran sus sockets
+    assert len(esperar_en_el_log(servidor, r"Worker \d listo \(pid (\d+)\)", 2)) == 2
+    return servidor
+
+
+def pids_workers(servidor):
+    return [int(pid) for pid in re.findall(r"Worker \d listo \(pid (\d+)\)", servidor.log())]
+
+
+def test_los_workers_atienden_en_el_mismo_puerto(servidor):
+    pedir = lambda _: servidor.get("/download?archivo=texto.txt", {'Accept-Encoding': 'gzip'})
+    with ThreadPoolExecutor(8) as pool:
+        for codigo, headers, body in pool.map(pedir, range(40)):
+            # Mientras un request comprime, los demás reciben el archivo sin comprimir
+            assert codigo == 200
+            assert (gzip.decompress(body) if headers.get('content-encoding') == "gzip" else body) == TEXTO
+
+
+def test_metricas_de_todos_los_workers(servidor):
+    for _ in range(20):
+        assert servidor.get("/download?archivo=texto.txt")[0] == 200
+    fin = time.monotonic() + 10
+    # Cada worker publica sus métricas cada INTERVALO_METRICAS_WORKERS segundos
+    while time.monotonic() < fin:
+        texto = servidor.get("/metrics")[2].decode('utf-8')
+        if 'http_requests_total{metodo="GET",ruta="/download",codigo="200"} 20' in texto:
+            break
+        time.sleep(0.2)
+    else:
+        pytest.fail(f"las métricas no suman los requests de todos los workers:\n{texto}")
+
+
+def test_un_worker_caido_se_reinicia(servidor):
+    caido = pids_workers(servidor)[0]
+    os.kill(caido, signal.SIGKILL)
+    assert esperar_en_el_log(servidor, rf"El worker \d \(pid {caido}\) terminó con código -9; reiniciándolo")
+    assert len(esperar_en_el_log(servidor, r"Worker \d listo", 3)) == 3
+    for _ in range(10):
+        assert servidor.get("/download?archivo=texto.txt")[0] == 200
+
+
+def test_sigterm_apaga_a_todos(servidor):
+    pids = pids_workers(servidor)
+    servidor.proceso.send_signal(signal.SIGTERM)
+    assert servidor.proceso.wait(10) == 0
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)